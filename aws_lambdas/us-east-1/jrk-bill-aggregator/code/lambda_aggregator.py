@@ -2,10 +2,14 @@
 Aggregator Lambda - Combines chunk results into final JSONL output
 Triggered when all chunks are processed (via DynamoDB Streams or direct invocation)
 Writes final output to Bill_Parser_3_Parsed_Outputs/
+Chunk results are fetched concurrently, merged in chunk order and streamed to S3
 """
 import os
+import re
 import json
 import boto3
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from urllib.parse import unquote_plus
 
@@ -18,6 +22,11 @@ CHUNK_RESULTS_PREFIX = os.getenv("CHUNK_RESULTS_PREFIX", "Bill_Parser_1_LargeFil
 CHUNKS_PREFIX = os.getenv("CHUNKS_PREFIX", "Bill_Parser_1_LargeFile_Chunks/")
 PARSED_OUTPUTS_PREFIX = os.getenv("PARSED_OUTPUTS_PREFIX", "Bill_Parser_3_Parsed_Outputs/")
 JOBS_TABLE = os.getenv("JOBS_TABLE", "jrk-bill-parser-jobs")
+CHUNK_STATS_PREFIX = os.getenv("CHUNK_STATS_PREFIX", "Bill_Parser_Cache/chunk_stats/")
+AGGREGATE_WORKERS = int(os.getenv("AGGREGATE_WORKERS", "16"))  # Concurrent S3 GETs / delete batches
+OUTPUT_PART_BYTES = 8 * 1024 * 1024  # Multipart part size for the Stage 3 output (S3 minimum is 5 MB)
+DELETE_BATCH_SIZE = 1000  # delete_objects limit
+CHUNK_STATS_DECAY = 0.9  # Weight kept by a vendor's history each time a new job is folded in
 
 # Columns
 COLUMNS = [
@@ -43,7 +52,8 @@ def get_job_info(job_id: str) -> dict:
             'total_chunks': int(item['total_chunks']['N']),
             'chunks_completed': int(item['chunks_completed']['N']),
             'status': item['status']['S'],
-            'chunk_results': [r['S'] for r in item.get('chunk_results', {}).get('L', [])]
+            'chunk_results': [r['S'] for r in item.get('chunk_results', {}).get('L', [])],
+            'vendor': item.get('vendor', {}).get('S', ''),
         }
     except Exception as e:
         print(f"Error getting job info: {e}")
@@ -60,47 +70,54 @@ def get_chunk_result(result_key: str) -> dict:
         return None
 
 
+def _chunk_num_from_key(result_key: str) -> int:
+    """chunk_007.json -> 7 (0 when the key doesn't follow the naming scheme)."""
+    m = re.search(r'chunk_(\d+)\.json$', result_key)
+    return int(m.group(1)) if m else 0
+
+
 def combine_chunk_results(job_info: dict) -> list[dict]:
-    """Combine all chunk results into single list of rows with page metadata.
+    """Fetch all chunk results concurrently and return them in chunk order.
 
-    Returns list of dicts: {"row": [...], "source_page_start": N, "source_page_end": N, "chunk_num": N}
+    Returns list of dicts: {"rows": [...], "chunk_num": N, "source_page_start": N, "source_page_end": N}.
+    Rows stay as the compact lists the chunk processor wrote; write_final_jsonl expands
+    them one chunk at a time while streaming the output.
     """
-    all_rows = []
-
     # Get all chunk result keys - if not in DynamoDB, list from S3
     result_keys = job_info.get('chunk_results', [])
     if not result_keys:
-        # List result files from S3
+        # List result files from S3 (timing sidecars share the prefix)
         job_id = job_info['job_id']
         result_prefix = f"{CHUNK_RESULTS_PREFIX}{job_id}/"
         try:
-            resp = s3.list_objects_v2(Bucket=BUCKET, Prefix=result_prefix)
-            if 'Contents' in resp:
-                result_keys = [obj['Key'] for obj in resp['Contents'] if obj['Key'].endswith('.json')]
-                result_keys.sort()
-                print(json.dumps({"message": "Found result files in S3", "count": len(result_keys)}))
+            result_keys = []
+            for page in s3.get_paginator('list_objects_v2').paginate(Bucket=BUCKET, Prefix=result_prefix):
+                result_keys.extend(obj['Key'] for obj in page.get('Contents', [])
+                                   if obj['Key'].endswith('.json') and not obj['Key'].endswith('.timing.json'))
+            print(json.dumps({"message": "Found result files in S3", "count": len(result_keys)}))
         except Exception as e:
             print(f"Error listing S3 results: {e}")
             return []
 
     # Deduplicate result keys (list_append could add same key twice
     # if the chunk processor Lambda was triggered twice for the same chunk)
-    seen_keys = set()
-    unique_keys = []
-    for k in result_keys:
-        if k not in seen_keys:
-            seen_keys.add(k)
-            unique_keys.append(k)
+    unique_keys = list(dict.fromkeys(result_keys))
     if len(unique_keys) < len(result_keys):
         print(json.dumps({"warning": "Deduplicated result keys", "original": len(result_keys), "unique": len(unique_keys)}))
-    result_keys = unique_keys
+    # Chunk order comes from the key name, so results can be consumed in order while
+    # later fetches are still in flight (DynamoDB chunk_results order is completion order)
+    result_keys = sorted(unique_keys, key=_chunk_num_from_key)
 
     # Track seen chunk numbers to prevent duplicate chunk data
     seen_chunks = set()
+    chunks = []
 
-    for result_key in result_keys:
-        chunk_data = get_chunk_result(result_key)
-        if chunk_data and 'rows' in chunk_data:
+    with ThreadPoolExecutor(max_workers=max(1, min(AGGREGATE_WORKERS, len(result_keys)))) as pool:
+        futures = [(k, pool.submit(get_chunk_result, k)) for k in result_keys]
+        for result_key, future in futures:
+            chunk_data = future.result()
+            if not chunk_data or 'rows' not in chunk_data:
+                continue
             chunk_num = chunk_data.get('chunk_num', 0)
 
             # Skip duplicate chunks (same chunk_num from different result keys)
@@ -111,15 +128,12 @@ def combine_chunk_results(job_info: dict) -> list[dict]:
 
             source_page_start = chunk_data.get('source_page_start', 0)
             source_page_end = chunk_data.get('source_page_end', 0)
-
-            # Wrap each row with its page metadata
-            for row in chunk_data['rows']:
-                all_rows.append({
-                    "row": row,
-                    "chunk_num": chunk_num,
-                    "source_page_start": source_page_start,
-                    "source_page_end": source_page_end,
-                })
+            chunks.append({
+                "rows": chunk_data['rows'],
+                "chunk_num": chunk_num,
+                "source_page_start": source_page_start,
+                "source_page_end": source_page_end,
+            })
 
             print(json.dumps({
                 "message": "Added chunk rows",
@@ -128,20 +142,72 @@ def combine_chunk_results(job_info: dict) -> list[dict]:
                 "pages": f"{source_page_start}-{source_page_end}"
             }))
 
-    # Sort by chunk_num to guarantee correct page order
-    # (S3 lexicographic sort on zero-padded names should already be correct,
-    # but DynamoDB chunk_results list order is not guaranteed)
-    all_rows.sort(key=lambda r: r.get('chunk_num', 0))
+    # Keys that didn't follow the naming scheme sorted first; order by the chunk_num inside
+    chunks.sort(key=lambda c: c.get('chunk_num', 0))
+
+    return chunks
+
+
+class S3StreamWriter:
+    """Buffered S3 writer: one put_object for small bodies, a multipart upload
+    (OUTPUT_PART_BYTES per part) once the body outgrows a single part."""
+
+    def __init__(self, bucket: str, key: str, content_type: str, part_bytes: int = 0):
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self.part_bytes = part_bytes or OUTPUT_PART_BYTES
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+        self.bytes_written = 0
+
+    def write(self, data: bytes):
+        self.buffer.extend(data)
+        self.bytes_written += len(data)
+        if len(self.buffer) >= self.part_bytes:
+            self._upload_part()
+
+    def _upload_part(self):
+        if self.upload_id is None:
+            self.upload_id = s3.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, ContentType=self.content_type)['UploadId']
+        part_number = len(self.parts) + 1
+        resp = s3.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                              PartNumber=part_number, Body=bytes(self.buffer))
+        self.parts.append({'ETag': resp['ETag'], 'PartNumber': part_number})
+        self.buffer = bytearray()
+
+    def close(self):
+        if self.upload_id is None:
+            s3.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer), ContentType=self.content_type)
+            return
+        if self.buffer:
+            self._upload_part()
+        s3.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                     MultipartUpload={'Parts': self.parts})
+
+    def abort(self):
+        if self.upload_id is not None:
+            try:
+                s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            except Exception as e:
+                print(json.dumps({"warning": "abort_multipart_failed", "key": self.key, "message": str(e)[:200]}))
 
-    return all_rows
 
+def write_final_jsonl(job_info: dict, chunks: list[dict]) -> tuple[str, int]:
+    """Stream combined results to the final JSONL file in Stage 3.
 
-def write_final_jsonl(job_info: dict, all_rows: list[dict]) -> str:
-    """Write combined results to final JSONL file in Stage 3.
+    Two passes over the chunks: the first collects the header-field majorities,
+    the second expands, normalizes and writes each chunk's rows in order, so only
+    the compact chunk rows (not every record, line and the joined body) stay in memory.
 
     Args:
         job_info: Job metadata from DynamoDB
-        all_rows: List of dicts with {"row": [...], "chunk_num": N, "source_page_start": N, "source_page_end": N}
+        chunks: Chunk results in order, each {"rows": [...], "chunk_num": N, "source_page_start": N, "source_page_end": N}
+
+    Returns:
+        (output key, rows written)
     """
     import re as _re
     now = datetime.now(timezone.utc)
@@ -202,26 +268,24 @@ def write_final_jsonl(job_info: dict, all_rows: list[dict]) -> str:
 
     key_stem = source_filename.rsplit('.', 1)[0] if '.' in source_filename else source_filename
 
-    # First pass: convert rows to dicts with page metadata
-    all_records = []
-    for row_data in all_rows:
-        row = row_data.get("row", row_data) if isinstance(row_data, dict) else row_data
-        # Handle both old format (list) and new format (dict with "row")
-        if isinstance(row, dict) and "row" not in row:
-            # Already a dict - just use it
-            data = row
+    def to_record(row, chunk: dict) -> dict:
+        # Handle both old format (dict) and new format (list in COLUMNS order)
+        if isinstance(row, dict):
+            data = dict(row)
         else:
-            # Convert list row to dict
-            actual_row = row if isinstance(row, list) else row_data
-            data = {k: v for k, v in zip(COLUMNS, actual_row[:len(COLUMNS)])}
-
-        # Add page metadata if present
-        if isinstance(row_data, dict):
-            data["source_chunk"] = row_data.get("chunk_num", 0)
-            data["source_page_start"] = row_data.get("source_page_start", 0)
-            data["source_page_end"] = row_data.get("source_page_end", 0)
-
-        all_records.append(data)
+            data = {k: v for k, v in zip(COLUMNS, row[:len(COLUMNS)])}
+        data["source_chunk"] = chunk.get("chunk_num", 0)
+        data["source_page_start"] = chunk.get("source_page_start", 0)
+        data["source_page_end"] = chunk.get("source_page_end", 0)
+
+        # Normalize Account Number - use Line Item Account Number as fallback
+        acct = data.get("Account Number", "").strip()
+        line_acct = data.get("Line Item Account Number", "").strip()
+        if not acct and line_acct:
+            data["Account Number"] = line_acct
+        elif acct and not line_acct:
+            data["Line Item Account Number"] = acct
+        return data
 
     # Apply header-level field normalization - ensure all line items have the same header fields
     # Header fields that should be consistent across all line items from the same PDF
@@ -230,78 +294,149 @@ def write_final_jsonl(job_info: dict, all_rows: list[dict]) -> str:
         "Invoice Number", "Account Number", "Bill Date", "Due Date"
     ]
 
-    from collections import Counter
-
-    # First, normalize Account Number - use Line Item Account Number as fallback
-    for record in all_records:
-        acct = record.get("Account Number", "").strip()
-        line_acct = record.get("Line Item Account Number", "").strip()
-        if not acct and line_acct:
-            record["Account Number"] = line_acct
-        elif acct and not line_acct:
-            record["Line Item Account Number"] = acct
-
-    for field in header_fields:
-        # Find the most common non-empty value for this field
-        values = [r.get(field, "").strip() for r in all_records if r.get(field, "").strip()]
-        if values:
-            # Use most common value (in case of conflicts)
-            most_common_value = Counter(values).most_common(1)[0][0]
-
-            # Apply to all records that are missing this field
-            for record in all_records:
-                if not record.get(field, "").strip():
-                    record[field] = most_common_value
+    # First pass: most common non-empty value per header field (in case of conflicts)
+    counters = {field: Counter() for field in header_fields}
+    for chunk in chunks:
+        for row in chunk["rows"]:
+            record = to_record(row, chunk)
+            for field in header_fields:
+                value = record.get(field, "").strip()
+                if value:
+                    counters[field][value] += 1
+    header_values = {f: c.most_common(1)[0][0] for f, c in counters.items() if c}
 
     # Normalize all date fields to MM/DD/YYYY format
     date_fields = [
         "Bill Period Start", "Bill Period End", "Bill Date", "Due Date",
         "Previous Reading Date", "Current Reading Date"
     ]
-    for record in all_records:
-        for dk in date_fields:
-            if dk in record and isinstance(record[dk], str):
-                record[dk] = fmt_us_date(record[dk])
-
-    # Second pass: create JSONL with normalized data
-    ndjson_lines = []
-    for data in all_records:
-        data["source_file_page"] = key_stem
-        data["source_input_key"] = source_file
-        data["PDF_LINK"] = source_file
-        data["parsed_at_utc"] = parsed_at_utc
-        data["parser_type"] = "large_file_chunked_parallel"
-        data["job_id"] = job_info['job_id']
-        data["Inferred Fields"] = data.get("Inferred Fields", "").split("-") if data.get("Inferred Fields") else []
-        ndjson_lines.append(json.dumps(data, ensure_ascii=False))
 
     # Write to Stage 3 with date partitioning
     out_prefix = f"{PARSED_OUTPUTS_PREFIX}yyyy={now.year:04d}/mm={now.month:02d}/dd={now.day:02d}/"
     out_key = f"{out_prefix}source=s3/{key_stem}.jsonl"
-    body = "\n".join(ndjson_lines) + "\n"
 
-    s3.put_object(Bucket=BUCKET, Key=out_key, Body=body.encode('utf-8'), ContentType='application/x-ndjson')
-    return out_key
+    # Second pass: normalize and stream JSONL, one chunk at a time in chunk order
+    writer = S3StreamWriter(BUCKET, out_key, 'application/x-ndjson')
+    written = 0
+    try:
+        for chunk in chunks:
+            lines = []
+            for row in chunk["rows"]:
+                data = to_record(row, chunk)
+                # Apply to records that are missing a header field
+                for field, value in header_values.items():
+                    if not data.get(field, "").strip():
+                        data[field] = value
+                for dk in date_fields:
+                    if dk in data and isinstance(data[dk], str):
+                        data[dk] = fmt_us_date(data[dk])
+                data["source_file_page"] = key_stem
+                data["source_input_key"] = source_file
+                data["PDF_LINK"] = source_file
+                data["parsed_at_utc"] = parsed_at_utc
+                data["parser_type"] = "large_file_chunked_parallel"
+                data["job_id"] = job_info['job_id']
+                data["Inferred Fields"] = data.get("Inferred Fields", "").split("-") if data.get("Inferred Fields") else []
+                lines.append(json.dumps(data, ensure_ascii=False) + "\n")
+            if lines:
+                writer.write("".join(lines).encode('utf-8'))
+                written += len(lines)
+        writer.close()
+    except Exception:
+        writer.abort()
+        raise
+    return out_key, written
+
+
+def vendor_stats_key(vendor: str) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "-", (vendor or "").lower()).strip("-")
+    return f"{CHUNK_STATS_PREFIX}{slug[:80]}.json" if slug else ""
+
+
+def fold_vendor_chunk_stats(stats: dict, timings: list[dict]) -> dict:
+    """Merge one job's chunk timings into a vendor's decayed running totals."""
+    stats = dict(stats or {})
+    for field in ("chunks", "pages", "rows", "retries"):
+        stats[field] = float(stats.get(field, 0)) * CHUNK_STATS_DECAY
+    job_high = 0.0
+    for t in timings:
+        pages = max(1, int(t.get("pages") or 1))
+        rows = int(t.get("lineCount") or 0)
+        stats["chunks"] += 1
+        stats["pages"] += pages
+        stats["rows"] += rows
+        stats["retries"] += min(1, int(t.get("retryCount") or 0))  # Chunks that needed any retry
+        job_high = max(job_high, rows / pages)
+    if stats["pages"]:
+        stats["rows_per_page"] = round(stats["rows"] / stats["pages"], 2)
+    if stats["chunks"]:
+        stats["retry_rate"] = round(stats["retries"] / stats["chunks"], 3)
+    stats["rows_per_page_high"] = round(max(job_high, float(stats.get("rows_per_page_high", 0)) * CHUNK_STATS_DECAY), 2)
+    stats["updated_at"] = datetime.now(timezone.utc).isoformat()
+    return stats
+
+
+def record_vendor_chunk_stats(job_info: dict):
+    """Roll this job's chunk timing sidecars into the vendor's stats file before cleanup.
+
+    The splitter reads these to size the next bill's chunks for the same vendor.
+    """
+    key = vendor_stats_key(job_info.get('vendor', ''))
+    if not key:
+        return
+    job_id = job_info['job_id']
+
+    def fetch_timing(n):
+        timing_key = f"{CHUNK_RESULTS_PREFIX}{job_id}/chunk_{str(n).zfill(3)}.timing.json"
+        try:
+            return json.loads(s3.get_object(Bucket=BUCKET, Key=timing_key)['Body'].read().decode('utf-8'))
+        except Exception:
+            return None
+
+    total = job_info['total_chunks']
+    with ThreadPoolExecutor(max_workers=max(1, min(AGGREGATE_WORKERS, total))) as pool:
+        timings = [t for t in pool.map(fetch_timing, range(1, total + 1)) if t]
+    if not timings:
+        return
+    try:
+        try:
+            stats = json.loads(s3.get_object(Bucket=BUCKET, Key=key)['Body'].read().decode('utf-8'))
+        except Exception:
+            stats = {"vendor": job_info['vendor']}
+        stats = fold_vendor_chunk_stats(stats, timings)
+        s3.put_object(Bucket=BUCKET, Key=key, Body=json.dumps(stats).encode('utf-8'), ContentType='application/json')
+        print(json.dumps({"message": "Vendor chunk stats updated", "vendor": job_info['vendor'],
+                          "rows_per_page": stats.get("rows_per_page"), "retry_rate": stats.get("retry_rate")}))
+    except Exception as e:
+        print(json.dumps({"warning": "vendor_chunk_stats_failed", "vendor": job_info['vendor'], "message": str(e)[:200]}))
+
+
+def _delete_prefix(prefix: str, pool: ThreadPoolExecutor) -> int:
+    """Delete every object under prefix with delete_objects batches run on pool."""
+    futures = []
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=BUCKET, Prefix=prefix):
+        keys = [{'Key': obj['Key']} for obj in page.get('Contents', [])]
+        for i in range(0, len(keys), DELETE_BATCH_SIZE):
+            batch = keys[i:i + DELETE_BATCH_SIZE]
+            futures.append((len(batch), pool.submit(
+                s3.delete_objects, Bucket=BUCKET, Delete={'Objects': batch, 'Quiet': True})))
+    deleted = 0
+    for count, future in futures:
+        errors = future.result().get('Errors', [])
+        deleted += count - len(errors)
+        if errors:
+            print(json.dumps({"warning": "delete_errors", "prefix": prefix, "count": len(errors), "first": errors[0].get('Key')}))
+    return deleted
 
 
 def cleanup_job_files(job_id: str):
-    """Delete temporary chunk and result files."""
+    """Delete temporary chunk and result files (chunk and result prefixes in parallel)."""
     try:
-        # List and delete chunk files
-        chunk_prefix = f"{CHUNKS_PREFIX}{job_id}/"
-        chunk_resp = s3.list_objects_v2(Bucket=BUCKET, Prefix=chunk_prefix)
-        if 'Contents' in chunk_resp:
-            for obj in chunk_resp['Contents']:
-                s3.delete_object(Bucket=BUCKET, Key=obj['Key'])
-            print(json.dumps({"message": "Deleted chunk files", "count": len(chunk_resp['Contents'])}))
-
-        # List and delete result files
-        result_prefix = f"{CHUNK_RESULTS_PREFIX}{job_id}/"
-        result_resp = s3.list_objects_v2(Bucket=BUCKET, Prefix=result_prefix)
-        if 'Contents' in result_resp:
-            for obj in result_resp['Contents']:
-                s3.delete_object(Bucket=BUCKET, Key=obj['Key'])
-            print(json.dumps({"message": "Deleted result files", "count": len(result_resp['Contents'])}))
+        with ThreadPoolExecutor(max_workers=max(2, AGGREGATE_WORKERS)) as pool:
+            chunk_count = _delete_prefix(f"{CHUNKS_PREFIX}{job_id}/", pool)
+            result_count = _delete_prefix(f"{CHUNK_RESULTS_PREFIX}{job_id}/", pool)
+        print(json.dumps({"message": "Deleted chunk files", "count": chunk_count}))
+        print(json.dumps({"message": "Deleted result files", "count": result_count}))
 
     except Exception as e:
         print(f"Error cleaning up files: {e}")
@@ -367,18 +502,19 @@ def process_job(job_id: str):
         return
 
     # Combine chunk results
-    all_rows = combine_chunk_results(job_info)
-    if not all_rows:
+    chunks = combine_chunk_results(job_info)
+    total_rows = sum(len(c['rows']) for c in chunks)
+    if not total_rows:
         print(json.dumps({"error": "no_rows_found", "job_id": job_id}))
         update_job_status(job_id, "failed")
         return
 
-    print(json.dumps({"message": "Combined all chunks", "total_rows": len(all_rows)}))
+    print(json.dumps({"message": "Combined all chunks", "chunks": len(chunks), "total_rows": total_rows}))
 
     # Write final JSONL
     try:
-        output_key = write_final_jsonl(job_info, all_rows)
-        print(json.dumps({"message": "Final output written", "output_key": output_key, "total_rows": len(all_rows)}))
+        output_key, written = write_final_jsonl(job_info, chunks)
+        print(json.dumps({"message": "Final output written", "output_key": output_key, "total_rows": written}))
     except Exception as e:
         print(json.dumps({"error": "failed_to_write_output", "message": str(e)}))
         update_job_status(job_id, "failed")
@@ -387,7 +523,8 @@ def process_job(job_id: str):
     # Update job status
     update_job_status(job_id, "completed", output_key)
 
-    # Cleanup temporary files
+    # Feed the splitter's chunk planner, then cleanup temporary files (timings included)
+    record_vendor_chunk_stats(job_info)
     cleanup_job_files(job_id)
 
     print(json.dumps({"message": "Job aggregation completed", "job_id": job_id, "output_key": output_key}))
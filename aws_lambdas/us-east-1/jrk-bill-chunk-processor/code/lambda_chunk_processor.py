@@ -6,12 +6,15 @@ Uses Gemini API to parse chunk and maintains context across chunks
 import os
 import json
 import base64
+import random
 import time
 import boto3
 import requests
 from urllib.parse import unquote_plus
 from datetime import datetime, timezone
 from decimal import Decimal
+import gemini_key_pool
+import parse_cache
 
 s3 = boto3.client("s3")
 ddb = boto3.client("dynamodb")
@@ -20,8 +23,8 @@ secrets = boto3.client("secretsmanager")
 # Configuration
 BUCKET = os.getenv("BUCKET", "jrk-analytics-billing")
 MAX_ATTEMPTS = 10  # Number of retry attempts with key rotation (match number of API keys)
-BASE_BACKOFF_SECONDS = 2  # Base delay for exponential backoff
-CHUNK_STAGGER_SECONDS = 1.5  # Delay per chunk number to stagger API calls
+BASE_BACKOFF_SECONDS = 2  # Delay before retrying after a non-429 error
+CHUNK_START_JITTER_SECONDS = 1.5  # Random start delay spreading a job's parallel chunk calls
 CHUNKS_PREFIX = os.getenv("CHUNKS_PREFIX", "Bill_Parser_1_LargeFile_Chunks/")
 CHUNK_RESULTS_PREFIX = os.getenv("CHUNK_RESULTS_PREFIX", "Bill_Parser_1_LargeFile_Results/")
 JOBS_TABLE = os.getenv("JOBS_TABLE", "jrk-bill-parser-jobs")
@@ -30,6 +33,10 @@ KNOWLEDGE_TABLE = os.getenv("KNOWLEDGE_TABLE", "jrk-bill-knowledge-base")
 PARSER_SECRET_NAME = os.getenv("PARSER_SECRET_NAME", "gemini/parser-keys")
 PIPELINE_TRACKER_TABLE = os.getenv("PIPELINE_TRACKER_TABLE", "jrk-bill-pipeline-tracker")
 MODEL_NAME = os.getenv("MODEL_NAME", "gemini-3-pro-preview")
+# Stand-ins for the Gemini-derived previous context in the prompt the parse cache is
+# keyed on, so a chunk's key depends only on its bytes and the instructions.
+_CACHE_CONTEXT_SLOT = "<previous chunk context>"
+_CACHE_ADDRESS_SLOT = "<previous chunk service address>"
 
 
 def _track(s3_key, event_type, stage, metadata=None):
@@ -126,19 +133,7 @@ Return ONLY the JSON array, no markdown code blocks, no explanation text.
 def get_keys_from_secret() -> list:
     """Get API keys from Secrets Manager."""
     try:
-        resp = secrets.get_secret_value(SecretId=PARSER_SECRET_NAME)
-        raw = resp.get("SecretString", "")
-        if not raw:
-            return []
-        try:
-            parsed = json.loads(raw)
-            if isinstance(parsed, dict) and "keys" in parsed:
-                return [str(k).strip() for k in parsed["keys"]][:10]
-        except:
-            pass
-        if "," in raw:
-            return [k.strip() for k in raw.split(",") if k.strip()][:10]
-        return [k.strip() for k in raw.splitlines() if k.strip()][:10]
+        return gemini_key_pool.parse_keys(gemini_key_pool.get_secret_string(secrets, PARSER_SECRET_NAME))  # Cached while warm
     except Exception as e:
         print(f"Error getting keys: {e}")
         return []
@@ -219,7 +214,12 @@ def get_job_info(job_id: str) -> dict:
             'expected_account_number': item.get('expected_account_number', {}).get('S', ''),
             'bill_from': item.get('bill_from', {}).get('S', ''),
             'pages_per_chunk': int(item.get('pages_per_chunk', {}).get('N', '2')),  # Default to 2 pages per chunk
+            # Planned page range per chunk ("3-5"); empty for jobs split at a fixed pages_per_chunk
+            'chunk_pages': [tuple(int(p) for p in r['S'].split('-')) for r in item.get('chunk_pages', {}).get('L', [])],
             'notes': item.get('notes', {}).get('S', ''),  # Free-form rework instructions
+            'rework': item.get('rework', {}).get('BOOL', False),
+            # "ready" when the splitter's header pass filled header_context up front
+            'header_status': item.get('header_status', {}).get('S', ''),
         }
     except Exception as e:
         print(f"Error getting job info: {e}")
@@ -229,9 +229,10 @@ def get_job_info(job_id: str) -> dict:
 def wait_for_header_context(job_id: str, max_wait_seconds: int = 30) -> str:
     """Wait for chunk 1 to populate header_context. Polls DynamoDB every 2s.
 
-    Chunks 2+ call this before building their Gemini prompt so they always
-    get the authoritative header info from page 1 (vendor, account, address)
-    rather than a race-prone 'previous_context' that any chunk can overwrite.
+    Only used when the splitter's header pass didn't produce a header
+    (header_status != "ready"): chunks 2+ then wait for chunk 1's header info
+    (vendor, account, address) rather than a race-prone 'previous_context'
+    that any chunk can overwrite.
     """
     waited = 0
     while waited < max_wait_seconds:
@@ -503,30 +504,28 @@ def _remaining_ms(deadline_epoch_ms: int) -> int:
 MIN_TIME_FOR_ATTEMPT_MS = 30_000  # 30 seconds — generous buffer for API + S3 write
 
 
-def parse_chunk_with_retry(api_keys: list, pdf_bytes: bytes, chunk_num: int, total_chunks: int, previous_context: str, expected_lines: int = 0, deadline_ms: int = 0, knowledge_notes: str = "", expected_account_number: str = "", rework_notes: str = "", pages_per_chunk: int = 1) -> tuple[list[list[str]], str]:
+def parse_chunk_with_retry(api_keys: list, pdf_bytes: bytes, chunk_num: int, total_chunks: int, previous_context: str, expected_lines: int = 0, deadline_ms: int = 0, knowledge_notes: str = "", expected_account_number: str = "", rework_notes: str = "", pages_per_chunk: int = 1, use_cache: bool = True, source: str = "", page_range: tuple[int, int] = None, timing: dict = None) -> tuple[list[list[str]], str]:
     """
     Parse a PDF chunk with key rotation and exponential backoff.
 
     Implements:
-    1. Key rotation - cycles through all available API keys
-    2. Exponential backoff - increasing delays on 429 errors
-    3. Staggered processing - initial delay based on chunk number
+    1. Key pool - picks keys by recent success rate with per-key token buckets;
+       a 429 puts the key in a cooldown shared with other Lambdas via DynamoDB
+    2. Waits only when every key is cooling down or out of tokens
+    3. Start jitter - small random delay for chunks after the first
     4. Time-budget awareness - stops retrying before Lambda timeout
 
     Args:
         deadline_ms: epoch-millisecond deadline from Lambda context.  If 0,
                      no budget enforcement (unit-test / local mode).
+        use_cache: consult the parse cache before calling Gemini (off for reworks).
+        page_range: 1-based (first, last) original-PDF pages in this chunk when the
+                    splitter planned variable-size chunks; else derived from pages_per_chunk.
+        timing: optional timing dict; retryCount is set to the attempts beyond the first.
 
     Returns rows + new context summary. Returns empty on complete failure.
     """
 
-    # Stagger chunk processing to avoid simultaneous API calls
-    # Chunk 1 starts immediately, chunk 2 waits 1.5s, chunk 3 waits 3s, etc.
-    stagger_delay = (chunk_num - 1) * CHUNK_STAGGER_SECONDS
-    if stagger_delay > 0:
-        print(json.dumps({"message": "Staggering chunk start", "chunk": chunk_num, "delay_seconds": stagger_delay}))
-        time.sleep(stagger_delay)
-
     # Build context note for prompt
     context_service_address = ""  # Will be populated from previous context for post-processing
     context_service_city = ""
@@ -537,8 +536,11 @@ def parse_chunk_with_retry(api_keys: list, pdf_bytes: bytes, chunk_num: int, tot
     # reference "page 1" / "skip the summary page" / "parse pages 2-4" can
     # be applied correctly. Without this, each chunk only knew its chunk
     # number, not which pages of the original PDF it actually contains.
-    page_start = (chunk_num - 1) * max(1, pages_per_chunk) + 1
-    page_end = chunk_num * max(1, pages_per_chunk)
+    if page_range:
+        page_start, page_end = page_range
+    else:
+        page_start = (chunk_num - 1) * max(1, pages_per_chunk) + 1
+        page_end = chunk_num * max(1, pages_per_chunk)
     page_range_str = (
         f"page {page_start} of the original PDF" if page_start == page_end
         else f"pages {page_start}-{page_end} of the original PDF"
@@ -560,13 +562,13 @@ def parse_chunk_with_retry(api_keys: list, pdf_bytes: bytes, chunk_num: int, tot
 
         fallback_addr = context_service_address or "(use address visible on this page)"
         context_note = f"""IMPORTANT: This is chunk {chunk_num} of {total_chunks}. This chunk contains {page_range_str}. Previous chunks contained:
-{previous_context}
+{_CACHE_CONTEXT_SLOT}
 
 **SERVICE ADDRESS FOR THIS CHUNK**:
 - This bill may serve MULTIPLE service addresses across different pages (e.g., DTE Energy multi-unit accounts).
 - Look at THIS page to determine the correct service address for the charges shown here.
 - If this page shows its own service address or unit number, use that address on every row from this chunk.
-- If no service address is visible on this page, fall back to: {fallback_addr}
+- If no service address is visible on this page, fall back to: {_CACHE_ADDRESS_SLOT}
 - NEVER leave service_address empty — always fill it with whatever you can identify.
 
 **CRITICAL — ALWAYS extract ALL line items from THIS page**, even if:
@@ -616,11 +618,29 @@ Use the vendor, account number, and bill dates from the previous context on EVER
                    "normally. If the user told you to parse pages this chunk DOES contain, extract every line "
                    "item from those pages.")
 
+    # Same chunk bytes under the same prompt were parsed before: no Gemini call. The key
+    # is taken before the previous context goes in - that text comes from another
+    # Gemini answer and differs run to run, which would make every later chunk miss.
+    cache_key = parse_cache.cache_key(pdf_bytes, prompt, MODEL_NAME)
+    if previous_context and chunk_num > 1:
+        prompt = prompt.replace(_CACHE_CONTEXT_SLOT, previous_context).replace(_CACHE_ADDRESS_SLOT, fallback_addr)
+    cached = parse_cache.get(s3, BUCKET, cache_key) if use_cache else None
+    if cached is not None:
+        print(json.dumps({"message": "Parse cache hit", "chunk": chunk_num, "cache_key": cache_key, "rows": len(cached["rows"])}))
+        return cached["rows"], cached.get("context_summary", "")
+
+    # Spread the burst of parallel chunk calls a little; 429s are handled by the backoff below.
+    # Chunk 1 starts immediately.
+    if chunk_num > 1 and CHUNK_START_JITTER_SECONDS > 0:
+        time.sleep(random.uniform(0, CHUNK_START_JITTER_SECONDS))
+
     # Retry loop with key rotation and exponential backoff
     last_error = None
     prev_content_errors = []  # Track validation errors for retry feedback
     empty_retries = 0  # Track retries for empty (0-row) responses
 
+    pool = gemini_key_pool.get_pool(api_keys, ddb)
+
     for attempt in range(MAX_ATTEMPTS):
         # --- Time-budget guard: bail if we don't have enough time for another attempt ---
         if deadline_ms and _remaining_ms(deadline_ms) < MIN_TIME_FOR_ATTEMPT_MS:
@@ -633,9 +653,12 @@ Use the vendor, account number, and bill dates from the previous context on EVER
             }))
             break  # fall through to the "all attempts exhausted" path below
 
-        # Rotate through API keys
-        api_key = api_keys[attempt % len(api_keys)]
-        key_index = attempt % len(api_keys)
+        # Next key from the pool; if all are cooling down this waits, but never past the budget
+        max_wait = 60.0
+        if deadline_ms:
+            max_wait = min(max_wait, max(0, (_remaining_ms(deadline_ms) - MIN_TIME_FOR_ATTEMPT_MS) / 1000))
+        api_key = pool.acquire(max_wait=max_wait)
+        key_index = api_keys.index(api_key)
 
         try:
             # Build the prompt - add validation error feedback if retrying due to content errors
@@ -660,6 +683,7 @@ Use the vendor, account number, and bill dates from the previous context on EVER
             }))
 
             reply_text = call_gemini_api(api_key, pdf_bytes, current_prompt, timeout=120)
+            pool.report(api_key, ok=True)  # Content retries below are not the key's fault
 
             # Success! Parse the response
             rows = []
@@ -842,28 +866,28 @@ Use the vendor, account number, and bill dates from the previous context on EVER
                 context_summary = f"No items extracted from chunk {chunk_num}"
 
             print(json.dumps({"message": "Chunk parsed successfully", "chunk": chunk_num, "rows": len(rows), "attempt": attempt + 1}))
+            if timing is not None:
+                timing["retryCount"] = attempt
+            if rows:
+                parse_cache.put(s3, BUCKET, cache_key, MODEL_NAME, rows, context_summary, source=source)
             return rows, context_summary
 
         except RateLimitError as e:
-            # Exponential backoff for rate limit errors
-            backoff_delay = BASE_BACKOFF_SECONDS * (2 ** attempt)  # 2, 4, 8, 16, 32, 64 seconds
-            # Cap backoff so we don't sleep past the deadline
-            if deadline_ms:
-                max_sleep = max(0, (_remaining_ms(deadline_ms) - MIN_TIME_FOR_ATTEMPT_MS) / 1000)
-                backoff_delay = min(backoff_delay, max_sleep)
+            # Cool this key down (for every Lambda); the next acquire picks another key
+            # right away, or waits for the first key to come back if all are cooling
+            pool.report(api_key, ok=False, error=e)
             last_error = str(e)
             print(json.dumps({
                 "warning": "rate_limit_hit",
                 "chunk": chunk_num,
                 "attempt": attempt + 1,
                 "key_index": key_index,
-                "backoff_seconds": backoff_delay,
                 "error": str(e)[:200]
             }))
-            time.sleep(backoff_delay)
 
         except Exception as e:
-            # Other errors - shorter delay, still rotate keys
+            # Other errors - short delay, lower the key's weight
+            pool.report(api_key, ok=False, error=e)
             last_error = str(e)
             print(json.dumps({
                 "warning": "api_call_failed",
@@ -881,6 +905,8 @@ Use the vendor, account number, and bill dates from the previous context on EVER
         "attempts": MAX_ATTEMPTS,
         "last_error": last_error[:300] if last_error else "unknown"
     }))
+    if timing is not None:
+        timing["retryCount"] = MAX_ATTEMPTS
     return [], f"Chunk {chunk_num} failed after {MAX_ATTEMPTS} attempts: {last_error[:100] if last_error else 'unknown'}"
 
 
@@ -911,7 +937,7 @@ def update_job_progress(job_id: str, chunk_num: int, result_key: str, context_su
             ':chunk_str': {'S': str(chunk_num)},
         }
 
-        # Chunk 1 sets the authoritative header_context
+        # Chunk 1 sets the authoritative header_context (for jobs without a splitter header)
         if chunk_num == 1:
             set_parts.append("header_context = :header_ctx")
             expr_values[':header_ctx'] = {'S': context_summary}
@@ -1012,8 +1038,11 @@ def lambda_handler(event, context):
 
         # Determine context for this chunk:
         # - Chunk 1 has no prior context (it IS the header source)
-        # - Chunks 2+ wait for chunk 1's header_context (authoritative, race-free)
-        if chunk_num > 1:
+        # - Chunks 2+ use the splitter's page-1 header pass when it succeeded (no waiting)
+        # - Otherwise chunks 2+ wait for chunk 1's header_context (authoritative, race-free)
+        if chunk_num > 1 and job_info.get('header_status') == 'ready' and job_info.get('header_context'):
+            context_for_chunk = job_info['header_context']
+        elif chunk_num > 1:
             context_for_chunk = wait_for_header_context(job_id)
             if not context_for_chunk:
                 # Fallback: use whatever's already in the job record
@@ -1029,6 +1058,16 @@ def lambda_handler(event, context):
         if knowledge_notes:
             print(json.dumps({"message": "Knowledge notes found for vendor", "vendor": bill_from, "notes_length": len(knowledge_notes)}))
 
+        # Original-PDF pages in this chunk: the splitter's plan, else the fixed-size formula
+        chunk_pages = job_info.get('chunk_pages') or []
+        if len(chunk_pages) >= chunk_num:
+            source_page_start, source_page_end = chunk_pages[chunk_num - 1]
+        else:
+            pages_per_chunk = job_info.get('pages_per_chunk', 2)
+            source_page_start = (chunk_num - 1) * pages_per_chunk + 1
+            source_page_end = chunk_num * pages_per_chunk  # May exceed actual total for last chunk
+        timing["pages"] = source_page_end - source_page_start + 1
+
         # Parse chunk with key rotation and exponential backoff
         rows, context_summary = parse_chunk_with_retry(
             keys,  # Pass all keys for rotation
@@ -1042,6 +1081,10 @@ def lambda_handler(event, context):
             expected_account_number=job_info.get('expected_account_number', ''),
             rework_notes=job_info.get('notes', ''),
             pages_per_chunk=job_info.get('pages_per_chunk', 1),
+            use_cache=not job_info.get('rework', False),
+            source=key,
+            page_range=(source_page_start, source_page_end),
+            timing=timing,
         )
 
         timing["geminiMs"] = int((time.time() - t0) * 1000)
@@ -1063,11 +1106,7 @@ def lambda_handler(event, context):
         # This ensures the aggregator can detect completion and not hang forever.
         result_key = f"{CHUNK_RESULTS_PREFIX}{job_id}/chunk_{str(chunk_num).zfill(3)}.json"
         try:
-            # Calculate page range for this chunk (for UI page-to-line mapping)
-            pages_per_chunk = job_info.get('pages_per_chunk', 2)
-            source_page_start = (chunk_num - 1) * pages_per_chunk + 1
-            source_page_end = chunk_num * pages_per_chunk  # May exceed actual total for last chunk
-
+            # Page range for this chunk (for UI page-to-line mapping)
             result_data = {
                 "job_id": job_id,
                 "chunk_num": chunk_num,
@@ -1075,7 +1114,7 @@ def lambda_handler(event, context):
                 "context_summary": context_summary,
                 "parsed_at": datetime.now(timezone.utc).isoformat(),
                 "failed": chunk_failed,
-                "pages_per_chunk": pages_per_chunk,
+                "pages_per_chunk": source_page_end - source_page_start + 1,
                 "source_page_start": source_page_start,
                 "source_page_end": source_page_end,
             }
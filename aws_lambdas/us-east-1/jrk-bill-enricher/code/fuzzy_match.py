@@ -0,0 +1,142 @@
+"""
+Local fuzzy matching for vendor / property / GL names (replaces difflib scans)
+
+- FuzzyIndex: character-trigram inverted index with IDF weights. A query pulls a
+  few dozen candidates from the posting lists, then rescores them with similarity()
+- similarity(): Jaro-Winkler on the whole name blended with a per-token
+  Jaro-Winkler score, so word order and small typos cost little
+- Indexes round-trip through to_dict()/from_dict() as plain JSON (the enricher
+  ships them in its candidate artifact)
+"""
+import math
+import heapq
+from functools import lru_cache
+
+RETRIEVE_MIN = 30  # Candidates pulled from the posting lists before rescoring
+WHOLE_WEIGHT = 0.4  # similarity(): weight of the whole-string score vs the token score
+
+
+def normalize(s: str) -> str:
+    """Same normalization as the enricher's _norm_name."""
+    return " ".join((s or "").lower().replace("&", "and").replace(",", " ").replace(".", " ").split())
+
+
+def trigrams(norm: str) -> set:
+    padded = f"  {norm} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def jaro_winkler(a: str, b: str) -> float:
+    if a == b:
+        return 1.0
+    la, lb = len(a), len(b)
+    if not la or not lb:
+        return 0.0
+    window = max(0, max(la, lb) // 2 - 1)
+    matched_b = [False] * lb
+    a_matches = []
+    for i, ch in enumerate(a):
+        lo, hi = max(0, i - window), min(lb, i + window + 1)
+        j = b.find(ch, lo, hi)
+        while j != -1 and matched_b[j]:
+            j = b.find(ch, j + 1, hi)
+        if j != -1:
+            matched_b[j] = True
+            a_matches.append(ch)
+    m = len(a_matches)
+    if not m:
+        return 0.0
+    b_matches = [b[j] for j in range(lb) if matched_b[j]]
+    transpositions = sum(x != y for x, y in zip(a_matches, b_matches)) / 2
+    jaro = (m / la + m / lb + (m - transpositions) / m) / 3
+    prefix = 0
+    for x, y in zip(a[:4], b[:4]):
+        if x != y:
+            break
+        prefix += 1
+    return jaro + prefix * 0.1 * (1 - jaro)
+
+
+@lru_cache(maxsize=65536)
+def _token_jw(a: str, b: str) -> float:
+    # Names share a small vocabulary ("energy", "apartments", ...), so token pairs repeat a lot
+    return jaro_winkler(a, b)
+
+
+def _token_score(qt: list, ct: list) -> float:
+    """Length-weighted average over qt of each token's best Jaro-Winkler against ct."""
+    total = sum(len(t) for t in qt)
+    if not total or not ct:
+        return 0.0
+    return sum(len(t) * max(_token_jw(t, c) for c in ct) for t in qt) / total
+
+
+def similarity(a: str, b: str, normalized: bool = False) -> float:
+    """0..1 similarity between two names (1.0 for identical normalized names)."""
+    if not normalized:
+        a, b = normalize(a), normalize(b)
+    if a == b:
+        return 1.0 if a else 0.0
+    if not a or not b:
+        return 0.0
+    at, bt = a.split(), b.split()
+    tokens = (_token_score(at, bt) + _token_score(bt, at)) / 2
+    return WHOLE_WEIGHT * jaro_winkler(a, b) + (1 - WHOLE_WEIGHT) * tokens
+
+
+class FuzzyIndex:
+    """Top-k fuzzy lookup over a fixed list of names (positions are returned)."""
+
+    def __init__(self, names: list):
+        self.norms = [normalize(n) for n in names]
+        postings = {}
+        grams = []
+        for i, n in enumerate(self.norms):
+            g = trigrams(n) if n else set()
+            grams.append(g)
+            for t in g:
+                postings.setdefault(t, []).append(i)
+        count = max(1, len(self.norms))
+        self.idf = {t: math.log(1 + count / len(ids)) for t, ids in postings.items()}
+        self.postings = postings
+        self.weights = [sum(self.idf[t] for t in g) for g in grams]
+
+    def __len__(self):
+        return len(self.norms)
+
+    def to_dict(self) -> dict:
+        return {"norms": self.norms, "postings": self.postings, "idf": self.idf, "weights": self.weights}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FuzzyIndex":
+        """Rebuild an index from to_dict() output without re-deriving the trigrams."""
+        index = cls.__new__(cls)
+        index.norms = list(data["norms"])
+        index.postings = {t: list(ids) for t, ids in data["postings"].items()}
+        index.idf = {t: float(w) for t, w in data["idf"].items()}
+        index.weights = [float(w) for w in data["weights"]]
+        return index
+
+    def search(self, query: str, k: int = 20, allowed=None) -> list:
+        """[(position, score)] best first. allowed: optional set of positions to consider."""
+        q = normalize(query)
+        if not q or not self.norms:
+            return []
+        if allowed is not None and len(allowed) <= max(RETRIEVE_MIN, k):
+            pool = allowed  # Small subset (e.g. one state's properties): just rescore all of it
+        else:
+            qg = trigrams(q)
+            qw = sum(self.idf.get(t, 0.0) for t in qg)
+            shared = {}
+            for t in qg:
+                w = self.idf.get(t)
+                if w is None:
+                    continue
+                for i in self.postings[t]:
+                    if allowed is None or i in allowed:
+                        shared[i] = shared.get(i, 0.0) + w
+            # IDF-weighted Dice on trigram sets
+            pool = heapq.nlargest(max(RETRIEVE_MIN, k * 2), shared,
+                                  key=lambda i: 2 * shared[i] / (qw + self.weights[i]))
+        scored = ((i, similarity(q, self.norms[i], normalized=True)) for i in pool)
+        return heapq.nlargest(k, scored, key=lambda x: x[1])
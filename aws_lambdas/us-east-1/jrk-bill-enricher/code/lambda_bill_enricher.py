@@ -4,22 +4,26 @@ import time
 import boto3
 import base64
 import gzip
+import hashlib
 import io
+import heapq
 import requests
 from urllib.parse import unquote_plus
-import difflib
 import re
-from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from botocore.exceptions import ClientError
+import fuzzy_match
 
 s3 = boto3.client("s3")
 secrets = boto3.client("secretsmanager")
 _ddb = boto3.client("dynamodb", region_name=os.getenv("AWS_REGION", "us-east-1"))
+lambda_client = boto3.client("lambda")
 _TRACKER_TABLE = os.getenv("PIPELINE_TRACKER_TABLE", "jrk-bill-pipeline-tracker")
 
 
 def _pipeline_track(s3_key: str, event_type: str, source: str, stage: str, metadata: dict | None = None):
     """Fire-and-forget pipeline lifecycle event."""
-    import hashlib
     try:
         key_hash = hashlib.sha1(s3_key.encode("utf-8")).hexdigest()
         now = datetime.now(timezone.utc)
@@ -53,12 +57,39 @@ MATCHER_SECRET_NAME = os.getenv("MATCHER_SECRET_NAME", "gemini/matcher-keys")
 ENRICH_MODEL = os.getenv("ENRICH_MODEL", "gemini-1.5-flash")
 PARSED_INPUTS_PREFIX = os.getenv("PARSED_INPUTS_PREFIX", "Bill_Parser_2_Parsed_Inputs/")
 SHORTENER_URL = os.getenv("SHORTENER_URL", "")  # e.g., https://abc123.execute-api.us-east-1.amazonaws.com
+# Prebuilt candidate artifact: parsed + normalized dim exports in one gzipped JSON object.
+# Bump CANDIDATE_ARTIFACT_VERSION whenever the artifact layout changes.
+CANDIDATE_ARTIFACT_VERSION = 4
+CANDIDATE_ARTIFACT_KEY = os.getenv("CANDIDATE_ARTIFACT_KEY", f"{ENRICH_PREFIX}enricher_candidates/v{CANDIDATE_ARTIFACT_VERSION}.json.gz")
+CANDIDATE_ARTIFACT_CHECK_SECONDS = int(os.getenv("CANDIDATE_ARTIFACT_CHECK_SECONDS", "60"))  # Warm ETag + export check interval
+# Local fuzzy matching: only the top MATCH_SHORTLIST candidates go to Gemini, and a clear
+# winner (score >= FUZZY_ACCEPT_SCORE, ahead of the runner-up by FUZZY_ACCEPT_MARGIN) skips it
+MATCH_SHORTLIST = int(os.getenv("MATCH_SHORTLIST", "20"))
+FUZZY_ACCEPT_SCORE = float(os.getenv("FUZZY_ACCEPT_SCORE", "0.95"))
+FUZZY_ACCEPT_MARGIN = float(os.getenv("FUZZY_ACCEPT_MARGIN", "0.05"))
+# Durable match memo (Gemini-resolved matches), keyed per dim-export version
+MATCH_MEMO_TABLE = os.getenv("MATCH_MEMO_TABLE", "jrk-bill-config")
+MATCH_MEMO_TTL_DAYS = int(os.getenv("MATCH_MEMO_TTL_DAYS", "180"))
+# Batch mode (backlogs / reprocessing): {"batch": {...}} events
+BATCH_MATCH_WORKERS = int(os.getenv("BATCH_MATCH_WORKERS", "8"))  # Concurrent Gemini match calls
+BATCH_IO_WORKERS = int(os.getenv("BATCH_IO_WORKERS", "16"))  # Concurrent S3 reads / enriched writes
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "500"))  # Per invocation; the rest is reported as remaining
+BATCH_DEADLINE_RESERVE_MS = int(os.getenv("BATCH_DEADLINE_RESERVE_MS", "60000"))  # Hand off with this much time left
+BATCH_MAX_HANDOFFS = int(os.getenv("BATCH_MAX_HANDOFFS", "20"))  # Chain limit for deadline hand-offs
 
 _VENDOR_CANDIDATES = None
 _PROPERTY_CANDIDATES = None
 _VENDOR_NAME_INDEX = None  # normalized name -> candidate
 _GL_CANDIDATES = None
 _UOM_MAPPINGS = None  # UOM conversion mappings
+# Prebuilt alongside the candidate lists (same order): fuzzy indexes and their normalized names
+_VENDOR_INDEX = _PROPERTY_INDEX = _GL_INDEX = None
+_VENDOR_NORMS = _PROPERTY_NORMS = _GL_NORMS = None
+_PROPERTY_STATE_POSITIONS = {}  # STATE -> frozenset of positions in _PROPERTY_CANDIDATES
+_DIM_VERSIONS = {}  # "vendors" / "properties" / "gl" -> content hash of the loaded candidate list
+_CANDIDATE_ETAG = None  # ETag of the loaded artifact ("" when built from the raw exports)
+_CANDIDATE_SOURCES = {}  # kind -> export key the loaded candidates were built from
+_CANDIDATE_CHECKED_AT = 0.0
 
 # --- Warm-invocation match caches (persist across Lambda reuses) ---
 _VENDOR_MATCH_CACHE = {}    # norm_vendor -> {"id", "name", "score"}
@@ -119,104 +150,297 @@ def _norm_name(s: str) -> str:
     return " ".join((s or "").lower().replace("&", "and").replace(",", " ").replace(".", " ").split())
 
 
+def _vendor_candidates_from_records(records: list) -> list:
+    out = []
+    for r in records:
+        # Prefer exported VENDOR_NAME explicitly for matching
+        name = (
+            r.get("VENDOR_NAME")
+            or r.get("vendor_name")
+            or r.get("Vendor Name")
+            or r.get("name")
+            or ""
+        ).strip()
+        if name:
+            vid = (
+                r.get("VENDOR_ID")
+                or r.get("vendor_id")
+                or name
+            )
+            out.append({"id": str(vid), "name": name})
+    return out
+
+
+def _property_candidates_from_records(records: list) -> list:
+    out = []
+    for r in records:
+        name = (
+            r.get("property_name")
+            or r.get("Property Name")
+            or r.get("PROPERTY_NAME")
+            or r.get("name")
+            or ""
+        ).strip()
+        if name:
+            pid = (
+                r.get("property_id")
+                or r.get("PROPERTY_ID")
+                or name
+            )
+            state = (
+                r.get("GEO_STATE")
+                or r.get("STATE")
+                or r.get("state")
+                or ""
+            )
+            pcode = (
+                r.get("LOOKUP_CODE")
+                or r.get("PROPERTY_CODE")
+                or r.get("code")
+                or r.get("CODE")
+                or ""
+            )
+            out.append({"id": str(pid), "name": name, "state": str(state).strip(), "lookup_code": str(pcode).strip()})
+    return out
+
+
+def _gl_candidates_from_records(records: list) -> list:
+    out = []
+    for r in records:
+        name = (r.get("NAME") or r.get("name") or "").strip()
+        if not name:
+            continue
+        gl_id = r.get("GL_ACCOUNT_ID") or r.get("id") or name
+        acc_num = (
+            r.get("FORMATTED_GL_ACCOUNT_NUMBER")
+            or r.get("FORMATTED_ACCOUNT_NUMBER")
+            or r.get("GL_ACCOUNT_NUMBER")
+            or r.get("ACCOUNT_NUMBER")
+            or r.get("formattedGlAccountNumber")
+            or r.get("glAccountNumber")
+            or r.get("ACCOUNT_NO")
+            or r.get("GL_NUMBER")
+            or r.get("number")
+            or ""
+        )
+        out.append({
+            "id": str(gl_id),
+            "name": name,
+            "number": str(acc_num)
+        })
+    return out
+
+
+_ARTIFACT_KINDS = ("vendors", "properties", "gl")
+
+
+def _dim_export_prefixes() -> tuple:
+    return (
+        ("vendors", DIM_VENDOR_PREFIX, _vendor_candidates_from_records),
+        ("properties", DIM_PROPERTY_PREFIX, _property_candidates_from_records),
+        ("gl", DIM_GL_PREFIX, _gl_candidates_from_records),
+    )
+
+
+def latest_dim_sources() -> dict:
+    """kind -> newest export key under each dim prefix ("" when there is none)."""
+    return {kind: _list_latest_object(BUCKET, prefix) or "" for kind, prefix, _ in _dim_export_prefixes()}
+
+
+def build_candidate_artifact(sources: dict = None) -> dict:
+    """Parse the newest dim_vendor / dim_property / dim_gl_account exports into the
+    candidate lists plus a fuzzy index over each list's names."""
+    sources = sources or latest_dim_sources()
+    art = {"version": CANDIDATE_ARTIFACT_VERSION, "built_at": datetime.now(timezone.utc).isoformat(), "sources": {}, "dim_versions": {}}
+    for kind, _, convert in _dim_export_prefixes():
+        key = sources.get(kind) or ""
+        records = _load_jsonl_from_s3(BUCKET, key) if key else []
+        print(json.dumps({"message": f"Loaded {kind} candidates", "key": key, "count": len(records)}))
+        cands = convert(records)
+        art["sources"][kind] = key
+        # Content hash, so a re-export of unchanged data keeps its memoized matches
+        art["dim_versions"][kind] = hashlib.sha1(json.dumps(cands, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        art[kind] = cands
+        art[f"{kind}_index"] = fuzzy_match.FuzzyIndex([c["name"] for c in cands])
+    return art
+
+
+def candidate_artifact_to_bytes(art: dict) -> bytes:
+    out = dict(art)
+    for kind in _ARTIFACT_KINDS:
+        out[f"{kind}_index"] = art[f"{kind}_index"].to_dict()
+    return gzip.compress(json.dumps(out, separators=(",", ":")).encode("utf-8"), compresslevel=6)
+
+
+def candidate_artifact_from_bytes(raw: bytes) -> dict:
+    art = json.loads(gzip.decompress(raw).decode("utf-8"))
+    if art.get("version") != CANDIDATE_ARTIFACT_VERSION:
+        raise ValueError(f"artifact version {art.get('version')}")
+    for kind in _ARTIFACT_KINDS:
+        art[f"{kind}_index"] = fuzzy_match.FuzzyIndex.from_dict(art[f"{kind}_index"])
+    return art
+
+
+def publish_candidate_artifact(art: dict = None) -> str:
+    """Write the candidate artifact (built now unless given); returns its ETag."""
+    art = art or build_candidate_artifact()
+    body = candidate_artifact_to_bytes(art)
+    resp = s3.put_object(Bucket=BUCKET, Key=CANDIDATE_ARTIFACT_KEY, Body=body, ContentType="application/json",
+                         ContentEncoding="gzip", Metadata={"version": str(CANDIDATE_ARTIFACT_VERSION)})
+    print(json.dumps({"message": "Published candidate artifact", "key": CANDIDATE_ARTIFACT_KEY, "bytes": len(body),
+                      "vendors": len(art["vendors"]), "properties": len(art["properties"]), "gl": len(art["gl"])}))
+    return resp.get("ETag", "")
+
+
+def _install_candidates(art: dict, etag: str):
+    global _VENDOR_CANDIDATES, _PROPERTY_CANDIDATES, _GL_CANDIDATES, _VENDOR_NAME_INDEX
+    global _VENDOR_INDEX, _PROPERTY_INDEX, _GL_INDEX, _VENDOR_NORMS, _PROPERTY_NORMS, _GL_NORMS
+    global _PROPERTY_STATE_POSITIONS, _DIM_VERSIONS, _CANDIDATE_ETAG, _CANDIDATE_SOURCES
+    if _CANDIDATE_ETAG is not None and _CANDIDATE_ETAG != etag:
+        # New dimension data: matches cached against the old lists may now be wrong
+        _VENDOR_MATCH_CACHE.clear()
+        _PROPERTY_MATCH_CACHE.clear()
+        _GL_MATCH_CACHE.clear()
+    _VENDOR_CANDIDATES, _VENDOR_INDEX = art["vendors"], art["vendors_index"]
+    _PROPERTY_CANDIDATES, _PROPERTY_INDEX = art["properties"], art["properties_index"]
+    _GL_CANDIDATES, _GL_INDEX = art["gl"], art["gl_index"]
+    _VENDOR_NORMS, _PROPERTY_NORMS, _GL_NORMS = _VENDOR_INDEX.norms, _PROPERTY_INDEX.norms, _GL_INDEX.norms
+    by_state = {}
+    for i, c in enumerate(_PROPERTY_CANDIDATES):
+        st = str(c.get("state", "")).strip().upper()
+        if st:
+            by_state.setdefault(st, []).append(i)
+    _PROPERTY_STATE_POSITIONS = {st: frozenset(ids) for st, ids in by_state.items()}
+    _DIM_VERSIONS = dict(art["dim_versions"])
+    _CANDIDATE_SOURCES = dict(art.get("sources") or {})
+    _VENDOR_NAME_INDEX = {n: c for n, c in zip(_VENDOR_NORMS, _VENDOR_CANDIDATES)} if _VENDOR_CANDIDATES else None
+    _CANDIDATE_ETAG = etag
+
+
 def _ensure_candidates_loaded():
-    global _VENDOR_CANDIDATES, _PROPERTY_CANDIDATES
-    global _VENDOR_NAME_INDEX
-    global _GL_CANDIDATES
-    if _VENDOR_CANDIDATES is None:
-        vk = _list_latest_object(BUCKET, DIM_VENDOR_PREFIX)
-        _VENDOR_CANDIDATES = []
-        if vk:
-            records = _load_jsonl_from_s3(BUCKET, vk)
-            print(json.dumps({"message": "Loaded vendor candidates", "key": vk, "count": len(records)}))
-            _VENDOR_NAME_INDEX = {}
-            for r in records:
-                # Prefer exported VENDOR_NAME explicitly for matching
-                name = (
-                    r.get("VENDOR_NAME")
-                    or r.get("vendor_name")
-                    or r.get("Vendor Name")
-                    or r.get("name")
-                    or ""
-                ).strip()
-                if name:
-                    vid = (
-                        r.get("VENDOR_ID")
-                        or r.get("vendor_id")
-                        or name
-                    )
-                    cand = {"id": str(vid), "name": name}
-                    _VENDOR_CANDIDATES.append(cand)
-                    _VENDOR_NAME_INDEX[_norm_name(name)] = cand
-    if _PROPERTY_CANDIDATES is None:
-        pk = _list_latest_object(BUCKET, DIM_PROPERTY_PREFIX)
-        _PROPERTY_CANDIDATES = []
-        if pk:
-            records = _load_jsonl_from_s3(BUCKET, pk)
-            print(json.dumps({"message": "Loaded property candidates", "key": pk, "count": len(records)}))
-            for r in records:
-                name = (
-                    r.get("property_name")
-                    or r.get("Property Name")
-                    or r.get("PROPERTY_NAME")
-                    or r.get("name")
-                    or ""
-                ).strip()
-                if name:
-                    pid = (
-                        r.get("property_id")
-                        or r.get("PROPERTY_ID")
-                        or name
-                    )
-                    state = (
-                        r.get("GEO_STATE")
-                        or r.get("STATE")
-                        or r.get("state")
-                        or ""
-                    )
-                    pcode = (
-                        r.get("LOOKUP_CODE")
-                        or r.get("PROPERTY_CODE")
-                        or r.get("code")
-                        or r.get("CODE")
-                        or ""
-                    )
-                    _PROPERTY_CANDIDATES.append({"id": str(pid), "name": name, "state": str(state).strip(), "lookup_code": str(pcode).strip()})
-
-    if _GL_CANDIDATES is None:
-        gk = _list_latest_object(BUCKET, DIM_GL_PREFIX)
-        _GL_CANDIDATES = []
-        if gk:
-            records = _load_jsonl_from_s3(BUCKET, gk)
-            print(json.dumps({"message": "Loaded GL candidates", "key": gk, "count": len(records)}))
-            for r in records:
-                name = (r.get("NAME") or r.get("name") or "").strip()
-                if not name:
-                    continue
-                gl_id = r.get("GL_ACCOUNT_ID") or r.get("id") or name
-                acc_num = (
-                    r.get("FORMATTED_GL_ACCOUNT_NUMBER")
-                    or r.get("FORMATTED_ACCOUNT_NUMBER")
-                    or r.get("GL_ACCOUNT_NUMBER")
-                    or r.get("ACCOUNT_NUMBER")
-                    or r.get("formattedGlAccountNumber")
-                    or r.get("glAccountNumber")
-                    or r.get("ACCOUNT_NO")
-                    or r.get("GL_NUMBER")
-                    or r.get("number")
-                    or ""
-                )
-                _GL_CANDIDATES.append({
-                    "id": str(gl_id),
-                    "name": name,
-                    "number": str(acc_num)
-                })
+    """Load candidates from the prebuilt artifact (one GET on a cold start).
+
+    Warm containers re-check at most every CANDIDATE_ARTIFACT_CHECK_SECONDS: the
+    artifact's ETag and the newest export under each dim prefix. The enricher's S3
+    notification only covers Stage 3, so a new export is noticed here: when the
+    artifact was built from older exports it is rebuilt and republished. Without an
+    artifact the raw exports are parsed as before and the artifact is published.
+    """
+    global _CANDIDATE_CHECKED_AT
+    now = time.time()
+    loaded = _VENDOR_CANDIDATES is not None
+    if loaded and now - _CANDIDATE_CHECKED_AT < CANDIDATE_ARTIFACT_CHECK_SECONDS:
+        return
+    _CANDIDATE_CHECKED_AT = now
+    try:
+        latest = latest_dim_sources()
+    except Exception as e:
+        print(json.dumps({"warning": "dim_export_list_failed", "error": str(e)[:200]}))
+        latest = None  # Can't tell whether the artifact is stale; trust it
+    etag = None
+    if loaded:
+        try:
+            etag = s3.head_object(Bucket=BUCKET, Key=CANDIDATE_ARTIFACT_KEY).get("ETag", "")
+        except Exception:
+            etag = None
+        if latest is None or latest == _CANDIDATE_SOURCES:
+            if etag is None or etag == _CANDIDATE_ETAG:
+                return  # Up to date (or S3 unreachable: keep what we have)
+    publish = latest is not None
+    if not (loaded and etag == _CANDIDATE_ETAG):
+        try:
+            obj = s3.get_object(Bucket=BUCKET, Key=CANDIDATE_ARTIFACT_KEY)
+            art = candidate_artifact_from_bytes(obj["Body"].read())
+            if latest is None or art.get("sources") == latest:
+                _install_candidates(art, obj.get("ETag", ""))
+                print(json.dumps({"message": "Loaded candidate artifact", "etag": _CANDIDATE_ETAG, "built_at": art.get("built_at"),
+                                  "vendors": len(_VENDOR_CANDIDATES), "properties": len(_PROPERTY_CANDIDATES), "gl": len(_GL_CANDIDATES)}))
+                return
+            print(json.dumps({"message": "Candidate artifact is older than the dim exports, rebuilding",
+                              "artifact_sources": art.get("sources"), "latest_sources": latest}))
+        except Exception as e:
+            missing = isinstance(e, ClientError) and e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404")
+            if not missing:
+                print(json.dumps({"warning": "candidate_artifact_load_failed", "key": CANDIDATE_ARTIFACT_KEY, "error": str(e)[:200]}))
+                publish = False  # Don't overwrite an artifact we merely failed to read
+                if loaded:
+                    return
+    art = build_candidate_artifact(latest)
+    etag = ""
+    if publish:
+        try:
+            etag = publish_candidate_artifact(art)
+        except Exception as e:
+            print(json.dumps({"warning": "candidate_artifact_publish_failed", "error": str(e)[:200]}))
+    _install_candidates(art, etag)
+
+
+def _memo_pk(kind: str, key: str) -> str:
+    return f"MATCH_MEMO#{kind}#{hashlib.sha1(key.encode('utf-8')).hexdigest()}"
+
+
+def memo_get_many(kind: str, keys) -> dict:
+    """Memoized matches for keys under the loaded dim version of kind: {key: best}.
+
+    kind is "vendors", "properties" or "gl". Matches memoized against an older
+    export are never read, so a new export invalidates the memo by itself.
+    """
+    version = _DIM_VERSIONS.get(kind)
+    by_pk = {_memo_pk(kind, k): k for k in keys}
+    if not version or not by_pk:
+        return {}
+    out = {}
+    pks = list(by_pk)
+    for i in range(0, len(pks), 100):  # BatchGetItem limit
+        request = {MATCH_MEMO_TABLE: {
+            "Keys": [{"PK": {"S": pk}, "SK": {"S": f"V#{version}"}} for pk in pks[i:i + 100]],
+            "ProjectionExpression": "PK, #m",
+            "ExpressionAttributeNames": {"#m": "match"},
+        }}
+        for _ in range(3):
+            try:
+                resp = _ddb.batch_get_item(RequestItems=request)
+            except Exception as e:
+                print(json.dumps({"warning": "match_memo_read_failed", "kind": kind, "error": str(e)[:200]}))
+                return out
+            for item in resp.get("Responses", {}).get(MATCH_MEMO_TABLE, []):
+                try:
+                    out[by_pk[item["PK"]["S"]]] = json.loads(item["match"]["S"])
+                except Exception:
+                    pass
+            request = resp.get("UnprocessedKeys") or {}
+            if not request:
+                break
+    return out
+
+
+def memo_put(kind: str, key: str, best: dict, source: str = "model") -> None:
+    """Remember a resolved match for key under the loaded dim version of kind."""
+    version = _DIM_VERSIONS.get(kind)
+    if not version or not best or not best.get("id"):
+        return
+    now = datetime.now(timezone.utc)
+    try:
+        _ddb.put_item(TableName=MATCH_MEMO_TABLE, Item={
+            "PK": {"S": _memo_pk(kind, key)},
+            "SK": {"S": f"V#{version}"},
+            "raw_key": {"S": key[:1000]},
+            "match": {"S": json.dumps(best)},
+            "score": {"N": str(round(float(best.get("score") or 0.0), 4))},
+            "source": {"S": source},
+            "created_at": {"S": now.isoformat()},
+            "ttl": {"N": str(int(now.timestamp()) + MATCH_MEMO_TTL_DAYS * 86400)},
+        })
+    except Exception as e:
+        print(json.dumps({"warning": "match_memo_write_failed", "kind": kind, "error": str(e)[:200]}))
+
 
 def _find_gl_by_name_contains(words: list[str]) -> dict | None:
     if not _GL_CANDIDATES:
         return None
-    for c in _GL_CANDIDATES:
-        n = _norm_name(c.get("name", ""))
+    norms = _GL_NORMS if _GL_NORMS and len(_GL_NORMS) == len(_GL_CANDIDATES) else None
+    for i, c in enumerate(_GL_CANDIDATES):
+        n = norms[i] if norms else _norm_name(c.get("name", ""))
         if all(w in n for w in words):
             return c
     return None
@@ -694,15 +918,12 @@ def _gemini_match(api_key: str, target: str, candidates: list, threshold: float
 
 
 def _deterministic_best(target: str, candidates: list) -> dict:
-    """Pick a best candidate deterministically using normalized fuzzy ratio."""
-    def norm(s: str) -> str:
-        return " ".join((s or "").lower().replace("&", "and").replace(",", " ").split())
-    t = norm(target)
+    """Pick a best candidate deterministically using normalized fuzzy similarity."""
+    t = _norm_name(target)
     best = None
     best_score = -1.0
     for c in candidates[:2000]:
-        name = str(c.get("name", ""))
-        score = difflib.SequenceMatcher(None, t, norm(name)).ratio()
+        score = fuzzy_match.similarity(t, _norm_name(str(c.get("name", ""))), normalized=True)
         if score > best_score:
             best_score = score
             best = c
@@ -734,133 +955,312 @@ def _resolve_best_from_model(model_obj: dict, candidates: list, target: str) ->
     return _deterministic_best(target, candidates)
 
 
-def _enrich_lines(lines: list) -> list:
-    _ensure_candidates_loaded()
-    mkeys = _get_matcher_keys()
+def _fuzzy_shortlist(target: str, candidates: list, index=None, allowed=None) -> list:
+    """[(candidate, score)] best first, at most MATCH_SHORTLIST long.
 
-    # --- Pass 0: Parse all lines into records ---
-    records = []
-    for ln in lines:
-        try:
-            records.append(json.loads(ln))
-        except Exception:
-            continue
+    index is the prebuilt FuzzyIndex over candidates (allowed: positions to consider);
+    without one the candidates are scored directly (small filtered lists).
+    """
+    if index is not None:
+        return [(candidates[i], score) for i, score in index.search(target, k=MATCH_SHORTLIST, allowed=allowed)]
+    t = _norm_name(target)
+    scored = ((c, fuzzy_match.similarity(t, _norm_name(str(c.get("name", ""))), normalized=True)) for c in candidates)
+    return heapq.nlargest(MATCH_SHORTLIST, scored, key=lambda x: x[1])
 
-    if not records:
-        return []
 
-    api_key = mkeys[(hash(records[0].get("Invoice Number", "")) or 0) % len(mkeys)] if mkeys else None
+def _is_clear_winner(hits: list) -> bool:
+    if not hits:
+        return False
+    runner_up = hits[1][1] if len(hits) > 1 else 0.0
+    return hits[0][1] >= FUZZY_ACCEPT_SCORE and hits[0][1] - runner_up >= FUZZY_ACCEPT_MARGIN
 
-    # --- Pass 1: Deduplicate vendor & property matching ---
-    unique_vendors = {}     # norm_vendor -> {"id", "name", "score"}
-    unique_properties = {}  # (norm_prop, state_upper) -> {"id", "name", ...}
 
-    if api_key and (_VENDOR_CANDIDATES or _PROPERTY_CANDIDATES):
-        # Collect unique names with a representative record for context
-        vendor_raw = {}      # norm_vendor -> raw vendor string
-        property_reps = {}   # (norm_prop, state_upper) -> first record
-
-        for rec in records:
-            vendor = (rec.get("Vendor Name") or rec.get("Bill From") or "").strip()
-            if vendor and _VENDOR_CANDIDATES:
-                nv = _norm_name(vendor)
-                if nv not in vendor_raw:
-                    vendor_raw[nv] = vendor
-
-            prop = (rec.get("Bill To Name First Line") or "").strip()
-            st = (rec.get("Service State") or "").strip().upper()
-            if prop and _PROPERTY_CANDIDATES:
-                pkey = (_norm_name(prop), st)
-                if pkey not in property_reps:
-                    property_reps[pkey] = rec
-
-        # --- Match each unique vendor (warm cache -> exact -> case-insensitive -> Gemini) ---
-        gemini_vendor_calls = 0
-        for nv, raw_vendor in vendor_raw.items():
-            # Warm-invocation cache (persists across Lambda reuses)
-            if nv in _VENDOR_MATCH_CACHE:
-                unique_vendors[nv] = _VENDOR_MATCH_CACHE[nv]
-                continue
-            # 1) Exact normalized match to export vendor name
-            exact = _VENDOR_NAME_INDEX.get(nv) if _VENDOR_NAME_INDEX else None
-            if exact:
-                best = {"id": exact.get("id"), "name": exact.get("name"), "score": 1.0}
+def _match_candidate(api_key: str, target: str, candidates: list, index=None, allowed=None,
+                     context: dict | None = None, accept_local: bool = True) -> tuple[dict, bool]:
+    """Local fuzzy shortlist, then Gemini over the shortlist only when there's no clear winner.
+
+    Returns (best, used_model).
+    """
+    hits = _fuzzy_shortlist(target, candidates, index=index, allowed=allowed)
+    if accept_local and _is_clear_winner(hits):
+        c, score = hits[0]
+        return {"id": str(c.get("id")), "name": str(c.get("name")), "number": str(c.get("number", "")), "score": round(score, 4)}, False
+    shortlist = [c for c, _ in hits] or candidates
+    model_obj = _gemini_match(api_key, target, shortlist, context=context)
+    return _resolve_best_from_model(model_obj, shortlist, target), True
+
+
+def _collect_entities(records: list) -> tuple[dict, dict]:
+    """Unique vendor and property strings across records.
+
+    Returns ({norm_vendor: raw vendor}, {(norm_prop, STATE): first record with it}).
+    """
+    vendor_raw = {}      # norm_vendor -> raw vendor string
+    property_reps = {}   # (norm_prop, state_upper) -> first record
+    for rec in records:
+        vendor = (rec.get("Vendor Name") or rec.get("Bill From") or "").strip()
+        if vendor and _VENDOR_CANDIDATES:
+            nv = _norm_name(vendor)
+            if nv not in vendor_raw:
+                vendor_raw[nv] = vendor
+
+        prop = (rec.get("Bill To Name First Line") or "").strip()
+        st = (rec.get("Service State") or "").strip().upper()
+        if prop and _PROPERTY_CANDIDATES:
+            pkey = (_norm_name(prop), st)
+            if pkey not in property_reps:
+                property_reps[pkey] = rec
+    return vendor_raw, property_reps
+
+
+def _resolve_vendor(api_key: str, nv: str, raw_vendor: str, memo: dict) -> tuple[dict, str]:
+    """(best, how) for one unique vendor; how is cache / memo / exact / fuzzy / model.
+
+    Order: warm cache -> memo -> exact -> case-insensitive -> fuzzy -> Gemini.
+    """
+    # Warm-invocation cache (persists across Lambda reuses)
+    if nv in _VENDOR_MATCH_CACHE:
+        return _VENDOR_MATCH_CACHE[nv], "cache"
+    if nv in memo:
+        best, how = memo[nv], "memo"
+    else:
+        # 1) Exact normalized match to export vendor name
+        exact = _VENDOR_NAME_INDEX.get(nv) if _VENDOR_NAME_INDEX else None
+        if exact:
+            best, how = {"id": exact.get("id"), "name": exact.get("name"), "score": 1.0}, "exact"
+        else:
+            # 2) Case-insensitive exact match
+            vendor_lower = raw_vendor.lower().strip()
+            exact_ci = None
+            for cand in _VENDOR_CANDIDATES:
+                if cand.get("name", "").lower().strip() == vendor_lower:
+                    exact_ci = cand
+                    break
+            if exact_ci:
+                best, how = {"id": exact_ci.get("id"), "name": exact_ci.get("name"), "score": 1.0}, "exact"
             else:
-                # 2) Case-insensitive exact match
-                vendor_lower = raw_vendor.lower().strip()
-                exact_ci = None
-                for cand in _VENDOR_CANDIDATES:
-                    if cand.get("name", "").lower().strip() == vendor_lower:
-                        exact_ci = cand
-                        break
-                if exact_ci:
-                    best = {"id": exact_ci.get("id"), "name": exact_ci.get("name"), "score": 1.0}
-                else:
-                    # 3) Gemini fallback — only if all deterministic paths fail
-                    vm = _gemini_match(api_key, raw_vendor, _VENDOR_CANDIDATES, context={})
-                    best = _resolve_best_from_model(vm, _VENDOR_CANDIDATES, raw_vendor)
-                    gemini_vendor_calls += 1
-            unique_vendors[nv] = best
-            _VENDOR_MATCH_CACHE[nv] = best
-
-        # --- Match each unique property (warm cache -> state filter -> address narrow -> Gemini) ---
-        gemini_property_calls = 0
-        for (np, st), rep_rec in property_reps.items():
-            cache_key = (np, st)
-            # Warm-invocation cache
-            if cache_key in _PROPERTY_MATCH_CACHE:
-                unique_properties[cache_key] = _PROPERTY_MATCH_CACHE[cache_key]
-                continue
+                # 3) Local fuzzy match; Gemini sees only the shortlist, and only without a clear winner
+                best, used_model = _match_candidate(api_key, raw_vendor, _VENDOR_CANDIDATES, index=_VENDOR_INDEX, context={})
+                how = "model" if used_model else "fuzzy"
+                if used_model:
+                    memo_put("vendors", nv, best)
+    _VENDOR_MATCH_CACHE[nv] = best
+    return best, how
 
-            prop_str = (rep_rec.get("Bill To Name First Line") or "").strip()
-            ctx = {
-                "city": (rep_rec.get("Service City") or "").strip(),
-                "state": st,
-                "zip": (rep_rec.get("Service Zipcode") or "").strip(),
-                "utility_type": (rep_rec.get("Utility Type") or "").strip(),
-            }
-
-            # Filter candidates by state
-            cand_list = _PROPERTY_CANDIDATES
-            if st:
-                subset = [c for c in cand_list if str(c.get("state", "")).strip().upper() == st]
-                if subset:
-                    cand_list = subset
-
-            # Address-based deterministic narrowing
-            best = None
-            try:
-                num, street = _addr_num_and_street(rep_rec.get("Service Address"))
-                if num and street:
-                    nn = num.strip()
-                    ss = street.strip().lower()
-                    narrowed = [c for c in cand_list if nn in _norm_name(str(c.get("name", ""))) and ss in _norm_name(str(c.get("name", "")))]
-                    if narrowed:
-                        best = _deterministic_best(f"{nn} {ss}", narrowed)
-                    else:
-                        pm = _gemini_match(api_key, prop_str, cand_list, context={**ctx, "addr_hint": f"{nn} {ss}"})
-                        best = _resolve_best_from_model(pm, cand_list, prop_str)
-                        gemini_property_calls += 1
+
+def _resolve_property(api_key: str, np: str, st: str, rep_rec: dict, memo: dict) -> tuple[dict, str]:
+    """(best, how) for one unique (property, state); how is cache / memo / address / fuzzy / model.
+
+    Order: warm cache -> memo -> state filter -> address narrow -> fuzzy -> Gemini.
+    """
+    cache_key = (np, st)
+    # Warm-invocation cache
+    if cache_key in _PROPERTY_MATCH_CACHE:
+        return _PROPERTY_MATCH_CACHE[cache_key], "cache"
+    memo_key = f"{np}|{st}"
+    if memo_key in memo:
+        best, how = memo[memo_key], "memo"
+    else:
+        prop_str = (rep_rec.get("Bill To Name First Line") or "").strip()
+        ctx = {
+            "city": (rep_rec.get("Service City") or "").strip(),
+            "state": st,
+            "zip": (rep_rec.get("Service Zipcode") or "").strip(),
+            "utility_type": (rep_rec.get("Utility Type") or "").strip(),
+        }
+
+        # Filter candidates by state
+        cand_list = _PROPERTY_CANDIDATES
+        allowed = _PROPERTY_STATE_POSITIONS.get(st) if st else None
+        if allowed:
+            cand_list = [_PROPERTY_CANDIDATES[i] for i in sorted(allowed)]
+
+        # Address-based deterministic narrowing
+        how = "address"
+        try:
+            num, street = _addr_num_and_street(rep_rec.get("Service Address"))
+            if num and street:
+                nn = num.strip()
+                ss = street.strip().lower()
+                narrowed = [c for c in cand_list if nn in _norm_name(str(c.get("name", ""))) and ss in _norm_name(str(c.get("name", "")))]
+                if narrowed:
+                    best = _deterministic_best(f"{nn} {ss}", narrowed)
                 else:
-                    pm = _gemini_match(api_key, prop_str, cand_list, context=ctx)
-                    best = _resolve_best_from_model(pm, cand_list, prop_str)
-                    gemini_property_calls += 1
-            except Exception:
-                pm = _gemini_match(api_key, prop_str, cand_list, context=ctx)
-                best = _resolve_best_from_model(pm, cand_list, prop_str)
-                gemini_property_calls += 1
+                    best, used_model = _match_candidate(api_key, prop_str, _PROPERTY_CANDIDATES, index=_PROPERTY_INDEX,
+                                                        allowed=allowed, context={**ctx, "addr_hint": f"{nn} {ss}"})
+                    how = "model" if used_model else "fuzzy"
+            else:
+                best, used_model = _match_candidate(api_key, prop_str, _PROPERTY_CANDIDATES, index=_PROPERTY_INDEX,
+                                                    allowed=allowed, context=ctx)
+                how = "model" if used_model else "fuzzy"
+        except Exception:
+            pm = _gemini_match(api_key, prop_str, cand_list, context=ctx)
+            best = _resolve_best_from_model(pm, cand_list, prop_str)
+            how = "model"
+        if how == "model":
+            memo_put("properties", memo_key, best)
+    _PROPERTY_MATCH_CACHE[cache_key] = best
+    return best, how
+
+
+def _resolve_entities(mkeys: list, records: list, stats: dict, workers: int = 1,
+                      should_stop=None) -> tuple[dict, dict]:
+    """Pass 1: match each unique vendor and property in records once.
+
+    Returns ({norm_vendor: best}, {(norm_prop, STATE): best}). Model calls rotate
+    through mkeys; with workers > 1 the matches run concurrently (batch mode).
+    Once should_stop() is true the remaining names are skipped and counted in
+    stats["deferred_matches"].
+    """
+    unique_vendors = {}     # norm_vendor -> {"id", "name", "score"}
+    unique_properties = {}  # (norm_prop, state_upper) -> {"id", "name", ...}
+    if not mkeys or not (_VENDOR_CANDIDATES or _PROPERTY_CANDIDATES):
+        return unique_vendors, unique_properties
+
+    vendor_raw, property_reps = _collect_entities(records)
+    # Durable memo for everything the warm caches and exact lookups can't answer (one batched read each)
+    vendor_memo = memo_get_many("vendors", [
+        nv for nv in vendor_raw
+        if nv not in _VENDOR_MATCH_CACHE and not (_VENDOR_NAME_INDEX and nv in _VENDOR_NAME_INDEX)
+    ])
+    property_memo = memo_get_many("properties", [
+        f"{np}|{st}" for (np, st) in property_reps if (np, st) not in _PROPERTY_MATCH_CACHE
+    ])
 
-            unique_properties[cache_key] = best
-            _PROPERTY_MATCH_CACHE[cache_key] = best
+    jobs = [("vendor", nv, raw) for nv, raw in vendor_raw.items()]
+    jobs += [("property", pkey, rep) for pkey, rep in property_reps.items()]
+
+    def run(item):
+        i, (kind, key, arg) = item
+        if should_stop is not None and should_stop():
+            return kind, key, (None, "deferred")
+        api_key = mkeys[i % len(mkeys)]
+        if kind == "vendor":
+            return kind, key, _resolve_vendor(api_key, key, arg, vendor_memo)
+        return kind, key, _resolve_property(api_key, key[0], key[1], arg, property_memo)
+
+    if workers > 1 and len(jobs) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(run, enumerate(jobs)))
+    else:
+        results = [run(item) for item in enumerate(jobs)]
+
+    counts = {}
+    for kind, key, (best, how) in results:
+        (unique_vendors if kind == "vendor" else unique_properties)[key] = best
+        counts[(kind, how)] = counts.get((kind, how), 0) + 1
+    pass_stats = {
+        "gemini_vendor_calls": counts.get(("vendor", "model"), 0),
+        "gemini_property_calls": counts.get(("property", "model"), 0),
+        "fuzzy_vendor_hits": counts.get(("vendor", "fuzzy"), 0),
+        "fuzzy_property_hits": counts.get(("property", "fuzzy"), 0),
+        "memo_hits": counts.get(("vendor", "memo"), 0) + counts.get(("property", "memo"), 0),
+    }
+    deferred = counts.get(("vendor", "deferred"), 0) + counts.get(("property", "deferred"), 0)
+    if deferred:
+        pass_stats["deferred_matches"] = deferred
+    for name, value in pass_stats.items():
+        stats[name] = stats.get(name, 0) + value
+    print(json.dumps({
+        "message": "Pass 1 dedup complete",
+        "lines": len(records),
+        "unique_vendors": len(vendor_raw),
+        "unique_properties": len(property_reps),
+        **pass_stats,
+    }))
+    return unique_vendors, unique_properties
+
+
+def _apply_entities(rec: dict, unique_vendors: dict, unique_properties: dict) -> None:
+    """Copy the Pass 1 vendor / property matches onto rec and normalize House/Vacant."""
+    # Vendor: O(1) lookup from dedup results
+    vendor = (rec.get("Vendor Name") or rec.get("Bill From") or "").strip()
+    if vendor and _VENDOR_CANDIDATES:
+        nv = _norm_name(vendor)
+        best = unique_vendors.get(nv, {})
+        rec["EnrichedVendorName"] = best.get("name")
+        rec["EnrichedVendorID"] = best.get("id")
+
+    # Property: O(1) lookup from dedup results
+    prop = (rec.get("Bill To Name First Line") or "").strip()
+    st = (rec.get("Service State") or "").strip().upper()
+    if prop and _PROPERTY_CANDIDATES:
+        pkey = (_norm_name(prop), st)
+        best = unique_properties.get(pkey, {})
+        rec["EnrichedProperty"] = best
+        rec["EnrichedPropertyName"] = best.get("name")
+        rec["EnrichedPropertyID"] = best.get("id")
+
+    # House/Vacant normalization before GL selection
+    try:
+        _ensure_hov(rec)
+    except Exception:
+        pass
 
-        print(json.dumps({
-            "message": "Pass 1 dedup complete",
-            "lines": len(records),
-            "unique_vendors": len(vendor_raw),
-            "unique_properties": len(property_reps),
-            "gemini_vendor_calls": gemini_vendor_calls,
-            "gemini_property_calls": gemini_property_calls,
-        }))
+
+def _gl_cache_key(rec: dict) -> tuple:
+    """GL Gemini cache key: (hov, utility, norm_description)."""
+    return (
+        (rec.get("House Or Vacant") or "").strip().lower(),
+        (rec.get("Utility Type") or "").strip().lower(),
+        _norm_name(rec.get("Line Item Description") or ""),
+    )
+
+
+def _resolve_gl(api_key: str, rec: dict, memo: dict | None = None) -> tuple[dict, str]:
+    """(best, how) for a line the deterministic GL rules didn't place; how is cache / model.
+
+    memo: prefetched memo entries (batch mode); otherwise the memo is read for this key.
+    """
+    gl_cache_key = _gl_cache_key(rec)
+    gl_memo_key = "|".join(gl_cache_key)
+    if gl_cache_key not in _GL_MATCH_CACHE:
+        memoized = (memo if memo is not None else memo_get_many("gl", [gl_memo_key])).get(gl_memo_key)
+        if memoized:
+            _GL_MATCH_CACHE[gl_cache_key] = memoized
+    if gl_cache_key in _GL_MATCH_CACHE:
+        return _GL_MATCH_CACHE[gl_cache_key], "cache"
+
+    hov_val = (rec.get("House Or Vacant") or "").strip()
+    util_val = (rec.get("Utility Type") or "").strip()
+    target = " | ".join([hov_val, util_val, (rec.get("Line Item Description") or "").strip()]).strip()
+    # Build candidate set respecting Vacant rule AND utility affinity
+    hov_lower = hov_val.lower()
+    util_aff = util_val.lower()
+    base = _GL_CANDIDATES or []
+    if util_aff == "water":
+        base = [c for c in base if "water" in _norm_name(c.get("name", ""))] or base
+    elif util_aff in ("sewer", "stormwater"):
+        base = [c for c in base if "sewer" in _norm_name(c.get("name", "")) or "storm" in _norm_name(c.get("name", ""))] or base
+    elif util_aff == "gas":
+        base = [c for c in base if "gas" in _norm_name(c.get("name", ""))] or base
+    elif util_aff in ("internet", "phone"):
+        base = [c for c in base if any(k in _norm_name(c.get("name", "")) for k in ["telephone", "phone", "telecom", "internet"])] or base
+    if hov_lower == "vacant":
+        cands = [c for c in base if "vacant" in _norm_name(c.get("name", ""))] or base
+    else:
+        cands = [c for c in base if "vacant" not in _norm_name(c.get("name", ""))] or base
+    # GL targets are descriptions, not names: shortlist locally but always let Gemini pick
+    gbest, _ = _match_candidate(api_key, target, cands, context={
+        "house_or_vacant": rec.get("House Or Vacant"),
+        "utility_type": rec.get("Utility Type"),
+        "line_desc": rec.get("Line Item Description"),
+    }, accept_local=False)
+    _GL_MATCH_CACHE[gl_cache_key] = gbest
+    memo_put("gl", gl_memo_key, gbest)
+    return gbest, "model"
+
+
+def _enrich_records(records: list, mkeys: list, stats: dict, resolved: tuple | None = None) -> list:
+    """Enrich parsed records; returns output lines.
+
+    resolved: (unique_vendors, unique_properties) already matched by the caller
+    (batch mode); otherwise Pass 1 runs over these records.
+    """
+    if resolved is None:
+        api_key = mkeys[(hash(records[0].get("Invoice Number", "")) or 0) % len(mkeys)] if mkeys and records else None
+        resolved = _resolve_entities([api_key] if api_key else [], records, stats)
+    unique_vendors, unique_properties = resolved
 
     # --- Pass 2: Apply enrichment to each record ---
     out = []
@@ -869,69 +1269,17 @@ def _enrich_lines(lines: list) -> list:
     for rec in records:
         api_key_line = mkeys[(hash(rec.get("Invoice Number", "")) or 0) % len(mkeys)] if mkeys else None
         if api_key_line:
-            # Vendor: O(1) lookup from dedup results
-            vendor = (rec.get("Vendor Name") or rec.get("Bill From") or "").strip()
-            if vendor and _VENDOR_CANDIDATES:
-                nv = _norm_name(vendor)
-                best = unique_vendors.get(nv, {})
-                rec["EnrichedVendorName"] = best.get("name")
-                rec["EnrichedVendorID"] = best.get("id")
-
-            # Property: O(1) lookup from dedup results
-            prop = (rec.get("Bill To Name First Line") or "").strip()
-            st = (rec.get("Service State") or "").strip().upper()
-            if prop and _PROPERTY_CANDIDATES:
-                pkey = (_norm_name(prop), st)
-                best = unique_properties.get(pkey, {})
-                rec["EnrichedProperty"] = best
-                rec["EnrichedPropertyName"] = best.get("name")
-                rec["EnrichedPropertyID"] = best.get("id")
-
-            # House/Vacant normalization before GL selection
-            try:
-                _ensure_hov(rec)
-            except Exception:
-                pass
+            _apply_entities(rec, unique_vendors, unique_properties)
 
             # GL assignment: deterministic rules first, then cached Gemini fallback
             if _GL_CANDIDATES:
                 gbest = _choose_gl_deterministic(rec)
                 if not gbest:
-                    # Check GL Gemini cache by (hov, utility, norm_description)
-                    hov_val = (rec.get("House Or Vacant") or "").strip()
-                    util_val = (rec.get("Utility Type") or "").strip()
-                    desc_val = _norm_name(rec.get("Line Item Description") or "")
-                    gl_cache_key = (hov_val.lower(), util_val.lower(), desc_val)
-
-                    if gl_cache_key in _GL_MATCH_CACHE:
-                        gbest = _GL_MATCH_CACHE[gl_cache_key]
-                        gl_cache_hits += 1
-                    else:
-                        target = " | ".join([hov_val, util_val, (rec.get("Line Item Description") or "").strip()]).strip()
-                        # Build candidate set respecting Vacant rule AND utility affinity
-                        hov_lower = hov_val.lower()
-                        util_aff = util_val.lower()
-                        base = _GL_CANDIDATES or []
-                        if util_aff == "water":
-                            base = [c for c in base if "water" in _norm_name(c.get("name", ""))] or base
-                        elif util_aff in ("sewer", "stormwater"):
-                            base = [c for c in base if "sewer" in _norm_name(c.get("name", "")) or "storm" in _norm_name(c.get("name", ""))] or base
-                        elif util_aff == "gas":
-                            base = [c for c in base if "gas" in _norm_name(c.get("name", ""))] or base
-                        elif util_aff in ("internet", "phone"):
-                            base = [c for c in base if any(k in _norm_name(c.get("name", "")) for k in ["telephone", "phone", "telecom", "internet"])] or base
-                        if hov_lower == "vacant":
-                            cands = [c for c in base if "vacant" in _norm_name(c.get("name", ""))] or base
-                        else:
-                            cands = [c for c in base if "vacant" not in _norm_name(c.get("name", ""))] or base
-                        gm = _gemini_match(api_key_line, target, cands, context={
-                            "house_or_vacant": rec.get("House Or Vacant"),
-                            "utility_type": rec.get("Utility Type"),
-                            "line_desc": rec.get("Line Item Description"),
-                        })
-                        gbest = _resolve_best_from_model(gm, cands, target)
-                        _GL_MATCH_CACHE[gl_cache_key] = gbest
+                    gbest, how = _resolve_gl(api_key_line, rec)
+                    if how == "model":
                         gl_gemini_calls += 1
+                    else:
+                        gl_cache_hits += 1
 
                 # Only utility GLs (electric, gas, water, sewer) can be swapped by
                 # House/Vacant or utility-affinity guards. Everything else is left alone.
@@ -1037,6 +1385,8 @@ def _enrich_lines(lines: list) -> list:
             pass
         out.append(json.dumps(rec, ensure_ascii=False))
 
+    stats["gl_gemini_calls"] = stats.get("gl_gemini_calls", 0) + gl_gemini_calls
+    stats["gl_cache_hits"] = stats.get("gl_cache_hits", 0) + gl_cache_hits
     if gl_gemini_calls or gl_cache_hits:
         print(json.dumps({
             "message": "GL Gemini cache stats",
@@ -1046,7 +1396,215 @@ def _enrich_lines(lines: list) -> list:
     return out
 
 
+def _parse_records(lines: list) -> list:
+    records = []
+    for ln in lines:
+        try:
+            records.append(json.loads(ln))
+        except Exception:
+            continue
+    return records
+
+
+def _enrich_lines(lines: list, stats: dict | None = None) -> list:
+    """Enrich one Stage 3 file's lines. stats (optional) collects match / model-call counters."""
+    _ensure_candidates_loaded()
+    mkeys = _get_matcher_keys()
+    records = _parse_records(lines)
+    if not records:
+        return []
+    return _enrich_records(records, mkeys, stats if stats is not None else {})
+
+
+def _stage4_key(key: str) -> str:
+    # Same partitioning and file stem as the Stage 3 input
+    stem = key.split("/", 1)[-1]  # drop prefix
+    return f"{OUTPUT_PREFIX}{stem}"
+
+
+def _list_batch_keys(spec: dict) -> list:
+    """Stage 3 .jsonl keys for a batch: explicit keys, a prefix, or a start/end date range.
+
+    For a prefix or date range, files that already have a Stage 4 output are skipped
+    unless only_missing is false.
+    """
+    if spec.get("keys"):
+        return [k for k in spec["keys"] if k.startswith(INPUT_PREFIX)]
+    if spec.get("prefix"):
+        prefix = spec["prefix"]
+        prefixes = [prefix if prefix.startswith(INPUT_PREFIX) else INPUT_PREFIX + prefix]
+    elif spec.get("start_date"):
+        d = date.fromisoformat(spec["start_date"])
+        end = date.fromisoformat(spec.get("end_date") or spec["start_date"])
+        prefixes = []
+        while d <= end:
+            prefixes.append(f"{INPUT_PREFIX}yyyy={d:%Y}/mm={d:%m}/dd={d:%d}/")
+            d += timedelta(days=1)
+    else:
+        raise ValueError("batch needs keys, prefix or start_date")
+
+    paginator = s3.get_paginator("list_objects_v2")
+
+    def list_keys(prefix: str) -> list:
+        return [o["Key"] for page in paginator.paginate(Bucket=BUCKET, Prefix=prefix) for o in page.get("Contents", [])]
+
+    keys = [k for p in prefixes for k in list_keys(p) if k.endswith(".jsonl")]
+    if spec.get("only_missing", True):
+        done = {k for p in prefixes for k in list_keys(_stage4_key(p))}
+        keys = [k for k in keys if _stage4_key(k) not in done]
+    return sorted(keys)
+
+
+def _hand_off_batch(spec: dict, keys: list, context) -> bool:
+    """Re-invoke this function asynchronously with the keys left when the deadline neared."""
+    handoffs = int(spec.get("handoffs") or 0)
+    if not keys or context is None or handoffs >= BATCH_MAX_HANDOFFS:
+        return False
+    rest = {k: v for k, v in spec.items() if k not in ("keys", "prefix", "start_date", "end_date")}
+    payload = {"batch": {**rest, "keys": keys, "handoffs": handoffs + 1}}
+    try:
+        lambda_client.invoke(FunctionName=context.function_name, InvocationType="Event",
+                             Payload=json.dumps(payload).encode("utf-8"))
+        return True
+    except Exception as e:
+        print(json.dumps({"level": "ALARM", "message": "BATCH_HANDOFF_FAILED", "keys": len(keys), "error": str(e)[:300]}))
+        return False
+
+
+def enrich_batch(spec: dict, context=None) -> dict:
+    """Batch mode: enrich many Stage 3 files with one shared matching pass.
+
+    spec: {"keys": [...]}, {"prefix": "yyyy=2026/mm=01/"} or {"start_date": "2026-01-01",
+    "end_date": "2026-01-31"}; optional only_missing (default true), max_files, workers.
+    Unique vendors, properties and GL descriptions across all files are resolved once,
+    with at most `workers` concurrent model calls, then the files are enriched and
+    written in parallel. At most max_files are handled per call; rerunning with
+    only_missing picks up the rest. Returns a throughput report.
+
+    With a Lambda context, work stops once less than BATCH_DEADLINE_RESERVE_MS is
+    left and the unwritten keys are handed to a fresh async invocation (matches
+    made so far are in the memo, so it starts further along).
+    """
+    t0 = time.time()
+    keys = _list_batch_keys(spec)
+    max_files = int(spec.get("max_files") or BATCH_MAX_FILES)
+    workers = max(1, int(spec.get("workers") or BATCH_MATCH_WORKERS))
+    report = {"files": min(len(keys), max_files), "remaining": max(0, len(keys) - max_files)}
+    keys = keys[:max_files]
+    if not keys:
+        print(json.dumps({"_metric": "enrich_batch_complete", **report}))
+        return report
+
+    def out_of_time() -> bool:
+        return context is not None and context.get_remaining_time_in_millis() < BATCH_DEADLINE_RESERVE_MS
+
+    _ensure_candidates_loaded()
+    mkeys = _get_matcher_keys()
+    stats = {}
+
+    # 1) Read and parse every file
+    def read(key):
+        try:
+            body = s3.get_object(Bucket=BUCKET, Key=key)["Body"].read().decode("utf-8", errors="ignore")
+            return key, _parse_records([ln for ln in body.splitlines() if ln.strip()])
+        except Exception as e:
+            print(json.dumps({"warning": "batch_read_failed", "key": key, "error": str(e)[:200]}))
+            return key, None
+
+    with ThreadPoolExecutor(max_workers=BATCH_IO_WORKERS) as pool:
+        files = [(k, recs) for k, recs in pool.map(read, keys) if recs]
+    all_records = [rec for _, recs in files for rec in recs]
+    t_read = time.time()
+
+    # 2) Vendors and properties: each unique string matched once for the whole batch
+    resolved = _resolve_entities(mkeys, all_records, stats, workers=workers, should_stop=out_of_time)
+
+    # 3) GL: each (hov, utility, description) the deterministic rules can't place, once
+    gl_pending = {}
+    if mkeys and _GL_CANDIDATES and not stats.get("deferred_matches"):
+        for rec in all_records:
+            probe = dict(rec)
+            _apply_entities(probe, *resolved)
+            if _choose_gl_deterministic(probe):
+                continue
+            ck = _gl_cache_key(probe)
+            if ck not in _GL_MATCH_CACHE and ck not in gl_pending:
+                gl_pending[ck] = probe
+        gl_memo = memo_get_many("gl", ["|".join(ck) for ck in gl_pending])
+
+        def resolve_gl(item):
+            i, probe = item
+            if out_of_time():
+                return "deferred"
+            return _resolve_gl(mkeys[i % len(mkeys)], probe, memo=gl_memo)[1]
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            hows = list(pool.map(resolve_gl, enumerate(gl_pending.values())))
+        stats["gl_gemini_calls"] = hows.count("model")
+        if hows.count("deferred"):
+            stats["deferred_matches"] = stats.get("deferred_matches", 0) + hows.count("deferred")
+    t_match = time.time()
+
+    # 4) Enrich and write every file; matching is all cache hits by now. Past the
+    # deadline (or with matches left unresolved) the files are handed off instead.
+    matched = not stats.get("deferred_matches")
+
+    def write(item):
+        key, records = item
+        if not matched or out_of_time():
+            return 0, None, key
+        try:
+            lines = _enrich_records(records, mkeys, {}, resolved=resolved)
+            out_key = _stage4_key(key)
+            s3.put_object(Bucket=BUCKET, Key=out_key, Body=("\n".join(lines) + "\n").encode("utf-8"), ContentType="application/x-ndjson")
+            _pipeline_track(key, "ENRICHED", "lambda:enricher:batch", "S4", {"out_key": out_key, "lines": len(lines)})
+            return len(lines), None, None
+        except Exception as e:
+            print(json.dumps({"level": "ALARM", "message": "ENRICHMENT_FAILED", "key": key, "error": str(e)[:300]}))
+            _pipeline_track(key, "ENRICHMENT_FAILED", "lambda:enricher:batch", "S3", {"error": str(e)[:200]})
+            return 0, key, None
+
+    with ThreadPoolExecutor(max_workers=BATCH_IO_WORKERS) as pool:
+        results = list(pool.map(write, files))
+    deferred = [k for _, _, k in results if k]
+    handed_off = _hand_off_batch(spec, deferred, context)
+    t_end = time.time()
+
+    elapsed = max(t_end - t0, 1e-6)
+    lines_written = sum(n for n, _, _ in results)
+    written = sum(1 for _, f, d in results if not f and not d)
+    read_ok = {k for k, _ in files}
+    failed = [k for _, k, _ in results if k] + [k for k in keys if k not in read_ok]
+    report.update({
+        "files_written": written,
+        "failed": len(failed),
+        "failed_keys": failed[:20],
+        "deferred": len(deferred),
+        "handed_off": handed_off,
+        "lines": lines_written,
+        "unique_vendors": len(resolved[0]),
+        "unique_properties": len(resolved[1]),
+        "unique_gl": len(gl_pending),
+        **stats,
+        "read_s": round(t_read - t0, 2),
+        "match_s": round(t_match - t_read, 2),
+        "write_s": round(t_end - t_match, 2),
+        "elapsed_s": round(elapsed, 2),
+        "files_per_s": round(written / elapsed, 2),
+        "lines_per_s": round(lines_written / elapsed, 1),
+    })
+    if deferred and not handed_off:
+        report["deferred_keys"] = deferred[:20]
+    print(json.dumps({"_metric": "enrich_batch_complete", **report}))
+    return report
+
+
 def lambda_handler(event, context):
+    if event.get("batch"):
+        # Batch mode: backlogs / reprocessing (see enrich_batch)
+        report = enrich_batch(event["batch"], context)
+        return {"statusCode": 200, "body": json.dumps(report)}
+
     # For each NDJSON created in stage 3, read, enrich, write to stage 4
     for record in event.get("Records", []):
         if record.get("eventSource") != "aws:s3":
@@ -1073,17 +1631,17 @@ def lambda_handler(event, context):
             timing["lineCount"] = len(lines)
 
             t_enrich = time.time()
-            enriched_lines = _enrich_lines(lines)
+            stats = {}
+            enriched_lines = _enrich_lines(lines, stats)
             timing["enrichMs"] = int((time.time() - t_enrich) * 1000)
             timing["success"] = True
 
             # Write to stage 4 with same partitioning and file stem
-            stem = key.split("/", 1)[-1]  # drop prefix
-            out_key = f"{OUTPUT_PREFIX}{stem}"
+            out_key = _stage4_key(key)
             s3.put_object(Bucket=BUCKET, Key=out_key, Body=("\n".join(enriched_lines) + "\n").encode('utf-8'), ContentType='application/x-ndjson')
             _pipeline_track(key, "ENRICHED", "lambda:enricher", "S4", {
                 "out_key": out_key, "lines": len(enriched_lines),
-                "vendor_gemini": vendor_gemini_calls, "gl_gemini": gl_gemini_calls,
+                "vendor_gemini": stats.get("gemini_vendor_calls", 0), "gl_gemini": stats.get("gl_gemini_calls", 0),
             })
 
             # Write timing sidecar to Stage 4
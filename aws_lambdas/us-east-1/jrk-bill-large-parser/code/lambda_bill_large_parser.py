@@ -2,18 +2,28 @@
 Chunk Splitter Lambda - Splits large PDFs into chunks for parallel processing
 Triggered by S3 ObjectCreated events on Bill_Parser_1_LargeFile/
 Creates chunks in Bill_Parser_1_LargeFile_Chunks/ which trigger chunk processor
+Runs a fast first-page header pass so every chunk can start with the bill's header context
+Plans chunk boundaries per document: pages are packed against a row budget using
+per-page density estimates and the vendor's history from past chunk timings
 """
 import os
+import re
 import json
 import uuid
+import base64
 import boto3
 import PyPDF2
+import requests
 from io import BytesIO
 from urllib.parse import unquote_plus
 from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+import gemini_key_pool
+import parse_cache
 
 s3 = boto3.client("s3")
 ddb = boto3.client("dynamodb")
+secrets = boto3.client("secretsmanager")
 
 # Configuration
 BUCKET = os.getenv("BUCKET", "jrk-analytics-billing")
@@ -23,20 +33,44 @@ CHUNKS_PREFIX = os.getenv("CHUNKS_PREFIX", "Bill_Parser_1_LargeFile_Chunks/")
 PARSED_INPUTS_PREFIX = os.getenv("PARSED_INPUTS_PREFIX", "Bill_Parser_2_Parsed_Inputs/")
 FAILED_PREFIX = os.getenv("FAILED_PREFIX", "Bill_Parser_Failed_Jobs/")
 JOBS_TABLE = os.getenv("JOBS_TABLE", "jrk-bill-parser-jobs")
-PAGES_PER_CHUNK = int(os.getenv("PAGES_PER_CHUNK", "2"))
-
-
-def split_pdf_into_chunks(pdf_bytes: bytes, pages_per_chunk: int) -> list[bytes]:
-    """Split PDF into chunks of N pages each."""
+PAGES_PER_CHUNK = int(os.getenv("PAGES_PER_CHUNK", "2"))  # Fixed split when ADAPTIVE_CHUNKING is off
+# Adaptive chunk planning: fill each chunk up to a row budget instead of a fixed page count.
+# The budget keeps one Gemini reply well under the model's output limit; dense vendors get less.
+ADAPTIVE_CHUNKING = os.getenv("ADAPTIVE_CHUNKING", "1") == "1"
+CHUNK_ROW_BUDGET = int(os.getenv("CHUNK_ROW_BUDGET", "60"))
+CHUNK_MAX_PAGES = int(os.getenv("CHUNK_MAX_PAGES", "8"))
+DEFAULT_ROWS_PER_PAGE = float(os.getenv("DEFAULT_ROWS_PER_PAGE", "20"))  # Scanned page, unknown vendor
+CHUNK_STATS_PREFIX = os.getenv("CHUNK_STATS_PREFIX", "Bill_Parser_Cache/chunk_stats/")
+PARSER_SECRET_NAME = os.getenv("PARSER_SECRET_NAME", "gemini/parser-keys")
+# Header pass: one small call on page 1 before the chunks are uploaded. It runs after the
+# source has moved out of LARGEFILE_PREFIX, so it gets a single bounded attempt; on failure
+# chunk 1 extracts the header as before.
+HEADER_MODEL = os.getenv("HEADER_MODEL", "gemini-2.5-flash")
+HEADER_PASS_TIMEOUT = int(os.getenv("HEADER_PASS_TIMEOUT", "25"))
+
+HEADER_PROMPT = """
+You are an expert utility-bill parser. Read the header of this bill (first page) and return ONLY a JSON object
+with these keys (empty string when not shown):
+bill_to_name, vendor_name, invoice_number, account_number (digits only), service_address, service_city,
+service_state (2-letter code), service_zipcode, bill_date (MM/DD/YYYY), due_date (MM/DD/YYYY)
+""".strip()
+
+
+def split_pdf_into_chunks(pdf_bytes: bytes, pages_per_chunk: int, page_ranges: list[tuple[int, int]] = None) -> list[bytes]:
+    """Split PDF into chunks of N pages each, or along page_ranges ((start, end) 0-based, end exclusive)."""
     try:
         pdf_file = BytesIO(pdf_bytes)
         pdf_reader = PyPDF2.PdfReader(pdf_file)
         total_pages = len(pdf_reader.pages)
         chunks = []
 
-        for start_page in range(0, total_pages, pages_per_chunk):
+        if not page_ranges:
+            page_ranges = [(start, min(start + pages_per_chunk, total_pages))
+                           for start in range(0, total_pages, pages_per_chunk)]
+
+        for start_page, end_page in page_ranges:
             pdf_writer = PyPDF2.PdfWriter()
-            end_page = min(start_page + pages_per_chunk, total_pages)
+            end_page = min(end_page, total_pages)
 
             for page_num in range(start_page, end_page):
                 pdf_writer.add_page(pdf_reader.pages[page_num])
@@ -52,6 +86,178 @@ def split_pdf_into_chunks(pdf_bytes: bytes, pages_per_chunk: int) -> list[bytes]
         return []
 
 
+# Lines carrying a dollar amount ("Delivery Charge ..... 45.67") are the line-item candidates
+_MONEY_RE = re.compile(r"\$?\s?-?\d{1,3}(?:,\d{3})*\.\d{2}\b")
+
+
+def vendor_stats_key(vendor: str) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "-", (vendor or "").lower()).strip("-")
+    return f"{CHUNK_STATS_PREFIX}{slug[:80]}.json" if slug else ""
+
+
+def get_vendor_chunk_stats(bucket: str, vendor: str) -> dict:
+    """Rolled-up chunk history for a vendor (written by the aggregator from chunk timing sidecars)."""
+    key = vendor_stats_key(vendor)
+    if not key:
+        return {}
+    try:
+        return json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read().decode("utf-8"))
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+            print(json.dumps({"warning": "chunk_stats_read_failed", "key": key, "message": str(e)[:200]}))
+        return {}
+    except Exception as e:
+        print(json.dumps({"warning": "chunk_stats_read_failed", "key": key, "message": str(e)[:200]}))
+        return {}
+
+
+def estimate_page_rows(pdf_bytes: bytes, vendor_stats: dict = None) -> list[float]:
+    """Expected line items per page.
+
+    Pages with a text layer count lines carrying a dollar amount. Scanned pages
+    (no text) use the vendor's observed high-water rows/page, else DEFAULT_ROWS_PER_PAGE.
+    """
+    vendor_stats = vendor_stats or {}
+    fallback = float(vendor_stats.get("rows_per_page_high") or vendor_stats.get("rows_per_page") or DEFAULT_ROWS_PER_PAGE)
+    estimates = []
+    for page in PyPDF2.PdfReader(BytesIO(pdf_bytes)).pages:
+        try:
+            text = page.extract_text() or ""
+        except Exception:
+            text = ""
+        if len(text.strip()) < 40:
+            estimates.append(max(1.0, fallback))
+            continue
+        money_lines = sum(1 for line in text.splitlines() if _MONEY_RE.search(line))
+        estimates.append(max(1.0, float(money_lines)))
+    return estimates
+
+
+def plan_chunks(page_rows: list[float], row_budget: float = CHUNK_ROW_BUDGET, max_pages: int = CHUNK_MAX_PAGES) -> list[tuple[int, int]]:
+    """Pack consecutive pages into chunks whose estimated rows stay within row_budget.
+
+    Returns (start, end) page ranges, 0-based with end exclusive. Greedy packing of an
+    ordered sequence gives the fewest chunks for a fixed budget; a page that alone
+    exceeds the budget gets a chunk of its own.
+    """
+    ranges = []
+    start, load = 0, 0.0
+    for i, rows in enumerate(page_rows):
+        if i > start and (load + rows > row_budget or i - start >= max_pages):
+            ranges.append((start, i))
+            start, load = i, 0.0
+        load += rows
+    if page_rows:
+        ranges.append((start, len(page_rows)))
+    return ranges
+
+
+def plan_pdf_chunks(bucket: str, pdf_bytes: bytes, vendor: str = "") -> tuple[list[tuple[int, int]], dict]:
+    """Chunk page ranges for this document plus a summary for logging.
+
+    Vendors whose chunks historically needed retries get a proportionally smaller budget.
+    """
+    stats = get_vendor_chunk_stats(bucket, vendor)
+    page_rows = estimate_page_rows(pdf_bytes, stats)
+    retry_rate = min(1.0, max(0.0, float(stats.get("retry_rate") or 0)))
+    budget = max(1.0, CHUNK_ROW_BUDGET / (1.0 + retry_rate))
+    ranges = plan_chunks(page_rows, budget, max(1, CHUNK_MAX_PAGES))
+    return ranges, {
+        "pages": len(page_rows),
+        "chunks": len(ranges),
+        "estimated_rows": round(sum(page_rows)),
+        "row_budget": round(budget, 1),
+        "vendor_history": bool(stats),
+    }
+
+
+def first_page_pdf(pdf_bytes: bytes) -> bytes:
+    """Page 1 of the PDF as its own document (input for the header pass)."""
+    pdf_reader = PyPDF2.PdfReader(BytesIO(pdf_bytes))
+    pdf_writer = PyPDF2.PdfWriter()
+    pdf_writer.add_page(pdf_reader.pages[0])
+    out = BytesIO()
+    pdf_writer.write(out)
+    return out.getvalue()
+
+
+def format_header_context(header: dict) -> str:
+    """Header fields in the same layout chunk processors write as context_summary
+    (they pull the service address back out of it with regexes)."""
+    g = lambda k: str(header.get(k) or "").strip()
+    return (
+        f"Bill To: {g('bill_to_name')} | Vendor: {g('vendor_name')} | Invoice: {g('invoice_number')} | "
+        f"Account: {g('account_number')} | Service Address: {g('service_address')}, {g('service_city')}, "
+        f"{g('service_state')} {g('service_zipcode')} | "
+        f"Bill Date: {g('bill_date')} | Due Date: {g('due_date')} | "
+        f"Header extracted from page 1"
+    )
+
+
+def _call_header_model(api_key: str, pdf_bytes: bytes) -> dict:
+    url = f"https://generativelanguage.googleapis.com/v1beta/models/{HEADER_MODEL}:generateContent?key={api_key}"
+    payload = {
+        "contents": [{"role": "user", "parts": [
+            {"inline_data": {"mime_type": "application/pdf", "data": base64.b64encode(pdf_bytes).decode("ascii")}},
+            {"text": HEADER_PROMPT},
+        ]}],
+        "generationConfig": {"responseMimeType": "application/json"},
+    }
+    r = requests.post(url, headers={"Content-Type": "application/json"}, data=json.dumps(payload),
+                      timeout=HEADER_PASS_TIMEOUT)
+    if r.status_code != 200:
+        raise RuntimeError(f"Gemini REST error {r.status_code}: {r.text[:300]}")
+    data = r.json()
+    parts = (((data.get("candidates") or [{}])[0] or {}).get("content") or {}).get("parts") or []
+    text = "".join(p.get("text", "") for p in parts if isinstance(p, dict)).strip()
+    header = json.loads(text)
+    if isinstance(header, list):
+        header = header[0] if header else {}
+    return header if isinstance(header, dict) else {}
+
+
+def extract_header_context(bucket: str, pdf_bytes: bytes, use_cache: bool = True) -> str:
+    """Vendor/account/address/dates from page 1, formatted for chunk prompts; '' on failure.
+
+    Results go through the content-addressed parse cache, so a re-ingested bill
+    produces the same header text (and therefore the same chunk prompts). A miss
+    makes one call with a key from the shared pool; there is no retry.
+    """
+    try:
+        page_bytes = first_page_pdf(pdf_bytes)
+    except Exception as e:
+        print(json.dumps({"warning": "header_pass_split_failed", "message": str(e)[:200]}))
+        return ""
+    cache_key = parse_cache.cache_key(page_bytes, HEADER_PROMPT, HEADER_MODEL)
+    if use_cache:
+        entry = parse_cache.get(s3, bucket, cache_key)
+        if entry and entry.get("context_summary"):
+            return entry["context_summary"]
+
+    try:
+        keys = gemini_key_pool.parse_keys(gemini_key_pool.get_secret_string(secrets, PARSER_SECRET_NAME))
+    except Exception as e:
+        print(json.dumps({"warning": "header_pass_no_keys", "message": str(e)[:200]}))
+        return ""
+    pool = gemini_key_pool.get_pool(keys, ddb)
+    api_key = pool.acquire(max_wait=0)
+    if not api_key:
+        return ""
+    try:
+        header = _call_header_model(api_key, page_bytes)
+    except Exception as e:
+        pool.report(api_key, ok=False, error=e)
+        print(json.dumps({"warning": "header_pass_failed", "model": HEADER_MODEL, "message": str(e)[:200]}))
+        return ""
+    pool.report(api_key, ok=True)
+    if not (header.get("vendor_name") or header.get("account_number")):
+        print(json.dumps({"warning": "header_pass_empty", "model": HEADER_MODEL}))
+        return ""
+    context = format_header_context(header)
+    parse_cache.put(s3, bucket, cache_key, HEADER_MODEL, [], context)
+    return context
+
+
 def get_rework_metadata(bucket: str, pdf_key: str) -> dict:
     """Read .rework.json sidecar file to get expected_lines, bill_from,
     expected_account_number, and free-form rework notes.
@@ -60,7 +266,7 @@ def get_rework_metadata(bucket: str, pdf_key: str) -> dict:
     reworks they sit alongside the PDF in LARGEFILE_PREFIX, and for normal
     routes they live in Bill_Parser_1_Pending_Parsing/.
     """
-    metadata = {'expected_lines': 0, 'bill_from': '', 'expected_account_number': '', 'notes': ''}
+    metadata = {'expected_lines': 0, 'bill_from': '', 'expected_account_number': '', 'notes': '', 'rework': False}
 
     # Extract suffix from the key (remove prefix)
     if pdf_key.startswith(LARGEFILE_PREFIX):
@@ -82,6 +288,7 @@ def get_rework_metadata(bucket: str, pdf_key: str) -> dict:
             rework_key = base_no_ext + '.rework.json'
             obj = s3.get_object(Bucket=bucket, Key=rework_key)
             data = json.loads(obj['Body'].read().decode('utf-8', 'ignore'))
+            metadata['rework'] = True
             if not metadata['expected_lines']:
                 metadata['expected_lines'] = int(data.get('expected_line_count') or data.get('expected_lines') or data.get('min_lines') or 0)
             if not metadata['bill_from']:
@@ -113,7 +320,7 @@ def get_rework_metadata(bucket: str, pdf_key: str) -> dict:
     return metadata
 
 
-def create_job_record(job_id: str, source_file: str, total_chunks: int, chunk_keys: list[str], expected_lines: int = 0, bill_from: str = '', pages_per_chunk: int = 2, expected_account_number: str = '', notes: str = ''):
+def create_job_record(job_id: str, source_file: str, total_chunks: int, chunk_keys: list[str], expected_lines: int = 0, bill_from: str = '', pages_per_chunk: int = 2, expected_account_number: str = '', notes: str = '', rework: bool = False, header_context: str = '', chunk_pages: list[tuple[int, int]] = None, vendor: str = ''):
     """Create job tracking record in DynamoDB."""
     now = datetime.now(timezone.utc)
     item = {
@@ -126,12 +333,19 @@ def create_job_record(job_id: str, source_file: str, total_chunks: int, chunk_ke
         'chunk_keys': {'L': [{'S': k} for k in chunk_keys]},
         'chunk_results': {'L': []},  # Will be populated by chunk processors
         'previous_context': {'S': ''},  # Summary of previous chunks for context
-        'header_context': {'S': ''},  # Chunk 1's header info — authoritative source for all subsequent chunks
+        # Page-1 header from the splitter's header pass; chunks start with it immediately.
+        # When the pass failed (header_status "pending") chunk 1 fills it in as before.
+        'header_context': {'S': header_context},
+        'header_status': {'S': 'ready' if header_context else 'pending'},
         'expected_lines': {'N': str(expected_lines)},  # Hint for chunk processors
         'bill_from': {'S': bill_from},  # Vendor hint for chunk processors
         'pages_per_chunk': {'N': str(pages_per_chunk)},  # Pages per chunk for page tracking
+        # Planned 1-based page range of each chunk ("3-5"); chunks may differ in size
+        'chunk_pages': {'L': [{'S': f"{a + 1}-{b}"} for a, b in (chunk_pages or [])]},
+        'vendor': {'S': vendor},  # Key for the per-vendor chunk stats the aggregator rolls up
         'expected_account_number': {'S': expected_account_number},  # Account number hint for chunk processors
         'notes': {'S': notes[:1900] if notes else ''},  # Free-form rework instructions for chunk processors
+        'rework': {'BOOL': rework},  # Reworks bypass the parse cache in chunk processors
     }
     ddb.put_item(TableName=JOBS_TABLE, Item=item)
     print(json.dumps({"message": "Job record created", "job_id": job_id, "total_chunks": total_chunks, "expected_lines": expected_lines, "pages_per_chunk": pages_per_chunk, "has_notes": bool(notes)}))
@@ -141,7 +355,7 @@ def lambda_handler(event, context):
     """
     Chunk Splitter Handler:
     1. Receives large PDF from S3
-    2. Splits into chunks (5 pages each)
+    2. Plans chunk boundaries and splits into chunks
     3. Saves chunks to S3 (triggers chunk processor)
     4. Creates job tracking record in DynamoDB
     """
@@ -177,20 +391,42 @@ def lambda_handler(event, context):
             print(json.dumps({"error": "failed_to_download", "key": dest_key_inputs, "message": str(e)}))
             continue
 
+        # Get rework metadata (expected_lines, bill_from, expected_account_number) from sidecar files
+        metadata = get_rework_metadata(bucket, key)
+
+        # Header pass before any chunk exists, so no chunk has to wait on chunk 1
+        header_context = extract_header_context(bucket, pdf_bytes, use_cache=not metadata.get('rework', False))
+        print(json.dumps({"message": "Header pass", "job_id": job_id, "ok": bool(header_context)}))
+        vendor_match = re.search(r'Vendor:\s*([^|]*)', header_context)
+        vendor = metadata['bill_from'] or (vendor_match.group(1).strip() if vendor_match else '')
+
+        # Plan chunk boundaries (falls back to the fixed split if planning fails)
+        page_ranges = None
+        if ADAPTIVE_CHUNKING:
+            try:
+                page_ranges, plan_info = plan_pdf_chunks(bucket, pdf_bytes, vendor)
+                print(json.dumps({"message": "Chunk plan", "job_id": job_id, "vendor": vendor, **plan_info}))
+            except Exception as e:
+                print(json.dumps({"warning": "chunk_plan_failed", "job_id": job_id, "message": str(e)[:200]}))
+                page_ranges = None
+
         # Split into chunks
-        chunks = split_pdf_into_chunks(pdf_bytes, PAGES_PER_CHUNK)
+        chunks = split_pdf_into_chunks(pdf_bytes, PAGES_PER_CHUNK, page_ranges)
         if not chunks:
             failed_key = f"{FAILED_PREFIX}{suffix}"
             s3.copy_object(Bucket=bucket, CopySource={'Bucket': bucket, 'Key': dest_key_inputs}, Key=failed_key)
             print(json.dumps({"error": "failed_to_split_pdf", "failed_key": failed_key}))
             continue
+        if not page_ranges:
+            page_ranges = [(i * PAGES_PER_CHUNK, (i + 1) * PAGES_PER_CHUNK) for i in range(len(chunks))]
+        max_chunk_pages = max(b - a for a, b in page_ranges)
 
         print(json.dumps({
             "message": "Splitting large PDF",
             "job_id": job_id,
             "source_file": suffix,
             "total_chunks": len(chunks),
-            "pages_per_chunk": PAGES_PER_CHUNK
+            "pages_per_chunk": max_chunk_pages
         }))
 
         # Build chunk keys list first
@@ -200,9 +436,6 @@ def lambda_handler(event, context):
             chunk_key = f"{CHUNKS_PREFIX}{job_id}/chunk_{chunk_num}.pdf"
             chunk_keys.append(chunk_key)
 
-        # Get rework metadata (expected_lines, bill_from, expected_account_number) from sidecar files
-        metadata = get_rework_metadata(bucket, key)
-
         # CRITICAL: Create job tracking record BEFORE uploading chunks
         # Chunk processors are triggered by S3 events and need the job record to exist
         try:
@@ -210,7 +443,11 @@ def lambda_handler(event, context):
                             expected_lines=metadata['expected_lines'],
                             bill_from=metadata['bill_from'],
                             notes=metadata.get('notes', ''),
-                            pages_per_chunk=PAGES_PER_CHUNK,
+                            rework=metadata.get('rework', False),
+                            header_context=header_context,
+                            pages_per_chunk=max_chunk_pages,
+                            chunk_pages=page_ranges,
+                            vendor=vendor,
                             expected_account_number=metadata['expected_account_number'])
         except Exception as e:
             print(json.dumps({"error": "failed_to_create_job_record", "job_id": job_id, "message": str(e)}))
@@ -0,0 +1,62 @@
+"""
+Content-addressed parse cache - shared by the parser, chunk processor and large-file splitter Lambdas
+
+Each Lambda is zipped from its own code/ dir, so every one carries a copy of this
+file; tests/unit/lambdas/test_parse_cache.py fails if the copies drift apart.
+Edit one copy and copy it over the others.
+
+- An entry is keyed by sha256(model, prompt, content bytes): identical bytes parsed
+  with the same prompt and model reuse the earlier answer instead of calling Gemini
+- Entries hold {"model", "rows", "context_summary", "source", "created_at"}
+- Expiry is an S3 lifecycle rule on the prefix; PARSE_CACHE_MAX_AGE_DAYS guards reads
+"""
+import os
+import json
+import hashlib
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+
+PARSE_CACHE_PREFIX = os.getenv("PARSE_CACHE_PREFIX", "Bill_Parser_Cache/parse/")
+PARSE_CACHE_ENABLED = os.getenv("PARSE_CACHE_ENABLED", "1") == "1"
+PARSE_CACHE_MAX_AGE_DAYS = int(os.getenv("PARSE_CACHE_MAX_AGE_DAYS", "30"))
+
+
+def cache_key(content: bytes, prompt: str, model: str) -> str:
+    """S3 key for a parse of these exact bytes with this prompt and model."""
+    content_sha = hashlib.sha256(content).hexdigest()
+    prompt_sha = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    digest = hashlib.sha256(f"{model}\n{prompt_sha}\n{content_sha}".encode("utf-8")).hexdigest()
+    return f"{PARSE_CACHE_PREFIX}{digest[:2]}/{digest}.json"
+
+
+def get(s3, bucket: str, key: str):
+    """Cached entry, or None when disabled, missing, expired or unreadable."""
+    if not PARSE_CACHE_ENABLED:
+        return None
+    try:
+        entry = json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read().decode("utf-8"))
+        created = datetime.fromisoformat(entry["created_at"])
+        if (datetime.now(timezone.utc) - created).days >= PARSE_CACHE_MAX_AGE_DAYS:
+            return None
+        return entry
+    except ClientError as e:
+        # A miss is the normal case; only log real read failures
+        if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+            print(json.dumps({"message": "parse_cache_read_failed", "key": key, "error": str(e)[:200]}))
+        return None
+    except Exception as e:
+        print(json.dumps({"message": "parse_cache_read_failed", "key": key, "error": str(e)[:200]}))
+        return None
+
+
+def put(s3, bucket: str, key: str, model: str, rows: list, context_summary: str = "", source: str = ""):
+    """Store an entry; a failed write is logged and otherwise ignored."""
+    if not PARSE_CACHE_ENABLED:
+        return
+    entry = {"model": model, "rows": rows, "context_summary": context_summary, "source": source,
+             "created_at": datetime.now(timezone.utc).isoformat()}
+    try:
+        s3.put_object(Bucket=bucket, Key=key, Body=json.dumps(entry, ensure_ascii=False).encode("utf-8"),
+                      ContentType="application/json")
+    except Exception as e:
+        print(json.dumps({"message": "parse_cache_write_failed", "key": key, "error": str(e)[:200]}))
@@ -0,0 +1,237 @@
+"""
+Gemini API key pool - shared by the parser, chunk processor and large-file splitter Lambdas
+
+Each Lambda is zipped from its own code/ dir, so every one carries a copy of this
+file; tests/unit/lambdas/test_gemini_key_pool.py fails if the copies drift apart.
+Edit one copy and copy it over the others.
+
+- Secret strings are cached for the life of a warm container (SECRET_TTL_SECONDS)
+- Each key gets a token bucket (GEMINI_KEY_RPM, GEMINI_KEY_BURST) so one container
+  can't fire a burst of calls at the same key
+- A 429 puts the key in cooldown (doubling on repeated 429s, long cooldown for a daily
+  quota). Cooldowns are written to DynamoDB so concurrent Lambdas skip the key too
+- Keys are picked at random, weighted by their recent success rate
+"""
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from datetime import datetime, timezone
+
+KEY_POOL_TABLE = os.getenv("KEY_POOL_TABLE", "jrk-bill-config")
+KEY_POOL_PK = "GEMINI_KEY_HEALTH"
+SECRET_TTL_SECONDS = int(os.getenv("SECRET_TTL_SECONDS", "900"))
+KEY_RPM = float(os.getenv("GEMINI_KEY_RPM", "30"))
+KEY_BURST = float(os.getenv("GEMINI_KEY_BURST", "5"))
+RATE_LIMIT_COOLDOWN_SECONDS = 20  # First 429; doubles per consecutive 429 on the same key
+MAX_COOLDOWN_SECONDS = 300
+QUOTA_COOLDOWN_SECONDS = 1800  # Daily quota exhausted - the key is done for a while
+HEALTH_REFRESH_SECONDS = 15  # How often a container re-reads cooldowns written by others
+HEALTH_FLUSH_SECONDS = 60  # How often a container writes its success rates
+SUCCESS_EWMA_ALPHA = 0.2
+MIN_WEIGHT = 0.05  # A key with a bad run still gets picked now and then
+
+_SECRETS = {}  # secret_id -> (fetched_at, secret string)
+_POOLS = {}  # tuple(keys) -> KeyPool
+
+
+def get_secret_string(secrets_client, secret_id: str) -> str:
+    """SecretString for secret_id, cached across warm invocations."""
+    now = time.time()
+    hit = _SECRETS.get(secret_id)
+    if hit and now - hit[0] < SECRET_TTL_SECONDS:
+        return hit[1]
+    raw = secrets_client.get_secret_value(SecretId=secret_id).get("SecretString") or ""
+    _SECRETS[secret_id] = (now, raw)
+    return raw
+
+
+def parse_keys(raw: str, limit: int = 10) -> list:
+    """API keys from a secret string: {"keys": [...]}, a JSON list, or comma/newline separated."""
+    raw = (raw or "").strip()
+    if not raw:
+        return []
+    try:
+        parsed = json.loads(raw)
+        if isinstance(parsed, dict) and isinstance(parsed.get("keys"), list):
+            parsed = parsed["keys"]
+        if isinstance(parsed, list):
+            return [k for k in (str(x).strip() for x in parsed) if k][:limit]
+    except ValueError:
+        pass
+    sep = "," if "," in raw else "\n"
+    return [k.strip() for k in raw.split(sep) if k.strip()][:limit]
+
+
+def key_id(api_key: str) -> str:
+    """Stable, non-secret identifier for a key (logs and DynamoDB)."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def classify_error(error) -> str:
+    """'quota' for an exhausted daily quota, 'rate' for other 429s, '' otherwise."""
+    text = str(error or "")
+    if "429" not in text and "RESOURCE_EXHAUSTED" not in text:
+        return ""
+    if "PerDay" in text or "per day" in text.lower():
+        return "quota"
+    return "rate"
+
+
+class _KeyState:
+    def __init__(self, api_key: str):
+        self.key = api_key
+        self.kid = key_id(api_key)
+        self.tokens = KEY_BURST
+        self.refilled_at = time.time()
+        self.cooldown_until = 0.0
+        self.strikes = 0  # Consecutive 429s
+        self.success_rate = 1.0
+
+    def refill(self, now: float):
+        self.tokens = min(KEY_BURST, self.tokens + (now - self.refilled_at) * KEY_RPM / 60.0)
+        self.refilled_at = now
+
+    def free_at(self, now: float) -> float:
+        token_wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) * 60.0 / max(KEY_RPM, 0.001)
+        return max(self.cooldown_until, now + token_wait)
+
+
+class KeyPool:
+    """Per-container key selection with cross-Lambda cooldowns."""
+
+    def __init__(self, keys: list, ddb_client=None, table: str = KEY_POOL_TABLE):
+        self.states = [_KeyState(k) for k in dict.fromkeys(keys) if k]
+        self.ddb = ddb_client
+        self.table = table
+        self.refreshed_at = 0.0
+        self.flushed_at = time.time()
+        self.lock = threading.Lock()
+
+    def _state(self, api_key: str):
+        return next((s for s in self.states if s.key == api_key), None)
+
+    def acquire(self, max_wait: float = 60.0) -> str:
+        """Key for the next call.
+
+        Picks among keys that are out of cooldown and have a token, weighted by success
+        rate. When none is ready, sleeps once (at most max_wait) for the key that frees
+        up first and returns it.
+        """
+        if not self.states:
+            return None
+        self.refresh()
+        with self.lock:
+            now = time.time()
+            for s in self.states:
+                s.refill(now)
+            ready = [s for s in self.states if s.cooldown_until <= now and s.tokens >= 1]
+            if ready:
+                state = random.choices(ready, weights=[max(MIN_WEIGHT, s.success_rate) for s in ready])[0]
+                state.tokens -= 1
+                return state.key
+            state = min(self.states, key=lambda s: s.free_at(now))
+            wait = min(max(0.0, max_wait), max(0.0, state.free_at(now) - now))
+        if wait > 0:
+            print(json.dumps({"message": "key_pool_wait", "key_id": state.kid, "wait_seconds": round(wait, 2)}))
+            time.sleep(wait)
+        with self.lock:
+            state.refill(time.time())
+            state.tokens = max(0.0, state.tokens - 1)
+        return state.key
+
+    def report(self, api_key: str, ok: bool, error=None):
+        """Record the outcome of a call made with api_key."""
+        state = self._state(api_key)
+        if state is None:
+            return
+        kind = "" if ok else classify_error(error)
+        with self.lock:
+            state.success_rate += SUCCESS_EWMA_ALPHA * ((1.0 if ok else 0.0) - state.success_rate)
+            if ok:
+                state.strikes = 0
+            elif kind:
+                state.strikes += 1
+                cooldown = QUOTA_COOLDOWN_SECONDS if kind == "quota" else min(
+                    MAX_COOLDOWN_SECONDS, RATE_LIMIT_COOLDOWN_SECONDS * 2 ** (state.strikes - 1))
+                state.cooldown_until = max(state.cooldown_until, time.time() + cooldown)
+        if kind:
+            print(json.dumps({"warning": "key_cooldown", "key_id": state.kid, "kind": kind,
+                              "cooldown_seconds": round(state.cooldown_until - time.time(), 1)}))
+            self._put_health(state, cooldown=True)
+        elif time.time() - self.flushed_at >= HEALTH_FLUSH_SECONDS:
+            self.flush()
+
+    def refresh(self, force: bool = False):
+        """Pull cooldowns and success rates written by other Lambdas."""
+        now = time.time()
+        if self.ddb is None or (not force and now - self.refreshed_at < HEALTH_REFRESH_SECONDS):
+            return
+        self.refreshed_at = now
+        try:
+            resp = self.ddb.query(
+                TableName=self.table,
+                KeyConditionExpression="PK = :pk",
+                ExpressionAttributeValues={":pk": {"S": KEY_POOL_PK}},
+            )
+            items = {i["SK"]["S"]: i for i in resp.get("Items", [])}
+        except Exception as e:
+            print(json.dumps({"warning": "key_pool_refresh_failed", "error": str(e)[:200]}))
+            return
+        with self.lock:
+            for s in self.states:
+                item = items.get(f"KEY#{s.kid}")
+                if not item:
+                    continue
+                s.cooldown_until = max(s.cooldown_until, float(item.get("cooldown_until", {}).get("N", "0")))
+                if "success_rate" in item:
+                    s.success_rate = (s.success_rate + float(item["success_rate"]["N"])) / 2
+
+    def flush(self):
+        """Write this container's success rates (cooldowns are written as they happen)."""
+        self.flushed_at = time.time()
+        for s in self.states:
+            self._put_health(s, cooldown=False)
+
+    def _put_health(self, state: _KeyState, cooldown: bool):
+        if self.ddb is None:
+            return
+        expr = "SET success_rate = :r, updated_at = :t"
+        values = {
+            ":r": {"N": f"{state.success_rate:.3f}"},
+            ":t": {"S": datetime.now(timezone.utc).isoformat()},
+        }
+        kwargs = {}
+        if cooldown:
+            # Never shorten a longer cooldown another Lambda already wrote
+            expr += ", cooldown_until = :c"
+            values[":c"] = {"N": f"{state.cooldown_until:.0f}"}
+            kwargs["ConditionExpression"] = "attribute_not_exists(cooldown_until) OR cooldown_until < :c"
+        try:
+            self.ddb.update_item(
+                TableName=self.table,
+                Key={"PK": {"S": KEY_POOL_PK}, "SK": {"S": f"KEY#{state.kid}"}},
+                UpdateExpression=expr,
+                ExpressionAttributeValues=values,
+                **kwargs,
+            )
+        except Exception as e:
+            if "ConditionalCheckFailed" not in str(e):
+                print(json.dumps({"warning": "key_pool_write_failed", "key_id": state.kid, "error": str(e)[:200]}))
+
+
+def get_pool(keys: list, ddb_client=None) -> KeyPool:
+    """The container's pool for this key set (kept across warm invocations)."""
+    pool_key = tuple(keys)
+    pool = _POOLS.get(pool_key)
+    if pool is None:
+        pool = _POOLS[pool_key] = KeyPool(keys, ddb_client)
+    return pool
+
+
+def reset_pools():
+    """Drop cached pools and secrets (tests, or after a key rotation)."""
+    _POOLS.clear()
+    _SECRETS.clear()
@@ -11,6 +11,8 @@ from io import BytesIO
 from urllib.parse import unquote_plus
 from datetime import datetime, timezone
 from error_tracker import log_parser_error, extract_gemini_error_code
+import gemini_key_pool
+import parse_cache
 
 # Optional PyPDF2 import for page counting (gracefully degrade if not available)
 try:
@@ -305,8 +307,7 @@ def get_keys_from_secret() -> list:
     - Plaintext: newline or comma separated
     - {"key1":"k1","key2":"k2","key3":"k3"}
     """
-    resp = secrets.get_secret_value(SecretId=PARSER_SECRET_NAME)
-    raw = resp.get("SecretString")
+    raw = gemini_key_pool.get_secret_string(secrets, PARSER_SECRET_NAME)  # Cached while warm
     if not raw:
         return []
     raw = raw.strip()
@@ -339,8 +340,7 @@ def get_keys_from_secret() -> list:
 
 def get_matcher_keys_from_secret() -> list:
     """Return up to 3 enrichment (matcher) API keys from Secrets Manager, tolerant to multiple formats."""
-    resp = secrets.get_secret_value(SecretId=MATCHER_SECRET_NAME)
-    raw = resp.get("SecretString")
+    raw = gemini_key_pool.get_secret_string(secrets, MATCHER_SECRET_NAME)  # Cached while warm
     if not raw:
         return []
     raw = raw.strip()
@@ -518,7 +518,70 @@ def _normalize_reply(text: str) -> str:
     return "\n".join(lines)
 
 
-def call_gemini_with_retry_rest(api_key: str, pdf_bytes: bytes, source_name: str):
+def _build_base_prompt() -> str:
+    """PROMPT plus the rework hints for the current file (first-attempt prompt)."""
+    prompt = PROMPT
+    # Reviewer's free-form rework instructions get top billing — these are
+    # human-verified and override the model's default behavior. e.g.
+    # "skip the summary page, parse pages 2-4 for all line items".
+    if __REWORK_NOTES:
+        prompt += (f"\n\n**USER REWORK INSTRUCTIONS** (a human reviewer who has the actual bill in front of them said): "
+                   f"{__REWORK_NOTES}\n"
+                   "Follow these instructions exactly. They override your default behavior.")
+    # Add expected_account_number hint if provided from rework metadata
+    if __EXPECTED_ACCOUNT_NUMBER:
+        prompt += (f"\n\n**ACCOUNT NUMBER CORRECTION**: A human reviewer has verified that the correct Account Number for this bill is '{__EXPECTED_ACCOUNT_NUMBER}'. "
+                   f"You MUST use '{__EXPECTED_ACCOUNT_NUMBER}' as the Account Number (digits only) for ALL rows. "
+                   "Do NOT use any other account number found on the bill.")
+    # Add expected_lines hint if provided from rework metadata
+    if __EXPECTED_LINES and __EXPECTED_LINES > 0:
+        prompt += (f"\n\n**CRITICAL REQUIREMENT**: A human reviewer has verified this bill contains EXACTLY {__EXPECTED_LINES} line items. "
+                   f"You MUST output EXACTLY {__EXPECTED_LINES} rows of data. This is NOT optional. "
+                   f"The human can see the bill and has counted {__EXPECTED_LINES} distinct charges/line items. "
+                   "Look carefully at EVERY charge on the bill including: base charges, usage charges, fees, taxes, surcharges, credits, adjustments, and any other itemized amounts. "
+                   "Each distinct charge MUST be its own row. Do NOT combine or aggregate charges. Do NOT skip any charges. "
+                   f"If you cannot find {__EXPECTED_LINES} line items, look harder - they are there. Check for charges that may appear in different sections or formats.\n\n"
+                   "**COLUMN ORDER - ALL 30 COLUMNS IN EXACT ORDER**:\n"
+                   "1. Bill To Name First Line (customer name)\n"
+                   "2. Bill To Name Second Line (customer name line 2)\n"
+                   "3. Vendor Name (utility company name)\n"
+                   "4. Invoice Number\n"
+                   "5. Account Number (digits only)\n"
+                   "6. Line Item Account Number\n"
+                   "7. Service Address (street address)\n"
+                   "8. Service City\n"
+                   "9. Service Zipcode\n"
+                   "10. Service State (2-letter code)\n"
+                   "11. Meter Number (meter ID)\n"
+                   "12. Meter Size (physical size: 5/8\", 1\", 2\" etc - NOT 'House')\n"
+                   "13. House Or Vacant (always 'House')\n"
+                   "14. Bill Period Start (date MM/DD/YYYY)\n"
+                   "15. Bill Period End (date MM/DD/YYYY)\n"
+                   "16. Utility Type (Electricity|Gas|Water|Sewer|Trash|Stormwater|HOA|Internet|Phone)\n"
+                   "17. Consumption Amount (numeric usage)\n"
+                   "18. Unit of Measure (kWh, CCF, gallons, therms)\n"
+                   "19. Previous Reading (numeric)\n"
+                   "20. Previous Reading Date (date)\n"
+                   "21. Current Reading (numeric)\n"
+                   "22. Current Reading Date (date)\n"
+                   "23. Rate (price per unit)\n"
+                   "24. Number of Days\n"
+                   "25. Line Item Description (TEXT like 'Water Usage', 'Electric Charge' - NOT a number)\n"
+                   "26. Line Item Charge (DOLLAR AMOUNT like 32.41 - MUST be a number)\n"
+                   "27. Bill Date (date MM/DD/YYYY)\n"
+                   "28. Due Date (date MM/DD/YYYY)\n"
+                   "29. Special Instructions (max 50 chars)\n"
+                   "30. Inferred Fields\n"
+                   "CRITICAL: Column 25 must be TEXT description, Column 26 must be DOLLAR AMOUNT. Do NOT swap them.")
+    return prompt
+
+
+def call_gemini_with_retry_rest(api_key: str, pdf_bytes: bytes, source_name: str, pool=None):
+    """Parse one PDF with content/format retries.
+
+    With a key pool, a 429 cools the key down and the next attempt takes another key
+    from the pool instead of backing off on the same one.
+    """
     global __EXPECTED_LINES
     attempts = 0
     prev_reply = ""
@@ -533,59 +596,7 @@ def call_gemini_with_retry_rest(api_key: str, pdf_bytes: bytes, source_name: str
         effective_max_attempts = max(MAX_ATTEMPTS, 14)
     while attempts < effective_max_attempts:
         attempts += 1
-        prompt = PROMPT
-        # Reviewer's free-form rework instructions get top billing — these are
-        # human-verified and override the model's default behavior. e.g.
-        # "skip the summary page, parse pages 2-4 for all line items".
-        if __REWORK_NOTES:
-            prompt += (f"\n\n**USER REWORK INSTRUCTIONS** (a human reviewer who has the actual bill in front of them said): "
-                       f"{__REWORK_NOTES}\n"
-                       "Follow these instructions exactly. They override your default behavior.")
-        # Add expected_account_number hint if provided from rework metadata
-        if __EXPECTED_ACCOUNT_NUMBER:
-            prompt += (f"\n\n**ACCOUNT NUMBER CORRECTION**: A human reviewer has verified that the correct Account Number for this bill is '{__EXPECTED_ACCOUNT_NUMBER}'. "
-                       f"You MUST use '{__EXPECTED_ACCOUNT_NUMBER}' as the Account Number (digits only) for ALL rows. "
-                       "Do NOT use any other account number found on the bill.")
-        # Add expected_lines hint if provided from rework metadata
-        if __EXPECTED_LINES and __EXPECTED_LINES > 0:
-            prompt += (f"\n\n**CRITICAL REQUIREMENT**: A human reviewer has verified this bill contains EXACTLY {__EXPECTED_LINES} line items. "
-                       f"You MUST output EXACTLY {__EXPECTED_LINES} rows of data. This is NOT optional. "
-                       f"The human can see the bill and has counted {__EXPECTED_LINES} distinct charges/line items. "
-                       "Look carefully at EVERY charge on the bill including: base charges, usage charges, fees, taxes, surcharges, credits, adjustments, and any other itemized amounts. "
-                       "Each distinct charge MUST be its own row. Do NOT combine or aggregate charges. Do NOT skip any charges. "
-                       f"If you cannot find {__EXPECTED_LINES} line items, look harder - they are there. Check for charges that may appear in different sections or formats.\n\n"
-                       "**COLUMN ORDER - ALL 30 COLUMNS IN EXACT ORDER**:\n"
-                       "1. Bill To Name First Line (customer name)\n"
-                       "2. Bill To Name Second Line (customer name line 2)\n"
-                       "3. Vendor Name (utility company name)\n"
-                       "4. Invoice Number\n"
-                       "5. Account Number (digits only)\n"
-                       "6. Line Item Account Number\n"
-                       "7. Service Address (street address)\n"
-                       "8. Service City\n"
-                       "9. Service Zipcode\n"
-                       "10. Service State (2-letter code)\n"
-                       "11. Meter Number (meter ID)\n"
-                       "12. Meter Size (physical size: 5/8\", 1\", 2\" etc - NOT 'House')\n"
-                       "13. House Or Vacant (always 'House')\n"
-                       "14. Bill Period Start (date MM/DD/YYYY)\n"
-                       "15. Bill Period End (date MM/DD/YYYY)\n"
-                       "16. Utility Type (Electricity|Gas|Water|Sewer|Trash|Stormwater|HOA|Internet|Phone)\n"
-                       "17. Consumption Amount (numeric usage)\n"
-                       "18. Unit of Measure (kWh, CCF, gallons, therms)\n"
-                       "19. Previous Reading (numeric)\n"
-                       "20. Previous Reading Date (date)\n"
-                       "21. Current Reading (numeric)\n"
-                       "22. Current Reading Date (date)\n"
-                       "23. Rate (price per unit)\n"
-                       "24. Number of Days\n"
-                       "25. Line Item Description (TEXT like 'Water Usage', 'Electric Charge' - NOT a number)\n"
-                       "26. Line Item Charge (DOLLAR AMOUNT like 32.41 - MUST be a number)\n"
-                       "27. Bill Date (date MM/DD/YYYY)\n"
-                       "28. Due Date (date MM/DD/YYYY)\n"
-                       "29. Special Instructions (max 50 chars)\n"
-                       "30. Inferred Fields\n"
-                       "CRITICAL: Column 25 must be TEXT description, Column 26 must be DOLLAR AMOUNT. Do NOT swap them.")
+        prompt = _build_base_prompt()
         if attempts > 1 and prev_reply:
             excerpt = prev_reply[:1500]
             prompt += ("\n\nYou previously returned data with formatting errors. "
@@ -603,8 +614,15 @@ def call_gemini_with_retry_rest(api_key: str, pdf_bytes: bytes, source_name: str
                        "- Line Item Charge is a DOLLAR AMOUNT (a number like 32.41), NOT a date")
         try:
             reply_text = call_gemini_rest(api_key, pdf_bytes, prompt)
+            if pool is not None:
+                pool.report(api_key, ok=True)
         except Exception as e:
             prev_reply = str(e)
+            if pool is not None:
+                pool.report(api_key, ok=False, error=e)
+                if gemini_key_pool.classify_error(e):
+                    api_key = pool.acquire(max_wait=30)  # Waits only if every key is cooling down
+                    continue
             backoff = min(2 ** (attempts - 1), 30)  # 1, 2, 4, 8, 16, 30, 30...
             jitter = random.uniform(0, backoff * 0.3)
             time.sleep(backoff + jitter)
@@ -891,6 +909,7 @@ def lambda_handler(event, context):
         expected_lines = 0
         expected_account_number = ""
         rework_notes = ""
+        is_rework = False
         try:
             pending_side = key.rsplit('.',1)[0] + '.notes.json'
             print(json.dumps({"message": "Looking for notes.json", "pending_side": pending_side, "bucket": bucket}))
@@ -913,6 +932,7 @@ def lambda_handler(event, context):
             rework_obj = s3.get_object(Bucket=bucket, Key=rework_side)
             rework_body = rework_obj['Body'].read().decode('utf-8','ignore')
             rework = json.loads(rework_body)
+            is_rework = True
             if not bill_from:
                 bill_from = str(rework.get('Bill From') or rework.get('bill_from') or '').strip()
             if not expected_lines:
@@ -994,37 +1014,49 @@ def lambda_handler(event, context):
         if total_pages > 0:
             print(json.dumps({"message": "PDF page count", "total_pages": total_pages, "key": key}))
 
-        # Fetch keys after moving the file, so Pending stays clean even if secret is malformed
-        keys = get_keys_from_secret()
-        if not keys:
-            # Move to failed for visibility
-            failed_key = f"{FAILED_PREFIX}{suffix}"
-            s3.copy_object(Bucket=bucket, CopySource={"Bucket": bucket, "Key": dest_key_inputs}, Key=failed_key)
-            print(json.dumps({"message": "No valid Gemini keys found in secret; moved to failed", "failed_key": failed_key}))
-            continue
-
         _pipeline_track(key, "PARSE_STARTED", "lambda:parser", "S3", {"pages": total_pages})
 
-        # Outer loop: retry with different API keys on total failure (inner loop handles content retries)
+        # Identical bytes + prompt + model were parsed before (duplicate ingest paths):
+        # reuse the rows. Reworks always re-parse since the reviewer wants a fresh answer.
+        cache_key = parse_cache.cache_key(pdf_bytes, _build_base_prompt(), MODEL_NAME)
+        cached = None if is_rework else parse_cache.get(s3, BUCKET, cache_key)
+        cached_rows = cached["rows"] if cached else None
+        timing["cacheHit"] = cached_rows is not None
+
         t_gemini = time.time()
         attempt = 0
         last_error = None
         rows = []
         last_reply = ""  # Initialize to avoid UnboundLocalError
         failed_due_to_columns = False
-        _OUTER_MAX = min(3, len(keys))  # Only retry with different keys, inner loop handles content retries
-        while attempt < _OUTER_MAX:
-            attempt += 1
-            api_key = keys[(attempt - 1) % len(keys)]  # simple rotation among 3 keys
-            try:
-                rows, failed_due_to_columns, last_reply = call_gemini_with_retry_rest(api_key, pdf_bytes, source_name=suffix)
-                if rows or not failed_due_to_columns:
-                    break
-            except Exception as e:
-                last_error = str(e)
-                backoff = min(2 ** (attempt - 1), 30)
-                jitter = random.uniform(0, backoff * 0.3)
-                time.sleep(backoff + jitter)
+        if cached_rows is not None:
+            rows = [[*r, f"{suffix}"] for r in cached_rows]
+            print(json.dumps({"message": "Parse cache hit", "key": key, "cache_key": cache_key, "rows": len(rows)}))
+        else:
+            # Fetch keys after moving the file, so Pending stays clean even if secret is malformed
+            keys = get_keys_from_secret()
+            if not keys:
+                # Move to failed for visibility
+                failed_key = f"{FAILED_PREFIX}{suffix}"
+                s3.copy_object(Bucket=bucket, CopySource={"Bucket": bucket, "Key": dest_key_inputs}, Key=failed_key)
+                print(json.dumps({"message": "No valid Gemini keys found in secret; moved to failed", "failed_key": failed_key}))
+                continue
+
+            # Outer loop: retry with a different pool key on total failure (inner loop handles content retries)
+            pool = gemini_key_pool.get_pool(keys, ddb)
+            _OUTER_MAX = min(3, len(keys))  # Only retry with different keys, inner loop handles content retries
+            while attempt < _OUTER_MAX:
+                attempt += 1
+                api_key = pool.acquire(max_wait=30)
+                try:
+                    rows, failed_due_to_columns, last_reply = call_gemini_with_retry_rest(api_key, pdf_bytes, source_name=suffix, pool=pool)
+                    if rows or not failed_due_to_columns:
+                        break
+                except Exception as e:
+                    last_error = str(e)
+                    backoff = min(2 ** (attempt - 1), 30)
+                    jitter = random.uniform(0, backoff * 0.3)
+                    time.sleep(backoff + jitter)
 
         timing["geminiMs"] = int((time.time() - t_gemini) * 1000)
         timing["retryCount"] = attempt
@@ -1052,6 +1084,8 @@ def lambda_handler(event, context):
             timing["success"] = True
             key_stem = f"{dest_key_inputs.split('/',1)[-1].rsplit('.',1)[0]}"
             out_key = write_ndjson(BUCKET, key_stem, rows, dest_key_inputs, bill_from=bill_from, pdf_id=key_stem, total_pages=total_pages, submitted_by=submitted_by)
+            if cached_rows is None:
+                parse_cache.put(s3, BUCKET, cache_key, MODEL_NAME, [r[:-1] for r in rows], source=dest_key_inputs)
             print(json.dumps({"message": "Parsed and wrote NDJSON", "out_key": out_key, "rows": len(rows), "total_pages": total_pages}))
             _pipeline_track(key, "PARSE_COMPLETED", "lambda:parser", "S3", {"out_key": out_key, "lines": len(rows), "pages": total_pages})
             # Write timing sidecar to Stage 3
@@ -3,7 +3,10 @@ PDF Router Lambda - Routes PDFs to appropriate parser based on size/complexity
 Triggered by S3 ObjectCreated events on Bill_Parser_1_Pending_Parsing/
 """
 import os
+import re
 import json
+import time
+import zlib
 import boto3
 from urllib.parse import unquote_plus
 from datetime import datetime, timezone
@@ -50,6 +53,14 @@ ROUTER_TABLE = os.getenv("ROUTER_TABLE", "jrk-bill-router-log")
 MAX_PAGES_STANDARD = int(os.getenv("MAX_PAGES_STANDARD", "10"))
 MAX_SIZE_MB_STANDARD = int(os.getenv("MAX_SIZE_MB_STANDARD", "10"))
 
+# Page-count probe: below PAGE_PROBE_MIN_BYTES one GET beats several ranged round trips;
+# a probe that needs more than PAGE_PROBE_MAX_BYTES or PAGE_PROBE_MAX_REQUESTS gives up
+# and the whole PDF is read instead.
+PAGE_PROBE_MIN_BYTES = int(os.getenv("PAGE_PROBE_MIN_BYTES", str(2 * 1024 * 1024)))
+PAGE_PROBE_MAX_BYTES = int(os.getenv("PAGE_PROBE_MAX_BYTES", str(2 * 1024 * 1024)))
+PAGE_PROBE_MAX_REQUESTS = int(os.getenv("PAGE_PROBE_MAX_REQUESTS", "16"))
+PAGE_PROBE_CHUNK = 16 * 1024
+
 
 def count_pdf_pages(pdf_bytes: bytes) -> int:
     """Count pages in a PDF using PyPDF2."""
@@ -62,6 +73,313 @@ def count_pdf_pages(pdf_bytes: bytes) -> int:
         return -1  # Unknown page count
 
 
+class PdfProbeError(Exception):
+    """The PDF structure can't be resolved from ranged reads; read the whole file."""
+
+
+class RangeReader:
+    """Ranged reads of one object with a small segment cache and transfer counters.
+
+    fetch(start, end) returns bytes [start, end) -- an S3 Range GET in the Lambda,
+    a file slice in the benchmark.
+    """
+
+    def __init__(self, fetch, size: int, max_bytes: int = PAGE_PROBE_MAX_BYTES,
+                 max_requests: int = PAGE_PROBE_MAX_REQUESTS):
+        self.fetch = fetch
+        self.size = size
+        self.max_bytes = max_bytes
+        self.max_requests = max_requests
+        self.bytes_read = 0
+        self.requests = 0
+        self._segments = []  # [(start, bytes)]
+
+    def read(self, start: int, length: int) -> bytes:
+        start = max(0, start)
+        end = min(self.size, start + length)
+        for seg_start, data in self._segments:
+            if seg_start <= start and end <= seg_start + len(data):
+                return data[start - seg_start:end - seg_start]
+        fetch_end = min(self.size, max(end, start + PAGE_PROBE_CHUNK))
+        if self.requests >= self.max_requests or self.bytes_read + (fetch_end - start) > self.max_bytes:
+            raise PdfProbeError("probe budget exceeded")
+        data = self.fetch(start, fetch_end)
+        self.requests += 1
+        self.bytes_read += len(data)
+        self._segments.append((start, data))
+        return data[:end - start]
+
+    def read_until(self, start: int, marker: bytes) -> bytes:
+        """Bytes from start through the first occurrence of marker."""
+        length = PAGE_PROBE_CHUNK
+        while True:
+            data = self.read(start, length)
+            pos = data.find(marker)
+            if pos >= 0:
+                return data[:pos + len(marker)]
+            if start + len(data) >= self.size:
+                raise PdfProbeError(f"{marker!r} not found")
+            length *= 2
+
+
+_REF = rb"\s+(\d+)\s+(\d+)\s+R"
+_OBJ_HEADER_RE = re.compile(rb"\s*(\d+)\s+(\d+)\s+obj")
+
+
+def _dict_ref(d: bytes, name: bytes):
+    m = re.search(rb"/" + name + _REF, d)
+    return int(m.group(1)) if m else None
+
+
+def _dict_int(d: bytes, name: bytes):
+    m = re.search(rb"/" + name + rb"\s+(\d+)(?!\s+\d+\s+R)(?![\d.])", d)
+    return int(m.group(1)) if m else None
+
+
+def _dict_int_array(d: bytes, name: bytes):
+    m = re.search(rb"/" + name + rb"\s*\[([\d\s]*)\]", d)
+    return [int(x) for x in m.group(1).split()] if m else None
+
+
+def _png_unpredict(data: bytes, columns: int) -> bytes:
+    """Undo PNG row predictors (xref streams use bpp=1)."""
+    out = bytearray()
+    prev = bytearray(columns)
+    row_len = columns + 1
+    for i in range(0, len(data) - row_len + 1, row_len):
+        ftype = data[i]
+        row = bytearray(data[i + 1:i + row_len])
+        for j in range(columns):
+            left = row[j - 1] if j else 0
+            up = prev[j]
+            if ftype == 1:
+                row[j] = (row[j] + left) & 0xFF
+            elif ftype == 2:
+                row[j] = (row[j] + up) & 0xFF
+            elif ftype == 3:
+                row[j] = (row[j] + ((left + up) >> 1)) & 0xFF
+            elif ftype == 4:
+                up_left = prev[j - 1] if j else 0
+                pa, pb, pc = abs(up - up_left), abs(left - up_left), abs(left + up - 2 * up_left)
+                row[j] = (row[j] + (left if pa <= pb and pa <= pc else up if pb <= pc else up_left)) & 0xFF
+            elif ftype != 0:
+                raise PdfProbeError(f"bad PNG filter {ftype}")
+        out += row
+        prev = row
+    return bytes(out)
+
+
+class PdfPageCounter:
+    """Resolve /Root -> /Pages -> /Count through the cross-reference data only.
+
+    Handles classic xref tables, xref streams (Flate, PNG predictors), hybrid files,
+    incremental updates (/Prev chains) and objects inside object streams. Anything
+    else raises PdfProbeError.
+    """
+
+    def __init__(self, reader: RangeReader):
+        self.r = reader
+        self.xref = {}  # obj num -> ("n", offset) | ("c", objstm num, index)
+        self.trailer = b""
+        self._objstm_cache = {}
+
+    def count(self) -> int:
+        # One ranged read of the tail usually covers startxref, the trailer and a classic xref
+        tail = self.r.read(max(0, self.r.size - PAGE_PROBE_CHUNK), PAGE_PROBE_CHUNK)[-1024:]
+        pos = tail.rfind(b"startxref")
+        if pos < 0:
+            raise PdfProbeError("no startxref")
+        m = re.match(rb"startxref\s+(\d+)", tail[pos:])
+        if not m:
+            raise PdfProbeError("bad startxref")
+        self._load_xref_chain(int(m.group(1)))
+        root = _dict_ref(self.trailer, b"Root")
+        if root is None:
+            raise PdfProbeError("no /Root")
+        pages = _dict_ref(self._object(root)[0], b"Pages")
+        if pages is None:
+            raise PdfProbeError("no /Pages")
+        pages_dict = self._object(pages)[0]
+        count_ref = _dict_ref(pages_dict, b"Count")
+        if count_ref is not None:
+            m = re.match(rb"\s*(\d+)", self._object(count_ref)[0])
+            return int(m.group(1)) if m else self._fail("bad /Count")
+        n = _dict_int(pages_dict, b"Count")
+        return n if n is not None else self._fail("no /Count")
+
+    def _fail(self, why: str):
+        raise PdfProbeError(why)
+
+    def _load_xref_chain(self, offset: int):
+        seen = set()
+        while offset is not None:
+            if offset in seen or offset >= self.r.size:
+                raise PdfProbeError("bad xref offset")
+            seen.add(offset)
+            head = self.r.read(offset, 16)
+            if head.lstrip().startswith(b"xref"):
+                trailer = self._read_xref_table(offset)
+                stm = _dict_int(trailer, b"XRefStm")
+                if stm is not None:
+                    self._read_xref_stream(stm)
+            else:
+                trailer = self._read_xref_stream(offset)
+            if not self.trailer:
+                self.trailer = trailer
+            offset = _dict_int(trailer, b"Prev")
+
+    def _read_xref_table(self, offset: int) -> bytes:
+        data = self.r.read_until(offset, b"trailer")
+        pos = data.find(b"xref") + 4
+        entry_re = re.compile(rb"\s*(\d{10})\s(\d{5})\s([nf])")
+        head_re = re.compile(rb"\s*(\d+)\s+(\d+)")
+        while True:
+            m = head_re.match(data, pos)
+            if not m:
+                break
+            first, n = int(m.group(1)), int(m.group(2))
+            pos = m.end()
+            for i in range(n):
+                e = entry_re.match(data, pos)
+                if not e:
+                    raise PdfProbeError("bad xref entry")
+                pos = e.end()
+                if e.group(3) == b"n":
+                    self.xref.setdefault(first + i, ("n", int(e.group(1))))
+                else:
+                    self.xref.setdefault(first + i, None)
+        trailer_at = offset + data.rfind(b"trailer")
+        return self.r.read_until(trailer_at, b"startxref")
+
+    def _read_xref_stream(self, offset: int) -> bytes:
+        d, stream = self._object_at(offset)
+        if b"/XRef" not in d or stream is None:
+            raise PdfProbeError("not an xref stream")
+        widths = _dict_int_array(d, b"W")
+        if not widths or len(widths) != 3:
+            raise PdfProbeError("bad /W")
+        index = _dict_int_array(d, b"Index") or [0, _dict_int(d, b"Size") or 0]
+        raw = self._decode(d, stream)
+        w0, w1, w2 = widths
+        row = w0 + w1 + w2
+        pos = 0
+        for first, n in zip(index[0::2], index[1::2]):
+            for num in range(first, first + n):
+                rec = raw[pos:pos + row]
+                if len(rec) < row:
+                    raise PdfProbeError("short xref stream")
+                pos += row
+                kind = int.from_bytes(rec[:w0], "big") if w0 else 1
+                f2 = int.from_bytes(rec[w0:w0 + w1], "big")
+                f3 = int.from_bytes(rec[w0 + w1:], "big")
+                if kind == 1:
+                    self.xref.setdefault(num, ("n", f2))
+                elif kind == 2:
+                    self.xref.setdefault(num, ("c", f2, f3))
+                else:
+                    self.xref.setdefault(num, None)
+        return d
+
+    def _decode(self, d: bytes, stream: bytes) -> bytes:
+        filt = re.search(rb"/Filter\s*\[?\s*/(\w+)", d)
+        if filt and filt.group(1) != b"FlateDecode":
+            raise PdfProbeError(f"unsupported filter {filt.group(1)!r}")
+        if re.search(rb"/Filter\s*\[\s*/\w+\s*/\w+", d):
+            raise PdfProbeError("filter chain")
+        data = zlib.decompress(stream) if filt else stream
+        predictor = _dict_int(d, b"Predictor") or 1
+        if predictor >= 10:
+            return _png_unpredict(data, _dict_int(d, b"Columns") or 1)
+        if predictor != 1:
+            raise PdfProbeError(f"unsupported predictor {predictor}")
+        return data
+
+    def _object(self, num: int):
+        """(dictionary-or-value bytes, raw stream bytes or None) for an object number."""
+        entry = self.xref.get(num)
+        if not entry:
+            raise PdfProbeError(f"object {num} not in xref")
+        if entry[0] == "n":
+            return self._object_at(entry[1], num)
+        if b"/Encrypt" in self.trailer:
+            raise PdfProbeError("encrypted object stream")
+        return self._object_in_stream(entry[1], entry[2]), None
+
+    def _object_at(self, offset: int, num: int = None):
+        """Object at a byte offset; when `num` is given the header must match it."""
+        data = self.r.read_until(offset, b"endobj")
+        m = _OBJ_HEADER_RE.match(data)
+        if not m:
+            raise PdfProbeError(f"no object at {offset}")
+        if num is not None and int(m.group(1)) != num:
+            raise PdfProbeError(f"xref offset {offset} holds object {m.group(1).decode()}, not {num}")
+        body = data[m.end():-len(b"endobj")]
+        sm = re.search(rb"stream\r?\n", body)
+        if not sm:
+            return body, None
+        d = body[:sm.start()]
+        length = _dict_int(d, b"Length")
+        length_ref = _dict_ref(d, b"Length")
+        if length_ref is not None:
+            v = re.match(rb"\s*(\d+)", self._object(length_ref)[0])
+            length = int(v.group(1)) if v else None
+        if length is None:
+            raise PdfProbeError("no stream /Length")
+        start = offset + m.end() + sm.end()
+        return d, self.r.read(start, length)
+
+    def _object_in_stream(self, stm_num: int, idx: int) -> bytes:
+        if stm_num not in self._objstm_cache:
+            d, stream = self._object(stm_num)
+            if stream is None:
+                raise PdfProbeError("object stream without data")
+            data = self._decode(d, stream)
+            n, first = _dict_int(d, b"N"), _dict_int(d, b"First")
+            if n is None or first is None:
+                raise PdfProbeError("bad object stream")
+            nums = [int(x) for x in data[:first].split()[:2 * n]]
+            offsets = [first + o for o in nums[1::2]] + [len(data)]
+            self._objstm_cache[stm_num] = [data[offsets[i]:offsets[i + 1]] for i in range(n)]
+        objs = self._objstm_cache[stm_num]
+        if idx >= len(objs):
+            raise PdfProbeError("object stream index out of range")
+        return objs[idx]
+
+
+def probe_pdf_page_count(fetch, size: int) -> tuple:
+    """Page count from ranged reads: (pages or None, bytes read, requests).
+
+    None means the structure wasn't resolvable (damaged, unsupported filter,
+    budget exceeded) and the caller should fall back to a full read. Any
+    error counts: malformed files surface as KeyError, TypeError or
+    RecursionError as readily as PdfProbeError.
+    """
+    reader = RangeReader(fetch, size)
+    try:
+        pages = PdfPageCounter(reader).count()
+    except Exception as e:
+        print(json.dumps({"message": "page_probe_fallback", "reason": str(e)[:200]}))
+        pages = None
+    return pages, reader.bytes_read, reader.requests
+
+
+def count_s3_pdf_pages(bucket: str, key: str, size: int) -> dict:
+    """Page count for an S3 PDF, probing with Range GETs before a full download."""
+    t0 = time.time()
+    probe_bytes = probe_requests = 0
+    if size >= PAGE_PROBE_MIN_BYTES:
+        def fetch(start, end):
+            return s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end - 1}")["Body"].read()
+        pages, probe_bytes, probe_requests = probe_pdf_page_count(fetch, size)
+        if pages is not None:
+            return {"pages": pages, "method": "range_probe", "bytes_read": probe_bytes,
+                    "requests": probe_requests, "ms": int((time.time() - t0) * 1000)}
+    pdf_bytes = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    return {"pages": count_pdf_pages(pdf_bytes), "method": "full_read",
+            "bytes_read": probe_bytes + len(pdf_bytes), "requests": probe_requests + 1,
+            "ms": int((time.time() - t0) * 1000)}
+
+
 def log_routing_decision(pdf_key: str, page_count: int, file_size_mb: float, route: str, reason: str):
     """Log routing decision to DynamoDB for tracking."""
     try:
@@ -89,7 +407,7 @@ def lambda_handler(event, context):
     """
     Router Lambda Handler:
     1. Receives S3 event for new PDF in Pending
-    2. Downloads PDF and analyzes (page count, file size)
+    2. Analyzes the PDF (file size; page count via ranged reads, full download as fallback)
     3. Routes to Standard or LargeFile prefix
     4. Logs decision to DynamoDB
     """
@@ -112,11 +430,10 @@ def lambda_handler(event, context):
             print(json.dumps({"error": "failed_to_get_metadata", "key": key, "message": str(e)}))
             continue
 
-        # Download PDF to count pages
+        # Count pages (ranged probe of the xref/page tree; full download as fallback)
         try:
-            obj = s3.get_object(Bucket=bucket, Key=key)
-            pdf_bytes = obj['Body'].read()
-            page_count = count_pdf_pages(pdf_bytes)
+            probe = count_s3_pdf_pages(bucket, key, file_size_bytes)
+            page_count = probe["pages"]
         except Exception as e:
             print(json.dumps({"error": "failed_to_download_pdf", "key": key, "message": str(e)}))
             continue
@@ -189,7 +506,10 @@ def lambda_handler(event, context):
                 "route": route,
                 "page_count": page_count,
                 "file_size_mb": round(file_size_mb, 2),
-                "reason": reason
+                "reason": reason,
+                "page_count_method": probe["method"],
+                "page_count_bytes_read": probe["bytes_read"],
+                "page_count_ms": probe["ms"],
             }))
             event_type = "ROUTED_LARGE" if route == "largefile" else "ROUTED_STANDARD"
             _pipeline_track(key, event_type, "lambda:router", f"S1_{route}", {
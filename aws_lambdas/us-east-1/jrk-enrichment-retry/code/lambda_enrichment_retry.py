@@ -6,6 +6,8 @@ Purpose: Find Stage 3 files that never made it to Stage 4 and re-trigger enrichm
 When the enricher Lambda times out or crashes, the S3 trigger doesn't retry.
 Files sit in Stage 3 forever. This Lambda scans for orphaned files and
 re-triggers them by copying in-place (which fires the S3 ObjectCreated event).
+Larger backlogs (BATCH_THRESHOLD+ files) are handed to the enricher's batch mode
+instead, so names shared across files are matched once.
 """
 import os
 import json
@@ -19,8 +21,34 @@ STAGE4_PREFIX = os.getenv("STAGE4_PREFIX", "Bill_Parser_4_Enriched_Outputs/")
 DAYS_BACK = int(os.getenv("DAYS_BACK", "3"))
 MIN_AGE_MINUTES = int(os.getenv("MIN_AGE_MINUTES", "30"))  # Don't retry files less than 30 min old
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
+ENRICHER_FUNCTION = os.getenv("ENRICHER_FUNCTION", "jrk-bill-enricher")
+BATCH_THRESHOLD = int(os.getenv("BATCH_THRESHOLD", "20"))  # 0 disables batch mode
+BATCH_INVOKE_KEYS = int(os.getenv("BATCH_INVOKE_KEYS", "500"))  # Keys per async invoke (256 KB event limit)
 
 s3 = boto3.client("s3", region_name=AWS_REGION)
+lambda_client = boto3.client("lambda", region_name=AWS_REGION)
+
+
+def dispatch_batches(keys: list) -> tuple[list, int]:
+    """Hand keys to the enricher's batch mode, BATCH_INVOKE_KEYS per async invocation.
+
+    Returns (keys that could not be dispatched, number of batches sent).
+    """
+    leftover = []
+    batches = 0
+    for i in range(0, len(keys), BATCH_INVOKE_KEYS):
+        chunk = keys[i:i + BATCH_INVOKE_KEYS]
+        try:
+            lambda_client.invoke(
+                FunctionName=ENRICHER_FUNCTION,
+                InvocationType="Event",
+                Payload=json.dumps({"batch": {"keys": chunk}}).encode("utf-8"),
+            )
+            batches += 1
+        except Exception as e:
+            print(json.dumps({"error": "batch_dispatch_failed", "keys": len(chunk), "message": str(e)[:200]}))
+            leftover.extend(chunk)
+    return leftover, batches
 
 
 def find_and_retry():
@@ -69,11 +97,18 @@ def find_and_retry():
     if not missing:
         return {"retriggered": 0, "stage3": len(stage3), "stage4": len(stage4)}
 
+    keys = [stage3[stem]["key"] for stem in missing]
+    batched = 0
+    batches = 0
+    if BATCH_THRESHOLD and len(keys) >= BATCH_THRESHOLD:
+        leftover, batches = dispatch_batches(keys)
+        batched = len(keys) - len(leftover)
+        keys = leftover  # Fall back to per-file copies for anything not dispatched
+
     # Re-trigger by copying in-place
     retriggered = 0
     errors = 0
-    for stem in missing:
-        key = stage3[stem]["key"]
+    for key in keys:
         try:
             s3.copy_object(
                 Bucket=BUCKET,
@@ -91,6 +126,8 @@ def find_and_retry():
     elapsed = time.time() - start
     result = {
         "retriggered": retriggered,
+        "batched": batched,
+        "batches": batches,
         "errors": errors,
         "stage3": len(stage3),
         "stage4": len(stage4),
@@ -7,11 +7,20 @@ instantly without doing any S3 scanning itself.
 
 Steps:
   A. Load config (GL mappings, accounts-to-track, dimension tables)
-  B. Scan DynamoDB for exclusion hashes (already-assigned line hashes)
-  C. Scan Stage 8 for UBI history (last assigned periods per account)
+  B. Load exclusion hashes (already-assigned line hashes) from the
+     incremental snapshot, scanning DynamoDB only as a fallback
+  C. Update the incremental Stage 8 period index (reads only files changed
+     since its watermark) -> last assigned periods per account
   D. Scan Stage 7 for unassigned bills (with GL mapping + suggestions)
   E. Compute filter options from scanned data
-  F. Write gzipped JSON cache to S3
+  F. Write gzipped JSON cache to S3, prune the patches it covers
+
+S3-event mode (Stage 7 ObjectCreated / ObjectRemoved notifications, direct or
+via SQS): only the changed Stage 7 keys are re-read. Each bill record is
+recomputed from the object's current state (missing = removed) and published
+as one small patch under CACHE_PATCH_PREFIX; the app applies patches in key
+order on top of the full cache. Steps A-C context is cached on warm
+containers for EVENT_CONTEXT_TTL_SECONDS.
 """
 
 import os
@@ -20,8 +29,10 @@ import gzip
 import hashlib
 import re
 import time
-from datetime import datetime, timedelta, date
+import uuid
+from datetime import datetime, timedelta, date, timezone
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import unquote_plus
 
 import boto3
 
@@ -48,6 +59,21 @@ DIM_GL_PREFIX = os.getenv("DIM_GL_PREFIX",
 CACHE_OUTPUT_KEY = os.getenv("CACHE_OUTPUT_KEY",
                              "Bill_Parser_Cache/ubi_unassigned_cache.json.gz")
 DAYS_BACK = int(os.getenv("DAYS_BACK", "60"))
+# Incremental exclusion set maintained by the app (snapshot + delta objects)
+EXCLUSION_SET_PREFIX = os.getenv("EXCLUSION_SET_PREFIX",
+                                 "Bill_Parser_Cache/ubi_exclusion/")
+EXCLUSION_SNAPSHOT_MAX_AGE_HOURS = float(
+    os.getenv("EXCLUSION_SNAPSHOT_MAX_AGE_HOURS", "24"))
+# Incremental Stage 8 last-period index shared with the app
+UBI_PERIODS_INDEX_PREFIX = os.getenv("UBI_PERIODS_INDEX_PREFIX",
+                                     "Bill_Parser_Cache/ubi_periods/")
+UBI_PERIODS_SKEW_SECONDS = 300
+# Incremental patches to the unassigned cache, written by S3-event runs (and
+# app operations): {"bills": {stage7_key: bill record, or null = removed}}
+CACHE_PATCH_PREFIX = os.getenv("CACHE_PATCH_PREFIX",
+                               "Bill_Parser_Cache/ubi_unassigned_patches/")
+CACHE_PATCH_SKEW_SECONDS = 300
+EVENT_CONTEXT_TTL_SECONDS = int(os.getenv("EVENT_CONTEXT_TTL_SECONDS", "300"))
 
 # Clients (reused across invocations via Lambda warm start)
 s3 = boto3.client("s3", region_name=AWS_REGION)
@@ -310,110 +336,175 @@ def load_dim_records(prefix):
 
 
 # ---------------------------------------------------------------------------
-# Step B: Scan DynamoDB for exclusion hashes
+# Step B: Exclusion hashes (snapshot + deltas, DynamoDB scan fallback)
 # ---------------------------------------------------------------------------
 
+def _scan_exclusion_table():
+    hashes = set()
+    paginator = ddb.get_paginator("scan")
+    for page in paginator.paginate(
+        TableName=ASSIGNMENTS_TABLE,
+        ProjectionExpression="line_hash"
+    ):
+        for item in page.get("Items", []):
+            lh = item.get("line_hash", {}).get("S")
+            if lh:
+                hashes.add(lh)
+    return hashes
+
+
+def _load_exclusion_snapshot():
+    """Snapshot + deltas written by the app. Returns None when the snapshot is
+    missing or too old to trust, so the caller falls back to a table scan."""
+    delta_keys = []
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=BUCKET,
+                                   Prefix=EXCLUSION_SET_PREFIX + "deltas/"):
+        for obj in page.get("Contents", []):
+            delta_keys.append(obj["Key"])
+    try:
+        obj = s3.get_object(Bucket=BUCKET,
+                            Key=EXCLUSION_SET_PREFIX + "snapshot.json.gz")
+    except s3.exceptions.ClientError:
+        return None
+    payload = json.loads(gzip.decompress(obj["Body"].read()))
+    age_h = (time.time() - float(payload.get("scan_started") or 0)) / 3600
+    if age_h > EXCLUSION_SNAPSHOT_MAX_AGE_HOURS:
+        print(f"[EXCLUSION] Snapshot is {age_h:.1f}h old, ignoring")
+        return None
+    hashes = set(payload.get("hashes") or [])
+
+    def _get_delta(key):
+        return key, json.loads(
+            s3.get_object(Bucket=BUCKET, Key=key)["Body"].read())
+
+    with ThreadPoolExecutor(max_workers=20) as ex:
+        deltas = dict(ex.map(_get_delta, delta_keys))
+    for key in sorted(deltas):
+        hashes.update(deltas[key].get("add") or [])
+        hashes.difference_update(deltas[key].get("remove") or [])
+    print(f"[EXCLUSION] Snapshot {payload.get('count')} hashes + "
+          f"{len(deltas)} deltas")
+    return hashes
+
+
 def load_exclusion_hashes():
-    """Full scan of jrk-bill-ubi-assignments for line_hash values."""
-    print("[EXCLUSION] Scanning assignments table...")
+    """line_hash values in jrk-bill-ubi-assignments.
+
+    Reads the app's incremental snapshot + deltas; only scans the table when
+    no usable snapshot exists.
+    """
+    print("[EXCLUSION] Loading exclusion set...")
     t0 = time.time()
-    hashes = set()
+    hashes = None
     try:
-        paginator = ddb.get_paginator("scan")
-        for page in paginator.paginate(
-            TableName=ASSIGNMENTS_TABLE,
-            ProjectionExpression="line_hash"
-        ):
-            for item in page.get("Items", []):
-                lh = item.get("line_hash", {}).get("S")
-                if lh:
-                    hashes.add(lh)
+        hashes = _load_exclusion_snapshot()
     except Exception as e:
-        print(f"[EXCLUSION] Error: {e}")
+        print(f"[EXCLUSION] Snapshot load failed: {e}")
+    if hashes is None:
+        print("[EXCLUSION] Scanning assignments table...")
+        try:
+            hashes = _scan_exclusion_table()
+        except Exception as e:
+            print(f"[EXCLUSION] Error: {e}")
+            hashes = set()
     elapsed = time.time() - t0
     print(f"[EXCLUSION] Loaded {len(hashes)} hashes in {elapsed:.1f}s")
     return hashes
 
 
 # ---------------------------------------------------------------------------
-# Step C: Scan Stage 8 for UBI history
+# Step C: Stage 8 UBI history (incremental period index)
 # ---------------------------------------------------------------------------
+# The app keeps a per-file index of Stage 8 assignments on S3: a snapshot
+# {"watermark", "scan_started", "files": {stage8_key: entries}} plus delta
+# objects {"put": {key: entries}, "drop": [keys]} written by every assign /
+# unassign / reassign. Each run merges them, reads only Stage 8 files modified
+# after the watermark, drops files that are gone and writes a new snapshot.
+
+def _stage8_file_entries(rows):
+    """[account_key, [year, month], service_start, service_end, ubi_period]
+    for one Stage 8 file (same entries main.py writes)."""
+    entries, seen = [], set()
+    for rec in rows:
+        ubi_period = rec.get("ubi_period")
+        if not ubi_period:
+            continue
+        service_start = rec.get("Bill Period Start", "")
+        service_month = _parse_service_period_to_month(service_start)
+        if not service_month:
+            continue
+        prop_id = rec.get("EnrichedPropertyID", "")
+        vendor_id = rec.get("EnrichedVendorID", "")
+        acct_num = str(rec.get("Account Number", "")).strip()
+        account_key = f"{prop_id}|{vendor_id}|{acct_num}"
+        sig = (account_key, service_month, ubi_period)
+        if sig in seen:
+            continue
+        seen.add(sig)
+        entries.append([account_key, list(service_month), service_start,
+                        rec.get("Bill Period End", ""), ubi_period])
+    return entries
 
-def scan_stage8_history():
-    """Scan all Stage 8 files to find last assigned period per account."""
-    print("[STAGE8] Scanning for UBI history...")
-    t0 = time.time()
 
-    # List all Stage 8 keys
-    all_keys = []
+def _delta_epoch(key):
+    """Epoch seconds from a "<UTC stamp>_<id>.json" delta or patch key."""
+    stamp = key.rsplit("/", 1)[-1].split("_", 1)[0]
+    try:
+        return datetime.strptime(stamp, "%Y%m%dT%H%M%S%fZ").replace(
+            tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return 0.0
+
+
+def _load_period_index():
+    """(files, watermark, delta keys) from snapshot + deltas; files is None
+    when there is no snapshot yet."""
+    delta_keys = []
     paginator = s3.get_paginator("list_objects_v2")
-    for page in paginator.paginate(Bucket=BUCKET, Prefix=UBI_ASSIGNED_PREFIX):
+    for page in paginator.paginate(Bucket=BUCKET,
+                                   Prefix=UBI_PERIODS_INDEX_PREFIX + "deltas/"):
         for obj in page.get("Contents", []):
-            if obj["Key"].endswith(".jsonl"):
-                all_keys.append(obj["Key"])
-    print(f"[STAGE8] Found {len(all_keys)} files to scan")
-
+            delta_keys.append(obj["Key"])
+    try:
+        obj = s3.get_object(Bucket=BUCKET,
+                            Key=UBI_PERIODS_INDEX_PREFIX + "snapshot.json.gz")
+    except s3.exceptions.ClientError:
+        return None, 0.0, delta_keys
+    payload = json.loads(gzip.decompress(obj["Body"].read()))
+    files = payload.get("files") or {}
+
+    def _get_delta(key):
+        return key, json.loads(
+            s3.get_object(Bucket=BUCKET, Key=key)["Body"].read())
+
+    with ThreadPoolExecutor(max_workers=20) as ex:
+        deltas = dict(ex.map(_get_delta, delta_keys))
+    for key in sorted(deltas):
+        for k in deltas[key].get("drop") or []:
+            files.pop(k, None)
+        files.update(deltas[key].get("put") or {})
+    return files, float(payload.get("watermark") or 0), delta_keys
+
+
+def _summarize_periods(files):
     account_data = {}  # account_key -> list of entries
-
-    def process_stage8_file(key):
-        local_accounts = {}
-        try:
-            file_timestamp = ""
-            ts_match = re.search(r'_(\d{8}T\d{6}Z)_', key)
-            if ts_match:
-                file_timestamp = ts_match.group(1)
-
-            obj_data = s3.get_object(Bucket=BUCKET, Key=key)
-            txt = obj_data["Body"].read().decode("utf-8", errors="ignore")
-            for line in txt.splitlines():
-                if not line.strip():
-                    continue
-                try:
-                    rec = json.loads(line)
-                    ubi_period = rec.get("ubi_period")
-                    if not ubi_period:
-                        continue
-                    service_start = rec.get("Bill Period Start", "")
-                    service_end = rec.get("Bill Period End", "")
-                    service_month = _parse_service_period_to_month(
-                        service_start)
-                    if not service_month:
-                        continue
-                    prop_id = rec.get("EnrichedPropertyID", "")
-                    vendor_id = rec.get("EnrichedVendorID", "")
-                    acct_num = str(
-                        rec.get("Account Number", "")).strip()
-                    account_key = f"{prop_id}|{vendor_id}|{acct_num}"
-                    if account_key not in local_accounts:
-                        local_accounts[account_key] = []
-                    local_accounts[account_key].append({
-                        "service_month": service_month,
-                        "service_start": service_start,
-                        "service_end": service_end,
-                        "ubi_period": ubi_period,
-                        "file_timestamp": file_timestamp,
-                    })
-                except Exception:
-                    continue
-        except Exception:
-            pass
-        return local_accounts
-
-    with ThreadPoolExecutor(max_workers=50) as executor:
-        results = list(executor.map(process_stage8_file, all_keys))
-
-    # Merge results
-    for local_accounts in results:
-        for account_key, entries in local_accounts.items():
-            if account_key not in account_data:
-                account_data[account_key] = []
-            account_data[account_key].extend(entries)
+    for key in sorted(files):
+        ts_match = re.search(r'_(\d{8}T\d{6}Z)_', key)
+        file_timestamp = ts_match.group(1) if ts_match else ""
+        for (account_key, service_month, service_start, service_end,
+             ubi_period) in files[key]:
+            account_data.setdefault(account_key, []).append({
+                "service_month": tuple(service_month),
+                "service_start": service_start,
+                "service_end": service_end,
+                "ubi_period": ubi_period,
+                "file_timestamp": file_timestamp,
+            })
 
     # Find latest per account
     result = {}
     for account_key, entries in account_data.items():
-        if not entries:
-            continue
         sorted_entries = sorted(
             entries,
             key=lambda x: (x["service_month"],
@@ -441,9 +532,84 @@ def scan_stage8_history():
             "last_service_end": latest.get("service_end", ""),
             "all_assignments": all_assignments,
         }
+    return result
+
+
+def scan_stage8_history():
+    """Last assigned period per account, from the incremental Stage 8 index."""
+    print("[STAGE8] Loading UBI history index...")
+    t0 = time.time()
+    scan_started = time.time()
+    try:
+        files, watermark, delta_keys = _load_period_index()
+    except Exception as e:
+        print(f"[STAGE8] Index load failed, rescanning Stage 8: {e}")
+        files, watermark, delta_keys = None, 0.0, []
+    if files is None:
+        files, watermark = {}, 0.0
 
+    # List all Stage 8 keys
+    listing = {}  # key -> LastModified epoch
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=BUCKET, Prefix=UBI_ASSIGNED_PREFIX):
+        for obj in page.get("Contents", []):
+            if obj["Key"].endswith(".jsonl"):
+                listing[obj["Key"]] = obj["LastModified"].timestamp()
+    files = {k: v for k, v in files.items() if k in listing}
+    cutoff = watermark - UBI_PERIODS_SKEW_SECONDS
+    to_read = [k for k, lm in listing.items() if lm > cutoff]
+    print(f"[STAGE8] {len(listing)} files, {len(to_read)} changed "
+          f"since the index watermark")
+
+    def process_stage8_file(key):
+        try:
+            obj_data = s3.get_object(Bucket=BUCKET, Key=key)
+            txt = obj_data["Body"].read().decode("utf-8", errors="ignore")
+        except Exception:
+            return key, None
+        rows = []
+        for line in txt.splitlines():
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except Exception:
+                continue
+        return key, _stage8_file_entries(rows)
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=50) as executor:
+        for key, entries in executor.map(process_stage8_file, to_read):
+            if entries is None:
+                failed.append(key)
+            else:
+                files[key] = entries
+    # Never move the watermark past a file we failed to read
+    new_watermark = min([max(listing.values(), default=watermark)]
+                        + [listing[k] for k in failed])
+
+    try:
+        payload = {"built_at": datetime.now(timezone.utc).isoformat(),
+                   "scan_started": scan_started,
+                   "watermark": new_watermark, "files": files}
+        s3.put_object(
+            Bucket=BUCKET, Key=UBI_PERIODS_INDEX_PREFIX + "snapshot.json.gz",
+            Body=gzip.compress(json.dumps(
+                payload, separators=(",", ":")).encode("utf-8")),
+            ContentType="application/json", ContentEncoding="gzip")
+        stale = [k for k in delta_keys if _delta_epoch(k)
+                 < scan_started - UBI_PERIODS_SKEW_SECONDS]
+        for n in range(0, len(stale), 1000):
+            s3.delete_objects(Bucket=BUCKET, Delete={
+                "Objects": [{"Key": k} for k in stale[n:n + 1000]],
+                "Quiet": True})
+    except Exception as e:
+        print(f"[STAGE8] Could not write index snapshot: {e}")
+
+    result = _summarize_periods(files)
     elapsed = time.time() - t0
-    print(f"[STAGE8] Scanned in {elapsed:.1f}s, "
+    print(f"[STAGE8] Read {len(to_read) - len(failed)} files "
+          f"({len(failed)} failed) in {elapsed:.1f}s, "
           f"found {len(result)} accounts with history")
     return result
 
@@ -452,13 +618,261 @@ def scan_stage8_history():
 # Step D: Scan Stage 7 for unassigned bills
 # ---------------------------------------------------------------------------
 
+def build_bill_record(key, ubi_account_keys, excluded_hashes,
+                      last_ubi_periods, gl_mappings, stats=None):
+    """Cache record for one Stage 7 file: GL mappings applied in memory,
+    suggestion / duplicate fields from Stage 8 history, excluded lines
+    dropped. None when no unassigned line is left. S3 errors (including a
+    missing key) propagate so the event path can tell a deleted bill apart.
+    """
+    obj_data = s3.get_object(Bucket=BUCKET, Key=key)
+    txt = obj_data["Body"].read().decode("utf-8", errors="ignore")
+    lines = [ln.strip() for ln in txt.splitlines() if ln.strip()]
+    if not lines:
+        return None
+
+    # Apply GL mappings in memory (no S3 rewrite)
+    if gl_mappings:
+        patched_lines = []
+        for raw_line in lines:
+            try:
+                rec = json.loads(raw_line)
+            except json.JSONDecodeError:
+                patched_lines.append(raw_line)
+                continue
+            is_overridden = rec.get("Charge Code Overridden") in (
+                True, "true", "True")
+            if not is_overridden:
+                prop_id = rec.get("EnrichedPropertyID", "")
+                gl_aid = (rec.get("EnrichedGLAccountID", "")
+                          or rec.get("GL Account ID", ""))
+                gl_c = (rec.get("EnrichedGLAccountNumber", "")
+                        or rec.get("GL Account Number", ""))
+                mapping = _lookup_charge_code(
+                    prop_id, gl_aid, gl_c, gl_mappings)
+                if mapping and mapping.get("charge_code"):
+                    old_cc = rec.get("Charge Code", "")
+                    new_cc = mapping["charge_code"]
+                    if old_cc != new_cc:
+                        rec["Charge Code"] = new_cc
+                        rec["Charge Code Source"] = "mapping"
+                        if mapping.get("utility_name"):
+                            rec["Mapped Utility Name"] = \
+                                mapping["utility_name"]
+                        if stats is not None:
+                            stats["gl_lines_patched"] += 1
+            patched_lines.append(
+                json.dumps(rec, ensure_ascii=False)
+                if isinstance(rec, dict) else rec)
+        lines = patched_lines
+
+    try:
+        first_rec = (json.loads(lines[0]) if isinstance(lines[0], str)
+                     else lines[0])
+    except json.JSONDecodeError:
+        return None
+
+    computed_pdf_id = pdf_id_from_key(key)
+    date_match = re.search(
+        r'yyyy=(\d{4})/mm=(\d{2})/dd=(\d{2})', key)
+    review_date = (
+        f"{date_match.group(1)}-{date_match.group(2)}"
+        f"-{date_match.group(3)}"
+        if date_match else "")
+
+    posted_at_str = (first_rec.get("PostedAt", "")
+                     or first_rec.get("SubmittedAt", ""))
+    posted_at_ts = 0
+    submitter = (first_rec.get("Submitter", "")
+                 or first_rec.get("SubmittedBy", ""))
+    if posted_at_str:
+        try:
+            posted_at_dt = datetime.fromisoformat(
+                posted_at_str.replace('Z', '+00:00'))
+            posted_at_ts = posted_at_dt.timestamp()
+        except Exception:
+            pass
+    if not posted_at_str:
+        s3_last_mod = obj_data.get("LastModified")
+        if s3_last_mod:
+            posted_at_str = s3_last_mod.strftime(
+                "%Y-%m-%dT%H:%M:%S")
+            posted_at_ts = s3_last_mod.timestamp()
+
+    property_id = first_rec.get("EnrichedPropertyID", "")
+    vendor_id = first_rec.get("EnrichedVendorID", "")
+    account_number = str(
+        first_rec.get("Account Number", "")).strip()
+    account_key = f"{property_id}|{vendor_id}|{account_number}"
+    account_key_nv = f"{property_id}||{account_number}"
+
+    is_ubi = (account_key in ubi_account_keys
+              or account_key_nv in ubi_account_keys)
+
+    # --- Suggestion logic ---
+    history = (last_ubi_periods.get(account_key)
+               if is_ubi else None)
+    suggested_period = None
+    last_ubi_period = None
+    last_service_month_str = None
+    last_service_dates = None
+
+    if history and is_ubi:
+        last_service_month = history.get("last_service_month")
+        last_ubi_period = history.get("last_ubi_period")
+        last_service_start = history.get("last_service_start", "")
+        last_service_end = history.get("last_service_end", "")
+
+        if last_service_month:
+            last_service_month_str = (
+                f"{last_service_month[1]:02d}"
+                f"/{last_service_month[0]}")
+            if last_service_start and last_service_end:
+                last_service_dates = (
+                    f"{last_service_start} - {last_service_end}")
+            elif last_service_start:
+                last_service_dates = last_service_start
+
+            bill_service_start = first_rec.get(
+                "Bill Period Start", "")
+            bill_service_month = _parse_service_period_to_month(
+                bill_service_start)
+
+            if bill_service_month and last_ubi_period:
+                last_year, last_month = last_service_month
+                bill_year, bill_month = bill_service_month
+                if last_month == 12:
+                    exp_year, exp_month = last_year + 1, 1
+                else:
+                    exp_year, exp_month = last_year, last_month + 1
+                if (bill_year == exp_year
+                        and bill_month == exp_month):
+                    suggested_period = _get_next_ubi_period(
+                        last_ubi_period)
+                elif (bill_year, bill_month) > (
+                        last_year, last_month):
+                    suggested_period = _get_next_ubi_period(
+                        last_ubi_period)
+            elif last_ubi_period:
+                suggested_period = _get_next_ubi_period(
+                    last_ubi_period)
+
+    # Duplicate detection + prior period suggestion
+    duplicate_warning = None
+    prior_period_suggestion = None
+    bill_svc_start_raw = first_rec.get("Bill Period Start", "")
+    bill_svc_end_raw = first_rec.get("Bill Period End", "")
+
+    if history and is_ubi and bill_svc_start_raw:
+        all_assignments = history.get("all_assignments", [])
+        bill_start_dt = _parse_date_any(bill_svc_start_raw)
+        bill_end_dt = _parse_date_any(bill_svc_end_raw)
+
+        if bill_start_dt and all_assignments:
+            for asgn in all_assignments:
+                asgn_start = _parse_date_any(
+                    asgn.get("service_start", ""))
+                asgn_end = _parse_date_any(
+                    asgn.get("service_end", ""))
+                if asgn_start:
+                    start_diff = abs(
+                        (bill_start_dt - asgn_start).days)
+                    if bill_end_dt and asgn_end:
+                        end_diff = abs(
+                            (bill_end_dt - asgn_end).days)
+                    else:
+                        end_diff = 999
+                    if start_diff <= 5 and end_diff <= 5:
+                        duplicate_warning = asgn.get(
+                            "ubi_period", "")
+                        break
+
+            if not suggested_period and not duplicate_warning:
+                bill_svc_month = _parse_service_period_to_month(
+                    bill_svc_start_raw)
+                if bill_svc_month:
+                    bill_y, bill_m = bill_svc_month
+                    for asgn in all_assignments:
+                        asgn_month = asgn.get("service_month")
+                        if not asgn_month:
+                            continue
+                        asgn_y, asgn_m = asgn_month
+                        if asgn_m == 1:
+                            prev_y, prev_m = asgn_y - 1, 12
+                        else:
+                            prev_y, prev_m = asgn_y, asgn_m - 1
+                        if bill_y == prev_y and bill_m == prev_m:
+                            prior_ubi = _get_prev_ubi_period(
+                                asgn.get("ubi_period", ""))
+                            if prior_ubi:
+                                prior_period_suggestion = prior_ubi
+                                suggested_period = prior_ubi
+                                break
+
+    bill_info = {
+        "s3_key": key,
+        "vendor": (first_rec.get("EnrichedVendorName", "")
+                   or first_rec.get("Vendor Name", "")),
+        "account": first_rec.get("Account Number", ""),
+        "account_key": account_key,
+        "property_name": first_rec.get("EnrichedPropertyName", ""),
+        "pdf_id": computed_pdf_id,
+        "review_date": review_date,
+        "invoice_no": first_rec.get("Invoice Number", ""),
+        "total_amount": 0.0,
+        "line_count": 0,
+        "unassigned_lines": [],
+        "last_modified": posted_at_str,
+        "last_modified_ts": posted_at_ts,
+        "submitter": submitter,
+        "suggested_period": suggested_period,
+        "last_assigned_period": last_ubi_period,
+        "last_assigned_service": (last_service_dates
+                                  or last_service_month_str),
+        "is_ubi_account": is_ubi,
+        "duplicate_warning": duplicate_warning,
+        "prior_period_suggestion": prior_period_suggestion,
+    }
+
+    for line in lines:
+        try:
+            rec = json.loads(line)
+            line_hash = _compute_stable_line_hash(rec)
+            if line_hash in excluded_hashes:
+                continue
+            charge = safe_parse_charge(
+                rec.get("Line Item Charge", "0"))
+            sanitized_rec = {}
+            for k, v in rec.items():
+                if k not in ESSENTIAL_FIELDS:
+                    continue
+                if isinstance(v, str):
+                    sanitized_rec[k] = v.replace(
+                        '\x00', '').replace('\ufffd', '')
+                else:
+                    sanitized_rec[k] = v
+            bill_info["unassigned_lines"].append({
+                "line_hash": line_hash,
+                "line_data": sanitized_rec,
+                "charge": charge,
+            })
+            bill_info["total_amount"] += charge
+            bill_info["line_count"] += 1
+        except (json.JSONDecodeError, ValueError, TypeError):
+            continue
+
+    if bill_info["unassigned_lines"]:
+        return bill_info
+    return None
+
+
 def scan_unassigned_bills(ubi_account_keys, excluded_hashes,
                           last_ubi_periods, gl_mappings, days_back):
     """Scan Stage 7 for unassigned bills. Core cache computation."""
     print(f"[STAGE7] Scanning last {days_back} days...")
     t0 = time.time()
 
-    gl_lines_patched = 0
+    stats = {"gl_lines_patched": 0}
 
     # Build date-partitioned prefixes
     today = datetime.now()
@@ -483,246 +897,9 @@ def scan_unassigned_bills(ubi_account_keys, excluded_hashes,
     print(f"[STAGE7] Found {len(all_keys)} JSONL files")
 
     def process_file(key):
-        nonlocal gl_lines_patched
         try:
-            obj_data = s3.get_object(Bucket=BUCKET, Key=key)
-            txt = obj_data["Body"].read().decode("utf-8", errors="ignore")
-            lines = [ln.strip() for ln in txt.splitlines() if ln.strip()]
-            if not lines:
-                return None
-
-            # Apply GL mappings in memory (no S3 rewrite)
-            if gl_mappings:
-                patched_lines = []
-                for raw_line in lines:
-                    try:
-                        rec = json.loads(raw_line)
-                    except json.JSONDecodeError:
-                        patched_lines.append(raw_line)
-                        continue
-                    is_overridden = rec.get("Charge Code Overridden") in (
-                        True, "true", "True")
-                    if not is_overridden:
-                        prop_id = rec.get("EnrichedPropertyID", "")
-                        gl_aid = (rec.get("EnrichedGLAccountID", "")
-                                  or rec.get("GL Account ID", ""))
-                        gl_c = (rec.get("EnrichedGLAccountNumber", "")
-                                or rec.get("GL Account Number", ""))
-                        mapping = _lookup_charge_code(
-                            prop_id, gl_aid, gl_c, gl_mappings)
-                        if mapping and mapping.get("charge_code"):
-                            old_cc = rec.get("Charge Code", "")
-                            new_cc = mapping["charge_code"]
-                            if old_cc != new_cc:
-                                rec["Charge Code"] = new_cc
-                                rec["Charge Code Source"] = "mapping"
-                                if mapping.get("utility_name"):
-                                    rec["Mapped Utility Name"] = \
-                                        mapping["utility_name"]
-                                gl_lines_patched += 1
-                    patched_lines.append(
-                        json.dumps(rec, ensure_ascii=False)
-                        if isinstance(rec, dict) else rec)
-                lines = patched_lines
-
-            try:
-                first_rec = (json.loads(lines[0]) if isinstance(lines[0], str)
-                             else lines[0])
-            except json.JSONDecodeError:
-                return None
-
-            computed_pdf_id = pdf_id_from_key(key)
-            date_match = re.search(
-                r'yyyy=(\d{4})/mm=(\d{2})/dd=(\d{2})', key)
-            review_date = (
-                f"{date_match.group(1)}-{date_match.group(2)}"
-                f"-{date_match.group(3)}"
-                if date_match else "")
-
-            posted_at_str = (first_rec.get("PostedAt", "")
-                             or first_rec.get("SubmittedAt", ""))
-            posted_at_ts = 0
-            submitter = (first_rec.get("Submitter", "")
-                         or first_rec.get("SubmittedBy", ""))
-            if posted_at_str:
-                try:
-                    posted_at_dt = datetime.fromisoformat(
-                        posted_at_str.replace('Z', '+00:00'))
-                    posted_at_ts = posted_at_dt.timestamp()
-                except Exception:
-                    pass
-            if not posted_at_str:
-                s3_last_mod = obj_data.get("LastModified")
-                if s3_last_mod:
-                    posted_at_str = s3_last_mod.strftime(
-                        "%Y-%m-%dT%H:%M:%S")
-                    posted_at_ts = s3_last_mod.timestamp()
-
-            property_id = first_rec.get("EnrichedPropertyID", "")
-            vendor_id = first_rec.get("EnrichedVendorID", "")
-            account_number = str(
-                first_rec.get("Account Number", "")).strip()
-            account_key = f"{property_id}|{vendor_id}|{account_number}"
-            account_key_nv = f"{property_id}||{account_number}"
-
-            is_ubi = (account_key in ubi_account_keys
-                      or account_key_nv in ubi_account_keys)
-
-            # --- Suggestion logic ---
-            history = (last_ubi_periods.get(account_key)
-                       if is_ubi else None)
-            suggested_period = None
-            last_ubi_period = None
-            last_service_month_str = None
-            last_service_dates = None
-
-            if history and is_ubi:
-                last_service_month = history.get("last_service_month")
-                last_ubi_period = history.get("last_ubi_period")
-                last_service_start = history.get("last_service_start", "")
-                last_service_end = history.get("last_service_end", "")
-
-                if last_service_month:
-                    last_service_month_str = (
-                        f"{last_service_month[1]:02d}"
-                        f"/{last_service_month[0]}")
-                    if last_service_start and last_service_end:
-                        last_service_dates = (
-                            f"{last_service_start} - {last_service_end}")
-                    elif last_service_start:
-                        last_service_dates = last_service_start
-
-                    bill_service_start = first_rec.get(
-                        "Bill Period Start", "")
-                    bill_service_month = _parse_service_period_to_month(
-                        bill_service_start)
-
-                    if bill_service_month and last_ubi_period:
-                        last_year, last_month = last_service_month
-                        bill_year, bill_month = bill_service_month
-                        if last_month == 12:
-                            exp_year, exp_month = last_year + 1, 1
-                        else:
-                            exp_year, exp_month = last_year, last_month + 1
-                        if (bill_year == exp_year
-                                and bill_month == exp_month):
-                            suggested_period = _get_next_ubi_period(
-                                last_ubi_period)
-                        elif (bill_year, bill_month) > (
-                                last_year, last_month):
-                            suggested_period = _get_next_ubi_period(
-                                last_ubi_period)
-                    elif last_ubi_period:
-                        suggested_period = _get_next_ubi_period(
-                            last_ubi_period)
-
-            # Duplicate detection + prior period suggestion
-            duplicate_warning = None
-            prior_period_suggestion = None
-            bill_svc_start_raw = first_rec.get("Bill Period Start", "")
-            bill_svc_end_raw = first_rec.get("Bill Period End", "")
-
-            if history and is_ubi and bill_svc_start_raw:
-                all_assignments = history.get("all_assignments", [])
-                bill_start_dt = _parse_date_any(bill_svc_start_raw)
-                bill_end_dt = _parse_date_any(bill_svc_end_raw)
-
-                if bill_start_dt and all_assignments:
-                    for asgn in all_assignments:
-                        asgn_start = _parse_date_any(
-                            asgn.get("service_start", ""))
-                        asgn_end = _parse_date_any(
-                            asgn.get("service_end", ""))
-                        if asgn_start:
-                            start_diff = abs(
-                                (bill_start_dt - asgn_start).days)
-                            if bill_end_dt and asgn_end:
-                                end_diff = abs(
-                                    (bill_end_dt - asgn_end).days)
-                            else:
-                                end_diff = 999
-                            if start_diff <= 5 and end_diff <= 5:
-                                duplicate_warning = asgn.get(
-                                    "ubi_period", "")
-                                break
-
-                    if not suggested_period and not duplicate_warning:
-                        bill_svc_month = _parse_service_period_to_month(
-                            bill_svc_start_raw)
-                        if bill_svc_month:
-                            bill_y, bill_m = bill_svc_month
-                            for asgn in all_assignments:
-                                asgn_month = asgn.get("service_month")
-                                if not asgn_month:
-                                    continue
-                                asgn_y, asgn_m = asgn_month
-                                if asgn_m == 1:
-                                    prev_y, prev_m = asgn_y - 1, 12
-                                else:
-                                    prev_y, prev_m = asgn_y, asgn_m - 1
-                                if bill_y == prev_y and bill_m == prev_m:
-                                    prior_ubi = _get_prev_ubi_period(
-                                        asgn.get("ubi_period", ""))
-                                    if prior_ubi:
-                                        prior_period_suggestion = prior_ubi
-                                        suggested_period = prior_ubi
-                                        break
-
-            bill_info = {
-                "s3_key": key,
-                "vendor": (first_rec.get("EnrichedVendorName", "")
-                           or first_rec.get("Vendor Name", "")),
-                "account": first_rec.get("Account Number", ""),
-                "account_key": account_key,
-                "property_name": first_rec.get("EnrichedPropertyName", ""),
-                "pdf_id": computed_pdf_id,
-                "review_date": review_date,
-                "invoice_no": first_rec.get("Invoice Number", ""),
-                "total_amount": 0.0,
-                "line_count": 0,
-                "unassigned_lines": [],
-                "last_modified": posted_at_str,
-                "last_modified_ts": posted_at_ts,
-                "submitter": submitter,
-                "suggested_period": suggested_period,
-                "last_assigned_period": last_ubi_period,
-                "last_assigned_service": (last_service_dates
-                                          or last_service_month_str),
-                "is_ubi_account": is_ubi,
-                "duplicate_warning": duplicate_warning,
-                "prior_period_suggestion": prior_period_suggestion,
-            }
-
-            for line in lines:
-                try:
-                    rec = json.loads(line)
-                    line_hash = _compute_stable_line_hash(rec)
-                    if line_hash in excluded_hashes:
-                        continue
-                    charge = safe_parse_charge(
-                        rec.get("Line Item Charge", "0"))
-                    sanitized_rec = {}
-                    for k, v in rec.items():
-                        if k not in ESSENTIAL_FIELDS:
-                            continue
-                        if isinstance(v, str):
-                            sanitized_rec[k] = v.replace(
-                                '\x00', '').replace('\ufffd', '')
-                        else:
-                            sanitized_rec[k] = v
-                    bill_info["unassigned_lines"].append({
-                        "line_hash": line_hash,
-                        "line_data": sanitized_rec,
-                        "charge": charge,
-                    })
-                    bill_info["total_amount"] += charge
-                    bill_info["line_count"] += 1
-                except (json.JSONDecodeError, ValueError, TypeError):
-                    continue
-
-            if bill_info["unassigned_lines"]:
-                return bill_info
-            return None
+            return build_bill_record(key, ubi_account_keys, excluded_hashes,
+                                     last_ubi_periods, gl_mappings, stats)
         except Exception as e:
             print(f"[STAGE7] Error processing {key}: {e}")
             return None
@@ -741,7 +918,7 @@ def scan_unassigned_bills(ubi_account_keys, excluded_hashes,
 
     elapsed = time.time() - t0
     print(f"[STAGE7] Computed {len(unassigned_bills)} bills in {elapsed:.1f}s"
-          f" (GL: {gl_lines_patched} lines patched)")
+          f" (GL: {stats['gl_lines_patched']} lines patched)")
     return unassigned_bills
 
 
@@ -817,11 +994,13 @@ def compute_filter_options(bills):
 # Step F: Write output
 # ---------------------------------------------------------------------------
 
-def write_cache_to_s3(bills, filter_options):
+def write_cache_to_s3(bills, filter_options, scan_started=None):
     """Write gzipped cache to S3."""
     payload = {
         "data": bills,
         "ts": time.time(),
+        # Patches older than this (less CACHE_PATCH_SKEW_SECONDS) are folded in
+        "scan_started": scan_started or time.time(),
         "filter_options": filter_options,
         "built_by": "lambda",
         "built_at": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
@@ -838,12 +1017,148 @@ def write_cache_to_s3(bills, filter_options):
           f"({len(raw) // 1024}KB raw, {len(compressed) // 1024}KB gzip)")
 
 
+def prune_cache_patches(scan_started):
+    """Delete patches a full build started after (they're in its output)."""
+    stale = []
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=BUCKET, Prefix=CACHE_PATCH_PREFIX):
+        for obj in page.get("Contents", []):
+            if (_delta_epoch(obj["Key"])
+                    < scan_started - CACHE_PATCH_SKEW_SECONDS):
+                stale.append(obj["Key"])
+    for n in range(0, len(stale), 1000):
+        s3.delete_objects(Bucket=BUCKET, Delete={
+            "Objects": [{"Key": k} for k in stale[n:n + 1000]],
+            "Quiet": True})
+    print(f"[OUTPUT] Pruned {len(stale)} cache patches")
+
+
+def write_cache_patch(bills):
+    """Publish {stage7_key: record or None} as one patch object."""
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    key = f"{CACHE_PATCH_PREFIX}{stamp}_{uuid.uuid4().hex[:8]}.json"
+    s3.put_object(
+        Bucket=BUCKET, Key=key,
+        Body=json.dumps({"bills": bills}, ensure_ascii=False).encode("utf-8"),
+        ContentType="application/json")
+    return key
+
+
+# ---------------------------------------------------------------------------
+# Step G: S3-event deltas
+# ---------------------------------------------------------------------------
+
+_EVENT_CONTEXT = {"loaded_at": 0.0}
+
+
+def _event_context():
+    """Steps A-C for event runs, reused across warm invocations. The Stage 8
+    index is read as-is (snapshot + deltas); scheduled runs reconcile it."""
+    ctx = _EVENT_CONTEXT
+    if time.time() - ctx["loaded_at"] < EVENT_CONTEXT_TTL_SECONDS:
+        return ctx
+    files = None
+    try:
+        files, _, _ = _load_period_index()
+    except Exception as e:
+        print(f"[EVENT] Stage 8 index load failed: {e}")
+    if files is None:
+        last_ubi_periods = scan_stage8_history()
+    else:
+        last_ubi_periods = _summarize_periods(files)
+    ctx.update({
+        "gl_mappings": load_gl_mappings(),
+        "ubi_account_keys": build_ubi_account_keys(load_accounts_to_track()),
+        "excluded_hashes": load_exclusion_hashes(),
+        "last_ubi_periods": last_ubi_periods,
+        "loaded_at": time.time(),
+    })
+    return ctx
+
+
+def stage7_keys_from_event(event):
+    """Stage 7 .jsonl keys named in an S3 notification (direct or SQS)."""
+    keys = []
+    for record in event.get("Records", []):
+        if "s3" not in record and record.get("body"):
+            try:
+                keys.extend(stage7_keys_from_event(json.loads(record["body"])))
+            except (TypeError, ValueError):
+                pass
+            continue
+        key = unquote_plus(record.get("s3", {}).get("object", {})
+                           .get("key", ""))
+        if key.startswith(POST_ENTRATA_PREFIX) and key.endswith(".jsonl"):
+            keys.append(key)
+    return list(dict.fromkeys(keys))
+
+
+def _in_window(key, days_back):
+    """Same date window the full build scans (partition date in the key)."""
+    m = re.search(r'yyyy=(\d{4})/mm=(\d{2})/dd=(\d{2})', key)
+    if not m:
+        return True
+    key_date = date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    return key_date > date.today() - timedelta(days=days_back)
+
+
+def process_stage7_events(event):
+    """Recompute the records for the Stage 7 keys in event; publish a patch.
+
+    The event type is not trusted: the object's current state decides
+    (missing or nothing left unassigned = removed), so out-of-order
+    create/delete notifications for one key still converge.
+    """
+    t0 = time.time()
+    # Bills outside the build window are left alone (same as a full build)
+    keys = [k for k in stage7_keys_from_event(event)
+            if _in_window(k, DAYS_BACK)]
+    if not keys:
+        return {"keys": 0, "upserted": 0, "removed": 0, "failed": 0}
+    ctx = _event_context()
+
+    def process(key):
+        try:
+            return key, build_bill_record(
+                key, ctx["ubi_account_keys"], ctx["excluded_hashes"],
+                ctx["last_ubi_periods"], ctx["gl_mappings"]), None
+        except Exception as e:
+            if "NoSuchKey" in str(e) or "404" in str(e):
+                return key, None, None
+            return key, None, e
+
+    bills, failed = {}, 0
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        for key, record, err in executor.map(process, keys):
+            if err is not None:
+                failed += 1
+                print(f"[EVENT] Error processing {key} (next full build "
+                      f"picks it up): {err}")
+                continue
+            bills[key] = record
+    patch_key = write_cache_patch(bills) if bills else None
+    upserted = sum(1 for r in bills.values() if r)
+    summary = {"keys": len(keys), "upserted": upserted,
+               "removed": len(bills) - upserted, "failed": failed,
+               "patch": patch_key,
+               "elapsed_seconds": round(time.time() - t0, 2)}
+    print(f"[EVENT] {json.dumps(summary)}")
+    return summary
+
+
 # ---------------------------------------------------------------------------
 # Lambda handler
 # ---------------------------------------------------------------------------
 
 def lambda_handler(event, context):
-    """Main entry point. Builds UBI cache and writes to S3."""
+    """Main entry point. Builds UBI cache and writes to S3.
+
+    S3 notifications (a "Records" event) only patch the changed bills.
+    """
+    if event and event.get("Records"):
+        return {"statusCode": 200,
+                "body": json.dumps(process_stage7_events(event))}
+
     overall_start = time.time()
     print(f"[START] UBI cache build triggered at "
           f"{datetime.utcnow().isoformat()}Z")
@@ -871,7 +1186,11 @@ def lambda_handler(event, context):
     filter_options = compute_filter_options(bills)
 
     # Step F: Write to S3
-    write_cache_to_s3(bills, filter_options)
+    write_cache_to_s3(bills, filter_options, scan_started=overall_start)
+    try:
+        prune_cache_patches(overall_start)
+    except Exception as e:
+        print(f"[OUTPUT] Patch prune failed: {e}")
 
     elapsed = time.time() - overall_start
     print(f"[DONE] Built cache with {len(bills)} bills in {elapsed:.1f}s")
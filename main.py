@@ -52,6 +52,8 @@ def _entrata_post_succeeded(resp_text: str) -> tuple[bool, str]:
         return False, "parse_error"
 
 import os
+import asyncio
+import functools
 import datetime as dt
 from datetime import datetime, timezone, timedelta
 from typing import List, Dict, Any, Tuple
@@ -76,11 +78,12 @@ import auth  # New role-based authentication module
 from itertools import islice
 import re
 import gzip
+import bisect
 from io import BytesIO
 from zoneinfo import ZoneInfo
 import time
 import calendar
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, as_completed, wait as futures_wait
 import google.generativeai as genai
 import base64
 
@@ -123,6 +126,7 @@ WORKFLOW_NOTES_KEY = os.getenv("WORKFLOW_NOTES_KEY", CONFIG_PREFIX + "workflow_n
 WORKFLOW_CACHE_KEY = os.getenv("WORKFLOW_CACHE_KEY", CONFIG_PREFIX + "workflow_cache.json")
 COMPLETION_TRACKER_CACHE_KEY = os.getenv("COMPLETION_TRACKER_CACHE_KEY", CONFIG_PREFIX + "completion_tracker_cache.json.gz")
 BILL_INDEX_CACHE_KEY = os.getenv("BILL_INDEX_CACHE_KEY", CONFIG_PREFIX + "bill_index_cache.json.gz")
+DAY_SNAPSHOT_PREFIX = os.getenv("DAY_SNAPSHOT_PREFIX", "Bill_Parser_Cache/day_snapshots/")
 ACCOUNT_STATISTICS_KEY = os.getenv("ACCOUNT_STATISTICS_KEY", CONFIG_PREFIX + "account_statistics.json")
 OUTLIER_RECORDS_KEY = os.getenv("OUTLIER_RECORDS_KEY", CONFIG_PREFIX + "outlier_records.json")
 UBI_ACCOUNT_HISTORY_KEY = os.getenv("UBI_ACCOUNT_HISTORY_KEY", CONFIG_PREFIX + "ubi_account_history.json")
@@ -517,10 +521,212 @@ def _record_audit_event(event_type: str, user: str, details: dict):
     except Exception as e:
         print(f"[AUDIT] Failed to record {event_type}: {e}")
 
-# Global thread pool for general parallel S3/DDB operations
-_GLOBAL_EXECUTOR = ThreadPoolExecutor(max_workers=20)
-# Dedicated high-concurrency pool for CHECK REVIEW bulk S3 reads (I/O-bound)
-_CHECK_REVIEW_EXECUTOR = ThreadPoolExecutor(max_workers=100)
+# -------- I/O Scheduler --------
+# One set of worker pools for all parallel S3/DDB/Snowflake work instead of a
+# ThreadPoolExecutor per request. Two lanes keep background rebuilds (search index,
+# metrics, trackers) from starving page loads; per-service caps bound how many calls
+# hit each backend at once regardless of how many requests are fanning out.
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+IO_LANE_WORKERS = {
+    "interactive": int(os.getenv("IO_INTERACTIVE_WORKERS", "96")),
+    "background": int(os.getenv("IO_BACKGROUND_WORKERS", "24")),
+}
+IO_SERVICE_CAPS = {
+    "s3": int(os.getenv("IO_S3_CONCURRENCY", "64")),
+    "ddb": int(os.getenv("IO_DDB_CONCURRENCY", "32")),
+    "snowflake": int(os.getenv("IO_SNOWFLAKE_CONCURRENCY", "4")),
+}
+
+
+class _IOScheduler:
+    """Lane pools plus per-service semaphores, with queue/run counters for /api/perf/io.
+
+    A task submitted from inside another scheduled task is "nested": it runs under its
+    parent's service slot, and if the lane is saturated the parent runs it inline.
+    Parking children behind parents that block on them could otherwise deadlock.
+    """
+
+    def __init__(self, lanes: dict, caps: dict):
+        self._workers = dict(lanes)
+        self._pools = {lane: ThreadPoolExecutor(max_workers=n, thread_name_prefix=f"io-{lane}")
+                       for lane, n in lanes.items()}
+        self._cap_sizes = dict(caps)
+        self._caps = {svc: threading.BoundedSemaphore(n) for svc, n in caps.items()}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._lane_stats = {lane: {"queued": 0, "running": 0, "held": 0, "completed": 0,
+                                   "inline": 0, "peak_queued": 0} for lane in lanes}
+        self._svc_stats = {svc: {"running": 0, "waiting": 0, "completed": 0} for svc in caps}
+
+    def in_task(self) -> bool:
+        return getattr(self._local, "depth", 0) > 0
+
+    def submit(self, lane: str, service: str | None, fn, args=(), kwargs=None, nested: bool | None = None) -> Future:
+        nested = self.in_task() if nested is None else nested
+        st = self._lane_stats[lane]
+        with self._lock:
+            inline = nested and st["queued"] + st["running"] >= self._workers[lane]
+            if inline:
+                st["inline"] += 1
+            else:
+                st["queued"] += 1
+                st["peak_queued"] = max(st["peak_queued"], st["queued"])
+        if not inline:
+            return self._pools[lane].submit(self._run, lane, service, fn, args, kwargs or {}, nested)
+        fut = Future()
+        fut.set_running_or_notify_cancel()
+        try:
+            fut.set_result(self._call(service, fn, args, kwargs or {}, nested))
+        except BaseException as e:
+            fut.set_exception(e)
+        return fut
+
+    def _run(self, lane, service, fn, args, kwargs, nested):
+        st = self._lane_stats[lane]
+        with self._lock:
+            st["queued"] -= 1
+            st["running"] += 1
+        try:
+            return self._call(service, fn, args, kwargs, nested)
+        finally:
+            with self._lock:
+                st["running"] -= 1
+                st["completed"] += 1
+
+    def _call(self, service, fn, args, kwargs, nested):
+        with self.slot(None if nested else service):
+            self._local.depth = getattr(self._local, "depth", 0) + 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._local.depth -= 1
+
+    @contextmanager
+    def slot(self, service: str | None):
+        """Hold one of `service`'s concurrency slots for the duration of the block."""
+        cap = self._caps.get(service) if service else None
+        if cap is None:
+            yield
+            return
+        st = self._svc_stats[service]
+        with self._lock:
+            st["waiting"] += 1
+        cap.acquire()
+        with self._lock:
+            st["waiting"] -= 1
+            st["running"] += 1
+        try:
+            yield
+        finally:
+            cap.release()
+            with self._lock:
+                st["running"] -= 1
+                st["completed"] += 1
+
+    def note_held(self, lane: str, n: int):
+        with self._lock:
+            self._lane_stats[lane]["held"] += n
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "lanes": [{"name": lane, "workers": self._workers[lane], **st}
+                          for lane, st in self._lane_stats.items()],
+                "services": [{"name": svc, "cap": self._cap_sizes[svc], **st}
+                             for svc, st in self._svc_stats.items()],
+            }
+
+
+class _IOExecutor(Executor):
+    """Executor view of the scheduler for one (service, lane), used where a
+    per-request ThreadPoolExecutor used to be built. `max_workers` caps this
+    caller's own fan-out (extra tasks are held here, counted as "held"), and
+    leaving a `with` block waits for the caller's tasks like a real pool would.
+    """
+
+    def __init__(self, sched: _IOScheduler, service: str | None, lane: str, max_workers: int | None = None):
+        self._sched = sched
+        self._service = service
+        self._lane = lane
+        self._limit = max_workers
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._backlog: deque = deque()
+        self._pending: set = set()
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        outer = Future()
+        item = (outer, fn, args, kwargs, self._sched.in_task())
+        with self._lock:
+            self._pending.add(outer)
+            if self._limit and self._inflight >= self._limit:
+                self._backlog.append(item)
+                self._sched.note_held(self._lane, 1)
+                return outer
+            self._inflight += 1
+        self._pump(item)
+        return outer
+
+    def _pump(self, item):
+        # Iterative so a run of tasks that finish inline doesn't recurse per task
+        while item is not None:
+            outer, fn, args, kwargs, nested = item
+            if not outer.set_running_or_notify_cancel():
+                item = self._release(outer)
+                continue
+            inner = self._sched.submit(self._lane, self._service, fn, args, kwargs, nested)
+            if not inner.done():
+                inner.add_done_callback(lambda f, o=outer: self._pump(self._settle(f, o)))
+                return
+            item = self._settle(inner, outer)
+
+    def _settle(self, inner: Future, outer: Future):
+        exc = inner.exception()
+        if exc is None:
+            outer.set_result(inner.result())
+        else:
+            outer.set_exception(exc)
+        return self._release(outer)
+
+    def _release(self, outer: Future):
+        """Drop a finished task; hand back the next held one (its slot carries over)."""
+        with self._lock:
+            self._pending.discard(outer)
+            if self._backlog:
+                self._sched.note_held(self._lane, -1)
+                return self._backlog.popleft()
+            self._inflight -= 1
+            return None
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        if cancel_futures:
+            with self._lock:
+                held = list(self._backlog)
+            for outer, *_ in held:
+                outer.cancel()
+        if wait:
+            with self._lock:
+                pending = list(self._pending)
+            futures_wait(pending)
+
+
+_IO = _IOScheduler(IO_LANE_WORKERS, IO_SERVICE_CAPS)
+
+
+def _io_executor(service: str | None = "s3", lane: str = "interactive", max_workers: int | None = None) -> _IOExecutor:
+    """Executor for parallel calls to one backend ("s3", "ddb", "snowflake", or None)."""
+    return _IOExecutor(_IO, service, lane, max_workers)
+
+
+# General-purpose parallel S3 operations, by lane
+_GLOBAL_EXECUTOR = _io_executor("s3")
+_BACKGROUND_EXECUTOR = _io_executor("s3", lane="background")
+_DDB_EXECUTOR = _io_executor("ddb")
+# CHECK REVIEW bulk S3 reads (I/O-bound); bounded by the S3 cap like everything else
+_CHECK_REVIEW_EXECUTOR = _io_executor("s3")
 
 # -------- App --------
 app = FastAPI(title="Bill Review", version="1.0")
@@ -741,8 +947,455 @@ async def perf_timing_middleware(request: Request, call_next):
 base_dir = os.path.dirname(__file__)
 templates = Jinja2Templates(directory=os.path.join(base_dir, "templates"))
 
+# -------- Cache Manager --------
+# Module-level caches are namespaces of one registry: each is a dict-compatible LRU
+# bounded by entry count and approximate bytes, with an optional max age, per-key
+# single-flight locks, and hit/miss/eviction counters for the /perf page.
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+
+CACHE_MAX_MB = int(os.getenv("CACHE_MAX_MB", "1024"))  # budget for the main _CACHE namespace
+
+
+def _approx_size(obj, _depth: int = 0) -> int:
+    """Cheap deep-size estimate. Large containers are sampled rather than walked."""
+    import sys
+    size = sys.getsizeof(obj)
+    if _depth >= 4:
+        return size
+    if isinstance(obj, dict):
+        n = len(obj)
+        if not n:
+            return size
+        sample = list(islice(obj.items(), 32))
+        per = sum(_approx_size(k, _depth + 1) + _approx_size(v, _depth + 1) for k, v in sample) / len(sample)
+        return size + int(per * n)
+    if isinstance(obj, (list, tuple, set, frozenset, deque)):
+        n = len(obj)
+        if not n:
+            return size
+        sample = list(islice(obj, 32))
+        per = sum(_approx_size(v, _depth + 1) for v in sample) / len(sample)
+        return size + int(per * n)
+    return size
+
+
+class _CacheNamespace(MutableMapping):
+    """LRU mapping with optional TTL (max age since set) and entry/byte budgets.
+
+    Existing call sites keep their own {"ts": ..., "data": ...} freshness checks;
+    the namespace adds the memory bound and the counters underneath them. With a
+    TTL, expired entries read as misses but stay available to get_stale() (for
+    serve-stale-while-refreshing paths) until they are replaced or evicted.
+    """
+
+    def __init__(self, name: str, ttl: float | None = None, max_entries: int | None = None,
+                 max_bytes: int | None = None):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: OrderedDict = OrderedDict()  # key -> (value, stored_at, size)
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._flight_locks: dict = {}  # key -> [lock, callers holding or waiting on it]
+        self.hits = self.misses = self.evictions = self.expirations = self.coalesced = 0
+
+    def _expired(self, stored_at: float) -> bool:
+        return not stored_at or (self.ttl is not None and time.time() - stored_at > self.ttl)
+
+    def __getitem__(self, key):
+        with self._lock:
+            ent = self._data.get(key)
+            if ent is None or self._expired(ent[1]):
+                if ent is not None:
+                    self.expirations += 1
+                self.misses += 1
+                raise KeyError(key)
+            self._data.move_to_end(key)
+            self.hits += 1
+            return ent[0]
+
+    def __setitem__(self, key, value):
+        size = _approx_size(value)
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, time.time(), size)
+            self._bytes += size
+            while self._data and (
+                (self.max_entries is not None and len(self._data) > self.max_entries)
+                or (self.max_bytes is not None and self._bytes > self.max_bytes and len(self._data) > 1)
+            ):
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def __delitem__(self, key):
+        with self._lock:
+            if key not in self._data:
+                raise KeyError(key)
+            self._drop(key)
+
+    def _drop(self, key):
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._data.keys()))
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            ent = self._data.get(key)
+            return ent is not None and not self._expired(ent[1])
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def get_stale(self, key, default=None):
+        """Value for key even past the TTL; not counted as a hit or miss."""
+        with self._lock:
+            ent = self._data.get(key)
+            return default if ent is None else ent[0]
+
+    def stored_at(self, key) -> float | None:
+        """time.time() when key was last set, or None (also after expire())."""
+        with self._lock:
+            ent = self._data.get(key)
+            return ent[1] if ent is not None and ent[1] else None
+
+    def expire(self, key):
+        """Mark key expired now; readers miss, get_stale() still returns the value."""
+        with self._lock:
+            ent = self._data.get(key)
+            if ent is not None:
+                self._data[key] = (ent[0], 0.0, ent[2])
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    @contextmanager
+    def single_flight(self, key):
+        """Serialize loads of one key: the first caller computes, concurrent callers
+        wait and then find the fresh entry on their re-check."""
+        with self._lock:
+            flight = self._flight_locks.get(key)
+            if flight is None:
+                flight = self._flight_locks[key] = [threading.Lock(), 0]
+            flight[1] += 1
+        lk = flight[0]
+        try:
+            if not lk.acquire(blocking=False):
+                with self._lock:
+                    self.coalesced += 1
+                lk.acquire()
+            try:
+                yield
+            finally:
+                lk.release()
+        finally:
+            # Drop the lock only once no caller holds or waits on it
+            with self._lock:
+                flight[1] -= 1
+                if not flight[1]:
+                    self._flight_locks.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            oldest = min((ent[1] for ent in self._data.values() if ent[1]), default=None)
+            return {
+                "name": self.name,
+                "entries": len(self._data),
+                "approx_mb": round(self._bytes / 1048576, 2),
+                "max_entries": self.max_entries,
+                "max_mb": round(self.max_bytes / 1048576, 1) if self.max_bytes else None,
+                "ttl_seconds": self.ttl,
+                "oldest_age_seconds": round(time.time() - oldest, 1) if oldest is not None else None,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "coalesced": self.coalesced,
+            }
+
+
+_CACHE_REGISTRY: dict[str, _CacheNamespace] = {}
+
+
+def _cache_namespace(name: str, ttl: float | None = None, max_entries: int | None = None,
+                     max_mb: float | None = None) -> _CacheNamespace:
+    """Create (or return) a registered cache namespace."""
+    ns = _CACHE_REGISTRY.get(name)
+    if ns is None:
+        ns = _CACHE_REGISTRY[name] = _CacheNamespace(
+            name, ttl=ttl, max_entries=max_entries,
+            max_bytes=int(max_mb * 1048576) if max_mb else None)
+    return ns
+
+
+def _cache_stats() -> dict:
+    namespaces = [ns.stats() for ns in _CACHE_REGISTRY.values()]
+    namespaces.append(_s3_disk_cache_stats())
+    namespaces.extend(proj.cache_stats() for proj in _STAGE_SCANS.values())
+    return {"namespaces": namespaces}
+
+
+# -------- S3 Object Cache --------
+# Read-through cache for immutable-by-ETag S3 objects (Stage 4/7/8 JSONL and the like).
+# Memory tier is a cache namespace keyed (bucket, key) -> {"etag", "body"}; the disk tier
+# keeps bodies under S3_DISK_CACHE_DIR named by sha1(bucket/key|etag), LRU-trimmed to
+# S3_DISK_CACHE_MB. Callers that already listed the prefix pass the listing ETag and pay
+# no request on a hit; otherwise a HEAD supplies the ETag.
+import tempfile
+
+S3_OBJECT_CACHE_MB = int(os.getenv("S3_OBJECT_CACHE_MB", "256"))
+S3_DISK_CACHE_DIR = os.getenv("S3_DISK_CACHE_DIR", os.path.join(tempfile.gettempdir(), "bill_review_s3_cache"))
+S3_DISK_CACHE_MB = int(os.getenv("S3_DISK_CACHE_MB", "2048"))  # 0 disables the disk tier
+
+_S3_OBJECT_CACHE = _cache_namespace("s3_objects", max_mb=S3_OBJECT_CACHE_MB)
+_S3_DISK_LOCK = threading.Lock()
+_S3_DISK_INDEX: "OrderedDict[str, int]" = OrderedDict()  # filename -> size, oldest first
+_S3_DISK_STATE = {"loaded": False, "bytes": 0, "hits": 0, "misses": 0, "evictions": 0, "heads": 0}
+
+
+def _s3_disk_load_index():
+    """Adopt files left by an earlier process (same container), oldest mtime first."""
+    if _S3_DISK_STATE["loaded"]:
+        return
+    _S3_DISK_STATE["loaded"] = True
+    try:
+        os.makedirs(S3_DISK_CACHE_DIR, exist_ok=True)
+        found = []
+        for ent in os.scandir(S3_DISK_CACHE_DIR):
+            if ent.is_file() and not ent.name.endswith(".tmp"):
+                st = ent.stat()
+                found.append((st.st_mtime, ent.name, st.st_size))
+        for _, name, size in sorted(found):
+            _S3_DISK_INDEX[name] = size
+            _S3_DISK_STATE["bytes"] += size
+    except Exception as e:
+        print(f"[S3 CACHE] Disk index load failed: {e}")
+
+
+def _s3_disk_name(bucket: str, key: str, etag: str) -> str:
+    return hashlib.sha1(f"{bucket}/{key}|{etag}".encode("utf-8")).hexdigest()
+
+
+def _s3_disk_get(bucket: str, key: str, etag: str) -> bytes | None:
+    if S3_DISK_CACHE_MB <= 0:
+        return None
+    name = _s3_disk_name(bucket, key, etag)
+    with _S3_DISK_LOCK:
+        _s3_disk_load_index()
+        if name not in _S3_DISK_INDEX:
+            _S3_DISK_STATE["misses"] += 1
+            return None
+        _S3_DISK_INDEX.move_to_end(name)
+    try:
+        with open(os.path.join(S3_DISK_CACHE_DIR, name), "rb") as f:
+            body = f.read()
+    except OSError:
+        with _S3_DISK_LOCK:
+            _S3_DISK_STATE["bytes"] -= _S3_DISK_INDEX.pop(name, 0)
+            _S3_DISK_STATE["misses"] += 1
+        return None
+    with _S3_DISK_LOCK:
+        _S3_DISK_STATE["hits"] += 1
+    return body
+
+
+def _s3_disk_put(bucket: str, key: str, etag: str, body: bytes):
+    if S3_DISK_CACHE_MB <= 0 or len(body) > S3_DISK_CACHE_MB * 1048576:
+        return
+    name = _s3_disk_name(bucket, key, etag)
+    path = os.path.join(S3_DISK_CACHE_DIR, name)
+    try:
+        with _S3_DISK_LOCK:
+            _s3_disk_load_index()
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"[S3 CACHE] Disk write failed for {key}: {e}")
+        return
+    evict = []
+    with _S3_DISK_LOCK:
+        _S3_DISK_STATE["bytes"] += len(body) - _S3_DISK_INDEX.pop(name, 0)
+        _S3_DISK_INDEX[name] = len(body)
+        budget = S3_DISK_CACHE_MB * 1048576
+        while _S3_DISK_STATE["bytes"] > budget and len(_S3_DISK_INDEX) > 1:
+            old, size = _S3_DISK_INDEX.popitem(last=False)
+            _S3_DISK_STATE["bytes"] -= size
+            _S3_DISK_STATE["evictions"] += 1
+            evict.append(old)
+    for old in evict:
+        try:
+            os.remove(os.path.join(S3_DISK_CACHE_DIR, old))
+        except OSError:
+            pass
+
+
+def _s3_disk_cache_stats() -> dict:
+    with _S3_DISK_LOCK:
+        hits, misses = _S3_DISK_STATE["hits"], _S3_DISK_STATE["misses"]
+        return {
+            "name": "s3_objects_disk",
+            "entries": len(_S3_DISK_INDEX),
+            "approx_mb": round(_S3_DISK_STATE["bytes"] / 1048576, 2),
+            "max_entries": None,
+            "max_mb": S3_DISK_CACHE_MB or None,
+            "ttl_seconds": None,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0,
+            "evictions": _S3_DISK_STATE["evictions"],
+            "expirations": 0,
+            "coalesced": _S3_DISK_STATE["heads"],  # HEADs issued for callers without an ETag
+        }
+
+
+def _s3_cached_get(key: str, bucket: str | None = None, etag: str | None = None) -> bytes:
+    """Return the raw body of s3://bucket/key, served from memory or disk when the
+    stored copy's ETag matches. Pass the ETag from a listing when available.
+    Raises like get_object when the object is missing."""
+    bucket = bucket or BUCKET
+    ck = (bucket, key)
+    if etag is None:
+        with _S3_DISK_LOCK:
+            _S3_DISK_STATE["heads"] += 1
+        etag = s3.head_object(Bucket=bucket, Key=key).get("ETag", "")
+    if etag:
+        ent = _S3_OBJECT_CACHE.get(ck)
+        if ent is not None and ent["etag"] == etag:
+            return ent["body"]
+        body = _s3_disk_get(bucket, key, etag)
+        if body is not None:
+            _S3_OBJECT_CACHE[ck] = {"etag": etag, "body": body}
+            return body
+    obj = s3.get_object(Bucket=bucket, Key=key)
+    body = obj["Body"].read()
+    got = obj.get("ETag", "") or etag
+    if got:
+        _S3_OBJECT_CACHE[ck] = {"etag": got, "body": body}
+        _s3_disk_put(bucket, key, got, body)
+    return body
+
+
+def _s3_cached_text(key: str, bucket: str | None = None, etag: str | None = None) -> str:
+    """_s3_cached_get decoded the way _read_s3_text decodes (gunzip .gz, utf-8 lenient)."""
+    raw = _s3_cached_get(key, bucket=bucket, etag=etag)
+    if key.lower().endswith(".gz"):
+        try:
+            return gzip.decompress(raw).decode("utf-8", errors="ignore")
+        except Exception:
+            pass
+    return raw.decode("utf-8", errors="ignore")
+
+
+# -------- Async S3/DDB access --------
+# boto3 blocks, so async handlers hand every AWS call to the I/O scheduler's
+# interactive lane instead of stalling the event loop. The scheduler's service caps
+# bound in-flight calls globally; aio_map additionally caps one request's fan-out so
+# a single large day cannot occupy every slot.
+AIO_REQUEST_FANOUT = int(os.getenv("AIO_REQUEST_FANOUT", "32"))
+_AIO_EXECUTORS = {svc: _io_executor(svc) for svc in ("s3", "ddb")}
+
+
+async def _aio_run(service: str, fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_AIO_EXECUTORS[service], functools.partial(fn, *args, **kwargs))
+
+
+async def aio_call(fn, *args, **kwargs):
+    """Run a blocking S3-bound call on the I/O scheduler and await its result."""
+    return await _aio_run("s3", fn, *args, **kwargs)
+
+
+async def aio_map(fn, items, limit: int | None = None, return_exceptions: bool = False,
+                  service: str = "s3") -> list:
+    """[fn(item) for item in items] on the I/O scheduler, at most `limit` in flight. Results keep input order."""
+    sem = asyncio.Semaphore(limit or AIO_REQUEST_FANOUT)
+
+    async def _one(item):
+        async with sem:
+            return await _aio_run(service, fn, item)
+
+    return await asyncio.gather(*(_one(i) for i in items), return_exceptions=return_exceptions)
+
+
+def _list_prefix_objects(prefix: str, bucket: str) -> list:
+    out = []
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        out.extend(page.get("Contents", []) or [])
+    return out
+
+
+async def aio_list_prefix(prefix: str, bucket: str | None = None) -> list:
+    """All object summaries (Key/ETag/LastModified/Size) under prefix."""
+    return await aio_call(_list_prefix_objects, prefix, bucket or BUCKET)
+
+
+async def aio_get_object(key: str, bucket: str | None = None, etag: str | None = None) -> bytes:
+    """Raw body of s3://bucket/key through the ETag-validated object cache."""
+    return await aio_call(_s3_cached_get, key, bucket=bucket, etag=etag)
+
+
+async def aio_get_objects(keys: List[str], bucket: str | None = None,
+                          etags: Dict[str, str] | None = None) -> Dict[str, bytes]:
+    """Bodies for many keys concurrently. Keys that fail to read are left out."""
+    etags = etags or {}
+    bodies = await aio_map(lambda k: _s3_cached_get(k, bucket=bucket, etag=etags.get(k) or None),
+                           keys, return_exceptions=True)
+    return {k: b for k, b in zip(keys, bodies) if not isinstance(b, BaseException)}
+
+
+async def aio_ddb_query(**kwargs) -> list:
+    """ddb.query with pagination followed; returns every item."""
+    items = []
+    params = dict(kwargs)
+    while True:
+        resp = await _aio_run("ddb", ddb.query, **params)
+        items.extend(resp.get("Items", []))
+        if "LastEvaluatedKey" not in resp:
+            return items
+        params["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+
+def _ddb_batch_get_chunk(table: str, keys: list, projection: str | None) -> list:
+    items = []
+    req: Dict[str, Any] = {"Keys": keys}
+    if projection:
+        req["ProjectionExpression"] = projection
+    while req["Keys"]:
+        resp = ddb.batch_get_item(RequestItems={table: req})
+        items.extend(resp.get("Responses", {}).get(table, []))
+        req = dict(req, Keys=resp.get("UnprocessedKeys", {}).get(table, {}).get("Keys", []))
+    return items
+
+
+async def aio_ddb_batch_get(table: str, keys: list, projection: str | None = None) -> list:
+    """batch_get_item over any number of keys: chunks of 100 fetched concurrently,
+    unprocessed keys retried until drained."""
+    chunks = [keys[i:i + 100] for i in range(0, len(keys), 100)]
+    results = await aio_map(lambda c: _ddb_batch_get_chunk(table, c, projection), chunks, service="ddb")
+    return [item for chunk in results for item in chunk]
+
+
 # simple in-memory cache
-_CACHE: dict = {}
+_CACHE = _cache_namespace("app", max_entries=5000, max_mb=CACHE_MAX_MB)
 CACHE_TTL_SECONDS = 300  # 5 minutes for today's data
 CACHE_TTL_PAST_DAYS = 3600  # 1 hour for past days (they change less frequently)
 
@@ -762,13 +1415,15 @@ def invalidate_day_cache(y: str, m: str, d: str):
         _CACHE.pop(("load_day", y, m, d), None)
     except Exception:
         pass
+    # Stage 4 rows changed; the persisted status rollup's grouping may no longer hold
+    _day_rollup_invalidate(y, m, d)
 
 # NOTE: Submitter Stats and Activity Detail caches have been migrated to the
 # unified _METRICS_CACHE with S3-persisted 60min TTL (see _metrics_serve near line 11733).
 
 # -------- Week Over Week Stats Cache --------
 # Cache week-over-week team stats (persisted to DynamoDB for historical data)
-_WEEK_OVER_WEEK_CACHE: Dict[str, Any] = {}  # key -> {"data": {...}, "ts": datetime}
+_WEEK_OVER_WEEK_CACHE = _cache_namespace("week_over_week", max_entries=200)  # key -> {"data": {...}, "ts": datetime}
 _WEEK_OVER_WEEK_TTL = 600  # 10 minutes (weekly data doesn't change often)
 WEEKLY_ROLLUP_PK = "WEEKLY_ROLLUP"  # DynamoDB PK for weekly stats
 
@@ -852,93 +1507,428 @@ def _save_week_rollup(stats: dict) -> bool:
         print(f"[WEEK_ROLLUP] Error saving cache for {stats.get('week_start', '?')}: {e}")
         return False
 
-# -------- UBI Exclusion Hash Cache --------
-# Cache exclusion hashes (Stage 8 + Stage 99) to avoid re-scanning on every request
 # -------- UBI Exclusion Hash Cache --------
 # Used by suggestions/calculate endpoints to filter out already-assigned lines.
-# NOT invalidated on operations — only refreshes on TTL expiry (5 min).
-_EXCLUSION_HASH_CACHE = {
-    "hashes": set(),
-    "last_refresh": None,
-    "ttl_seconds": 300  # 5 minutes
+# NOT invalidated on operations — refreshes on TTL expiry (5 min).
+#
+# The set is maintained incrementally instead of scanning jrk-bill-ubi-assignments
+# on every refresh: a compacted snapshot (sorted hash array) lives on S3 and every
+# assign/unassign path appends a small delta object {"add": [...], "remove": [...]}
+# next to it. A refresh is one LIST of the delta prefix plus GETs of deltas not seen
+# before; the full table scan only runs to rebuild a missing/old snapshot or when
+# deltas pile up, and then prunes the deltas the new snapshot already covers.
+EXCLUSION_SET_PREFIX = os.getenv("EXCLUSION_SET_PREFIX", "Bill_Parser_Cache/ubi_exclusion/")
+EXCLUSION_SNAPSHOT_MAX_AGE_HOURS = float(os.getenv("EXCLUSION_SNAPSHOT_MAX_AGE_HOURS", "24"))
+EXCLUSION_MAX_DELTAS = int(os.getenv("EXCLUSION_MAX_DELTAS", "2000"))
+_EXCLUSION_SNAPSHOT_KEY = f"{EXCLUSION_SET_PREFIX}snapshot.json.gz"
+_EXCLUSION_DELTA_PREFIX = f"{EXCLUSION_SET_PREFIX}deltas/"
+_EXCLUSION_DELTA_SKEW_SECONDS = 300  # deltas this close to a snapshot's scan start are kept and re-applied
+
+_EXCLUSION_HASH_CACHE = _cache_namespace("ubi_exclusion_hashes", ttl=300, max_entries=1)  # "hashes" -> set
+_EXCLUSION_SYNC_STATE = {
+    "snapshot_etag": None,
+    "snapshot_scan_started": 0.0,
+    "base": frozenset(),
+    "deltas": {},  # delta key -> (add, remove)
+    "last_source": None,
 }
 
 
-def _get_cached_exclusion_hashes(days_back: int = 90) -> set:
-    """Get cached exclusion hashes from DynamoDB (5-min TTL, never invalidated by operations)."""
-    from datetime import datetime
-    cache = _EXCLUSION_HASH_CACHE
-    now = datetime.now()
-    if cache["last_refresh"] and (now - cache["last_refresh"]).total_seconds() < cache["ttl_seconds"]:
-        return cache["hashes"]
-    print("[UBI EXCLUSION CACHE] Loading exclusion hashes...")
-    t0 = time.time()
-    hashes = set()
+def _exclusion_record_delta(add=(), remove=()):
+    """Append an exclusion-set change. Call after the DDB write/delete succeeded so a
+    snapshot scan that starts later always includes it."""
+    import uuid
+    add, remove = sorted(set(add)), sorted(set(remove))
+    if not add and not remove:
+        return
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    key = f"{_EXCLUSION_DELTA_PREFIX}{stamp}_{uuid.uuid4().hex[:8]}.json"
     try:
-        ddb_paginator = ddb.get_paginator('scan')
-        for page in ddb_paginator.paginate(
-            TableName='jrk-bill-ubi-assignments',
-            ProjectionExpression='line_hash'
-        ):
-            for item in page.get('Items', []):
-                if 'line_hash' in item and 'S' in item['line_hash']:
-                    hashes.add(item['line_hash']['S'])
-    except Exception as e:
-        print(f"[UBI EXCLUSION CACHE] Error: {e}")
-    elapsed = time.time() - t0
-    print(f"[UBI EXCLUSION CACHE] Loaded {len(hashes)} hashes in {elapsed:.1f}s")
-    cache["hashes"] = hashes
-    cache["last_refresh"] = now
+        s3.put_object(Bucket=BUCKET, Key=key, Body=json.dumps({"add": add, "remove": remove}).encode("utf-8"),
+                      ContentType="application/json")
+    except Exception as e:
+        print(f"[UBI EXCLUSION CACHE] Could not record delta (next snapshot rebuild reconciles): {e}")
+
+
+def _s3_delta_epoch(key: str) -> float:
+    """Epoch seconds from a "<UTC stamp>_<id>.json" delta or patch key; 0.0 if unparseable."""
+    stamp = key.rsplit("/", 1)[-1].split("_", 1)[0]
+    try:
+        return datetime.strptime(stamp, "%Y%m%dT%H%M%S%fZ").replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return 0.0
+
+
+def _exclusion_full_scan() -> set:
+    hashes = set()
+    ddb_paginator = ddb.get_paginator('scan')
+    for page in ddb_paginator.paginate(
+        TableName='jrk-bill-ubi-assignments',
+        ProjectionExpression='line_hash'
+    ):
+        for item in page.get('Items', []):
+            if 'line_hash' in item and 'S' in item['line_hash']:
+                hashes.add(item['line_hash']['S'])
+    return hashes
+
+
+def _exclusion_rebuild_snapshot(delta_keys) -> set:
+    """Full table scan -> new snapshot; prune deltas the snapshot covers."""
+    scan_started = time.time()
+    hashes = _exclusion_full_scan()
+    payload = {"built_at": datetime.now(timezone.utc).isoformat(), "scan_started": scan_started,
+               "count": len(hashes), "hashes": sorted(hashes)}
+    s3.put_object(Bucket=BUCKET, Key=_EXCLUSION_SNAPSHOT_KEY,
+                  Body=gzip.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8")),
+                  ContentType="application/json", ContentEncoding="gzip")
+    stale = [k for k in delta_keys if _s3_delta_epoch(k) < scan_started - _EXCLUSION_DELTA_SKEW_SECONDS]
+    for n in range(0, len(stale), 1000):
+        try:
+            s3.delete_objects(Bucket=BUCKET, Delete={"Objects": [{"Key": k} for k in stale[n:n + 1000]], "Quiet": True})
+        except Exception as e:
+            print(f"[UBI EXCLUSION CACHE] Delta prune failed: {e}")
+    print(f"[UBI EXCLUSION CACHE] Rebuilt snapshot with {len(hashes)} hashes, pruned {len(stale)} deltas")
+    return hashes
+
+
+def _refresh_exclusion_hashes(state: dict) -> set:
+    # List deltas BEFORE reading the snapshot: if a rebuild lands in between we pair
+    # the new snapshot with a superset of its deltas, which re-applies idempotently.
+    delta_etags = {}
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=BUCKET, Prefix=_EXCLUSION_DELTA_PREFIX):
+        for obj in page.get('Contents', []):
+            delta_etags[obj['Key']] = obj.get('ETag') or None
+    try:
+        snap_etag = s3.head_object(Bucket=BUCKET, Key=_EXCLUSION_SNAPSHOT_KEY).get("ETag", "")
+    except s3.exceptions.ClientError:
+        snap_etag = None
+    if snap_etag and snap_etag != state["snapshot_etag"]:
+        payload = json.loads(gzip.decompress(_s3_cached_get(_EXCLUSION_SNAPSHOT_KEY, etag=snap_etag)))
+        state["base"] = frozenset(payload.get("hashes") or [])
+        state["snapshot_scan_started"] = float(payload.get("scan_started") or 0)
+        state["snapshot_etag"] = snap_etag
+
+    age_h = (time.time() - state["snapshot_scan_started"]) / 3600
+    if not snap_etag or age_h > EXCLUSION_SNAPSHOT_MAX_AGE_HOURS or len(delta_etags) > EXCLUSION_MAX_DELTAS:
+        state["last_source"] = "scan"
+        hashes = _exclusion_rebuild_snapshot(list(delta_etags))
+        # Reload the new snapshot (and the deltas that survived pruning) next refresh
+        state["snapshot_etag"] = None
+        state["deltas"] = {}
+        return hashes
+
+    deltas = state["deltas"]
+    for k in list(deltas):
+        if k not in delta_etags:
+            deltas.pop(k)
+    for k in delta_etags:
+        if k not in deltas:
+            try:
+                d = json.loads(_s3_cached_get(k, etag=delta_etags[k]))
+                deltas[k] = (tuple(d.get("add") or ()), tuple(d.get("remove") or ()))
+            except Exception as e:
+                print(f"[UBI EXCLUSION CACHE] Skipping unreadable delta {k}: {e}")
+    hashes = set(state["base"])
+    for k in sorted(deltas):
+        add, remove = deltas[k]
+        hashes.update(add)
+        hashes.difference_update(remove)
+    state["last_source"] = f"snapshot+{len(deltas)} deltas"
     return hashes
 
 
+def _get_cached_exclusion_hashes(days_back: int = 90) -> set:
+    """Get cached exclusion hashes (snapshot + deltas, 5-min TTL, never invalidated by operations)."""
+    cache = _EXCLUSION_HASH_CACHE
+    hashes = cache.get("hashes")
+    if hashes is not None:
+        return hashes
+    with cache.single_flight("hashes"):
+        # A concurrent request may have refreshed while we waited
+        hashes = cache.get("hashes")
+        if hashes is not None:
+            return hashes
+        state = _EXCLUSION_SYNC_STATE
+        print("[UBI EXCLUSION CACHE] Loading exclusion hashes...")
+        t0 = time.time()
+        try:
+            hashes = _refresh_exclusion_hashes(state)
+        except Exception as e:
+            print(f"[UBI EXCLUSION CACHE] Incremental refresh failed, scanning table: {e}")
+            state["last_source"] = "scan"
+            try:
+                hashes = _exclusion_full_scan()
+            except Exception as e2:
+                print(f"[UBI EXCLUSION CACHE] Error: {e2}")
+                hashes = set()
+        elapsed = time.time() - t0
+        print(f"[UBI EXCLUSION CACHE] Loaded {len(hashes)} hashes in {elapsed:.1f}s ({state['last_source']})")
+        cache["hashes"] = hashes
+        return hashes
+
+
 # -------- UBI Unassigned Bills Cache --------
 # Built externally by jrk-ubi-cache-builder Lambda, app only READS from S3.
-# Operations (assign/archive) do surgical in-memory removal — no rebuilds.
-# _UBI_REMOVED_KEYS tracks keys removed by operations so they survive S3 reloads.
-# When Lambda writes a new cache (new ts), removed keys are cleared since Lambda
-# already excludes archived/assigned bills.
+# The scheduled full build is the base. Between builds the Lambda's S3-event mode
+# (and app removals) publish small patches {"bills": {stage7_key: record or null}}
+# under UBI_CACHE_PATCH_PREFIX; the app applies unseen patches in key order on top
+# of the base, so reloading the base never brings back a bill a patch removed.
+# Patches older than the base's scan_started (less skew) are already in it.
 import threading as _threading
-_UBI_UNASSIGNED_CACHE: dict = {}  # {"data": [...], "ts": float}
-_UBI_FILTER_OPTIONS_CACHE: dict = {}  # {"properties": [], "vendors": [], "gl_codes": []}
+# "store" -> _UbiBillStore, "filter_options" -> {"properties": [], "vendors": [], "gl_codes": []}
+_UBI_UNASSIGNED_CACHE = _cache_namespace("ubi_unassigned", max_entries=2)
 _UBI_CACHE_S3_KEY = "Bill_Parser_Cache/ubi_unassigned_cache.json.gz"
-_UBI_REMOVED_KEYS: set = set()  # s3_keys removed by assign/archive since last Lambda build
-_UBI_LAST_LAMBDA_TS: float = 0  # ts from last Lambda build we loaded
+UBI_CACHE_PATCH_PREFIX = os.getenv("UBI_CACHE_PATCH_PREFIX", "Bill_Parser_Cache/ubi_unassigned_patches/")
+UBI_CACHE_POLL_SECONDS = int(os.getenv("UBI_CACHE_POLL_SECONDS", "30"))
+_UBI_CACHE_PATCH_SKEW_SECONDS = 300
+_UBI_CACHE_STATE = {
+    "etag": "",  # ETag of the base we loaded
+    "scan_started": 0.0,  # base build's scan start; older patches are folded into it
+    "applied": set(),  # patch keys applied on top of the base
+}
+_UBI_CACHE_LOCK = _threading.RLock()
+
+
+def _ubi_bill_first_line_data(bill: dict) -> dict:
+    lines = bill.get("unassigned_lines") or []
+    return (lines[0].get("line_data") or {}) if lines else {}
+
+
+def _ubi_bill_property(bill: dict) -> str:
+    ld = _ubi_bill_first_line_data(bill)
+    return ld.get("EnrichedPropertyName") or ld.get("Property Name") or ""
+
+
+def _ubi_bill_vendor(bill: dict) -> str:
+    ld = _ubi_bill_first_line_data(bill)
+    return ld.get("EnrichedVendorName") or ld.get("Vendor Name") or bill.get("vendor", "") or ""
+
+
+def _ubi_bill_gl_codes(bill: dict) -> set:
+    codes = set()
+    for line in bill.get("unassigned_lines") or []:
+        ld = line.get("line_data") or {}
+        gl = ld.get("EnrichedGLAccountNumber") or ld.get("GL Account Number") or ""
+        if gl:
+            codes.add(gl)
+    return codes
+
+
+class _UbiBillStore:
+    """Unassigned UBI bills keyed by s3_key.
+
+    Secondary indexes (property / vendor name of the first line, every line's GL
+    code, account_key) map to key sets, and one sorted cursor per sort field holds
+    (value, s3_key). Property/vendor filters are substring matches, so they scan the
+    distinct names rather than the bills. Writers and readers share one lock.
+    """
+
+    SORTS = {
+        "amount": lambda b: float(b.get("total_amount") or 0),
+        "modified": lambda b: float(b.get("last_modified_ts") or 0),
+        "vendor": lambda b: _ubi_bill_vendor(b).lower(),
+        "property": lambda b: _ubi_bill_property(b).lower(),
+    }
+    BULK_REMOVE = 64  # Removing more keys than this rebuilds the cursors in one pass
+    SORT_SUBSET_RATIO = 8  # Filtered sets this much smaller than the store are sorted directly
+
+    def __init__(self, bills=()):
+        self._lock = threading.RLock()
+        self.bills = {}
+        self.by_property = {}  # property name -> {s3_key}
+        self.by_vendor = {}
+        self.by_gl = {}
+        self.by_account = {}
+        self._entries = {}  # s3_key -> (property, vendor, gl codes, account_key, {sort: value})
+        for bill in bills:
+            if bill.get("s3_key"):
+                self._index(bill)
+        self.cursors = {name: sorted((e[4][name], k) for k, e in self._entries.items()) for name in self.SORTS}
+
+    def __len__(self):
+        return len(self.bills)
+
+    def __contains__(self, s3_key):
+        return s3_key in self.bills
+
+    def get(self, s3_key: str):
+        return self.bills.get(s3_key)
+
+    def values(self) -> list:
+        with self._lock:
+            return list(self.bills.values())
+
+    def _index(self, bill: dict):
+        key = bill["s3_key"]
+        self._unindex(key)
+        entry = (_ubi_bill_property(bill), _ubi_bill_vendor(bill), _ubi_bill_gl_codes(bill),
+                 bill.get("account_key") or "", {name: fn(bill) for name, fn in self.SORTS.items()})
+        self.bills[key] = bill
+        self._entries[key] = entry
+        self.by_property.setdefault(entry[0], set()).add(key)
+        self.by_vendor.setdefault(entry[1], set()).add(key)
+        for gl in entry[2]:
+            self.by_gl.setdefault(gl, set()).add(key)
+        self.by_account.setdefault(entry[3], set()).add(key)
+        return entry
+
+    def _unindex(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self.bills.pop(key, None)
+        for index, values in ((self.by_property, [entry[0]]), (self.by_vendor, [entry[1]]),
+                              (self.by_gl, entry[2]), (self.by_account, [entry[3]])):
+            for v in values:
+                keys = index.get(v)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del index[v]
+        return entry
+
+    def upsert(self, bill: dict):
+        with self._lock:
+            key = bill["s3_key"]
+            old = self._entries.get(key)
+            if old is not None:
+                self._cursor_remove(key, old)
+            entry = self._index(bill)
+            for name, cursor in self.cursors.items():
+                bisect.insort(cursor, (entry[4][name], key))
+
+    def reindex(self, s3_key: str):
+        """Refresh indexes after a bill was mutated in place."""
+        with self._lock:
+            bill = self.bills.get(s3_key)
+            if bill is not None:
+                self.upsert(bill)
+
+    def _cursor_remove(self, key: str, entry):
+        for name, cursor in self.cursors.items():
+            item = (entry[4][name], key)
+            i = bisect.bisect_left(cursor, item)
+            if i < len(cursor) and cursor[i] == item:
+                del cursor[i]
+
+    def remove(self, s3_key: str) -> bool:
+        with self._lock:
+            entry = self._unindex(s3_key)
+            if entry is None:
+                return False
+            self._cursor_remove(s3_key, entry)
+            return True
+
+    def remove_many(self, keys) -> int:
+        with self._lock:
+            gone = {k for k in keys if k in self._entries}
+            if len(gone) <= self.BULK_REMOVE:
+                return sum(self.remove(k) for k in gone)
+            for k in gone:
+                self._unindex(k)
+            for name in self.cursors:
+                self.cursors[name] = [item for item in self.cursors[name] if item[1] not in gone]
+            return len(gone)
+
+    def apply(self, changes: dict):
+        """{s3_key: bill or None (removed)} — the shape of a cache patch."""
+        with self._lock:
+            self.remove_many([k for k, rec in changes.items() if not rec])
+            for rec in changes.values():
+                if rec:
+                    self.upsert(rec)
+
+    @staticmethod
+    def _names_matching(index: dict, needle: str) -> set:
+        out = set()
+        for name, keys in index.items():
+            if needle in name.lower():
+                out |= keys
+        return out
+
+    def query(self, property_filter: str = "", vendor_filter: str = "", gl_filter: str = "",
+              sort: str = "amount_desc", offset: int = 0, limit: int = 50) -> tuple:
+        """(total matching, one page of bills). property/vendor: case-insensitive substring
+        of the first line's names; gl: exact GL code on any line."""
+        with self._lock:
+            keys = None
+            if property_filter:
+                keys = self._names_matching(self.by_property, property_filter)
+            if vendor_filter:
+                matched = self._names_matching(self.by_vendor, vendor_filter)
+                keys = matched if keys is None else keys & matched
+            if gl_filter:
+                matched = self.by_gl.get(gl_filter, set())
+                keys = set(matched) if keys is None else keys & matched
+
+            name, _, direction = sort.rpartition("_")
+            if name not in self.SORTS or direction not in ("asc", "desc"):
+                name, direction = "amount", "desc"
+            desc = direction == "desc"
+            cursor = self.cursors[name]
+            offset = max(0, offset)
+
+            if keys is None:
+                total = len(cursor)
+                if desc:
+                    hi = total - offset
+                    page = [cursor[i][1] for i in range(hi - 1, max(hi - limit, 0) - 1, -1)]
+                else:
+                    page = [item[1] for item in cursor[offset:offset + limit]]
+            elif len(keys) * self.SORT_SUBSET_RATIO < len(cursor):
+                total = len(keys)
+                ordered = sorted(keys, key=lambda k: (self._entries[k][4][name], k), reverse=desc)
+                page = ordered[offset:offset + limit]
+            else:
+                total = len(keys)
+                page, skipped = [], 0
+                for _, k in (reversed(cursor) if desc else cursor):
+                    if k not in keys:
+                        continue
+                    if skipped < offset:
+                        skipped += 1
+                        continue
+                    page.append(k)
+                    if len(page) >= limit:
+                        break
+            return total, [self.bills[k] for k in page]
+
+    def filter_options(self) -> dict:
+        """Names/codes present in the store (O(distinct values))."""
+        with self._lock:
+            return {
+                "properties": sorted(n for n in self.by_property if n),
+                "vendors": sorted(n for n in self.by_vendor if n),
+                "gl_codes": sorted(self.by_gl),
+            }
+
 
 
 def _load_ubi_cache_from_s3() -> bool:
-    """Load Lambda-built UBI cache from S3. Returns True if loaded successfully.
-    Re-applies _UBI_REMOVED_KEYS so locally-removed bills stay removed.
-    If the Lambda ts is newer than what we had, clears removed keys (Lambda already excluded them).
+    """Load Lambda-built UBI cache from S3 and apply the patches published since it was built.
+    Returns True if loaded successfully.
     """
-    global _UBI_UNASSIGNED_CACHE, _UBI_FILTER_OPTIONS_CACHE, _UBI_REMOVED_KEYS, _UBI_LAST_LAMBDA_TS
     try:
         import gzip
-        obj = s3.get_object(Bucket=BUCKET, Key=_UBI_CACHE_S3_KEY)
-        compressed = obj["Body"].read()
-        payload = json.loads(gzip.decompress(compressed))
-        data = payload.get("data", [])
-        ts = payload.get("ts", 0)
-        age_hours = (time.time() - ts) / 3600
-
-        # If Lambda produced a newer build, clear removed keys (it already excluded them)
-        if ts > _UBI_LAST_LAMBDA_TS:
-            if _UBI_REMOVED_KEYS:
-                print(f"[UBI CACHE] New Lambda build (ts={ts:.0f}), clearing {len(_UBI_REMOVED_KEYS)} removed keys")
-            _UBI_REMOVED_KEYS = set()
-            _UBI_LAST_LAMBDA_TS = ts
-
-        # Re-apply locally-removed keys (operations done since last Lambda build)
-        if _UBI_REMOVED_KEYS:
-            before = len(data)
-            data = [b for b in data if b.get("s3_key") not in _UBI_REMOVED_KEYS]
-            print(f"[UBI CACHE] Re-applied {before - len(data)} local removals ({len(_UBI_REMOVED_KEYS)} tracked keys)")
-
-        _UBI_UNASSIGNED_CACHE = {"data": data, "ts": ts}
-        fo = payload.get("filter_options")
-        if fo:
-            _UBI_FILTER_OPTIONS_CACHE = fo
-        print(f"[UBI CACHE] Loaded {len(data)} bills from S3 (age {age_hours:.1f}h)")
+        with _UBI_CACHE_LOCK:
+            obj = s3.get_object(Bucket=BUCKET, Key=_UBI_CACHE_S3_KEY)
+            compressed = obj["Body"].read()
+            payload = json.loads(gzip.decompress(compressed))
+            data = payload.get("data", [])
+            ts = payload.get("ts", 0)
+            age_hours = (time.time() - ts) / 3600
+
+            _UBI_CACHE_STATE.update({
+                "etag": obj.get("ETag", ""),
+                "scan_started": float(payload.get("scan_started") or ts),
+                "applied": set(),
+            })
+            _UBI_UNASSIGNED_CACHE["store"] = _UbiBillStore(data)
+            fo = payload.get("filter_options")
+            if fo:
+                _UBI_UNASSIGNED_CACHE["filter_options"] = fo
+            print(f"[UBI CACHE] Loaded {len(data)} bills from S3 (age {age_hours:.1f}h)")
+            _apply_ubi_cache_patches()
         return True
     except s3.exceptions.NoSuchKey:
         print("[UBI CACHE] No cache in S3 — waiting for Lambda to build it")
@@ -947,34 +1937,94 @@ def _load_ubi_cache_from_s3() -> bool:
         print(f"[UBI CACHE] Failed to load from S3: {e}")
         return False
 
+
+def _apply_ubi_cache_patches() -> int:
+    """Apply patches not yet applied to the in-memory cache. Returns the number applied."""
+    with _UBI_CACHE_LOCK:
+        store = _UBI_UNASSIGNED_CACHE.get("store")
+        if store is None:
+            return 0
+        state = _UBI_CACHE_STATE
+        listed = {}
+        for page in s3.get_paginator('list_objects_v2').paginate(Bucket=BUCKET, Prefix=UBI_CACHE_PATCH_PREFIX):
+            for obj in page.get('Contents', []):
+                listed[obj['Key']] = obj.get('ETag') or None
+        state["applied"] &= set(listed)  # pruned by a newer build
+        cutoff = state["scan_started"] - _UBI_CACHE_PATCH_SKEW_SECONDS
+        changed = {}
+        new_keys = sorted(k for k in listed if k not in state["applied"] and _s3_delta_epoch(k) >= cutoff)
+        for k in new_keys:
+            try:
+                changed.update(json.loads(_s3_cached_get(k, etag=listed[k])).get("bills") or {})
+            except Exception as e:
+                print(f"[UBI CACHE] Skipping unreadable patch {k}: {e}")
+            state["applied"].add(k)
+        if changed:
+            store.apply(changed)
+            print(f"[UBI CACHE] Applied {len(new_keys)} patches ({len(changed)} bills changed, {len(store)} bills)")
+        return len(new_keys)
+
+
+_UBI_CACHE_PENDING_PATCH: dict = {}  # stage7_key -> record or None, waiting for the background PUT
+_UBI_CACHE_PATCH_LOCK = _threading.Lock()
+
+
+def _ubi_cache_publish_patch(bills: dict):
+    """Queue {stage7_key: bill record or None (removed)} for every app instance to pick up.
+
+    The PUT runs on the background executor, off the request path; changes queued
+    before it runs go out in the same patch object.
+    """
+    with _UBI_CACHE_PATCH_LOCK:
+        schedule = not _UBI_CACHE_PENDING_PATCH
+        _UBI_CACHE_PENDING_PATCH.update(bills)
+    if schedule:
+        _BACKGROUND_EXECUTOR.submit(_ubi_cache_flush_patch)
+
+
+def _ubi_cache_flush_patch():
+    """Publish the queued changes as one patch object."""
+    import uuid
+    with _UBI_CACHE_PATCH_LOCK:
+        bills = dict(_UBI_CACHE_PENDING_PATCH)
+        _UBI_CACHE_PENDING_PATCH.clear()
+    if not bills:
+        return
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    key = f"{UBI_CACHE_PATCH_PREFIX}{stamp}_{uuid.uuid4().hex[:8]}.json"
+    try:
+        s3.put_object(Bucket=BUCKET, Key=key, Body=json.dumps({"bills": bills}).encode("utf-8"),
+                      ContentType="application/json")
+    except Exception as e:
+        print(f"[UBI CACHE] Could not publish patch (next Lambda build reconciles): {e}")
+
+
+def _poll_ubi_cache():
+    """One poll: reload the base when its ETag changed, otherwise apply new patches only."""
+    etag = s3.head_object(Bucket=BUCKET, Key=_UBI_CACHE_S3_KEY).get("ETag", "")
+    if etag != _UBI_CACHE_STATE["etag"]:
+        print("[UBI CACHE] New Lambda build detected, reloading...")
+        _load_ubi_cache_from_s3()
+    else:
+        _apply_ubi_cache_patches()
+
 # -------- PRINT CHECKS Posted Invoices Cache --------
 # Cache posted invoices to avoid scanning S3 on every request
-_PRINT_CHECKS_CACHE = {
-    "invoices": [],  # List of invoice dicts
-    "last_refresh": None,
-    "ttl_seconds": 600  # 10 MINUTES - use Refresh button to force update
-}
+# "invoices" -> list of invoice dicts; 10 MINUTES - use Refresh button to force update
+_PRINT_CHECKS_CACHE = _cache_namespace("print_checks", ttl=600, max_entries=1)
 
 # Cache for invoices already in check slips (DynamoDB scan is slow)
-_CHECK_SLIP_INVOICES_CACHE = {
-    "pdf_ids": set(),
-    "last_refresh": None,
-    "ttl_seconds": 300  # 5 minutes
-}
+_CHECK_SLIP_INVOICES_CACHE = _cache_namespace("check_slip_invoices", ttl=300, max_entries=1)  # "pdf_ids" -> set
 
 # Cache for vendor codes (rarely changes)
-_VENDOR_CODE_CACHE = {
-    "map": {},
-    "last_refresh": None,
-    "ttl_seconds": 3600  # 1 hour
-}
+_VENDOR_CODE_CACHE = _cache_namespace("vendor_codes", ttl=3600, max_entries=1)  # "map" -> {vendor_id: vendor_code}
 
 def _get_cached_vendor_codes():
     """Get vendor code map from cache or S3."""
     cache = _VENDOR_CODE_CACHE
-    now = dt.datetime.now()
-    if cache["last_refresh"] and (now - cache["last_refresh"]).total_seconds() < cache["ttl_seconds"] and cache["map"]:
-        return cache["map"]
+    cached = cache.get("map")
+    if cached:
+        return cached
     vendor_code_map = {}
     try:
         vend_cache_obj = s3.get_object(Bucket="api-vendor", Key="vendors/latest.json")
@@ -985,7 +2035,6 @@ def _get_cached_vendor_codes():
             if vid and vcode:
                 vendor_code_map[vid] = vcode
         cache["map"] = vendor_code_map
-        cache["last_refresh"] = now
     except Exception as e:
         print(f"[PRINT CHECKS] Vendor cache load error: {e}")
     return vendor_code_map
@@ -993,46 +2042,38 @@ def _get_cached_vendor_codes():
 def _get_cached_invoices_in_slips(force_refresh=False):
     """Get pdf_ids already in check slips from cache or DynamoDB."""
     cache = _CHECK_SLIP_INVOICES_CACHE
-    now = dt.datetime.now()
-    if not force_refresh and cache["last_refresh"] and (now - cache["last_refresh"]).total_seconds() < cache["ttl_seconds"]:
-        return cache["pdf_ids"]
+    cached = None if force_refresh else cache.get("pdf_ids")
+    if cached is not None:
+        return cached
     pdf_ids = _ddb_get_invoices_in_check_slips()
     cache["pdf_ids"] = pdf_ids
-    cache["last_refresh"] = now
     return pdf_ids
 
 def _invalidate_print_checks_cache():
     """Invalidate the print checks cache (call after creating check slips)."""
-    _PRINT_CHECKS_CACHE["last_refresh"] = None
-    _PRINT_CHECKS_CACHE["invoices"] = []
-    _CHECK_SLIP_INVOICES_CACHE["last_refresh"] = None
-    _CHECK_SLIP_INVOICES_CACHE["pdf_ids"] = set()
+    _PRINT_CHECKS_CACHE.clear()
+    _CHECK_SLIP_INVOICES_CACHE.clear()
     print("[PRINT CHECKS] All caches invalidated")
 
 # -------- Vendor-Property / Vendor-GL Historical Pair Cache --------
 # Scans Stage 7 + Historical Archive for the past year to build sets of
 # (vendor_id, property_id) and (vendor_id, gl_code) pairs that have been posted.
-_VENDOR_PAIR_CACHE = {
-    "vendor_property": set(),   # set of (vendor_id, property_id) tuples
-    "vendor_gl": set(),          # set of (vendor_id, gl_code) tuples
-    "last_refresh": None,
-    "ttl_seconds": 3600,         # 1 hour
-    "scan_succeeded": False,     # tracks if last scan got real data
-}
+# "pairs" -> ({(vendor_id, property_id)}, {(vendor_id, gl_code)}); 1 hour
+_VENDOR_PAIR_CACHE = _cache_namespace("vendor_pairs", ttl=3600, max_entries=1)
 import threading
 _VENDOR_PAIR_LOCK = threading.Lock()
 
 # Precomputed INVOICES_MAT cache for instant accrual modal loads
-_INVOICE_HISTORY_CACHE = {
-    "data": {},           # {property_code: {vendor_name_lower: [{"month": "2025-01", "amount": float, "gl_account": str, "gl_name": str, "vendor_raw": str, "line_count": int}]}}
-    "account_data": {},   # {property_code: {account_number: [{"month": "2025-01", "amount": float, "gl_account": str, "gl_name": str, "vendor_raw": str, "line_count": int}]}}
-    "prop_code_map": {},  # {property_id: property_code}  from dim_property
-    "vendor_index": {},   # {property_code: [vendor_name_lower, ...]}  for regex scanning
-    "last_refresh": None,
-    "ttl_seconds": 7200,  # 2 hours (mat view updates daily)
-    "loading": False,
-}
-_INVOICE_HISTORY_LOCK = threading.Lock()
+# "index" -> {
+#     "data": {property_code: {vendor_name_lower: [{"month": "2025-01", "amount": float, "gl_account": str, "gl_name": str, "vendor_raw": str, "line_count": int}]}},
+#     "account_data": {property_code: {account_number: [same records]}},
+#     "prop_code_map": {property_id: property_code}  from dim_property,
+#     "vendor_index": {property_code: [vendor_name_lower, ...]}  for regex scanning,
+# }
+# Replaced whole by the background reload, so readers never see a half-built index.
+_INVOICE_HISTORY_CACHE = _cache_namespace("invoice_history", max_entries=1)
+_INVOICE_HISTORY_REFRESH_SECONDS = 7200  # 2 hours (mat view updates daily)
+_INVOICE_HISTORY_LOCK = threading.Lock()  # held while a load runs
 
 # -------- Precomputed Search Index --------
 # In-memory index of all Stage 4 invoice metadata for instant advanced search
@@ -1044,9 +2085,16 @@ _SEARCH_INDEX = {
     "loading": False,
     "last_refresh": None,
     "entry_count": 0,
+    "lookup": None,          # trigram postings + date order over "entries" (see _build_search_lookup)
+    "removed": set(),        # pdf_ids hidden from queries until the next build drops them
+    "tombstones": {},        # {month: {pdf_id}} persisted in the delta until that segment is rewritten
+    "segments_dirty": False, # True after a legacy load — next save rewrites every segment
 }
 _SEARCH_INDEX_LOCK = threading.Lock()
 
+_VENDOR_PAIR_FIELDS = ("EnrichedVendorID", "EnrichedPropertyID", "EnrichedGLAccountNumber")
+
+
 def _scan_historical_pairs_for_prefix(prefix: str, start_date, end_date):
     """Scan a single S3 prefix (Stage 7 or Archive) for vendor-property and vendor-GL pairs."""
     vp_pairs = set()
@@ -1073,26 +2121,19 @@ def _scan_historical_pairs_for_prefix(prefix: str, start_date, end_date):
                 for obj in page.get('Contents', []):
                     k = obj['Key']
                     if k.endswith('.jsonl'):
-                        keys.append(k)
+                        keys.append((k, obj.get('ETag') or None))
 
-            for key in keys:
+            for key, etag in keys:
                 try:
-                    resp = s3.get_object(Bucket=BUCKET, Key=key)
-                    content = resp['Body'].read().decode('utf-8')
-                    for line in content.strip().split('\n'):
-                        if not line.strip():
-                            continue
-                        try:
-                            rec = json.loads(line)
-                            vendor_id = str(rec.get("EnrichedVendorID") or "").strip()
-                            prop_id = str(rec.get("EnrichedPropertyID") or "").strip()
-                            gl_code = str(rec.get("EnrichedGLAccountNumber") or "").strip()
-                            if vendor_id and prop_id:
-                                local_vp.add((vendor_id, prop_id))
-                            if vendor_id and gl_code:
-                                local_vg.add((vendor_id, gl_code))
-                        except Exception:
-                            pass
+                    for rec in _s3_jsonl_records(key, etag=etag, fields=_VENDOR_PAIR_FIELDS,
+                                                 skip_large=JSONL_SKIP_LARGE_BYTES):
+                        vendor_id = str(rec.get("EnrichedVendorID") or "").strip()
+                        prop_id = str(rec.get("EnrichedPropertyID") or "").strip()
+                        gl_code = str(rec.get("EnrichedGLAccountNumber") or "").strip()
+                        if vendor_id and prop_id:
+                            local_vp.add((vendor_id, prop_id))
+                        if vendor_id and gl_code:
+                            local_vg.add((vendor_id, gl_code))
                 except Exception:
                     pass
         except Exception:
@@ -1100,7 +2141,7 @@ def _scan_historical_pairs_for_prefix(prefix: str, start_date, end_date):
         return local_vp, local_vg
 
     # Parallel scan across months
-    futures = [_GLOBAL_EXECUTOR.submit(_list_and_parse, mp) for mp in month_prefixes]
+    futures = [_BACKGROUND_EXECUTOR.submit(_list_and_parse, mp) for mp in month_prefixes]
     for f in futures:
         try:
             local_vp, local_vg = f.result(timeout=120)
@@ -1116,21 +2157,23 @@ def _get_cached_vendor_pairs(force_refresh=False):
     """Get vendor-property and vendor-GL pair sets from cache or scan S3.
     Thread-safe with stampede protection. Returns stale cache on scan failure."""
     cache = _VENDOR_PAIR_CACHE
-    now = dt.datetime.now()
-    if not force_refresh and cache["last_refresh"] and (now - cache["last_refresh"]).total_seconds() < cache["ttl_seconds"]:
-        return cache["vendor_property"], cache["vendor_gl"]
+    pairs = None if force_refresh else cache.get("pairs")
+    if pairs is not None:
+        return pairs
 
     # Use lock to prevent concurrent scans (stampede protection)
     acquired = _VENDOR_PAIR_LOCK.acquire(blocking=False)
     if not acquired:
         # Another thread is already refreshing; return current cache (may be stale)
         print("[VENDOR PAIRS] Scan already in progress, returning current cache")
-        return cache["vendor_property"], cache["vendor_gl"]
+        return cache.get_stale("pairs", (set(), set()))
 
     try:
         # Double-check after acquiring lock (another thread may have just finished)
-        if not force_refresh and cache["last_refresh"] and (now - cache["last_refresh"]).total_seconds() < cache["ttl_seconds"]:
-            return cache["vendor_property"], cache["vendor_gl"]
+        pairs = None if force_refresh else cache.get("pairs")
+        if pairs is not None:
+            return pairs
+        stale = cache.get_stale("pairs")
 
         print("[VENDOR PAIRS] Scanning Stage 7 + Archive for historical pairs...")
         end_date = dt.date.today()
@@ -1142,8 +2185,8 @@ def _get_cached_vendor_pairs(force_refresh=False):
         prefixes_attempted = 2
 
         # Scan both Stage 7 and Historical Archive in parallel
-        stage7_future = _GLOBAL_EXECUTOR.submit(_scan_historical_pairs_for_prefix, POST_ENTRATA_PREFIX, start_date, end_date)
-        archive_future = _GLOBAL_EXECUTOR.submit(_scan_historical_pairs_for_prefix, HIST_ARCHIVE_PREFIX, start_date, end_date)
+        stage7_future = _BACKGROUND_EXECUTOR.submit(_scan_historical_pairs_for_prefix, POST_ENTRATA_PREFIX, start_date, end_date)
+        archive_future = _BACKGROUND_EXECUTOR.submit(_scan_historical_pairs_for_prefix, HIST_ARCHIVE_PREFIX, start_date, end_date)
 
         for future in [stage7_future, archive_future]:
             try:
@@ -1157,19 +2200,19 @@ def _get_cached_vendor_pairs(force_refresh=False):
         # If no prefixes succeeded at all, keep stale cache
         if prefixes_succeeded == 0:
             print("[VENDOR PAIRS] All scans failed; keeping stale cache to avoid false positives")
-            cache["last_refresh"] = now
-            return cache["vendor_property"], cache["vendor_gl"]
+            cache["pairs"] = stale or (set(), set())
+            return cache["pairs"]
 
         # If partial scan (some prefixes failed) and we got fewer pairs than before,
         # keep stale cache to avoid false positives from missing data
-        if prefixes_succeeded < prefixes_attempted and cache["scan_succeeded"]:
-            old_vp_count = len(cache["vendor_property"])
-            old_vg_count = len(cache["vendor_gl"])
+        if prefixes_succeeded < prefixes_attempted and stale is not None:
+            old_vp_count = len(stale[0])
+            old_vg_count = len(stale[1])
             if len(vp_all) < old_vp_count or len(vg_all) < old_vg_count:
                 print(f"[VENDOR PAIRS] Partial scan returned fewer pairs (VP: {len(vp_all)} vs {old_vp_count}, "
                       f"VG: {len(vg_all)} vs {old_vg_count}); keeping stale cache")
-                cache["last_refresh"] = now
-                return cache["vendor_property"], cache["vendor_gl"]
+                cache["pairs"] = stale
+                return stale
 
         # Apply overrides from DynamoDB config
         vp_overrides = _ddb_get_config("vendor-property-overrides") or []
@@ -1192,10 +2235,7 @@ def _get_cached_vendor_pairs(force_refresh=False):
                 elif ov.get("action") == "block":
                     vg_all.discard((vid, gl))
 
-        cache["vendor_property"] = vp_all
-        cache["vendor_gl"] = vg_all
-        cache["last_refresh"] = now
-        cache["scan_succeeded"] = True
+        cache["pairs"] = (vp_all, vg_all)
         print(f"[VENDOR PAIRS] Loaded {len(vp_all)} vendor-property pairs, {len(vg_all)} vendor-GL pairs")
         return vp_all, vg_all
     finally:
@@ -1204,34 +2244,28 @@ def _get_cached_vendor_pairs(force_refresh=False):
 
 def _remove_bill_from_ubi_cache(s3_key: str):
     """Remove a specific bill from the in-memory UBI cache by s3_key.
-    Also adds to _UBI_REMOVED_KEYS so it stays removed across S3 reloads."""
-    global _UBI_REMOVED_KEYS
-    _UBI_REMOVED_KEYS.add(s3_key)
-    cached_data = _UBI_UNASSIGNED_CACHE.get("data")
-    if cached_data is not None:
-        before = len(cached_data)
-        _UBI_UNASSIGNED_CACHE["data"] = [b for b in cached_data if b.get("s3_key") != s3_key]
-        after = len(_UBI_UNASSIGNED_CACHE["data"])
-        if before != after:
-            print(f"[UBI CACHE] Removed bill {s3_key.split('/')[-1]} from cache ({before}->{after}, {len(_UBI_REMOVED_KEYS)} tracked)")
+    Also queues a removal patch so it stays removed across S3 reloads and instances."""
+    _ubi_cache_publish_patch({s3_key: None})
+    store = _UBI_UNASSIGNED_CACHE.get("store")
+    if store is not None:
+        if store.remove(s3_key):
+            print(f"[UBI CACHE] Removed bill {s3_key.split('/')[-1]} from cache ({len(store)} left)")
         else:
-            print(f"[UBI CACHE] Bill not found in cache: {s3_key.split('/')[-1]} (tracked for future reloads)")
+            print(f"[UBI CACHE] Bill not found in cache: {s3_key.split('/')[-1]} (removal patch queued)")
 
 
 def _add_bill_to_ubi_cache(s3_key: str, rows: list, posted_at: str = "", submitter: str = ""):
     """Append a synthesized bill record to the in-memory UBI cache so a freshly-advanced
-    Stage 7 bill shows up in BILLBACK within seconds rather than waiting for the next
-    Lambda rebuild. The next Lambda rebuild produces the canonical record (with
-    suggestions, duplicate warnings, last_assigned_period); this synthesized one is
-    overwritten then.
+    Stage 7 bill shows up in BILLBACK right away. The Lambda's S3-event patch for the
+    new key (seconds later) carries the canonical record (with suggestions, duplicate
+    warnings, last_assigned_period); this synthesized one is overwritten then.
 
     Mirrors the bill_info shape from lambda_ubi_cache_builder.py:671-694.
     Suggestion / duplicate / last_assigned fields are left None — they will populate
-    on next Lambda build. is_ubi_account is set optimistically; if the account isn't
+    with the Lambda's patch. is_ubi_account is set optimistically; if the account isn't
     actually a UBI account, the BILLBACK UI's filter logic will hide it once the
-    Lambda rebuild lands the canonical record.
+    canonical record lands.
     """
-    global _UBI_REMOVED_KEYS
     if not rows:
         return
     try:
@@ -1283,11 +2317,10 @@ def _add_bill_to_ubi_cache(s3_key: str, rows: list, posted_at: str = "", submitt
             "prior_period_suggestion": None,
         }
 
-        if _UBI_UNASSIGNED_CACHE.get("data") is not None:
-            existing_keys = {b.get("s3_key") for b in _UBI_UNASSIGNED_CACHE["data"]}
-            if s3_key not in existing_keys:
-                _UBI_UNASSIGNED_CACHE["data"].append(bill_record)
-                _UBI_REMOVED_KEYS.discard(s3_key)
+        store = _UBI_UNASSIGNED_CACHE.get("store")
+        if store is not None:
+            if s3_key not in store:
+                store.upsert(bill_record)
                 print(f"[UBI CACHE] Appended new S7 bill {s3_key.split('/')[-1]} ({len(unassigned_lines)} lines, ${total_amount:.2f})")
     except Exception as e:
         print(f"[UBI CACHE] Failed to append bill to cache: {e}")
@@ -1410,25 +2443,10 @@ async def startup_prewarm_caches():
         print("[STARTUP] Loading UBI cache from S3 (built by Lambda)...")
         _load_ubi_cache_from_s3()
         print("[STARTUP] UBI cache ready")
-        # Track the S3 ETag so we only download when the file actually changes
-        last_etag = ""
         while True:
-            _t.sleep(300)  # Check every 5 minutes for Lambda updates
+            _t.sleep(UBI_CACHE_POLL_SECONDS)
             try:
-                head = s3.head_object(Bucket=BUCKET, Key=_UBI_CACHE_S3_KEY)
-                etag = head.get("ETag", "")
-                if etag == last_etag:
-                    continue  # Same file, don't reload — preserves local removals
-                # File changed — download and check Lambda ts
-                import gzip as _gzip
-                obj = s3.get_object(Bucket=BUCKET, Key=_UBI_CACHE_S3_KEY)
-                compressed = obj["Body"].read()
-                payload = json.loads(_gzip.decompress(compressed))
-                new_ts = payload.get("ts", 0)
-                last_etag = etag
-                if new_ts > _UBI_LAST_LAMBDA_TS:
-                    print(f"[UBI CACHE] New Lambda build detected (ts {_UBI_LAST_LAMBDA_TS:.0f} -> {new_ts:.0f}), reloading...")
-                    _load_ubi_cache_from_s3()
+                _poll_ubi_cache()
             except Exception as e:
                 print(f"[UBI CACHE] Poll error: {e}")
     threading.Thread(target=ubi_cache_startup_and_poll, daemon=True, name="ubi-cache-poll").start()
@@ -1436,7 +2454,7 @@ async def startup_prewarm_caches():
     # Background refresh thread for invoice history cache (every 2 hours)
     def _invoice_history_refresh_loop():
         while True:
-            time.sleep(7200)
+            time.sleep(_INVOICE_HISTORY_REFRESH_SECONDS)
             try:
                 _load_invoice_history_cache()
             except Exception:
@@ -1706,28 +2724,174 @@ def list_dates() -> List[Dict[str, Any]]:
     return dates
 
 
-def _fetch_s3_file(key: str) -> List[Dict[str, Any]]:
+# -------- JSONL Parsing --------
+# Stage files are parsed line by line from bytes, or straight from the S3 streaming
+# body (the stage scan), with orjson and a stdlib fallback. Every line is parsed in
+# full; `fields` then keeps only the named keys and `skip_large` nulls oversized
+# top-level string values (embedded base64 PDFs) so kept records don't pin them.
+# Only lines longer than the limit pay for that pass. Neither may be used for rows
+# that are written back or hashed (_compute_stable_line_hash covers the whole record).
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+
+JSONL_SKIP_LARGE_BYTES = int(os.getenv("JSONL_SKIP_LARGE_BYTES", str(256 * 1024)))
+# Characters str.splitlines() breaks on but bytes.splitlines() does not
+_JSONL_STR_ONLY_BREAKS = (b"\x0b", b"\x0c", b"\x1c", b"\x1d", b"\x1e", b"\xc2\x85", b"\xe2\x80\xa8", b"\xe2\x80\xa9")
+
+
+def _json_loads_fast(line):
+    """json.loads for one JSONL line (bytes or str); invalid UTF-8 is dropped like decode(errors="ignore")."""
+    if _orjson is not None:
+        try:
+            return _orjson.loads(line)
+        except Exception:
+            pass  # NaN, huge ints, bad UTF-8: let the stdlib decide
+    try:
+        return json.loads(line)
+    except UnicodeDecodeError:
+        return json.loads(line.decode("utf-8", errors="ignore"))
+
+
+def _jsonl_lines(data) -> list:
+    """Physical lines of a JSONL body, numbered exactly as str.splitlines() numbers the
+    decoded text (row ids like key#idx depend on that numbering)."""
+    if any(b in data for b in _JSONL_STR_ONLY_BREAKS):
+        return data.decode("utf-8", errors="ignore").splitlines()
+    return data.splitlines()
+
+
+def _drop_large_values(rec: dict, limit: int) -> dict:
+    """rec with top-level string values of at least `limit` characters set to None."""
+    return {k: None if isinstance(v, str) and len(v) >= limit else v for k, v in rec.items()}
+
+
+def _iter_jsonl_records(data, fields=None, skip_large: int | None = None, contains: bytes | None = None):
+    """Yield (line_index, record) for each parseable JSONL line.
+
+    `data` is bytes, an S3 StreamingBody (read through iter_lines in 1MB chunks; its
+    line numbers count b"\\n"-separated lines) or an iterable of lines. Each line is
+    parsed in full; `fields` then projects the record to those keys and `skip_large`
+    nulls its top-level string values of at least that many characters when the line
+    is longer than that. `contains` skips lines lacking that raw substring unparsed.
+    """
+    if isinstance(data, (bytes, bytearray)):
+        lines = _jsonl_lines(data)
+    elif hasattr(data, "iter_lines"):
+        lines = data.iter_lines(chunk_size=1 << 20)
+    else:
+        lines = data
+    wanted = tuple(fields) if fields else None
+    contains_str = contains.decode("utf-8") if contains is not None else None
+    for idx, line in enumerate(lines):
+        if contains is not None and (contains if isinstance(line, (bytes, bytearray)) else contains_str) not in line:
+            continue
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            rec = _json_loads_fast(line)
+        except Exception:
+            continue
+        if not isinstance(rec, dict):
+            continue
+        if wanted is not None:
+            rec = {k: rec[k] for k in wanted if k in rec}
+        if skip_large and len(line) > skip_large:
+            rec = _drop_large_values(rec, skip_large)
+        yield idx, rec
+
+
+def _s3_jsonl_records(key: str, etag: str | None = None, fields=None, skip_large: int | None = None,
+                      contains: bytes | None = None) -> list:
+    """Records of one JSONL(.gz) object via the ETag-validated object cache."""
+    raw = _s3_cached_get(key, etag=etag)
+    if key.lower().endswith(".gz"):
+        raw = gzip.decompress(raw)
+    return [rec for _, rec in _iter_jsonl_records(raw, fields=fields, skip_large=skip_large, contains=contains)]
+
+
+def _s3_read_first_jsonl_record(key: str, fields=None, skip_large: int | None = None) -> dict | None:
+    """First record of a JSONL object using ranged GETs (32KB, then 512KB, then the
+    whole object) so bills with an embedded PDF don't cost a full download."""
+    for range_end in (32767, 524287, None):
+        kwargs = {"Bucket": BUCKET, "Key": key}
+        if range_end is not None:
+            kwargs["Range"] = f"bytes=0-{range_end}"
+        obj = s3.get_object(**kwargs)
+        chunk = obj["Body"].read()
+        obj["Body"].close()
+        # A ranged read that stopped mid-line can't be parsed; widen the range
+        complete = range_end is None or b"\n" in chunk or len(chunk) <= range_end
+        if not complete:
+            continue
+        first_line = chunk.split(b"\n", 1)[0]
+        for _, rec in _iter_jsonl_records(first_line, fields=fields, skip_large=skip_large):
+            return rec
+        return None
+    return None
+
+
+def _fetch_s3_file(key: str, etag: str | None = None) -> List[Dict[str, Any]]:
     """Fetch a single S3 JSONL file and parse it. Used for parallel loading."""
     try:
-        body = s3.get_object(Bucket=BUCKET, Key=key)["Body"].read().decode("utf-8", errors="ignore")
         rows = []
-        for idx, line in enumerate(body.splitlines()):
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                rec = json.loads(line)
-                rec["__s3_key__"] = key
-                rec["__row_idx__"] = idx
-                rec["__id__"] = f"{key}#{idx}"
-                rows.append(rec)
-            except Exception:
-                continue
+        for idx, rec in _iter_jsonl_records(_s3_cached_get(key, etag=etag)):
+            rec["__s3_key__"] = key
+            rec["__row_idx__"] = idx
+            rec["__id__"] = f"{key}#{idx}"
+            rows.append(rec)
         return rows
     except Exception:
         return []
 
 
+# -------- Stage 4 Day Snapshots --------
+# One compacted gzip object per day holding the parsed rows of every Stage 4 file,
+# keyed by source key + ETag. The per-file JSONL stays the source of truth: load_day
+# still LISTs the day prefix (one cheap call) and only GETs files whose ETag is not in
+# the snapshot, then writes the merged snapshot back so the next miss is one GET.
+
+def _day_snapshot_key(y: str, m: str, d: str) -> str:
+    return f"{DAY_SNAPSHOT_PREFIX}yyyy={y}/mm={m}/dd={d}/day.json.gz"
+
+
+def _load_day_snapshot(y: str, m: str, d: str) -> Dict[str, Dict[str, Any]]:
+    """Return {s3_key: {"etag": str, "rows": [...]}} from the day snapshot, or {} if absent/unreadable."""
+    try:
+        obj = s3.get_object(Bucket=BUCKET, Key=_day_snapshot_key(y, m, d))
+        payload = json.loads(gzip.decompress(obj["Body"].read()))
+        files = payload.get("files", {})
+        return files if isinstance(files, dict) else {}
+    except s3.exceptions.NoSuchKey:
+        return {}
+    except Exception as e:
+        print(f"[DAY SNAPSHOT] Failed to read {y}-{m}-{d}: {e}")
+        return {}
+
+
+def _save_day_snapshot(y: str, m: str, d: str, files: Dict[str, Dict[str, Any]]):
+    """Serialize the day snapshot now (before callers mutate the rows) and upload it in the background.
+    Best-effort: a failed write only costs the next miss extra GETs.
+    """
+    try:
+        payload = {"files": files, "saved_at": dt.datetime.utcnow().isoformat() + "Z"}
+        raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    except Exception as e:
+        print(f"[DAY SNAPSHOT] Failed to serialize {y}-{m}-{d}: {e}")
+        return
+
+    def _upload():
+        try:
+            s3.put_object(Bucket=BUCKET, Key=_day_snapshot_key(y, m, d), Body=gzip.compress(raw),
+                          ContentType="application/json", ContentEncoding="gzip")
+        except Exception as e:
+            print(f"[DAY SNAPSHOT] Failed to write {y}-{m}-{d}: {e}")
+
+    _BACKGROUND_EXECUTOR.submit(_upload)
+
+
 def load_day(y: str, m: str, d: str, force_refresh: bool = False) -> List[Dict[str, Any]]:
     # cached by date - use longer TTL for past days
     _k = ("load_day", y, m, d)
@@ -1736,17 +2900,31 @@ def load_day(y: str, m: str, d: str, force_refresh: bool = False) -> List[Dict[s
     ttl = _get_cache_ttl(y, m, d)
     if not force_refresh and ent and (now - ent.get("ts", 0) < ttl):
         return ent.get("data", [])
+    # Single-flight: concurrent misses for the same day share one S3 load
+    with _CACHE.single_flight(_k):
+        ent = _CACHE.get(_k)
+        if ent and ent.get("ts", 0) >= now:
+            return ent.get("data", [])
+        rows = _load_day_from_s3(y, m, d)
+        _CACHE[_k] = {"ts": time.time(), "data": rows}
+        return rows
+
+
+def _load_day_from_s3(y: str, m: str, d: str) -> List[Dict[str, Any]]:
+    """Uncached body of load_day: list the Stage 4 day prefix and merge snapshot + changed files."""
     prefix = f"{ENRICH_PREFIX}yyyy={y}/mm={m}/dd={d}/"
     paginator = s3.get_paginator("list_objects_v2")
     pages = paginator.paginate(Bucket=BUCKET, Prefix=prefix)
 
-    # Collect all keys first
+    # Collect all keys first (with ETags to validate snapshot entries)
     keys = []
+    etags: Dict[str, str] = {}
     for page in pages:
         for obj in page.get("Contents", []):
             key = obj["Key"]
             if key.lower().endswith(".jsonl"):
                 keys.append(key)
+                etags[key] = obj.get("ETag", "")
 
     # Deduplicate LARGEFILE variants: if both foo.jsonl and foo_LARGEFILE_.jsonl
     # exist, drop the normal version (LARGEFILE was produced by the large-file
@@ -1759,19 +2937,41 @@ def load_day(y: str, m: str, d: str, force_refresh: bool = False) -> List[Dict[s
     if largefile_superseded:
         keys = [k for k in keys if k not in largefile_superseded]
 
+    # Reuse snapshot entries whose ETag still matches; only fetch new/changed files
+    snapshot = _load_day_snapshot(y, m, d) if keys else {}
+    files: Dict[str, Dict[str, Any]] = {}
+    to_fetch = []
+    for key in keys:
+        snap = snapshot.get(key)
+        if snap and etags.get(key) and snap.get("etag") == etags[key]:
+            files[key] = snap
+        else:
+            to_fetch.append(key)
+
+    reused = len(files)
+
     # Fetch files in parallel (up to 50 concurrent requests)
-    rows: List[Dict[str, Any]] = []
-    if keys:
-        with ThreadPoolExecutor(max_workers=50) as executor:
-            futures = {executor.submit(_fetch_s3_file, key): key for key in keys}
+    if to_fetch:
+        with _io_executor("s3", max_workers=50) as executor:
+            futures = {executor.submit(_fetch_s3_file, key, etags.get(key) or None): key for key in to_fetch}
             for future in as_completed(futures):
                 try:
                     file_rows = future.result()
-                    rows.extend(file_rows)
                 except Exception:
-                    pass
+                    continue
+                # Empty result may be a failed GET - don't pin it in the snapshot
+                if file_rows:
+                    files[futures[future]] = {"etag": etags.get(futures[future], ""), "rows": file_rows}
+
+    rows: List[Dict[str, Any]] = []
+    for key in keys:
+        if key in files:
+            rows.extend(files[key]["rows"])
+
+    # Persist the merged snapshot if anything was added or removed
+    if len(files) > reused or reused != len(snapshot):
+        _save_day_snapshot(y, m, d, files)
 
-    _CACHE[_k] = {"ts": now, "data": rows}
     return rows
 
 
@@ -1812,6 +3012,7 @@ def _write_jsonl(prefix: str, y: str, m: str, d: str, basename: str, rows: List[
                 r[acct_field] = _clean_account_number(r[acct_field])
     body = "\n".join(json.dumps(r, ensure_ascii=False) for r in rows) + "\n"
     s3.put_object(Bucket=BUCKET, Key=out_key, Body=body.encode('utf-8'), ContentType='application/x-ndjson')
+    _stage_scan_mark_stale()
     return out_key
 
 
@@ -1853,13 +3054,19 @@ def _safe_write_and_delete(dest_prefix: str, y: str, m: str, d: str, basename: s
         # Verified — safe to delete source
         if source_key:
             s3.delete_object(Bucket=BUCKET, Key=source_key)
+            _stage_scan_mark_stale()
         return new_key
     except Exception as e:
         print(f"[SAFE_WRITE] FAILED to write {dest_prefix} from {source_key}: {e}")
         return None
 
 
-def put_status(id_: str, status: str, user: str):
+def put_status(id_: str, status: str, user: str, rollup: bool = True) -> str | None:
+    """Write a line status and return the previous one.
+
+    With rollup=True the change is folded into the day's status rollup; callers
+    updating many lines pass rollup=False and hand the changes to _day_rollup_apply.
+    """
     now_iso = dt.datetime.utcnow().isoformat()
     item = {
         "pk": {"S": id_},
@@ -1870,7 +3077,11 @@ def put_status(id_: str, status: str, user: str):
     # Add submitted_at timestamp when marking as Submitted
     if status == "Submitted":
         item["submitted_at"] = {"S": now_iso}
-    ddb.put_item(TableName=REVIEW_TABLE, Item=item)
+    resp = ddb.put_item(TableName=REVIEW_TABLE, Item=item, ReturnValues="ALL_OLD")
+    old = resp.get("Attributes", {}).get("status", {}).get("S")
+    if rollup and old != status:
+        _day_rollup_apply([(id_, old, status)])
+    return old
 
 
 def get_draft(pdf_id: str, line_id: str, user: str) -> Dict[str, Any] | None:
@@ -1912,7 +3123,7 @@ def get_header_drafts_batch(pdf_ids: List[str], user: str) -> Dict[str, Dict[str
         except Exception:
             return pid, None
 
-    with ThreadPoolExecutor(max_workers=30) as executor:
+    with _io_executor("ddb", max_workers=30) as executor:
         futures = {executor.submit(fetch_one, pid): pid for pid in pdf_ids}
         for future in as_completed(futures):
             try:
@@ -3181,6 +4392,254 @@ def _iter_stage_objects_by_month(prefix_root: str, months: List[dt.date], suffix
                 pass
 
 
+# -------- Stage scan service --------
+# One rolling in-memory projection per stage (7 PostEntrata, 8 UBI assigned,
+# 9 flagged) of the day partitions the UBI/flagged endpoints look at. A refresh
+# re-lists the window's day prefixes and only GETs objects whose ETag changed;
+# objects that vanished are dropped. Reads stream the body and keep just the
+# projected fields, so embedded PDFs never reach memory or the shared object
+# cache. Endpoints read the projection instead of re-listing and re-reading the stage.
+# Writes through _write_jsonl / _safe_write_and_delete mark the projections
+# stale; anything else (direct deletes, other writers) shows up within
+# STAGE_SCAN_REFRESH_SECONDS. The window follows the widest days_back asked
+# for in the last _STAGE_SCAN_WINDOW_DECAY_SECONDS, capped at
+# STAGE_SCAN_MAX_DAYS; wider requests get a one-off scan that isn't kept.
+STAGE_SCAN_REFRESH_SECONDS = int(os.getenv("STAGE_SCAN_REFRESH_SECONDS", "30"))
+STAGE_SCAN_MAX_DAYS = int(os.getenv("STAGE_SCAN_MAX_DAYS", "120"))
+_STAGE_SCAN_MIN_REFRESH_SECONDS = 2  # Floor between refreshes when writes keep marking stale
+_STAGE_SCAN_WINDOW_DECAY_SECONDS = 900  # A wide request holds the window open this long
+_STAGE_SCAN_DAY_RE = re.compile(r"yyyy=(\d{4})/mm=(\d{2})/dd=(\d{2})/")
+# Stage 7 keeps only what the suggestion/stats endpoints read
+_STAGE7_HEAD_FIELDS = (
+    "EnrichedPropertyID", "EnrichedVendorID", "EnrichedPropertyName", "Property Name",
+    "Account Number", "Vendor Name", "Invoice Number", "Bill Date",
+    "Bill Period Start", "Bill Period End", "PostedAt", "pdf_id",
+)
+_STAGE7_LINE_FIELDS = ("Line Item Charge",)
+# Stage 8 lines keep the assignment fields plus what the assigned view and the
+# duplicate-assignment check read from line_data
+_STAGE8_LINE_FIELDS = (
+    "ubi_assignments", "ubi_period", "ubi_amount", "ubi_assigned_date", "ubi_assigned_by",
+    "Line Item Charge", "Line Item Description", "Charge Code", "Notes",
+    "Vendor Name", "EnrichedVendorName", "Property Name", "EnrichedPropertyName", "EnrichedPropertyID",
+    "Account Number", "Invoice Number", "Bill Date", "Bill Period Start", "Bill Period End",
+    "Submitter", "SubmittedBy", "source_input_key", "PDF_LINK",
+)
+# Stage 9 lines keep what the flagged list, stats and email views read
+_STAGE9_LINE_FIELDS = (
+    "original_submitter", "Submitter", "SubmittedBy",
+    "Line Item Charge", "AMOUNT", "Line Item Description", "Charge Code Description",
+    "Vendor Name", "EnrichedVendorName", "Property Name", "EnrichedPropertyName",
+    "Account Number", "Line Item Account Number",
+    "flagged_note", "flagged_reason", "flagged_by", "flagged_date",
+    "confirmed_as_mistake", "confirmed_by", "confirmed_date",
+    "source_s3_key", "source_input_key", "__s3_key__",
+)
+
+
+class _StageProjection:
+    """Recent files of one stage: key -> {"etag", "last_modified", "day", "head", "lines"}.
+
+    "lines" is [(stable line hash, line_fields of the record)]; "head" keeps
+    head_fields of the first record. The hash still covers the whole record.
+    """
+
+    def __init__(self, name: str, prefix: str, head_fields, line_fields):
+        self.name = name
+        self.prefix = prefix
+        self.head_fields = tuple(head_fields)
+        self.line_fields = tuple(line_fields)
+        self.files: dict = {}
+        self.bytes = 0  # Approximate size of files, set on refresh
+        self.days = 0  # Current window (days back)
+        self.requested: dict = {}  # days_back -> when a caller last asked for it
+        self.refreshed_at = 0.0
+        self.stale = False
+        self.stats = {"refreshes": 0, "served": 0, "coalesced": 0, "listed": 0, "loaded": 0, "dropped": 0, "errors": 0}
+
+    @staticmethod
+    def _day_of(key: str):
+        m = _STAGE_SCAN_DAY_RE.search(key)
+        if not m:
+            return None
+        try:
+            return dt.date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+        except ValueError:
+            return None
+
+    def _window(self) -> list:
+        # Callers count days back from local or UTC "today"; cover both
+        local, utc = dt.datetime.now().date(), dt.datetime.utcnow().date()
+        first = min(local, utc) - dt.timedelta(days=max(self.days, 1) - 1)
+        return [first + dt.timedelta(days=i) for i in range((max(local, utc) - first).days + 1)]
+
+    def _project(self, body, listed: dict) -> dict:
+        """Project a JSONL body (bytes or a streaming S3 body) one line at a time."""
+        lines = []
+        head = None
+        for _, rec in _iter_jsonl_records(body):
+            if head is None:
+                head = {f: rec[f] for f in self.head_fields if f in rec}
+            lines.append((_compute_stable_line_hash(rec), {f: rec[f] for f in self.line_fields if f in rec}))
+        return {"etag": listed["etag"], "last_modified": listed["last_modified"],
+                "day": listed["day"], "head": head, "lines": lines}
+
+    def refresh(self):
+        """Re-list the window and re-read only new or changed objects."""
+        window = self._window()
+        started = time.time()
+        listed: dict = {}
+        failed_days: set = set()
+
+        def _list_day(d):
+            out = {}
+            prefix = f"{self.prefix}yyyy={d.year}/mm={d.month:02d}/dd={d.day:02d}/"
+            for page in s3.get_paginator("list_objects_v2").paginate(Bucket=BUCKET, Prefix=prefix):
+                for obj in page.get("Contents", []) or []:
+                    k = obj["Key"]
+                    if k.endswith(".jsonl"):
+                        out[k] = {"etag": obj.get("ETag", ""), "last_modified": obj.get("LastModified"), "day": d}
+            return out
+
+        with _io_executor("s3", lane="background", max_workers=20) as ex:
+            futures = {ex.submit(_list_day, d): d for d in window}
+            for fut in as_completed(futures):
+                try:
+                    listed.update(fut.result())
+                except Exception as e:
+                    failed_days.add(futures[fut])
+                    print(f"[STAGE SCAN] {self.name}: error listing {futures[fut]}: {e}")
+
+        old = self.files
+        to_load = [k for k, meta in listed.items() if k not in old or old[k]["etag"] != meta["etag"] or not meta["etag"]]
+
+        def _load(k):
+            # Plain GET, streamed: only the projection is kept
+            body = s3.get_object(Bucket=BUCKET, Key=k)["Body"]
+            try:
+                return k, self._project(body, listed[k])
+            finally:
+                body.close()
+
+        files = {k: old[k] for k in listed if k not in to_load}
+        errors = 0
+        with _io_executor("s3", lane="background", max_workers=20) as ex:
+            for fut in as_completed([ex.submit(_load, k) for k in to_load]):
+                try:
+                    k, ent = fut.result()
+                    files[k] = ent
+                except Exception as e:
+                    errors += 1
+                    print(f"[STAGE SCAN] {self.name}: error reading object: {e}")
+        first_day = window[0]
+        for k, ent in old.items():
+            if k in files:
+                continue
+            if k in listed or (ent["day"] in failed_days):
+                files[k] = ent  # Read or listing failed: keep the last good copy until the next refresh
+        dropped = sum(1 for k, ent in old.items() if k not in files and ent["day"] >= first_day)
+        self.files = files
+        self.bytes = sum(_approx_size(ent) for ent in files.values())
+        self.refreshed_at = started
+        self.stats["refreshes"] += 1
+        self.stats["listed"] = len(listed)
+        self.stats["loaded"] += len(to_load) - errors
+        self.stats["dropped"] += dropped
+        self.stats["errors"] += errors + len(failed_days)
+        print(f"[STAGE SCAN] {self.name}: {len(files)} files over {len(window)} days, "
+              f"read {len(to_load) - errors}, dropped {dropped} in {time.time() - started:.1f}s")
+
+    def ensure(self, days_back: int):
+        """Refresh when stale, expired, or when days_back widens the window.
+
+        On refresh the window is re-sized to the widest days_back requested
+        within _STAGE_SCAN_WINDOW_DECAY_SECONDS, so it narrows again once
+        wide queries stop.
+        """
+        now = time.time()
+        self.requested[days_back] = now
+        age = now - self.refreshed_at
+        if (days_back <= self.days and age < STAGE_SCAN_REFRESH_SECONDS
+                and not (self.stale and age >= _STAGE_SCAN_MIN_REFRESH_SECONDS)):
+            self.stats["served"] += 1
+            return
+        seen = self.stats["refreshes"]
+        with _CACHE.single_flight(("stage_scan", self.name)):
+            # A concurrent caller refreshed while we waited; its window covers ours
+            if self.stats["refreshes"] != seen and days_back <= self.days:
+                self.stats["coalesced"] += 1
+                return
+            cutoff = time.time() - _STAGE_SCAN_WINDOW_DECAY_SECONDS
+            self.requested = {d: at for d, at in list(self.requested.items()) if at >= cutoff}
+            self.days = max([days_back, *self.requested])
+            self.stale = False
+            self.refresh()
+
+    def cache_stats(self) -> dict:
+        """Size and bounds in the shape of _CacheNamespace.stats(); the window is capped
+        at STAGE_SCAN_MAX_DAYS and each line holds only line_fields."""
+        lookups = self.stats["served"] + self.stats["refreshes"]
+        return {
+            "name": f"stage_scan_{self.name}",
+            "entries": len(self.files),
+            "approx_mb": round(self.bytes / 1048576, 2),
+            "max_entries": None,
+            "max_mb": None,
+            "ttl_seconds": STAGE_SCAN_REFRESH_SECONDS,
+            "oldest_age_seconds": round(time.time() - self.refreshed_at, 1) if self.refreshed_at else None,
+            "window_days": self.days,
+            "max_days": STAGE_SCAN_MAX_DAYS,
+            "line_fields": len(self.line_fields),
+            "hits": self.stats["served"],
+            "misses": self.stats["refreshes"],
+            "hit_rate": round(self.stats["served"] / lookups, 4) if lookups else 0,
+            "evictions": self.stats["dropped"],
+            "expirations": 0,
+            "coalesced": self.stats["coalesced"],
+        }
+
+    def scan_once(self, days_back: int) -> dict:
+        """Files of a one-off window wider than STAGE_SCAN_MAX_DAYS, not kept.
+
+        Objects already in the shared window are reused unless their ETag changed.
+        """
+        once = _StageProjection(self.name, self.prefix, self.head_fields, self.line_fields)
+        once.days = days_back
+        once.files = dict(self.files)
+        once.refresh()
+        return once.files
+
+    def recent(self, days_back: int, today=None) -> list:
+        """[(key, entry)] for files in the last days_back days counted from today (local date)."""
+        days_back = max(1, int(days_back))
+        if days_back > STAGE_SCAN_MAX_DAYS:
+            files = self.scan_once(days_back)
+        else:
+            self.ensure(days_back)
+            files = self.files
+        today = today or dt.datetime.now().date()
+        first = today - dt.timedelta(days=days_back - 1)
+        return [(k, ent) for k, ent in files.items() if first <= ent["day"] <= today]
+
+
+_STAGE_SCANS = {
+    "stage7": _StageProjection("stage7", POST_ENTRATA_PREFIX, _STAGE7_HEAD_FIELDS, _STAGE7_LINE_FIELDS),
+    "stage8": _StageProjection("stage8", UBI_ASSIGNED_PREFIX, (), _STAGE8_LINE_FIELDS),
+    "stage9": _StageProjection("stage9", FLAGGED_REVIEW_PREFIX, (), _STAGE9_LINE_FIELDS),
+}
+
+
+def _stage_scan_files(stage: str, days_back: int, today=None) -> list:
+    """Recent files of a stage from the shared projection: [(key, entry)]."""
+    return _STAGE_SCANS[stage].recent(days_back, today)
+
+
+def _stage_scan_mark_stale():
+    """A stage file was written or moved; the next query re-lists (cheaply) first."""
+    for proj in _STAGE_SCANS.values():
+        proj.stale = True
+
+
 def put_draft(pdf_id: str, line_id: str, user: str, fields: Dict[str, Any], date: str, invoice: str):
     pk = f"draft#{pdf_id}#{line_id}#{user}"
     ddb.put_item(
@@ -3511,7 +4970,7 @@ def parse_dashboard(request: Request, user: str = Depends(require_user)):
 
     Optimized to only compute status counts for displayed days (not all historical days).
     """
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from concurrent.futures import as_completed
 
     refresh = request.query_params.get("refresh") == "1"
 
@@ -3538,10 +4997,20 @@ def parse_dashboard(request: Request, user: str = Depends(require_user)):
     # Only fetch status counts for the days we're actually displaying
     dates_to_display = filtered_dates[offset:offset + limit]
 
+    # One Query serves every displayed day that has a fresh persisted rollup
+    rollups = day_status_counts_many([
+        tuple(d["tuple"]) for d in dates_to_display
+        if ("day_status_counts", *d["tuple"]) not in _CACHE
+    ])
+
     def fetch_day_counts(d):
         """Fetch status counts for a single day (uses per-day caching)."""
         y, m, dd = d["tuple"]
-        counts = day_status_counts(y, m, dd)
+        counts = rollups.get((y, m, dd))
+        if counts is not None:
+            _CACHE[("day_status_counts", y, m, dd)] = {"ts": time.time(), "data": counts}
+        else:
+            counts = day_status_counts(y, m, dd)
         return {
             "date": f"{y}-{m}-{dd}",
             "label": d["label"],
@@ -3553,7 +5022,7 @@ def parse_dashboard(request: Request, user: str = Depends(require_user)):
     # Fetch only displayed days in parallel (up to 10 concurrent)
     day_cards = []
     if dates_to_display:
-        with ThreadPoolExecutor(max_workers=10) as executor:
+        with _io_executor("s3", max_workers=10) as executor:
             futures = {executor.submit(fetch_day_counts, d): d for d in dates_to_display}
             for future in as_completed(futures):
                 try:
@@ -3659,46 +5128,252 @@ def _index_one_day(y: str, m: str, d: str) -> List[Dict]:
     return entries
 
 
-_SEARCH_INDEX_S3_KEY = "Bill_Parser_Config/search_index.json.gz"
+_SEARCH_FIELDS = ("account_l", "vendor_l", "property_l")
 
 
-def _save_search_index_to_s3():
-    """Persist the search index to S3 as compressed JSON so it survives restarts."""
-    import gzip
-    idx = _SEARCH_INDEX
+def _trigrams(s: str) -> set:
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+def _build_search_lookup(entries: List[Dict]) -> Dict[str, Any]:
+    """Build trigram posting lists per search field plus a date-sorted order over entries.
+
+    Postings map trigram -> ascending entry indices. "order" holds entry indices sorted
+    by date ascending, with "dates" as the parallel key list for bisecting date ranges.
+    The lookup keeps its own reference to entries so readers always see a matching pair.
+    """
+    postings: Dict[str, Dict[str, list]] = {f: {} for f in _SEARCH_FIELDS}
+    for i, e in enumerate(entries):
+        for f in _SEARCH_FIELDS:
+            field_postings = postings[f]
+            for g in _trigrams(e.get(f, "")):
+                lst = field_postings.get(g)
+                if lst is None:
+                    field_postings[g] = [i]
+                else:
+                    lst.append(i)
+    order = sorted(range(len(entries)), key=lambda i: entries[i]["date"])
+    return {
+        "entries": entries,
+        "by_pdf": {e["pdf_id"]: i for i, e in enumerate(entries)},
+        "postings": postings,
+        "order": order,
+        "dates": [entries[i]["date"] for i in order],
+    }
+
+
+def _search_lookup_query(lookup: Dict[str, Any], terms: Dict[str, str],
+                         start_date: str, end_date: str, limit: int,
+                         removed: set = frozenset()) -> List[Dict]:
+    """Return up to `limit` entries matching every (field -> lowercase substring) term, newest first.
+
+    Terms of 3+ chars are resolved by intersecting trigram postings; every hit is then
+    verified with a substring check, which also covers shorter terms.
+    """
+    import bisect
+    entries = lookup["entries"]
+    postings = lookup["postings"]
+    terms = {f: t for f, t in terms.items() if t}
+
+    candidates = None
+    for field, term in terms.items():
+        if len(term) < 3:
+            continue
+        lists = []
+        for g in _trigrams(term):
+            lst = postings[field].get(g)
+            if not lst:
+                return []
+            lists.append(lst)
+        lists.sort(key=len)
+        matched = set(lists[0])
+        for lst in lists[1:]:
+            matched.intersection_update(lst)
+            if not matched:
+                return []
+        candidates = matched if candidates is None else candidates & matched
+        if not candidates:
+            return []
+
+    dates = lookup["dates"]
+    lo = bisect.bisect_left(dates, start_date) if start_date else 0
+    hi = bisect.bisect_right(dates, end_date) if end_date else len(dates)
+
+    if candidates is not None and len(candidates) < hi - lo:
+        # Few candidates: sort them by date instead of walking the whole date range
+        ordered = sorted(
+            (i for i in candidates
+             if (not start_date or entries[i]["date"] >= start_date)
+             and (not end_date or entries[i]["date"] <= end_date)),
+            key=lambda i: entries[i]["date"], reverse=True,
+        )
+    else:
+        order = lookup["order"]
+        ordered = (order[j] for j in range(hi - 1, lo - 1, -1))
+        if candidates is not None:
+            ordered = (i for i in ordered if i in candidates)
+
+    results = []
+    for i in ordered:
+        e = entries[i]
+        if e["pdf_id"] in removed:
+            continue
+        if all(t in e[f] for f, t in terms.items()):
+            results.append(e)
+            if len(results) >= limit:
+                break
+    return results
+
+
+_SEARCH_INDEX_S3_KEY = "Bill_Parser_Config/search_index.json.gz"  # legacy single-object format (read-only)
+# Segmented format: one immutable gzip segment per month, a manifest listing them,
+# and a small delta object of tombstones (pdf_ids removed since their segment was written).
+_SEARCH_INDEX_SEG_PREFIX = "Bill_Parser_Config/search_index/"
+_SEARCH_INDEX_MANIFEST_KEY = _SEARCH_INDEX_SEG_PREFIX + "manifest.json"
+_SEARCH_INDEX_DELTA_KEY = _SEARCH_INDEX_SEG_PREFIX + "delta.json.gz"
+
+
+def _search_segment_month(entry: Dict) -> str:
+    return (entry.get("date") or "")[:7] or "undated"
+
+
+def _search_segment_key(month: str) -> str:
+    return f"{_SEARCH_INDEX_SEG_PREFIX}segments/{month}.json.gz"
+
+
+def _slim_search_entry(e: Dict) -> Dict:
     # Strip the _l (lowercase) fields to save space — we rebuild them on load
-    slim_entries = [
-        {"pdf_id": e["pdf_id"], "date": e["date"], "account": e["account"],
-         "vendor": e["vendor"], "property": e["property"], "amount": e["amount"]}
-        for e in idx["entries"]
-    ]
-    payload = {
-        "entries": slim_entries,
-        "dates_indexed": sorted(idx["dates_indexed"]),
+    slim = {"pdf_id": e["pdf_id"], "date": e["date"], "account": e["account"],
+            "vendor": e["vendor"], "property": e["property"], "amount": e["amount"]}
+    if e.get("stage"):
+        slim["stage"] = e["stage"]
+    return slim
+
+
+def _save_search_index_delta():
+    """Persist only the tombstone delta (cheap; called after every removal)."""
+    with _SEARCH_INDEX_LOCK:
+        tombstones = {m: sorted(p) for m, p in _SEARCH_INDEX["tombstones"].items() if p}
+    body = gzip.compress(json.dumps({
+        "tombstones": tombstones,
+        "saved_at": dt.datetime.utcnow().isoformat() + "Z",
+    }).encode("utf-8"))
+    s3.put_object(Bucket=BUCKET, Key=_SEARCH_INDEX_DELTA_KEY, Body=body, ContentType="application/gzip")
+
+
+def _save_search_index_to_s3(months: set | None = None):
+    """Persist the search index to S3 so it survives restarts.
+
+    Only the month segments in `months` are rewritten (None = all). Rewritten segments
+    no longer contain removed entries, so their tombstones are dropped from the delta.
+    The manifest is written last so a reader never sees a segment list it can't load.
+    """
+    idx = _SEARCH_INDEX
+    with _SEARCH_INDEX_LOCK:
+        entries = idx["entries"]
+        removed = set(idx["removed"])
+        dates_indexed = sorted(idx["dates_indexed"])
+        if idx["segments_dirty"]:
+            months = None
+            idx["segments_dirty"] = False
+
+    by_month: Dict[str, list] = {}
+    for e in entries:
+        if e["pdf_id"] not in removed:
+            by_month.setdefault(_search_segment_month(e), []).append(_slim_search_entry(e))
+    to_write = set(by_month) if months is None else (set(months) & set(by_month))
+
+    def _put_segment(month: str) -> int:
+        body = gzip.compress(json.dumps({"entries": by_month[month]}, ensure_ascii=False).encode("utf-8"))
+        s3.put_object(Bucket=BUCKET, Key=_search_segment_key(month), Body=body, ContentType="application/gzip")
+        return len(body)
+
+    written_bytes = 0
+    if to_write:
+        with _io_executor("s3", lane="background", max_workers=min(16, len(to_write))) as executor:
+            for n in executor.map(_put_segment, sorted(to_write)):
+                written_bytes += n
+
+    manifest = {
+        "segments": {m: len(v) for m, v in sorted(by_month.items())},
+        "dates_indexed": dates_indexed,
         "saved_at": dt.datetime.utcnow().isoformat() + "Z",
     }
-    raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
-    compressed = gzip.compress(raw)
-    s3.put_object(Bucket=BUCKET, Key=_SEARCH_INDEX_S3_KEY, Body=compressed,
-                  ContentType="application/gzip")
-    print(f"[SEARCH INDEX] Saved to S3: {len(slim_entries)} entries, {len(compressed)//1024}KB compressed")
+    s3.put_object(Bucket=BUCKET, Key=_SEARCH_INDEX_MANIFEST_KEY,
+                  Body=json.dumps(manifest).encode("utf-8"), ContentType="application/json")
+
+    # A tombstone is obsolete once its month was rewritten without that pdf_id
+    # (or the month has no segment at all any more)
+    seg_pids = {m: {e["pdf_id"] for e in by_month[m]} for m in to_write}
+    pruned = False
+    with _SEARCH_INDEX_LOCK:
+        for m in list(idx["tombstones"]):
+            if m in seg_pids or m not in by_month:
+                keep = idx["tombstones"][m] & seg_pids.get(m, set())
+                if keep != idx["tombstones"][m]:
+                    pruned = True
+                if keep:
+                    idx["tombstones"][m] = keep
+                else:
+                    del idx["tombstones"][m]
+    if pruned:
+        _save_search_index_delta()
+    print(f"[SEARCH INDEX] Saved to S3: {len(to_write)}/{len(by_month)} segment(s), "
+          f"{sum(manifest['segments'].values())} entries, {written_bytes//1024}KB written")
+
+
+def _load_search_segments_from_s3() -> tuple | None:
+    """Load manifest + month segments in parallel and apply tombstones.
+    Returns (entries, dates_indexed, tombstones, saved_at) or None if no segmented index exists.
+    """
+    try:
+        manifest = json.loads(s3.get_object(Bucket=BUCKET, Key=_SEARCH_INDEX_MANIFEST_KEY)["Body"].read())
+    except s3.exceptions.NoSuchKey:
+        return None
+
+    def _get_segment(month: str) -> list:
+        obj = s3.get_object(Bucket=BUCKET, Key=_search_segment_key(month))
+        return json.loads(gzip.decompress(obj["Body"].read())).get("entries", [])
+
+    months = sorted(manifest.get("segments", {}))
+    entries: list = []
+    if months:
+        with _io_executor("s3", lane="background", max_workers=min(16, len(months))) as executor:
+            for seg in executor.map(_get_segment, months):
+                entries.extend(seg)
+
+    tombstones: Dict[str, set] = {}
+    try:
+        obj = s3.get_object(Bucket=BUCKET, Key=_SEARCH_INDEX_DELTA_KEY)
+        payload = json.loads(gzip.decompress(obj["Body"].read()))
+        tombstones = {m: set(p) for m, p in payload.get("tombstones", {}).items()}
+    except s3.exceptions.NoSuchKey:
+        pass
+    if tombstones:
+        dead = set().union(*tombstones.values())
+        entries = [e for e in entries if e["pdf_id"] not in dead]
+    return entries, set(manifest.get("dates_indexed", [])), tombstones, manifest.get("saved_at", "?")
 
 
 def _load_search_index_from_s3() -> bool:
-    """Load persisted search index from S3. Returns True if loaded successfully."""
-    import gzip
+    """Load persisted search index from S3. Returns True if loaded successfully.
+    Falls back to the legacy single-object index, which is re-saved as segments on the next build.
+    """
     try:
-        obj = s3.get_object(Bucket=BUCKET, Key=_SEARCH_INDEX_S3_KEY)
-        compressed = obj["Body"].read()
-        raw = gzip.decompress(compressed)
-        payload = json.loads(raw)
-        entries = payload.get("entries", [])
-        dates_indexed = set(payload.get("dates_indexed", []))
+        loaded = _load_search_segments_from_s3()
+        legacy = loaded is None
+        if legacy:
+            obj = s3.get_object(Bucket=BUCKET, Key=_SEARCH_INDEX_S3_KEY)
+            payload = json.loads(gzip.decompress(obj["Body"].read()))
+            loaded = (payload.get("entries", []), set(payload.get("dates_indexed", [])), {},
+                      payload.get("saved_at", "?"))
+        entries, dates_indexed, tombstones, saved_at = loaded
         # Rebuild lowercase fields for fast search
         for e in entries:
             e["account_l"] = e["account"].lower()
             e["vendor_l"] = e["vendor"].lower()
             e["property_l"] = e["property"].lower()
+        lookup = _build_search_lookup(entries)
         with _SEARCH_INDEX_LOCK:
             _SEARCH_INDEX["entries"] = entries
             _SEARCH_INDEX["dates_indexed"] = dates_indexed
@@ -3706,7 +5381,12 @@ def _load_search_index_from_s3() -> bool:
             _SEARCH_INDEX["ready"] = True
             _SEARCH_INDEX["entry_count"] = len(entries)
             _SEARCH_INDEX["last_refresh"] = time.time()
-        print(f"[SEARCH INDEX] Loaded from S3: {len(entries)} entries across {len(dates_indexed)} dates (saved {payload.get('saved_at', '?')})")
+            _SEARCH_INDEX["lookup"] = lookup
+            _SEARCH_INDEX["removed"] = set()
+            _SEARCH_INDEX["tombstones"] = tombstones
+            _SEARCH_INDEX["segments_dirty"] = legacy
+        print(f"[SEARCH INDEX] Loaded from S3: {len(entries)} entries across {len(dates_indexed)} dates "
+              f"({'legacy' if legacy else 'segmented'}, saved {saved_at})")
         return True
     except s3.exceptions.NoSuchKey:
         print("[SEARCH INDEX] No persisted index found in S3, will do full backfill")
@@ -3717,22 +5397,30 @@ def _load_search_index_from_s3() -> bool:
 
 
 def _search_index_remove(pdf_ids: set):
-    """Remove entries from the in-memory search index by pdf_id.
+    """Tombstone entries in the search index by pdf_id.
     Called when invoices are deleted or reworked so search results stay fresh.
+    Entries are hidden from queries immediately and dropped physically on the next
+    build; only the small tombstone delta is written to S3.
     """
     if not pdf_ids:
         return
+    idx = _SEARCH_INDEX
     with _SEARCH_INDEX_LOCK:
-        before = len(_SEARCH_INDEX["entries"])
-        _SEARCH_INDEX["entries"] = [e for e in _SEARCH_INDEX["entries"] if e["pdf_id"] not in pdf_ids]
-        after = len(_SEARCH_INDEX["entries"])
-        _SEARCH_INDEX["entry_count"] = after
-    removed = before - after
-    if removed:
-        print(f"[SEARCH INDEX] Removed {removed} stale entries for {len(pdf_ids)} pdf_ids")
-        # Persist updated index to S3 so stale entries don't reappear on restart
+        lookup = idx["lookup"]
+        if lookup is None or lookup["entries"] is not idx["entries"]:
+            lookup = None
+        by_pdf = lookup["by_pdf"] if lookup else {e["pdf_id"]: i for i, e in enumerate(idx["entries"])}
+        entries = idx["entries"]
+        newly = {p for p in pdf_ids if p in by_pdf and p not in idx["removed"]}
+        for p in newly:
+            idx["tombstones"].setdefault(_search_segment_month(entries[by_pdf[p]]), set()).add(p)
+        idx["removed"] |= newly
+        idx["entry_count"] = len(entries) - len(idx["removed"])
+    if newly:
+        print(f"[SEARCH INDEX] Removed {len(newly)} stale entries for {len(pdf_ids)} pdf_ids")
+        # Persist tombstones to S3 so stale entries don't reappear on restart
         try:
-            _save_search_index_to_s3()
+            _save_search_index_delta()
         except Exception as e:
             print(f"[SEARCH INDEX] Warning: failed to persist after removal: {e}")
 
@@ -3775,7 +5463,7 @@ def _build_search_index(force_full: bool = False):
         indexed = 0
         print(f"[SEARCH INDEX] Indexing {total_dates} date(s)...")
 
-        with ThreadPoolExecutor(max_workers=10) as executor:
+        with _io_executor("s3", lane="background", max_workers=10) as executor:
             futures = {
                 executor.submit(_index_one_day, d["tuple"][0], d["tuple"][1], d["tuple"][2]): d["label"]
                 for d in to_index
@@ -3792,17 +5480,9 @@ def _build_search_index(force_full: bool = False):
                 except Exception as e:
                     print(f"[SEARCH INDEX] Error indexing {date_label}: {e}")
 
-        with _SEARCH_INDEX_LOCK:
-            idx["entries"] = new_entries
-            idx["by_date"] = new_by_date
-            idx["dates_indexed"] = {d["label"] for d in dates}
-            idx["ready"] = True
-            idx["loading"] = False
-            idx["last_refresh"] = time.time()
-            idx["entry_count"] = len(new_entries)
-
         # Also index post-submission invoices from DDB metadata (written at post time)
         # This ensures bills remain searchable after being submitted/posted
+        posted_months = set()
         try:
             existing_pids = {e["pdf_id"] for e in new_entries}
             post_stage_count = 0
@@ -3835,17 +5515,39 @@ def _build_search_index(force_full: bool = False):
                         "stage": "posted",
                     })
                     existing_pids.add(pid)
+                    posted_months.add(_search_segment_month(new_entries[-1]))
                     post_stage_count += 1
             if post_stage_count:
                 print(f"[SEARCH INDEX] Added {post_stage_count} posted invoice entries from DDB")
         except Exception as e:
             print(f"[SEARCH INDEX] Warning: failed to index posted invoices: {e}")
 
+        # Drop tombstoned entries physically, then swap entries + lookup together
+        with _SEARCH_INDEX_LOCK:
+            removed = set(idx["removed"])
+        if removed:
+            new_entries = [e for e in new_entries if e["pdf_id"] not in removed]
+        lookup = _build_search_lookup(new_entries)
+        with _SEARCH_INDEX_LOCK:
+            idx["entries"] = new_entries
+            idx["lookup"] = lookup
+            idx["removed"] = idx["removed"] - removed
+            idx["entry_count"] = len(new_entries) - len(idx["removed"])
+            idx["by_date"] = new_by_date
+            idx["dates_indexed"] = {d["label"] for d in dates}
+            idx["ready"] = True
+            idx["loading"] = False
+            idx["last_refresh"] = time.time()
+            # Segments to rewrite: re-indexed days, new posted entries, and any with tombstones
+            dirty_months = None if force_full else (
+                {d["label"][:7] for d in to_index} | posted_months | set(idx["tombstones"])
+            )
+
         print(f"[SEARCH INDEX] Done. {len(new_entries)} invoices indexed across {len(idx['dates_indexed'])} dates.")
 
-        # Persist to S3 so next startup is instant
+        # Persist changed segments to S3 so next startup is instant
         try:
-            _save_search_index_to_s3()
+            _save_search_index_to_s3(dirty_months)
         except Exception as e:
             print(f"[SEARCH INDEX] Warning: failed to persist to S3: {e}")
 
@@ -3880,35 +5582,28 @@ def api_search(
             "indexing": True,
         }, status_code=503)
 
-    results = []
     max_results = 500
-
-    for entry in idx["entries"]:
-        # Date range filter
-        if start_date and entry["date"] < start_date:
-            continue
-        if end_date and entry["date"] > end_date:
-            continue
-        # Search term filters (contains match)
-        if account and account not in entry["account_l"]:
-            continue
-        if vendor and vendor not in entry["vendor_l"]:
-            continue
-        if prop and prop not in entry["property_l"]:
-            continue
-
-        results.append({
-            "date": entry["date"],
-            "pdf_id": entry["pdf_id"],
-            "account_id": entry["account"],
-            "vendor": entry["vendor"],
-            "property": entry["property"],
-            "amount": entry["amount"],
-        })
-        if len(results) >= max_results:
-            break
-
-    results.sort(key=lambda x: x["date"], reverse=True)
+    lookup = idx["lookup"]
+    if lookup is None or lookup["entries"] is not idx["entries"]:
+        lookup = _build_search_lookup(idx["entries"])
+        with _SEARCH_INDEX_LOCK:
+            if idx["entries"] is lookup["entries"]:
+                idx["lookup"] = lookup
+
+    # Postings narrow the candidates; the date order yields newest matches first
+    matches = _search_lookup_query(
+        lookup,
+        {"account_l": account, "vendor_l": vendor, "property_l": prop},
+        start_date, end_date, max_results, idx["removed"],
+    )
+    results = [{
+        "date": entry["date"],
+        "pdf_id": entry["pdf_id"],
+        "account_id": entry["account"],
+        "vendor": entry["vendor"],
+        "property": entry["property"],
+        "amount": entry["amount"],
+    } for entry in matches]
     return {
         "results": results,
         "truncated": len(results) >= max_results,
@@ -4127,7 +5822,7 @@ def _build_account_map_from_s3():
       - Flat root-level folders:  {account_number}/ (orphaned / legacy)
     """
     global _scraper_account_map
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from concurrent.futures import as_completed
 
     def _scan_integration(integration_id, provider):
         """List account folders for one integration."""
@@ -4144,7 +5839,7 @@ def _build_account_map_from_s3():
             pass
         return accounts
 
-    with ThreadPoolExecutor(max_workers=10) as executor:
+    with _io_executor("s3", lane="background", max_workers=10) as executor:
         futures = {}
         for integration_id, provider in _scraper_integration_map.items():
             futures[executor.submit(_scan_integration, integration_id, provider)] = (integration_id, provider)
@@ -4312,7 +6007,7 @@ def api_scraper_accounts(provider_folder: str, user: str = Depends(require_user)
 
         # Count PDFs per account in parallel
         if accounts:
-            from concurrent.futures import ThreadPoolExecutor, as_completed
+            from concurrent.futures import as_completed
 
             def _count_pdfs(acct):
                 count = 0
@@ -4326,7 +6021,7 @@ def api_scraper_accounts(provider_folder: str, user: str = Depends(require_user)
                     pass
                 return count
 
-            with ThreadPoolExecutor(max_workers=20) as executor:
+            with _io_executor("s3", max_workers=20) as executor:
                 futures = {executor.submit(_count_pdfs, a): a for a in accounts}
                 filtered = []
                 for f in as_completed(futures):
@@ -4443,7 +6138,7 @@ def api_scraper_all_pdfs(provider_folder: str, user: str = Depends(require_user)
                             })
 
         # Now get all PDFs from all accounts (parallel for performance)
-        from concurrent.futures import ThreadPoolExecutor, as_completed
+        from concurrent.futures import as_completed
 
         def _list_acct_pdfs(acct):
             pdfs = []
@@ -4469,7 +6164,7 @@ def api_scraper_all_pdfs(provider_folder: str, user: str = Depends(require_user)
             return pdfs
 
         all_pdfs = []
-        with ThreadPoolExecutor(max_workers=20) as executor:
+        with _io_executor("s3", max_workers=20) as executor:
             futures = [executor.submit(_list_acct_pdfs, a) for a in accounts]
             for f in as_completed(futures):
                 all_pdfs.extend(f.result())
@@ -5086,7 +6781,7 @@ def api_history_archived(request: Request, user: str = Depends(require_user), st
                 pass
             return items
 
-        with ThreadPoolExecutor(max_workers=20) as executor:
+        with _io_executor("s3", max_workers=20) as executor:
             for result in executor.map(_read_archived, all_keys):
                 line_items.extend(result)
 
@@ -5258,7 +6953,7 @@ def api_billback_posted(request: Request, user: str = Depends(require_user), sta
                 pass
             return items
 
-        with ThreadPoolExecutor(max_workers=20) as executor:
+        with _io_executor("s3", max_workers=20) as executor:
             for result in executor.map(_read_posted, all_keys):
                 line_items.extend(result)
 
@@ -5657,44 +7352,46 @@ def api_billback_ubi_filter_options(
 ):
     """Return unique properties, vendors, and GL codes for the filter drawer.
 
-    Reads from the Lambda-built cache (loaded into _UBI_FILTER_OPTIONS_CACHE).
-    No S3 scanning — instant response.
+    Reads from the Lambda-built cache (loaded into _UBI_UNASSIGNED_CACHE["filter_options"]),
+    merged with the values indexed by the in-memory store so bills patched in since the
+    last build are filterable. No S3 scanning — instant response.
     """
-    if _UBI_FILTER_OPTIONS_CACHE:
-        return {**_UBI_FILTER_OPTIONS_CACHE, "scan_time_seconds": 0}
-
-    # Fallback: try reloading from S3 if filter options not yet loaded
-    _load_ubi_cache_from_s3()
-    if _UBI_FILTER_OPTIONS_CACHE:
-        return {**_UBI_FILTER_OPTIONS_CACHE, "scan_time_seconds": 0}
+    if not _UBI_UNASSIGNED_CACHE.get("filter_options"):
+        # Fallback: try reloading from S3 if filter options not yet loaded
+        _load_ubi_cache_from_s3()
+    filter_options = _UBI_UNASSIGNED_CACHE.get("filter_options") or {}
+    store = _UBI_UNASSIGNED_CACHE.get("store")
+    if filter_options or store is not None:
+        local = store.filter_options() if store is not None else {}
+        return {
+            name: sorted(set(filter_options.get(name) or []) | set(local.get(name) or []))
+            for name in ("properties", "vendors", "gl_codes")
+        } | {"scan_time_seconds": 0}
 
     # Last resort: return empty (Lambda hasn't run yet)
     return {"properties": [], "vendors": [], "gl_codes": [], "scan_time_seconds": 0}
 
 
-def _get_ubi_unassigned_cached(days_back: int = 60, force_refresh: bool = False) -> list:
-    """Return cached bills from Lambda-built S3 cache. Never computes locally."""
-    cached = _UBI_UNASSIGNED_CACHE
-    has_data = cached.get("data") is not None
-
-    if has_data:
-        age = time.time() - cached.get("ts", 0)
-        print(f"[UBI CACHE] Returning {len(cached['data'])} bills (age {age:.0f}s)")
-        return cached["data"]
+def _get_ubi_unassigned_cached(days_back: int = 60, force_refresh: bool = False) -> _UbiBillStore:
+    """Return the store of cached bills from Lambda-built S3 cache. Never computes locally."""
+    store = _UBI_UNASSIGNED_CACHE.get("store")
+    if store is not None:
+        return store
 
     # No in-memory data — try S3 directly
     print("[UBI CACHE] No in-memory data, loading from S3...")
     try:
         loaded = _load_ubi_cache_from_s3()
-        if loaded and _UBI_UNASSIGNED_CACHE.get("data") is not None:
-            print(f"[UBI CACHE] Loaded from S3: {len(_UBI_UNASSIGNED_CACHE['data'])} bills")
-            return _UBI_UNASSIGNED_CACHE["data"]
+        store = _UBI_UNASSIGNED_CACHE.get("store")
+        if loaded and store is not None:
+            print(f"[UBI CACHE] Loaded from S3: {len(store)} bills")
+            return store
     except Exception as e:
         print(f"[UBI CACHE] S3 load failed: {e}")
 
     # No data anywhere — Lambda hasn't run yet
     print("[UBI CACHE] No cache available — waiting for Lambda build")
-    return []
+    return _UbiBillStore()
 
 
 # -------- Server-Side GL Mapping Refresh --------
@@ -5732,7 +7429,7 @@ def _lookup_charge_code(property_id: str, gl_account_id: str, gl_code: str, mapp
 
 
 @app.get("/api/billback/ubi/unassigned")
-def api_billback_ubi_unassigned(
+async def api_billback_ubi_unassigned(
     user: str = Depends(require_user),
     page: int = 1,
     page_size: int = 50,
@@ -5751,68 +7448,19 @@ def api_billback_ubi_unassigned(
     """
     try:
         start_time = time.time()
-        all_bills = _get_ubi_unassigned_cached(days_back, force_refresh=bool(refresh))
-
-        # Apply server-side filtering
-        filtered = all_bills
-        prop_filter_lower = property_filter.lower().strip() if property_filter else ""
-        vendor_filter_lower = vendor_filter.lower().strip() if vendor_filter else ""
-        gl_filter_clean = gl_filter.strip() if gl_filter else ""
-
-        if prop_filter_lower or vendor_filter_lower or gl_filter_clean:
-            filtered_bills = []
-            for bill in filtered:
-                first_line = bill.get("unassigned_lines", [{}])[0] if bill.get("unassigned_lines") else {}
-                ld = first_line.get("line_data", {})
-
-                if prop_filter_lower:
-                    prop_name = (ld.get("EnrichedPropertyName") or ld.get("Property Name") or "").lower()
-                    if prop_filter_lower not in prop_name:
-                        continue
-
-                if vendor_filter_lower:
-                    vendor_name = (ld.get("EnrichedVendorName") or ld.get("Vendor Name") or bill.get("vendor", "")).lower()
-                    if vendor_filter_lower not in vendor_name:
-                        continue
-
-                if gl_filter_clean:
-                    has_gl = any(
-                        (line.get("line_data", {}).get("EnrichedGLAccountNumber") or
-                         line.get("line_data", {}).get("GL Account Number") or "") == gl_filter_clean
-                        for line in bill.get("unassigned_lines", [])
-                    )
-                    if not has_gl:
-                        continue
-
-                filtered_bills.append(bill)
-            filtered = filtered_bills
-
-        # Sort
-        def get_sort_key(bill):
-            first_line = bill.get("unassigned_lines", [{}])[0] if bill.get("unassigned_lines") else {}
-            ld = first_line.get("line_data", {})
-            if sort == "amount_asc":
-                return bill.get("total_amount", 0)
-            elif sort == "amount_desc":
-                return -bill.get("total_amount", 0)
-            elif sort == "modified_asc":
-                return bill.get("last_modified_ts", 0)
-            elif sort == "modified_desc":
-                return -bill.get("last_modified_ts", 0)
-            elif sort == "vendor_asc":
-                return (ld.get("EnrichedVendorName") or ld.get("Vendor Name") or bill.get("vendor", "")).lower()
-            elif sort == "property_asc":
-                return (ld.get("EnrichedPropertyName") or ld.get("Property Name") or "").lower()
-            else:
-                return -bill.get("total_amount", 0)
-
-        filtered.sort(key=get_sort_key)
-
-        # Paginate
-        total_bills = len(filtered)
+        store = await aio_call(_get_ubi_unassigned_cached, days_back, force_refresh=bool(refresh))
+
+        # Filter, sort and page through the store's indexes and sorted cursors
+        page = max(1, page)
+        total_bills, paginated_bills = store.query(
+            property_filter=property_filter.lower().strip() if property_filter else "",
+            vendor_filter=vendor_filter.lower().strip() if vendor_filter else "",
+            gl_filter=gl_filter.strip() if gl_filter else "",
+            sort=sort,
+            offset=(page - 1) * page_size,
+            limit=page_size,
+        )
         total_pages = max(1, (total_bills + page_size - 1) // page_size)
-        start_idx = (page - 1) * page_size
-        paginated_bills = filtered[start_idx:start_idx + page_size]
 
         elapsed = time.time() - start_time
         print(f"[UBI UNASSIGNED] Page {page}/{total_pages} ({len(paginated_bills)}/{total_bills} bills) in {elapsed:.2f}s")
@@ -6114,12 +7762,14 @@ async def api_billback_ubi_assign(request: Request, user: str = Depends(require_
         # Write assigned items to Stage 8 (UBI_ASSIGNED_PREFIX)
         assigned_key = _write_jsonl(UBI_ASSIGNED_PREFIX, y, m, d, base.replace('.jsonl', ''), assigned_items)
         print(f"[UBI ASSIGN] Wrote {len(assigned_items)} assigned items to {assigned_key}")
+        _ubi_periods_record_delta(put={assigned_key: assigned_items})
 
         # Also write to Stage 99 (HIST_ARCHIVE_PREFIX) for historical record
         archive_key = _write_jsonl(HIST_ARCHIVE_PREFIX, y, m, d, base.replace('.jsonl', ''), assigned_items)
         print(f"[UBI ASSIGN] Also archived {len(assigned_items)} items to {archive_key}")
 
         # Write line hashes to DDB exclusion tables for fast duplicate detection
+        written_hashes = []  # Recorded as a delta even if a later put fails
         try:
             for rec in assigned_items:
                 line_hash = _compute_stable_line_hash(rec)
@@ -6138,6 +7788,7 @@ async def api_billback_ubi_assign(request: Request, user: str = Depends(require_
                     'assigned_date': {'S': now_utc},
                 }
                 ddb.put_item(TableName='jrk-bill-ubi-assignments', Item=assignment_item)
+                written_hashes.append(line_hash)
 
                 # Write to archived table (uses archive_id)
                 archive_item = {
@@ -6152,6 +7803,8 @@ async def api_billback_ubi_assign(request: Request, user: str = Depends(require_
             print(f"[UBI ASSIGN] Wrote {len(assigned_items)} hashes to DDB exclusion tables")
         except Exception as ddb_err:
             print(f"[UBI ASSIGN] Warning: Could not write to DDB exclusion tables: {ddb_err}")
+        finally:
+            _exclusion_record_delta(add=written_hashes)
 
         # Update source file: rewrite with remaining items or delete if empty
         if remaining_items:
@@ -6226,8 +7879,7 @@ def api_billback_ubi_suggestions(user: str = Depends(require_user), page: int =
     """Get UBI allocation suggestions for unassigned bills with service period dates."""
     try:
         def _compute():
-            from datetime import datetime, timedelta
-            from concurrent.futures import ThreadPoolExecutor, as_completed
+            from datetime import datetime
 
             start_time = datetime.now()
             print(f"[UBI SUGGESTIONS] Loading suggestions for unassigned bills")
@@ -6256,58 +7908,31 @@ def api_billback_ubi_suggestions(user: str = Depends(require_user), page: int =
             # Use cached exclusion hashes
             excluded_hashes = _get_cached_exclusion_hashes(days_back)
 
-            # Build date-partitioned prefixes
-            prefixes_to_scan = []
-            today = datetime.now()
-            for i in range(days_back):
-                d = today - timedelta(days=i)
-                prefix = f"{POST_ENTRATA_PREFIX}yyyy={d.year}/mm={d.month:02d}/dd={d.day:02d}/"
-                prefixes_to_scan.append(prefix)
-
-            # Collect all S3 keys
-            all_keys = []
-            for prefix in prefixes_to_scan:
-                try:
-                    paginator = s3.get_paginator('list_objects_v2')
-                    s3_pages = paginator.paginate(Bucket=BUCKET, Prefix=prefix)
-                    for s3_page in s3_pages:
-                        for obj in s3_page.get('Contents', []):
-                            key = obj['Key']
-                            if key.endswith('.jsonl'):
-                                all_keys.append(key)
-                except Exception:
-                    continue
-
-            print(f"[UBI SUGGESTIONS] Found {len(all_keys)} files to check")
+            # Recent Stage 7 files from the shared stage scan
+            stage7_files = _stage_scan_files("stage7", days_back)
+            print(f"[UBI SUGGESTIONS] Found {len(stage7_files)} files to check")
 
-            def process_file_for_suggestions(key):
-                """Process a single file and calculate suggestions."""
+            def process_file_for_suggestions(key, ent):
+                """Calculate the suggestion for one projected Stage 7 file."""
                 try:
-                    obj_data = s3.get_object(Bucket=BUCKET, Key=key)
-                    txt = obj_data['Body'].read().decode('utf-8', errors='ignore')
-                    lines = [ln.strip() for ln in txt.splitlines() if ln.strip()]
-
-                    if not lines:
+                    first_rec = ent["head"]
+                    if first_rec is None:
                         return None
 
-                    try:
-                        first_rec = json.loads(lines[0])
-                    except json.JSONDecodeError:
-                        return None
-
-                    # Skip if all lines are already assigned
-                    has_unassigned = False
-                    for line in lines:
+                    # Total over unassigned lines; skip if all lines are already assigned
+                    total_amount = 0.0
+                    unassigned_count = 0
+                    for line_hash, rec in ent["lines"]:
+                        if line_hash in excluded_hashes:
+                            continue
+                        charge_str = str(rec.get("Line Item Charge", "0")).replace("$", "").replace(",", "").strip()
                         try:
-                            rec = json.loads(line)
-                            _lh = _compute_stable_line_hash(rec)
-                            if _lh not in excluded_hashes:
-                                has_unassigned = True
-                                break
+                            total_amount += float(charge_str)
                         except Exception:
-                            continue
+                            pass
+                        unassigned_count += 1
 
-                    if not has_unassigned:
+                    if not unassigned_count:
                         return None
 
                     # Parse bill info
@@ -6323,64 +7948,13 @@ def api_billback_ubi_suggestions(user: str = Depends(require_user), page: int =
                     # Get account history if exists (only for UBI accounts)
                     acct_history = account_histories.get(account_key) if is_ubi_account else None
 
-                    # Parse service dates
                     service_start_str = first_rec.get("Bill Period Start", "")
                     service_end_str = first_rec.get("Bill Period End", "")
 
-                    service_start = _parse_date_any(service_start_str) if service_start_str else None
-                    service_end = _parse_date_any(service_end_str) if service_end_str else None
-
-                    # Calculate total amount
-                    total_amount = 0.0
-                    unassigned_count = 0
-                    for line in lines:
-                        try:
-                            rec = json.loads(line)
-                            _lh = _compute_stable_line_hash(rec)
-                            if _lh not in excluded_hashes:
-                                charge_str = str(rec.get("Line Item Charge", "0")).replace("$", "").replace(",", "").strip()
-                                try:
-                                    total_amount += float(charge_str)
-                                except Exception:
-                                    pass
-                                unassigned_count += 1
-                        except Exception:
-                            continue
-
-                    # Calculate suggestion - ONLY for UBI accounts
-                    suggestion = None
-                    if is_ubi_account:
-                        # Prefer Stage 8 history over ubi_account_history.json
-                        stage8_data = stage8_history.get(account_key)
-                        if stage8_data and stage8_data.get("last_ubi_period"):
-                            # Use Stage 8 history - suggest next period after last assigned
-                            last_ubi = stage8_data["last_ubi_period"]
-                            next_ubi = _get_next_ubi_period(last_ubi)
-                            suggestion = {
-                                "suggested_periods": [{
-                                    "period": next_ubi,
-                                    "days": 30,
-                                    "amount": round(total_amount, 2),
-                                    "pct": 100.0
-                                }],
-                                "confidence": "high",
-                                "reason": f"Next sequential period after {last_ubi} (from Stage 8 history)",
-                                "last_period": last_ubi,
-                                "spans_months": False
-                            }
-                        else:
-                            # Fall back to ubi_account_history.json calculation
-                            suggestion = _calculate_ubi_suggestion(
-                                service_start,
-                                service_end,
-                                total_amount,
-                                acct_history
-                            )
-
                     # Get posted date
                     posted_at = first_rec.get("PostedAt", "")
                     if not posted_at:
-                        s3_last_mod = obj_data.get('LastModified')
+                        s3_last_mod = ent.get("last_modified")
                         if s3_last_mod:
                             posted_at = s3_last_mod.strftime("%Y-%m-%dT%H:%M:%S")
 
@@ -6400,7 +7974,8 @@ def api_billback_ubi_suggestions(user: str = Depends(require_user), page: int =
                         "total_amount": round(total_amount, 2),
                         "unassigned_lines": unassigned_count,
                         "posted_at": posted_at,
-                        "suggestion": suggestion,
+                        "suggestion": None,  # Filled in for all bills at once below
+                        "is_ubi_account": is_ubi_account,
                         "has_history": acct_history is not None,
                         "avg_service_days": acct_history.get("avgServiceDays") if acct_history else None,
                         "last_ubi_periods": acct_history.get("lastUbiPeriods", []) if acct_history else []
@@ -6409,14 +7984,20 @@ def api_billback_ubi_suggestions(user: str = Depends(require_user), page: int =
                     print(f"[UBI SUGGESTIONS] Error processing {key}: {e}")
                     return None
 
-            # Process files concurrently
             bills_with_suggestions = []
-            with ThreadPoolExecutor(max_workers=20) as executor:
-                futures = {executor.submit(process_file_for_suggestions, key): key for key in all_keys}
-                for future in as_completed(futures):
-                    result = future.result()
-                    if result:
-                        bills_with_suggestions.append(result)
+            for key, ent in stage7_files:
+                result = process_file_for_suggestions(key, ent)
+                if result:
+                    bills_with_suggestions.append(result)
+
+            # Suggestions (Stage 8 history first, then ubi_account_history.json) for UBI accounts only
+            suggestions = _ubi_suggest_batch(
+                [{"account_key": b["account_key"], "amount": b["total_amount"], "is_ubi": b.pop("is_ubi_account")}
+                 for b in bills_with_suggestions],
+                stage8_history,
+            )
+            for bill, suggestion in zip(bills_with_suggestions, suggestions):
+                bill["suggestion"] = suggestion
 
             # Sort by confidence (high first), then by amount
             confidence_order = {"high": 0, "medium": 1, "low": 2}
@@ -6444,6 +8025,7 @@ def api_billback_ubi_suggestions(user: str = Depends(require_user), page: int =
         high_confidence = sum(1 for b in all_bills if (b.get("suggestion") or {}).get("confidence") == "high")
         medium_confidence = sum(1 for b in all_bills if (b.get("suggestion") or {}).get("confidence") == "medium")
         low_confidence = sum(1 for b in all_bills if (b.get("suggestion") or {}).get("confidence") == "low")
+        with_warnings = sum(1 for b in all_bills if (b.get("suggestion") or {}).get("warnings"))
 
         return {
             "bills": paginated,
@@ -6454,7 +8036,8 @@ def api_billback_ubi_suggestions(user: str = Depends(require_user), page: int =
             "summary": {
                 "high_confidence": high_confidence,
                 "medium_confidence": medium_confidence,
-                "low_confidence": low_confidence
+                "low_confidence": low_confidence,
+                "with_warnings": with_warnings
             },
             "processing_time_seconds": 0
         }
@@ -6658,11 +8241,13 @@ async def api_billback_ubi_accept_suggestion(request: Request, user: str = Depen
         # Write to Stage 8
         assigned_key = _write_jsonl(UBI_ASSIGNED_PREFIX, y, m, d, base.replace('.jsonl', ''), assigned_items)
         print(f"[UBI ACCEPT] Wrote {len(assigned_items)} items to {assigned_key}")
+        _ubi_periods_record_delta(put={assigned_key: assigned_items})
 
         # Archive copy
         archive_key = _write_jsonl(HIST_ARCHIVE_PREFIX, y, m, d, base.replace('.jsonl', ''), assigned_items)
 
         # Write exclusion hashes to DDB (same as main assign endpoint)
+        written_hashes = []  # Recorded as a delta even if a later put fails
         try:
             now_utc = datetime.utcnow().isoformat() + "Z"
             for rec in assigned_items:
@@ -6675,6 +8260,7 @@ async def api_billback_ubi_accept_suggestion(request: Request, user: str = Depen
                     'assigned_by': {'S': user},
                     'assigned_date': {'S': now_utc},
                 })
+                written_hashes.append(lh)
                 # Also write to archived table (consistent with main assign endpoint)
                 ddb.put_item(TableName='jrk-bill-ubi-archived', Item={
                     'assignment_id': {'S': lh},
@@ -6687,6 +8273,8 @@ async def api_billback_ubi_accept_suggestion(request: Request, user: str = Depen
             print(f"[UBI ACCEPT] Wrote {len(assigned_items)} hashes to DDB exclusion + archived tables")
         except Exception as ddb_err:
             print(f"[UBI ACCEPT] Warning: Could not write to DDB exclusion tables: {ddb_err}")
+        finally:
+            _exclusion_record_delta(add=written_hashes)
 
         # Update source file - MUST delete original when writing new file
         if remaining_items:
@@ -6812,59 +8400,26 @@ def api_billback_ubi_assigned(user: str = Depends(require_user), period: str = "
     """Load line items assigned to a specific UBI period from Stage 8 (S3)."""
     try:
         def _compute():
-            from datetime import datetime, timedelta
             from collections import defaultdict
-            from concurrent.futures import ThreadPoolExecutor, as_completed
 
             print(f"[UBI ASSIGNED] Loading ALL assigned items from Stage 8")
 
-            # Build date-partitioned prefixes for the last N days
-            prefixes_to_scan = []
-            today = datetime.now()
-            for i in range(days_back):
-                d = today - timedelta(days=i)
-                prefix = f"{UBI_ASSIGNED_PREFIX}yyyy={d.year}/mm={d.month:02d}/dd={d.day:02d}/"
-                prefixes_to_scan.append(prefix)
+            # Recent Stage 8 files from the shared stage scan
+            stage8_files = _stage_scan_files("stage8", days_back)
+            print(f"[UBI ASSIGNED] Found {len(stage8_files)} files in Stage 8")
 
-            # Collect all S3 keys
-            all_keys = []
-            for prefix in prefixes_to_scan:
+            def process_file(key, ent):
+                """Items of one projected Stage 8 file — no period filtering (cache full dataset)."""
                 try:
-                    paginator = s3.get_paginator('list_objects_v2')
-                    for page in paginator.paginate(Bucket=BUCKET, Prefix=prefix):
-                        for obj in page.get('Contents', []):
-                            key = obj['Key']
-                            if key.endswith('.jsonl'):
-                                all_keys.append(key)
-                except Exception as e:
-                    print(f"[UBI ASSIGNED] Error listing {prefix}: {e}")
-
-            print(f"[UBI ASSIGNED] Found {len(all_keys)} files in Stage 8")
-
-            def process_file(key):
-                """Process a single S3 file — no period filtering (cache full dataset)."""
-                try:
-                    body = _read_s3_text(BUCKET, key)
-                    lines = [ln.strip() for ln in body.splitlines() if ln.strip()]
-                    if not lines:
-                        return []
-
                     results = []
-                    first_rec = json.loads(lines[0])
 
-                    # Compute pdf_id from s3_key and extract review date from path
+                    # Compute pdf_id from s3_key; review date is the key's day partition
                     computed_pdf_id = pdf_id_from_key(key)
-                    import re
-                    date_match = re.search(r'yyyy=(\d{4})/mm=(\d{2})/dd=(\d{2})', key)
-                    review_date = f"{date_match.group(1)}-{date_match.group(2)}-{date_match.group(3)}" if date_match else ""
+                    review_date = ent["day"].isoformat()
 
-                    for line in lines:
-                        rec = json.loads(line)
-                        line_hash = _compute_stable_line_hash(rec)
-
-                        # Exclude large fields
-                        EXCLUDE_FIELDS = {'__pdf_b64__', '__pdf_filename__', 'EnrichedProperty'}
-                        filtered_rec = {k: v for k, v in rec.items() if k not in EXCLUDE_FIELDS}
+                    for line_hash, rec in ent["lines"]:
+                        # The projection already keeps only _STAGE8_LINE_FIELDS
+                        filtered_rec = dict(rec)
 
                         # Handle multi-period format (ubi_assignments array)
                         ubi_assignments = rec.get("ubi_assignments", [])
@@ -6926,12 +8481,9 @@ def api_billback_ubi_assigned(user: str = Depends(require_user), period: str = "
                     print(f"[UBI ASSIGNED] Error processing {key}: {e}")
                     return []
 
-            # Process files concurrently
             all_items = []
-            with ThreadPoolExecutor(max_workers=20) as executor:
-                futures = {executor.submit(process_file, key): key for key in all_keys}
-                for future in as_completed(futures):
-                    all_items.extend(future.result())
+            for key, ent in stage8_files:
+                all_items.extend(process_file(key, ent))
 
             # Group results by period and bill
             by_period = defaultdict(lambda: {"total_amount": 0.0, "line_count": 0, "bills": {}})
@@ -7111,9 +8663,11 @@ async def api_billback_ubi_unassign(request: Request, user: str = Depends(requir
                     print(f"[UBI UNASSIGN] Deleted original {s3_key}, remaining items in {new_key}")
                 else:
                     print(f"[UBI UNASSIGN] Rewrote {len(remaining_items)} remaining items to Stage 8")
+                _ubi_periods_record_delta(put={new_key: remaining_items}, drop=[s3_key])
             else:
                 s3.delete_object(Bucket=BUCKET, Key=s3_key)
                 print(f"[UBI UNASSIGN] Deleted empty Stage 8 file {s3_key}")
+                _ubi_periods_record_delta(drop=[s3_key])
 
             total_unassigned += len(unassigned_items)
 
@@ -7172,6 +8726,7 @@ async def api_billback_ubi_unassign(request: Request, user: str = Depends(requir
                 print(f"[UBI UNASSIGN] Warning: scan for old records failed: {e}")
 
         print(f"[UBI UNASSIGN] Deleted {deleted_count} DDB assignment records")
+        _exclusion_record_delta(remove=all_unassigned_line_hashes)
 
 
         # 3) Invalidate downstream caches so BILLBACK + Master Bills tracker
@@ -7325,8 +8880,10 @@ async def api_billback_ubi_unassign_account(request: Request, user: str = Depend
                 new_key = _write_jsonl(UBI_ASSIGNED_PREFIX, y, m, d, base.replace('.jsonl', ''), remaining_items)
                 if new_key != key:
                     s3.delete_object(Bucket=BUCKET, Key=key)
+                _ubi_periods_record_delta(put={new_key: remaining_items}, drop=[key])
             else:
                 s3.delete_object(Bucket=BUCKET, Key=key)
+                _ubi_periods_record_delta(drop=[key])
 
             total_unassigned += len(unassigned_items)
 
@@ -7375,6 +8932,7 @@ async def api_billback_ubi_unassign_account(request: Request, user: str = Depend
                 print(f"[UBI UNASSIGN ACCOUNT] Warning: scan for old records failed: {e}")
 
         print(f"[UBI UNASSIGN ACCOUNT] Deleted {deleted_count} DDB records")
+        _exclusion_record_delta(remove=line_hashes_unassigned)
 
         # Invalidate caches — both BILLBACK + Master Bills tracker
         _CACHE.pop(("ubi_unassigned",), None)
@@ -7474,6 +9032,7 @@ async def api_billback_ubi_cleanup_exclusions(request: Request, user: str = Depe
         # Invalidate cache
 
         print(f"[CLEANUP EXCLUSIONS] Deleted {deleted_count}/{len(line_hashes)} exclusion records")
+        _exclusion_record_delta(remove=line_hashes)
         return {"ok": True, "deleted": deleted_count, "total_hashes": len(line_hashes)}
 
     except Exception as e:
@@ -7592,6 +9151,7 @@ async def api_billback_ubi_reassign_account(request: Request, user: str = Depend
                 new_key = _write_jsonl(UBI_ASSIGNED_PREFIX, y, m, d, base.replace('.jsonl', ''), modified_items)
                 if new_key != key:
                     s3.delete_object(Bucket=BUCKET, Key=key)
+                _ubi_periods_record_delta(put={new_key: modified_items}, drop=[key])
                 print(f"[UBI REASSIGN ACCOUNT] Updated {key} with new periods")
 
         if total_reassigned == 0:
@@ -7738,6 +9298,7 @@ async def api_billback_ubi_reassign(request: Request, user: str = Depends(requir
                 if new_key != s3_key:
                     s3.delete_object(Bucket=BUCKET, Key=s3_key)
                     print(f"[UBI REASSIGN] Deleted original {s3_key}, updated in {new_key}")
+                _ubi_periods_record_delta(put={new_key: updated_lines}, drop=[s3_key])
 
                 print(f"[UBI REASSIGN] Wrote {len(updated_lines)} lines back to Stage 8")
 
@@ -7888,9 +9449,13 @@ async def api_billback_ubi_archive(request: Request, user: str = Depends(require
                     pass  # Good — file is gone
             else:
                 print(f"[UBI ARCHIVE] Rewrote {len(remaining_items)} remaining items to source")
+            if source_prefix == UBI_ASSIGNED_PREFIX:
+                _ubi_periods_record_delta(put={new_key: remaining_items}, drop=[s3_key])
         else:
             s3.delete_object(Bucket=BUCKET, Key=s3_key)
             print(f"[UBI ARCHIVE] Deleted empty source file {s3_key}")
+            if source_prefix == UBI_ASSIGNED_PREFIX:
+                _ubi_periods_record_delta(drop=[s3_key])
 
         _remove_bill_from_ubi_cache(s3_key)
         _METRICS_CACHE.pop("ubi_suggestions", None)
@@ -8038,6 +9603,7 @@ async def api_billback_flag(request: Request, user: str = Depends(require_user))
 
         # Delete the source file (entire invoice moved to review)
         s3.delete_object(Bucket=BUCKET, Key=s3_key)
+        _stage_scan_mark_stale()
         print(f"[FLAG REVIEW] Deleted source file {s3_key}")
 
         print(f"[FLAG REVIEW] COMPLETED: Moved {len(flagged_items)} items to Stage 9")
@@ -8054,54 +9620,17 @@ async def api_billback_flag(request: Request, user: str = Depends(require_user))
 def api_flagged_list(user: str = Depends(require_user), days_back: int = 90):
     """Get all flagged items grouped by submitter."""
     try:
-        from datetime import datetime, timedelta
+        from datetime import datetime
         from collections import defaultdict
-        from concurrent.futures import ThreadPoolExecutor, as_completed
 
         if user not in ADMIN_USERS:
             return JSONResponse({"error": "Admin access required"}, status_code=403)
 
-        today = datetime.utcnow()
-
-        def fetch_day_flagged(d):
-            """Fetch flagged items for a single day."""
-            items = []
-            prefix = f"{FLAGGED_REVIEW_PREFIX}yyyy={d.year}/mm={d.month:02d}/dd={d.day:02d}/"
-            try:
-                paginator = s3.get_paginator('list_objects_v2')
-                for page in paginator.paginate(Bucket=BUCKET, Prefix=prefix):
-                    for obj in page.get('Contents', []):
-                        key = obj['Key']
-                        if not key.endswith('.jsonl'):
-                            continue
-                        try:
-                            body = _read_s3_text(BUCKET, key)
-                            for line in body.splitlines():
-                                line = (line or '').strip()
-                                if not line:
-                                    continue
-                                rec = json.loads(line)
-                                rec['_s3_key'] = key
-                                rec['_line_hash'] = _compute_stable_line_hash(rec)
-                                items.append(rec)
-                        except Exception as e:
-                            print(f"[FLAGGED LIST] Error reading {key}: {e}")
-            except Exception as e:
-                print(f"[FLAGGED LIST] Error listing prefix {prefix}: {e}")
-            return items
-
-        # Parallel fetch all days
+        # Recent Stage 9 files from the shared stage scan
         all_flagged = []
-        dates_to_scan = [today - timedelta(days=i) for i in range(days_back)]
-
-        with ThreadPoolExecutor(max_workers=20) as executor:
-            futures = {executor.submit(fetch_day_flagged, d): d for d in dates_to_scan}
-            for future in as_completed(futures):
-                try:
-                    items = future.result()
-                    all_flagged.extend(items)
-                except Exception as e:
-                    print(f"[FLAGGED LIST] Worker error: {e}")
+        for key, ent in _stage_scan_files("stage9", days_back, today=datetime.utcnow().date()):
+            for line_hash, rec in ent["lines"]:
+                all_flagged.append(dict(rec, _s3_key=key, _line_hash=line_hash))
 
         # Group by submitter
         by_submitter = defaultdict(list)
@@ -8231,6 +9760,7 @@ async def api_flagged_unflag(request: Request, user: str = Depends(require_user)
         else:
             s3.delete_object(Bucket=BUCKET, Key=s3_key)
             print(f"[UNFLAG] Deleted empty flagged file {s3_key}")
+        _stage_scan_mark_stale()
 
         print(f"[UNFLAG] COMPLETED: Moved {len(unflagged_items)} items back to Stage 7")
         return {"ok": True, "unflagged": len(unflagged_items)}
@@ -8492,6 +10022,7 @@ async def api_flagged_confirm(request: Request, user: str = Depends(require_user
                 s3.delete_object(Bucket=BUCKET, Key=s3_key)
                 print(f"[CONFIRM FLAGGED] Deleted empty flagged file {s3_key}")
 
+        _stage_scan_mark_stale()
         print(f"[CONFIRM FLAGGED] Updated {updated_count} items")
         return {"ok": True, "confirmed": updated_count, "is_mistake": is_mistake}
 
@@ -8506,59 +10037,25 @@ async def api_flagged_confirm(request: Request, user: str = Depends(require_user
 def api_flagged_stats(user: str = Depends(require_user), days_back: int = 90):
     """Get quality metrics - flagged items stats by submitter over time."""
     try:
-        from datetime import datetime, timedelta
+        from datetime import datetime
         from collections import defaultdict
-        from concurrent.futures import ThreadPoolExecutor, as_completed
 
         if user not in ADMIN_USERS:
             return JSONResponse({"error": "Admin access required"}, status_code=403)
 
-        today = datetime.utcnow()
-
-        def fetch_day_stats(d):
-            """Fetch stats for a single day, returns list of (submitter, week_key, amount) tuples."""
-            results = []
-            week_key = f"{d.year}-W{d.isocalendar()[1]:02d}"
-            prefix = f"{FLAGGED_REVIEW_PREFIX}yyyy={d.year}/mm={d.month:02d}/dd={d.day:02d}/"
-            try:
-                paginator = s3.get_paginator('list_objects_v2')
-                for page in paginator.paginate(Bucket=BUCKET, Prefix=prefix):
-                    for obj in page.get('Contents', []):
-                        key = obj['Key']
-                        if not key.endswith('.jsonl'):
-                            continue
-                        try:
-                            body = _read_s3_text(BUCKET, key)
-                            for line in body.splitlines():
-                                line = (line or '').strip()
-                                if not line:
-                                    continue
-                                rec = json.loads(line)
-                                submitter = rec.get('original_submitter', rec.get('Submitter', 'Unknown'))
-                                amt = rec.get("Line Item Charge") or rec.get("AMOUNT") or 0
-                                try:
-                                    amt_val = float(str(amt).replace('$', '').replace(',', ''))
-                                except (ValueError, TypeError):
-                                    amt_val = 0.0
-                                results.append((submitter, week_key, amt_val))
-                        except Exception:
-                            pass
-            except Exception:
-                pass
-            return results
-
-        # Parallel fetch all days
-        dates_to_scan = [today - timedelta(days=i) for i in range(days_back)]
+        # Recent Stage 9 files from the shared stage scan: (submitter, week_key, amount) per line
         all_results = []
-
-        with ThreadPoolExecutor(max_workers=20) as executor:
-            futures = {executor.submit(fetch_day_stats, d): d for d in dates_to_scan}
-            for future in as_completed(futures):
+        for key, ent in _stage_scan_files("stage9", days_back, today=datetime.utcnow().date()):
+            d = ent["day"]
+            week_key = f"{d.year}-W{d.isocalendar()[1]:02d}"
+            for _, rec in ent["lines"]:
+                submitter = rec.get('original_submitter', rec.get('Submitter', 'Unknown'))
+                amt = rec.get("Line Item Charge") or rec.get("AMOUNT") or 0
                 try:
-                    results = future.result()
-                    all_results.extend(results)
-                except Exception as e:
-                    print(f"[FLAGGED STATS] Worker error: {e}")
+                    amt_val = float(str(amt).replace('$', '').replace(',', ''))
+                except (ValueError, TypeError):
+                    amt_val = 0.0
+                all_results.append((submitter, week_key, amt_val))
 
         # Aggregate stats
         stats_by_submitter = defaultdict(lambda: {"total_flagged": 0, "total_dollars": 0.0, "by_week": defaultdict(int)})
@@ -8596,8 +10093,7 @@ def api_ubi_stats_by_property(
     Returns property names sorted by invoice count descending.
     """
     def _compute():
-        from datetime import datetime, timedelta
-        from concurrent.futures import ThreadPoolExecutor, as_completed
+        from datetime import datetime
         from collections import defaultdict
 
         start_time = datetime.now()
@@ -8606,75 +10102,23 @@ def api_ubi_stats_by_property(
         excluded_hashes = _get_cached_exclusion_hashes(days_back)
         print(f"[UBI STATS BY PROPERTY] Using {len(excluded_hashes)} cached exclusion hashes")
 
-        # Build date-partitioned prefixes
-        prefixes_to_scan = []
-        today = datetime.now()
-        for i in range(days_back):
-            d = today - timedelta(days=i)
-            prefix = f"{POST_ENTRATA_PREFIX}yyyy={d.year}/mm={d.month:02d}/dd={d.day:02d}/"
-            prefixes_to_scan.append(prefix)
+        # Recent Stage 7 files from the shared stage scan
+        stage7_files = _stage_scan_files("stage7", days_back)
+        print(f"[UBI STATS BY PROPERTY] Found {len(stage7_files)} JSONL files to process")
 
-        # Collect all S3 keys
-        all_keys = []
-        for prefix in prefixes_to_scan:
-            try:
-                paginator = s3.get_paginator('list_objects_v2')
-                s3_pages = paginator.paginate(Bucket=BUCKET, Prefix=prefix)
-                for s3_page in s3_pages:
-                    for obj in s3_page.get('Contents', []):
-                        key = obj['Key']
-                        if key.endswith('.jsonl'):
-                            all_keys.append(key)
-            except Exception:
+        # Count invoices with at least one unassigned line by property
+        property_counts = defaultdict(int)
+        for key, ent in stage7_files:
+            first_rec = ent["head"]
+            if first_rec is None:
                 continue
-
-        print(f"[UBI STATS BY PROPERTY] Found {len(all_keys)} JSONL files to process")
-
-        # Process a single S3 file - return property name if it has unassigned lines
-        def get_property_if_unassigned(key):
-            try:
-                obj_data = s3.get_object(Bucket=BUCKET, Key=key)
-                txt = obj_data['Body'].read().decode('utf-8', errors='ignore')
-                lines = [ln.strip() for ln in txt.splitlines() if ln.strip()]
-
-                if not lines:
-                    return None
-
-                try:
-                    first_rec = json.loads(lines[0])
-                except json.JSONDecodeError:
-                    return None
-
+            if any(line_hash not in excluded_hashes for line_hash, _ in ent["lines"]):
                 property_name = (
                     first_rec.get("EnrichedPropertyName") or
                     first_rec.get("Property Name") or
                     "Unknown Property"
                 ).strip()
-
-                # Check if any line is unassigned
-                for line in lines:
-                    try:
-                        rec = json.loads(line)
-                        _lh = _compute_stable_line_hash(rec)
-                        if _lh not in excluded_hashes:
-                            # This invoice has at least one unassigned line
-                            return property_name
-                    except (json.JSONDecodeError, ValueError, TypeError):
-                        continue
-
-                return None
-            except Exception as e:
-                print(f"[UBI STATS BY PROPERTY] Error processing {key}: {e}")
-                return None
-
-        # Process files concurrently
-        property_counts = defaultdict(int)
-        with ThreadPoolExecutor(max_workers=20) as executor:
-            futures = {executor.submit(get_property_if_unassigned, key): key for key in all_keys}
-            for future in as_completed(futures):
-                result = future.result()
-                if result:
-                    property_counts[result] += 1
+                property_counts[property_name] += 1
 
         # Sort by count descending
         sorted_stats = sorted(
@@ -9579,7 +11023,7 @@ def api_vacant_accounts(
                 except Exception:
                     return None
 
-            with ThreadPoolExecutor(max_workers=20) as executor:
+            with _io_executor("s3", lane="background", max_workers=20) as executor:
                 for result in executor.map(_read_for_vacant, all_keys):
                     if not result:
                         continue
@@ -9956,8 +11400,6 @@ def api_vendor_correction_suspects(user: str = Depends(require_user), days: int
         submission_lookup = {}
         files_scanned = 0
 
-        from concurrent.futures import ThreadPoolExecutor
-
         def process_file_for_submission(s3_key):
             """Read first line only to extract submission metadata"""
             try:
@@ -10025,7 +11467,7 @@ def api_vendor_correction_suspects(user: str = Depends(require_user), days: int
             files_scanned = len(all_keys)
 
             # Process files in parallel (much faster)
-            with ThreadPoolExecutor(max_workers=30) as executor:
+            with _io_executor("s3", lane="background", max_workers=30) as executor:
                 results = list(executor.map(process_file_for_submission, all_keys))
 
             # Build lookup from results
@@ -10635,20 +12077,19 @@ async def api_gap_analysis_add_missing(request: Request, user: str = Depends(req
 
 
 # Workflow S3 cache functions
-_WORKFLOW_DATA_CACHE: dict = {}  # in-memory cache for aging accounts S3 data
+_WORKFLOW_DATA_CACHE = _cache_namespace("workflow_data", ttl=300, max_entries=1)  # "data" -> aging accounts S3 data
 
 def _s3_get_workflow_cache() -> dict | None:
     """Load pre-computed workflow data from S3 cache, with in-memory caching."""
     # Check in-memory first (avoids re-downloading 3MB from S3 every request)
     cached = _WORKFLOW_DATA_CACHE.get("data")
-    if cached and (time.time() - _WORKFLOW_DATA_CACHE.get("ts", 0) < 300):
+    if cached:
         return json.loads(json.dumps(cached))  # deep copy to prevent mutation
     try:
         obj = s3.get_object(Bucket=CONFIG_BUCKET, Key=WORKFLOW_CACHE_KEY)
         data = json.loads(obj["Body"].read().decode("utf-8"))
         if isinstance(data, dict):
             _WORKFLOW_DATA_CACHE["data"] = data
-            _WORKFLOW_DATA_CACHE["ts"] = time.time()
             return json.loads(json.dumps(data))  # deep copy
         return None
     except s3.exceptions.NoSuchKey:
@@ -10673,6 +12114,15 @@ def _s3_put_workflow_cache(data: dict) -> bool:
         return False
 
 
+# Fields norm_rec reads from each bill's first record
+_WORKFLOW_BILL_FIELDS = (
+    "EnrichedPropertyID", "propertyId", "PropertyID", "EnrichedVendorID", "vendorId", "VendorID",
+    "Account Number", "accountNumber", "AccountNumber", "Bill Date", "billDate",
+    "Bill Period Start", "billPeriodStart", "Bill Period End", "billPeriodEnd",
+    "source_input_key", "pdfKey", "PDF_LINK",
+)
+
+
 def _compute_workflow_data() -> dict:
     """Heavy computation: scan all bill stages and compute workflow status for each account.
     This should be called in background, not during page load.
@@ -10724,12 +12174,12 @@ def _compute_workflow_data() -> dict:
     print(f"[_compute_workflow_data] Found keys: S4={len(stage4_keys)}, S6={len(stage6_keys)}, S7={len(stage7_keys)}, S8={len(stage8_keys)}, S9={len(stage9_keys)}, Archive={len(archive_keys)}")
 
     # Only read FIRST record from each file (we just need header info: bill date, property, vendor, account)
-    stage4 = _read_first_record_from_s3(stage4_keys)
-    stage6 = _read_first_record_from_s3(stage6_keys)
-    stage7 = _read_first_record_from_s3(stage7_keys)
-    stage8 = _read_first_record_from_s3(stage8_keys)
-    stage9 = _read_first_record_from_s3(stage9_keys)
-    archive = _read_first_record_from_s3(archive_keys)
+    stage4 = _read_first_record_from_s3(stage4_keys, fields=_WORKFLOW_BILL_FIELDS)
+    stage6 = _read_first_record_from_s3(stage6_keys, fields=_WORKFLOW_BILL_FIELDS)
+    stage7 = _read_first_record_from_s3(stage7_keys, fields=_WORKFLOW_BILL_FIELDS)
+    stage8 = _read_first_record_from_s3(stage8_keys, fields=_WORKFLOW_BILL_FIELDS)
+    stage9 = _read_first_record_from_s3(stage9_keys, fields=_WORKFLOW_BILL_FIELDS)
+    archive = _read_first_record_from_s3(archive_keys, fields=_WORKFLOW_BILL_FIELDS)
     print(f"[_compute_workflow_data] Read first records: S4={len(stage4)}, S6={len(stage6)}, S7={len(stage7)}, S8={len(stage8)}, S9={len(stage9)}, Archive={len(archive)}")
 
     # Index bills by (propertyId, vendorId, accountNumber)
@@ -11624,14 +13074,14 @@ def _get_ubi_account_amounts_from_stage8() -> dict:
         pages = paginator.paginate(Bucket=BUCKET, Prefix=UBI_ASSIGNED_PREFIX)
 
         all_keys = []
+        etags = {}
         for page in pages:
             for obj in page.get('Contents', []):
                 if obj['Key'].endswith('.jsonl'):
                     all_keys.append(obj['Key'])
+                    etags[obj['Key']] = obj.get('ETag') or None
 
         print(f"[UBI AMOUNTS] Found {len(all_keys)} Stage 8 files to scan")
-
-        from concurrent.futures import ThreadPoolExecutor
         import re
 
         def process_stage8_file_for_amounts(key):
@@ -11640,8 +13090,7 @@ def _get_ubi_account_amounts_from_stage8() -> dict:
                 ts_match = re.search(r'_(\d{8}T\d{6}Z)_', key)
                 file_timestamp = ts_match.group(1) if ts_match else ""
 
-                obj_data = s3.get_object(Bucket=BUCKET, Key=key)
-                txt = obj_data['Body'].read().decode('utf-8', errors='ignore')
+                txt = _s3_cached_get(key, etag=etags.get(key)).decode('utf-8', errors='ignore')
                 for line in txt.splitlines():
                     if not line.strip():
                         continue
@@ -11681,7 +13130,7 @@ def _get_ubi_account_amounts_from_stage8() -> dict:
                 pass
             return local_accounts
 
-        with ThreadPoolExecutor(max_workers=20) as executor:
+        with _io_executor("s3", lane="background", max_workers=20) as executor:
             results = list(executor.map(process_stage8_file_for_amounts, all_keys))
 
         # Merge results
@@ -11938,7 +13387,7 @@ def api_workflow_research(
 
 
 # Small TTL cache for live Entrata lookups so repeated drawer clicks don't hammer Snowflake.
-_ENTRATA_LIVE_CACHE: dict = {}  # (prop_code, vendor_lower, account_lower, days) -> {ts, rows}
+_ENTRATA_LIVE_CACHE = _cache_namespace("entrata_live", max_entries=500, max_mb=128)  # (prop_code, vendor_lower, account_lower, days) -> {ts, rows}
 _ENTRATA_LIVE_TTL_SECONDS = 300  # 5 minutes
 
 
@@ -11983,7 +13432,7 @@ def api_workflow_research_entrata_live(
         # Resolve property_id → property_code (lookup_code in AP_INVOICE_LIVE).
         # If the INVOICES_MAT cache has been built, prop_code_map has the answer;
         # otherwise fall back to the raw property_id (often matches lookup_code).
-        cache = _INVOICE_HISTORY_CACHE
+        cache = _INVOICE_HISTORY_CACHE.get("index") or {}
         prop_code = ""
         if isinstance(cache.get("prop_code_map"), dict):
             prop_code = cache["prop_code_map"].get(property_id_s, "")
@@ -12119,12 +13568,6 @@ def api_workflow_research_entrata_live(
             "columns": cols_out,
             "date_col": date_col_used,
         }
-        # Trim cache if it grows large
-        if len(_ENTRATA_LIVE_CACHE) > 500:
-            _oldest = sorted(_ENTRATA_LIVE_CACHE.items(), key=lambda kv: kv[1]["ts"])[:100]
-            for _k, _ in _oldest:
-                _ENTRATA_LIVE_CACHE.pop(_k, None)
-
         return {
             "ok": True,
             "rows": rows_out,
@@ -13043,7 +14486,7 @@ def metrics_view(request: Request, user: str = Depends(require_user)):
 
 
 @app.get("/api/metrics/user-timing")
-def api_metrics_user_timing(date: str = "", user: str = Depends(require_user)):
+async def api_metrics_user_timing(date: str = "", user: str = Depends(require_user)):
     """Get all user timing data across all users for metrics."""
     def _compute():
         all_items = []
@@ -13090,7 +14533,7 @@ def api_metrics_user_timing(date: str = "", user: str = Depends(require_user)):
             "total_seconds": total_all,
             "total_hours": round(total_all / 3600, 2),
         }
-    result = _metrics_serve("user_timing", _compute)
+    result = await aio_call(_metrics_serve, "user_timing", _compute)
     # Apply client-side date filter (cache stores all data, filter at serve time)
     if date and isinstance(result, dict) and result.get("users"):
         for u in result["users"]:
@@ -13109,30 +14552,21 @@ def api_metrics_user_timing(date: str = "", user: str = Depends(require_user)):
 
 
 @app.get("/api/metrics/parsing-volume")
-def api_metrics_parsing_volume(days: int = 7, user: str = Depends(require_user)):
+async def api_metrics_parsing_volume(days: int = 7, user: str = Depends(require_user)):
     """Get parsing volume metrics by day."""
     try:
-        results = []
         today = dt.datetime.utcnow().date()
-        for i in range(days):
-            target_date = today - dt.timedelta(days=i)
-            y, m, d = target_date.strftime('%Y'), target_date.strftime('%m'), target_date.strftime('%d')
-            prefix = f"{ENRICH_PREFIX}yyyy={y}/mm={m}/dd={d}/"
-
+        dates = [today - dt.timedelta(days=i) for i in range(days)]
+        # List every day prefix concurrently; a failed listing counts as zero
+        listings = await aio_map(
+            lambda t: _list_prefix_objects(f"{ENRICH_PREFIX}yyyy={t:%Y}/mm={t:%m}/dd={t:%d}/", BUCKET),
+            dates, return_exceptions=True)
+        results = []
+        for target_date, objs in zip(dates, listings):
             # Count files in enriched outputs for this day
             file_count = 0
-            total_lines = 0
-            try:
-                paginator = s3.get_paginator('list_objects_v2')
-                for page in paginator.paginate(Bucket=BUCKET, Prefix=prefix):
-                    for obj in page.get("Contents", []) or []:
-                        k = obj.get("Key", "")
-                        if k.endswith('.jsonl'):
-                            file_count += 1
-                            # Optionally count lines (can be slow for many files)
-            except Exception:
-                pass
-
+            if not isinstance(objs, BaseException):
+                file_count = sum(1 for obj in objs if obj.get("Key", "").endswith('.jsonl'))
             results.append({
                 "date": str(target_date),
                 "invoices_parsed": file_count,
@@ -13146,7 +14580,7 @@ def api_metrics_parsing_volume(days: int = 7, user: str = Depends(require_user))
 
 
 @app.get("/api/metrics/pipeline-summary")
-def api_metrics_pipeline_summary(user: str = Depends(require_user)):
+async def api_metrics_pipeline_summary(user: str = Depends(require_user)):
     """Get pipeline summary - count of files in each processing stage. Uses S3-persisted cache with 60min TTL."""
     def _compute():
         stages = [
@@ -13209,14 +14643,14 @@ def api_metrics_pipeline_summary(user: str = Depends(require_user)):
 
         return {"stages": results}
 
-    return _metrics_serve("pipeline_summary", _compute)
+    return await aio_call(_metrics_serve, "pipeline_summary", _compute)
 
 
 # -------- Metrics S3-Persisted Cache --------
 # Generic caching layer: in-memory -> S3 (gzip) -> async background rebuild
 # All metrics endpoints use this to avoid blocking requests on expensive computations.
 
-_METRICS_CACHE: dict = {}
+_METRICS_CACHE = _cache_namespace("metrics", max_entries=500, max_mb=256)
 _METRICS_CACHE_TTL = 3600  # 60 minutes
 
 def _metrics_cache_get(name: str):
@@ -14455,7 +15889,7 @@ def api_metrics_submitter_stats(date: str = "", start_date: str = "", end_date:
         print(f"[SUBMITTER_STATS] Found {len(stage7_keys_info)} Stage 7 files to check, fetching in parallel...")
 
         # Step 2: Fetch all files in PARALLEL
-        from concurrent.futures import ThreadPoolExecutor, as_completed as as_completed2
+        from concurrent.futures import as_completed as as_completed2
 
         def fetch_stage7_file(key_info):
             k, s3_last_modified = key_info
@@ -14467,7 +15901,7 @@ def api_metrics_submitter_stats(date: str = "", start_date: str = "", end_date:
                 return (k, s3_last_modified, None)
 
         stage7_contents = {}  # key -> (s3_last_modified, content)
-        with ThreadPoolExecutor(max_workers=20) as executor:
+        with _io_executor("s3", lane="background", max_workers=20) as executor:
             futures = {executor.submit(fetch_stage7_file, ki): ki for ki in stage7_keys_info}
             for future in as_completed2(futures):
                 try:
@@ -14536,7 +15970,7 @@ def api_metrics_submitter_stats(date: str = "", start_date: str = "", end_date:
         all_unique = submitted_basenames  # Only count invoices where someone submitted today
 
         # PRE-FETCH all S3 file stats in PARALLEL to avoid sequential reads
-        from concurrent.futures import ThreadPoolExecutor, as_completed
+        from concurrent.futures import as_completed
         s3_keys_to_fetch = set()
         for basename in submitted_only | all_unique:
             if basename in submitted_invoices_data:
@@ -14548,7 +15982,7 @@ def api_metrics_submitter_stats(date: str = "", start_date: str = "", end_date:
         def fetch_one(key):
             return key, get_file_stats_from_s3(key)
 
-        with ThreadPoolExecutor(max_workers=20) as executor:
+        with _io_executor("s3", lane="background", max_workers=20) as executor:
             futures = {executor.submit(fetch_one, k): k for k in s3_keys_to_fetch}
             for future in as_completed(futures):
                 try:
@@ -14790,7 +16224,7 @@ def api_metrics_week_over_week(weeks: int = 6, submitter: str = "", user: str =
         print(f"[WEEK_OVER_WEEK] Found {len(invoice_data)} unique SUBMITTED invoices")
 
         # Pre-fetch S3 file stats in parallel (same as submitter-stats)
-        from concurrent.futures import ThreadPoolExecutor, as_completed
+        from concurrent.futures import as_completed
 
         def get_file_stats(s3_key: str) -> tuple:
             """Read Stage 4 file and count lines/dollars/late fees."""
@@ -14828,7 +16262,7 @@ def api_metrics_week_over_week(weeks: int = 6, submitter: str = "", user: str =
         s3_keys_to_fetch = {inv['s3_key'] for inv in invoice_data.values()}
         file_stats = {}  # s3_key -> (lines, dollars, late_fees)
 
-        with ThreadPoolExecutor(max_workers=20) as executor:
+        with _io_executor("s3", lane="background", max_workers=20) as executor:
             futures = {executor.submit(get_file_stats, k): k for k in s3_keys_to_fetch}
             for future in as_completed(futures):
                 try:
@@ -16284,7 +17718,7 @@ def _generate_directed_plan(user: str, *, mode: str = "my_bills",
                 except Exception:
                     pass
 
-        with ThreadPoolExecutor(max_workers=10) as scraper_executor:
+        with _io_executor("s3", max_workers=10) as scraper_executor:
             futures = [scraper_executor.submit(_check_scraper_pdfs, t) for t in scraper_tasks]
             try:
                 for f in as_completed(futures, timeout=30):
@@ -16603,8 +18037,8 @@ def _calculate_ubi_period_from_date(date_val: dt.date) -> str:
     return f"{date_val.month:02d}/{date_val.year}"
 
 
-# Cache for last UBI periods from Stage 8 (5 min TTL)
-_last_ubi_periods_cache = {"data": {}, "expires": 0}
+# Cache for last UBI periods from Stage 8 (5 min TTL): "data" -> {account key: last period}
+_LAST_UBI_PERIODS_CACHE = _cache_namespace("last_ubi_periods", ttl=300, max_entries=1)
 
 def _parse_service_period_to_month(date_str: str) -> tuple:
     """Parse a date string like '11/01/2025' or '2025-11-01' to (year, month) tuple."""
@@ -16625,203 +18059,280 @@ def _parse_service_period_to_month(date_str: str) -> tuple:
         pass
     return None
 
-_UBI_PERIODS_S3_KEY = "config/ubi_last_periods_cache.json.gz"
+# Last-period index: Stage 8 file -> its assignment entries, kept on S3 as a snapshot
+# plus small delta objects ({"put": {key: entries}, "drop": [keys]}) that every
+# assign / unassign / reassign appends when it writes or deletes a Stage 8 file.
+# Readers merge snapshot + deltas. The reconcile lists Stage 8 but only reads files
+# modified after the snapshot's watermark, drops indexed files that are gone, then
+# writes a new snapshot and prunes the deltas it covers.
+UBI_PERIODS_INDEX_PREFIX = os.getenv("UBI_PERIODS_INDEX_PREFIX", "Bill_Parser_Cache/ubi_periods/")
+UBI_PERIODS_RECONCILE_SECONDS = int(os.getenv("UBI_PERIODS_RECONCILE_SECONDS", "3600"))
+_UBI_PERIODS_SNAPSHOT_KEY = f"{UBI_PERIODS_INDEX_PREFIX}snapshot.json.gz"
+_UBI_PERIODS_DELTA_PREFIX = f"{UBI_PERIODS_INDEX_PREFIX}deltas/"
+_UBI_PERIODS_SKEW_SECONDS = 300  # files/deltas this close to the watermark or scan start are re-checked
 _UBI_PERIODS_REBUILDING = False
+_UBI_PERIODS_INDEX = {
+    "snapshot_etag": None,
+    "base": {},  # stage8 key -> entries, from the snapshot
+    "watermark": 0.0,  # LastModified (epoch) up to which Stage 8 has been read
+    "scan_started": 0.0,
+    "deltas": {},  # delta key -> (put, drop)
+}
+_UBI_PERIODS_INDEX_LOCK = threading.Lock()
 
-def _get_last_ubi_periods_from_stage8() -> dict:
-    """Scan Stage 8 to find the last assigned service period and UBI period per account.
-    Returns dict of account_key -> {
-        "last_service_month": (year, month),  # e.g. (2025, 11)
-        "last_ubi_period": "02/2026"
-    }
-
-    Uses S3-cached results + background rebuild to avoid blocking requests.
-    """
-    global _last_ubi_periods_cache, _UBI_PERIODS_REBUILDING
-    import time
-    now = time.time()
 
-    # Return in-memory cache if not expired
-    if _last_ubi_periods_cache["expires"] > now and _last_ubi_periods_cache["data"]:
-        return _last_ubi_periods_cache["data"]
+def _ubi_period_entries(rows) -> list:
+    """Index entries for one Stage 8 file: [account_key, [year, month], service_start, service_end, ubi_period]."""
+    entries, seen = [], set()
+    for rec in rows:
+        ubi_period = rec.get("ubi_period")
+        if not ubi_period:
+            continue
+        service_start = rec.get("Bill Period Start", "")
+        service_month = _parse_service_period_to_month(service_start)
+        if not service_month:
+            continue
+        account_key = f"{rec.get('EnrichedPropertyID', '')}|{rec.get('EnrichedVendorID', '')}|{str(rec.get('Account Number', '')).strip()}"
+        sig = (account_key, service_month, ubi_period)
+        if sig in seen:
+            continue
+        seen.add(sig)
+        entries.append([account_key, list(service_month), service_start, rec.get("Bill Period End", ""), ubi_period])
+    return entries
 
-    # Try loading from S3 cache (survives deploys, shared across instances)
-    if not _last_ubi_periods_cache["data"]:
-        try:
-            import gzip as _gzip
-            obj = s3.get_object(Bucket=BUCKET, Key=_UBI_PERIODS_S3_KEY)
-            payload = json.loads(_gzip.decompress(obj["Body"].read()))
-            cached_data = payload.get("data", {})
-            # Convert list keys back to tuples for service_month
-            for v in cached_data.values():
-                if isinstance(v.get("last_service_month"), list):
-                    v["last_service_month"] = tuple(v["last_service_month"])
-                for a in v.get("all_assignments", []):
-                    if isinstance(a.get("service_month"), list):
-                        a["service_month"] = tuple(a["service_month"])
-            _last_ubi_periods_cache = {"data": cached_data, "expires": now + 300}
-            print(f"[UBI SUGGEST] Loaded {len(cached_data)} accounts from S3 cache")
-            # Trigger background rebuild if cache is older than 1 hour
-            cache_age = now - payload.get("ts", 0)
-            if cache_age > 3600 and not _UBI_PERIODS_REBUILDING:
-                _UBI_PERIODS_REBUILDING = True
-                threading.Thread(target=_rebuild_ubi_periods_cache, daemon=True).start()
-            return cached_data
-        except Exception:
-            pass
 
-    # No cache at all — rebuild synchronously (first call only)
-    if _UBI_PERIODS_REBUILDING:
-        return _last_ubi_periods_cache.get("data", {})
+def _ubi_periods_record_delta(put=None, drop=()):
+    """Record Stage 8 file changes for the last-period index.
 
-    _UBI_PERIODS_REBUILDING = True
-    result = _rebuild_ubi_periods_cache()
-    return result or {}
+    put: {stage8_key: rows written to it}; drop: stage8 keys deleted. Call after the
+    S3 write/delete succeeded; a missed delta is picked up by the next reconcile.
+    """
+    import uuid
+    put = {k: _ubi_period_entries(rows) for k, rows in (put or {}).items()}
+    drop = sorted(set(drop) - set(put))
+    if not put and not drop:
+        return
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    key = f"{_UBI_PERIODS_DELTA_PREFIX}{stamp}_{uuid.uuid4().hex[:8]}.json"
+    try:
+        s3.put_object(Bucket=BUCKET, Key=key, Body=json.dumps({"put": put, "drop": drop}).encode("utf-8"),
+                      ContentType="application/json")
+    except Exception as e:
+        print(f"[UBI SUGGEST] Could not record period-index delta (next reconcile catches up): {e}")
 
 
-def _rebuild_ubi_periods_cache() -> dict:
-    """Background-safe rebuild of UBI periods cache. Writes result to S3 + in-memory."""
-    global _last_ubi_periods_cache, _UBI_PERIODS_REBUILDING
-    import time
-
-    print("[UBI SUGGEST] Scanning Stage 8 for last assigned periods...")
-    start = time.time()
+def _ubi_periods_summarize(files: dict) -> dict:
+    """Per-account last service month / UBI period from index entries (same shape the Stage 8 scan produced)."""
+    import re
+    account_data = {}  # account_key -> list of {service_month, ubi_period, ...}
+    for key in sorted(files):
+        # Key format: ...filename_20251217T221100Z_20251217T221218Z.jsonl
+        # The first timestamp is the assignment time (tiebreaker within a service month)
+        ts_match = re.search(r'_(\d{8}T\d{6}Z)_', key)
+        file_timestamp = ts_match.group(1) if ts_match else ""
+        for account_key, service_month, service_start, service_end, ubi_period in files[key]:
+            account_data.setdefault(account_key, []).append({
+                "service_month": tuple(service_month),
+                "service_start": service_start,
+                "service_end": service_end,
+                "ubi_period": ubi_period,
+                "file_timestamp": file_timestamp,
+            })
 
-    account_data = {}  # account_key -> list of {service_month, ubi_period}
+    # Find the latest service month per account and its corresponding UBI period
+    # CRITICAL: When multiple files have the same service month (corrections/updates),
+    # use file_timestamp as tiebreaker to get the most recent assignment
+    result = {}
+    for account_key, entries in account_data.items():
+        sorted_entries = sorted(
+            entries,
+            key=lambda x: (x["service_month"], x.get("file_timestamp", "")),
+            reverse=True
+        )
+        latest = sorted_entries[0]
+        # Deduplicate assignments by (service_month, ubi_period) for duplicate detection
+        seen_combos = set()
+        all_assignments = []
+        for e in sorted_entries:
+            combo = (e["service_month"], e["ubi_period"])
+            if combo not in seen_combos:
+                seen_combos.add(combo)
+                all_assignments.append({
+                    "service_start": e.get("service_start", ""),
+                    "service_end": e.get("service_end", ""),
+                    "service_month": e["service_month"],
+                    "ubi_period": e["ubi_period"],
+                })
+        result[account_key] = {
+            "last_service_month": latest["service_month"],
+            "last_service_start": latest.get("service_start", ""),
+            "last_service_end": latest.get("service_end", ""),
+            "last_ubi_period": latest["ubi_period"],
+            "all_assignments": all_assignments,
+        }
+    return result
 
-    try:
-        # Scan all Stage 8 files
-        paginator = s3.get_paginator('list_objects_v2')
-        pages = paginator.paginate(Bucket=BUCKET, Prefix=UBI_ASSIGNED_PREFIX)
 
-        all_keys = []
-        for page in pages:
-            for obj in page.get('Contents', []):
-                if obj['Key'].endswith('.jsonl'):
-                    all_keys.append(obj['Key'])
+def _ubi_periods_load_index(state: dict) -> tuple:
+    """Snapshot + deltas -> ({stage8_key: entries}, delta keys). files is None when there is no snapshot."""
+    with _UBI_PERIODS_INDEX_LOCK:
+        return _ubi_periods_merge_index(state)
+
+
+def _ubi_periods_merge_index(state: dict) -> tuple:
+    # List deltas BEFORE reading the snapshot: pairing a newer snapshot with a superset
+    # of its deltas re-applies them idempotently
+    delta_etags = {}
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=BUCKET, Prefix=_UBI_PERIODS_DELTA_PREFIX):
+        for obj in page.get('Contents', []):
+            delta_etags[obj['Key']] = obj.get('ETag') or None
+    try:
+        snap_etag = s3.head_object(Bucket=BUCKET, Key=_UBI_PERIODS_SNAPSHOT_KEY).get("ETag", "")
+    except s3.exceptions.ClientError:
+        return None, list(delta_etags)
+    if snap_etag != state["snapshot_etag"]:
+        payload = json.loads(gzip.decompress(_s3_cached_get(_UBI_PERIODS_SNAPSHOT_KEY, etag=snap_etag)))
+        state["base"] = payload.get("files") or {}
+        state["watermark"] = float(payload.get("watermark") or 0)
+        state["scan_started"] = float(payload.get("scan_started") or 0)
+        state["snapshot_etag"] = snap_etag
+
+    deltas = state["deltas"]
+    for k in list(deltas):
+        if k not in delta_etags:
+            deltas.pop(k)
+    for k in delta_etags:
+        if k not in deltas:
+            try:
+                d = json.loads(_s3_cached_get(k, etag=delta_etags[k]))
+                deltas[k] = (d.get("put") or {}, d.get("drop") or [])
+            except Exception as e:
+                print(f"[UBI SUGGEST] Skipping unreadable period-index delta {k}: {e}")
+    files = dict(state["base"])
+    for k in sorted(deltas):
+        put, drop = deltas[k]
+        for key in drop:
+            files.pop(key, None)
+        files.update(put)
+    return files, list(delta_etags)
 
-        print(f"[UBI SUGGEST] Found {len(all_keys)} Stage 8 files to scan")
 
-        # Process files in parallel
-        from concurrent.futures import ThreadPoolExecutor
-        import re
+def _ubi_periods_reconcile(files: dict, watermark: float, delta_keys) -> dict:
+    """Bring the index up to date with Stage 8 and write a new snapshot.
 
-        def process_stage8_file(key):
-            local_accounts = {}
+    Only Stage 8 files modified after watermark (less the skew margin) are read; with
+    no snapshot (files empty, watermark 0) that is all of them.
+    """
+    scan_started = time.time()
+    listing = {}  # stage8 key -> LastModified epoch
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=BUCKET, Prefix=UBI_ASSIGNED_PREFIX):
+        for obj in page.get('Contents', []):
+            if obj['Key'].endswith('.jsonl'):
+                listing[obj['Key']] = obj['LastModified'].timestamp()
+    files = {k: v for k, v in files.items() if k in listing}
+    cutoff = watermark - _UBI_PERIODS_SKEW_SECONDS
+    # Files already indexed through a delta are re-read too: cheap, and covers in-place rewrites
+    to_read = [k for k, lm in listing.items() if lm > cutoff]
+
+    def read(key):
+        try:
+            txt = s3.get_object(Bucket=BUCKET, Key=key)['Body'].read().decode('utf-8', errors='ignore')
+        except Exception as e:
+            return key, None, e
+        rows = []
+        for line in txt.splitlines():
+            if not line.strip():
+                continue
             try:
-                # Extract timestamp from key for tiebreaker when same service month
-                # Key format: ...filename_20251217T221100Z_20251217T221218Z.jsonl
-                # The first timestamp is the assignment time
-                file_timestamp = ""
-                ts_match = re.search(r'_(\d{8}T\d{6}Z)_', key)
-                if ts_match:
-                    file_timestamp = ts_match.group(1)  # e.g., "20251217T221100Z"
-
-                obj_data = s3.get_object(Bucket=BUCKET, Key=key)
-                txt = obj_data['Body'].read().decode('utf-8', errors='ignore')
-                for line in txt.splitlines():
-                    if not line.strip():
-                        continue
-                    try:
-                        rec = json.loads(line)
-                        ubi_period = rec.get("ubi_period")
-                        if not ubi_period:
-                            continue
+                rows.append(json.loads(line))
+            except Exception:
+                continue
+        return key, _ubi_period_entries(rows), None
 
-                        # Get service period start to determine the service month
-                        service_start = rec.get("Bill Period Start", "")
-                        service_end = rec.get("Bill Period End", "")
-                        service_month = _parse_service_period_to_month(service_start)
-                        if not service_month:
-                            continue
+    failed = []
+    with _io_executor("s3", lane="background", max_workers=20) as executor:
+        for key, entries, err in executor.map(read, to_read):
+            if err is None:
+                files[key] = entries
+            else:
+                failed.append(key)
+                print(f"[UBI SUGGEST] Could not read {key} (retried next reconcile): {err}")
+    # Never move the watermark past a file we failed to read
+    new_watermark = min([max(listing.values(), default=watermark)] + [listing[k] for k in failed])
+
+    payload = {"built_at": datetime.now(timezone.utc).isoformat(), "scan_started": scan_started,
+               "watermark": new_watermark, "files": files}
+    s3.put_object(Bucket=BUCKET, Key=_UBI_PERIODS_SNAPSHOT_KEY,
+                  Body=gzip.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8")),
+                  ContentType="application/json", ContentEncoding="gzip")
+    stale = [k for k in delta_keys if _s3_delta_epoch(k) < scan_started - _UBI_PERIODS_SKEW_SECONDS]
+    for n in range(0, len(stale), 1000):
+        try:
+            s3.delete_objects(Bucket=BUCKET, Delete={"Objects": [{"Key": k} for k in stale[n:n + 1000]], "Quiet": True})
+        except Exception as e:
+            print(f"[UBI SUGGEST] Period-index delta prune failed: {e}")
+    print(f"[UBI SUGGEST] Reconciled period index: {len(listing)} Stage 8 files, read {len(to_read)}, "
+          f"{len(failed)} failed, pruned {len(stale)} deltas")
+    return files
 
-                        prop_id = rec.get("EnrichedPropertyID", "")
-                        vendor_id = rec.get("EnrichedVendorID", "")
-                        acct_num = str(rec.get("Account Number", "")).strip()
-                        account_key = f"{prop_id}|{vendor_id}|{acct_num}"
 
-                        if account_key not in local_accounts:
-                            local_accounts[account_key] = []
-                        local_accounts[account_key].append({
-                            "service_month": service_month,
-                            "service_start": service_start,
-                            "service_end": service_end,
-                            "ubi_period": ubi_period,
-                            "file_timestamp": file_timestamp  # For tiebreaker
-                        })
-                    except Exception:
-                        continue
-            except Exception as e:
-                pass
-            return local_accounts
+def _get_last_ubi_periods_from_stage8() -> dict:
+    """Last assigned service period and UBI period per account, from the Stage 8 period index.
+    Returns dict of account_key -> {
+        "last_service_month": (year, month),  # e.g. (2025, 11)
+        "last_ubi_period": "02/2026"
+    }
 
-        with ThreadPoolExecutor(max_workers=20) as executor:
-            results = list(executor.map(process_stage8_file, all_keys))
+    Snapshot + deltas are merged on a 5 min TTL; a snapshot older than
+    UBI_PERIODS_RECONCILE_SECONDS is reconciled in the background.
+    """
+    global _UBI_PERIODS_REBUILDING
+    now = time.time()
 
-        # Merge results
-        for local_accounts in results:
-            for account_key, entries in local_accounts.items():
-                if account_key not in account_data:
-                    account_data[account_key] = []
-                account_data[account_key].extend(entries)
+    # Return in-memory cache if not expired
+    cached = _LAST_UBI_PERIODS_CACHE.get("data")
+    if cached:
+        return cached
 
-        # Find the latest service month per account and its corresponding UBI period
-        # CRITICAL: When multiple files have the same service month (corrections/updates),
-        # use file_timestamp as tiebreaker to get the most recent assignment
-        result = {}
-        for account_key, entries in account_data.items():
-            if not entries:
-                continue
-            # Sort by service month (year, month) descending, then file_timestamp descending
-            # This ensures most recent assignment wins when same service month
-            sorted_entries = sorted(
-                entries,
-                key=lambda x: (x["service_month"], x.get("file_timestamp", "")),
-                reverse=True
-            )
-            latest = sorted_entries[0]
-            # Deduplicate assignments by (service_month, ubi_period) for duplicate detection
-            seen_combos = set()
-            all_assignments = []
-            for e in sorted_entries:
-                combo = (e["service_month"], e["ubi_period"])
-                if combo not in seen_combos:
-                    seen_combos.add(combo)
-                    all_assignments.append({
-                        "service_start": e.get("service_start", ""),
-                        "service_end": e.get("service_end", ""),
-                        "service_month": e["service_month"],
-                        "ubi_period": e["ubi_period"],
-                    })
-            result[account_key] = {
-                "last_service_month": latest["service_month"],
-                "last_service_start": latest.get("service_start", ""),
-                "last_service_end": latest.get("service_end", ""),
-                "last_ubi_period": latest["ubi_period"],
-                "all_assignments": all_assignments,
-            }
+    state = _UBI_PERIODS_INDEX
+    try:
+        files, _ = _ubi_periods_load_index(state)
+    except Exception as e:
+        print(f"[UBI SUGGEST] Period index load failed: {e}")
+        files = None
 
-        elapsed = time.time() - start
-        print(f"[UBI SUGGEST] Scanned Stage 8 in {elapsed:.1f}s, found {len(result)} accounts with UBI history")
+    if files is None:
+        # No snapshot yet — build it synchronously (first call only)
+        if _UBI_PERIODS_REBUILDING:
+            return _LAST_UBI_PERIODS_CACHE.get_stale("data", {})
+        _UBI_PERIODS_REBUILDING = True
+        return _rebuild_ubi_periods_cache() or {}
 
-        # Cache in-memory for 5 minutes
-        now = time.time()
-        _last_ubi_periods_cache = {"data": result, "expires": now + 300}
+    result = _ubi_periods_summarize(files)
+    _LAST_UBI_PERIODS_CACHE["data"] = result
+    if now - state["scan_started"] > UBI_PERIODS_RECONCILE_SECONDS and not _UBI_PERIODS_REBUILDING:
+        _UBI_PERIODS_REBUILDING = True
+        threading.Thread(target=_rebuild_ubi_periods_cache, daemon=True).start()
+    return result
 
-        # Persist to S3 so other instances and future deploys get it instantly
-        try:
-            import gzip as _gzip
-            payload = json.dumps({"ts": now, "data": result}).encode("utf-8")
-            s3.put_object(Bucket=BUCKET, Key=_UBI_PERIODS_S3_KEY,
-                          Body=_gzip.compress(payload), ContentType="application/gzip")
-            print(f"[UBI SUGGEST] Persisted cache to S3 ({len(result)} accounts)")
-        except Exception as e:
-            print(f"[UBI SUGGEST] Warning: failed to persist cache to S3: {e}")
 
+def _rebuild_ubi_periods_cache() -> dict:
+    """Background-safe reconcile of the Stage 8 period index. Writes the snapshot + in-memory cache."""
+    global _UBI_PERIODS_REBUILDING
+    start = time.time()
+    try:
+        state = _UBI_PERIODS_INDEX
+        files, delta_keys = _ubi_periods_load_index(state)
+        files = _ubi_periods_reconcile(files or {}, state["watermark"] if files is not None else 0.0, delta_keys)
+        # Reload the new snapshot (and any deltas that survived pruning) next time
+        state["snapshot_etag"] = None
+        state["deltas"] = {}
+        result = _ubi_periods_summarize(files)
+        _LAST_UBI_PERIODS_CACHE["data"] = result
+        print(f"[UBI SUGGEST] Period index reconciled in {time.time() - start:.1f}s, {len(result)} accounts with UBI history")
         return result
-
     except Exception as e:
-        print(f"[UBI SUGGEST] Error scanning Stage 8: {e}")
+        print(f"[UBI SUGGEST] Error reconciling period index: {e}")
         return {}
     finally:
         _UBI_PERIODS_REBUILDING = False
@@ -16923,6 +18434,177 @@ def _calculate_ubi_suggestion(
     }
 
 
+# -------- Batch UBI suggestions --------
+# Suggestions for a whole unassigned list at once. Account history (S3
+# ubi_account_history.json + the Stage 8 last-period index) is flattened into
+# per-account columns, rebuilt only when its version changes (history ETag,
+# Stage 8 summary object). Bills are then scored with vectorized pandas ops:
+# same rules as _calculate_ubi_suggestion (Stage 8 last period first), plus
+# warnings for bills of one account landing on the same period and for
+# months skipped since the account's earliest known period.
+_UBI_SUGGEST_STATE = {
+    "etag": None,  # ubi_account_history.json ETag the columns were built from
+    "stage8": None,  # Stage 8 summary dict they were built from (compared by identity)
+    "accounts": None,  # DataFrame indexed by account_key: s8_last, s8_label, hist_last, hist_label
+    "months": None,  # DataFrame (account_key, month): every period known assigned per account
+    "result_key": None,  # Last batch scored (version + inputs) and its result
+    "result": None,
+}
+_UBI_SUGGEST_LOCK = threading.Lock()
+_UBI_GAP_LIST_MAX = 12  # Missing periods listed per bill (the count is always exact)
+
+
+def _ubi_period_to_index(period) -> int | None:
+    """'MM/YYYY' -> months since year 0, or None when unparseable."""
+    try:
+        month, year = (int(p) for p in str(period).split("/"))
+    except (ValueError, TypeError):
+        return None
+    return year * 12 + month - 1 if 1 <= month <= 12 else None
+
+
+def _ubi_period_from_index(idx: int) -> str:
+    return f"{idx % 12 + 1:02d}/{idx // 12}"
+
+
+def _ubi_suggest_history(stage8_history: dict) -> tuple:
+    """(accounts, months) frames for the current history version, rebuilt on change."""
+    import pandas as pd
+    st = _UBI_SUGGEST_STATE
+    try:
+        etag = s3.head_object(Bucket=CONFIG_BUCKET, Key=UBI_ACCOUNT_HISTORY_KEY).get("ETag", "")
+        accounts = None
+    except Exception as e:
+        code = str(getattr(e, "response", {}).get("Error", {}).get("Code", ""))
+        if code in ("404", "NoSuchKey", "NotFound"):
+            etag, accounts = "", {}
+        else:
+            # Let the regular loader report (and survive) the error
+            data, etag = _s3_get_ubi_account_history(return_etag=True)
+            accounts = data.get("accounts", {})
+    if st["accounts"] is not None and st["etag"] == etag and st["stage8"] is stage8_history:
+        return st["accounts"], st["months"]
+    if accounts is None:
+        accounts = json.loads(_s3_cached_get(UBI_ACCOUNT_HISTORY_KEY, bucket=CONFIG_BUCKET, etag=etag)).get("accounts", {})
+
+    rows, months = [], []
+    for key in set(accounts) | set(stage8_history):
+        s8_label = (stage8_history.get(key) or {}).get("last_ubi_period") or None
+        s8_last = _ubi_period_to_index(s8_label) if s8_label else None
+        hist = accounts.get(key) or {}
+        hist_last, hist_label = None, None
+        for p in hist.get("lastUbiPeriods") or []:
+            idx = _ubi_period_to_index(p)
+            if idx is not None and (hist_last is None or idx > hist_last):
+                hist_last, hist_label = idx, p
+        rows.append((key, s8_last, s8_label if s8_last is not None else None, hist_last, hist_label))
+        known = {s8_last, hist_last}
+        for h in hist.get("billHistory") or []:
+            known.update(_ubi_period_to_index(p) for p in h.get("ubiPeriods") or [])
+        months.extend((key, m) for m in known if m is not None)
+    acc = pd.DataFrame(rows, columns=["account_key", "s8_last", "s8_label", "hist_last", "hist_label"])
+    acc = acc.astype({"s8_last": "float64", "hist_last": "float64"}).set_index("account_key")
+    mon = pd.DataFrame(months, columns=["account_key", "month"]).astype({"month": "int64"})
+    st.update({"etag": etag, "stage8": stage8_history, "accounts": acc, "months": mon,
+               "result_key": None, "result": None})
+    print(f"[UBI SUGGEST] Rebuilt suggestion history columns: {len(acc)} accounts, {len(mon)} assigned periods")
+    return acc, mon
+
+
+def _ubi_suggest_batch(bills: list, stage8_history: dict = None) -> list:
+    """Suggestions for many bills at once, in input order.
+
+    bills: [{"account_key", "amount", "is_ubi"}]. Returns a _calculate_ubi_suggestion-shaped
+    dict per UBI bill, with a "warnings" list added, and None for non-UBI bills.
+    """
+    import numpy as np
+    import pandas as pd
+    if not bills:
+        return []
+    if stage8_history is None:
+        stage8_history = _get_last_ubi_periods_from_stage8()
+    today = dt.date.today()
+    today_idx = today.year * 12 + today.month - 1
+    with _UBI_SUGGEST_LOCK:
+        acc, mon = _ubi_suggest_history(stage8_history)
+        st = _UBI_SUGGEST_STATE
+        result_key = (st["etag"], today_idx,
+                      tuple((b["account_key"], round(float(b["amount"]), 2), bool(b["is_ubi"])) for b in bills))
+        if st["result_key"] == result_key:
+            return st["result"]
+
+    df = pd.DataFrame({
+        "account_key": [b["account_key"] for b in bills],
+        "amount": np.asarray([round(float(b["amount"]), 2) for b in bills], dtype="float64"),
+        "is_ubi": np.asarray([bool(b["is_ubi"]) for b in bills], dtype=bool),
+    }).join(acc, on="account_key")
+    use_s8 = df["is_ubi"].to_numpy() & df["s8_last"].notna().to_numpy()
+    use_hist = df["is_ubi"].to_numpy() & ~use_s8 & df["hist_last"].notna().to_numpy()
+    last = np.where(use_s8, df["s8_last"].to_numpy(), np.where(use_hist, df["hist_last"].to_numpy(), np.nan))
+    df["next"] = np.where(np.isnan(last), today_idx, last + 1).astype("int64")
+
+    # Bills of one account that would land on the same period
+    ubi = df[df["is_ubi"]]
+    df["same_period"] = ubi.groupby(["account_key", "next"])["next"].transform("size").reindex(df.index).fillna(0)
+
+    # Prior-period gaps: months from the earliest known period up to the suggestion with nothing
+    # assigned (only for suggestions that follow a known last period)
+    df["missing"] = 0
+    df["already_assigned"] = False
+    sequential = df[use_s8 | use_hist]
+    if len(mon) and len(sequential):
+        pairs = sequential[["account_key", "next"]].reset_index().merge(mon, on="account_key")
+        before = pairs[pairs["month"] < pairs["next"]].groupby("index")["month"].agg(["min", "nunique"])
+        span = df.loc[before.index, "next"] - before["min"]
+        df.loc[before.index, "missing"] = (span - before["nunique"]).astype("int64")
+        hit = pairs.loc[pairs["month"] == pairs["next"], "index"].unique()
+        df.loc[hit, "already_assigned"] = True
+
+    gap_accounts = df.loc[df["missing"] > 0, "account_key"].unique()
+    known = {k: set(v) for k, v in mon[mon["account_key"].isin(gap_accounts)].groupby("account_key")["month"]}
+    out = []
+    for i, row in enumerate(df.itertuples(index=False)):
+        if not row.is_ubi:
+            out.append(None)
+            continue
+        period = _ubi_period_from_index(row.next)
+        if use_s8[i]:
+            last_label = row.s8_label
+            reason, confidence = f"Next sequential period after {last_label} (from Stage 8 history)", "high"
+        elif use_hist[i]:
+            last_label = row.hist_label
+            reason, confidence = f"Next sequential period after {last_label}", "high"
+        else:
+            last_label = None
+            reason, confidence = "No assignment history - defaulting to current month. Check previous bills.", "low"
+        warnings = []
+        if row.same_period > 1:
+            warnings.append({"type": "duplicate_period", "count": int(row.same_period),
+                             "message": f"{int(row.same_period)} unassigned bills for this account would get {period}"})
+        if row.already_assigned:
+            warnings.append({"type": "duplicate_period", "count": 1,
+                             "message": f"{period} is already assigned for this account"})
+        if row.missing > 0:
+            seen = known[row.account_key]
+            gaps = [_ubi_period_from_index(m) for m in range(min(seen), row.next) if m not in seen]
+            warnings.append({"type": "prior_period_gap", "count": int(row.missing),
+                             "missing_periods": gaps[:_UBI_GAP_LIST_MAX],
+                             "message": f"{int(row.missing)} earlier period(s) have no assignment for this account"})
+        out.append({
+            "suggested_periods": [{"period": period, "days": 30, "amount": float(row.amount), "pct": 100.0}],
+            "confidence": confidence,
+            "reason": reason,
+            "last_period": last_label,
+            "spans_months": False,
+            "warnings": warnings,
+        })
+
+    with _UBI_SUGGEST_LOCK:
+        if st["etag"] == result_key[0] and st["stage8"] is stage8_history:
+            st["result_key"], st["result"] = result_key, out
+    return out
+
+
 def _update_ubi_account_history(
     account_key: str,
     bill_date: str,
@@ -17034,7 +18716,7 @@ def _s3_put_vendor_corrections(data: dict) -> bool:
 def _find_bills_for_account(property_id: str, account_number: str, days_back: int = 180) -> list:
     """Find all bills matching a property and account number across all stages."""
     from datetime import datetime, timedelta
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from concurrent.futures import as_completed
 
     account_number = str(account_number).strip()
     matching_bills = []
@@ -17108,7 +18790,7 @@ def _find_bills_for_account(property_id: str, account_number: str, days_back: in
         return results
 
     # Search in parallel
-    with ThreadPoolExecutor(max_workers=20) as executor:
+    with _io_executor("s3", max_workers=20) as executor:
         futures = [executor.submit(search_prefix, args) for args in prefixes_to_scan]
         for future in as_completed(futures):
             results = future.result()
@@ -17261,7 +18943,7 @@ def _get_account_bill_history(account_key: str, max_bills: int = 12) -> list[dic
             pass
 
     # Read matched files in parallel
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from concurrent.futures import as_completed
     seen_invoices = set()
 
     def _read_file(key):
@@ -17306,7 +18988,7 @@ def _get_account_bill_history(account_key: str, max_bills: int = 12) -> list[dic
         except Exception:
             return None
 
-    with ThreadPoolExecutor(max_workers=10) as executor:
+    with _io_executor("s3", max_workers=10) as executor:
         futures = {executor.submit(_read_file, k): k for k in matching_keys[:max_bills * 3]}
         for f in as_completed(futures, timeout=30):
             try:
@@ -17894,6 +19576,22 @@ def api_perf_rollups(days: int = 7, user: str = Depends(require_user)):
     return {"hours": hours, "count": len(hours)}
 
 
+@app.get("/api/perf/caches")
+def api_perf_caches(user: str = Depends(require_user)):
+    """Cache manager stats: per-namespace size, age, and hit/miss/eviction counters."""
+    if user not in ADMIN_USERS:
+        return JSONResponse({"error": "Admin access required"}, status_code=403)
+    return _cache_stats()
+
+
+@app.get("/api/perf/io")
+def api_perf_io(user: str = Depends(require_user)):
+    """I/O scheduler stats: per-lane queue depth/running/held tasks and per-service slot usage."""
+    if user not in ADMIN_USERS:
+        return JSONResponse({"error": "Admin access required"}, status_code=403)
+    return _IO.stats()
+
+
 @app.get("/api/perf/slow")
 def api_perf_slow(threshold_ms: int = 3000, minutes: int = 60, user: str = Depends(require_user)):
     """Get requests slower than threshold."""
@@ -18428,7 +20126,7 @@ def _s3_put_json(bucket: str, key: str, data: Any) -> None:
 
 
 # -------- GL Override helpers (cached to avoid repeated S3 reads per POST) --------
-_POST_HELPER_CACHE: dict[str, dict] = {}  # key -> {"ts": float, "data": ...}
+_POST_HELPER_CACHE = _cache_namespace("post_helper", max_entries=64)  # key -> {"ts": float, "data": ...}
 _POST_HELPER_TTL = 600  # 10 minutes
 
 def _load_gl_number_to_id_map() -> dict:
@@ -18561,8 +20259,9 @@ def _iter_stage_objects(prefix_root: str, start: dt.date, end: dt.date):
         cur += dt.timedelta(days=1)
 
 
-def _read_first_record_from_s3(keys: list[str]) -> list[dict]:
-    """Read only the first JSON record from each JSONL file.
+def _read_first_record_from_s3(keys: list[str], fields=None) -> list[dict]:
+    """Read only the first JSON record from each JSONL file (ranged reads; optionally
+    projected to `fields`, in which case oversized values are skipped too).
     Uses global s3 client with low concurrency to avoid connection issues.
     """
     if not keys:
@@ -18570,26 +20269,17 @@ def _read_first_record_from_s3(keys: list[str]) -> list[dict]:
 
     def read_one(key: str) -> dict | None:
         try:
-            obj = s3.get_object(Bucket=BUCKET, Key=key)
-            # Read up to 512KB — first JSONL line can be large (embedded base64 PDF)
-            chunk = obj["Body"].read(524288).decode("utf-8", errors="ignore")
-            obj["Body"].close()
-            first_line = chunk.split("\n")[0].strip()
-            if first_line:
-                try:
-                    return json.loads(first_line)
-                except Exception:
-                    pass
+            return _s3_read_first_jsonl_record(key, fields=fields,
+                                               skip_large=JSONL_SKIP_LARGE_BYTES if fields else None)
         except Exception:
-            pass
-        return None
+            return None
 
     BATCH_SIZE = 200
     WORKERS = 10
     out = []
     for batch_start in range(0, len(keys), BATCH_SIZE):
         batch_keys = keys[batch_start:batch_start + BATCH_SIZE]
-        executor = ThreadPoolExecutor(max_workers=WORKERS)
+        executor = _io_executor("s3", max_workers=WORKERS)
         futures = {executor.submit(read_one, key): key for key in batch_keys}
         try:
             for future in as_completed(futures, timeout=300):
@@ -18612,7 +20302,7 @@ def _read_first_record_from_s3(keys: list[str]) -> list[dict]:
 
 
 def _read_json_records_from_s3(keys: list[str]) -> list[dict]:
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from concurrent.futures import as_completed
 
     def _read_one(key):
         records = []
@@ -18645,7 +20335,7 @@ def _read_json_records_from_s3(keys: list[str]) -> list[dict]:
     if not keys:
         return []
     out = []
-    with ThreadPoolExecutor(max_workers=20) as pool:
+    with _io_executor("s3", max_workers=20) as pool:
         futures = {pool.submit(_read_one, k): k for k in keys}
         for f in as_completed(futures):
             try:
@@ -18713,6 +20403,38 @@ def _get_snowflake_credentials() -> dict | None:
         return None
 
 
+class _SnowflakeSlotConnection:
+    """Snowflake connection that holds an I/O scheduler "snowflake" slot until closed
+    (or collected), so concurrent queries stay within IO_SNOWFLAKE_CONCURRENCY."""
+
+    def __init__(self, conn, slot):
+        self._conn = conn
+        self._slot = slot
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        try:
+            self._conn.close()
+        finally:
+            self._release()
+
+    def _release(self):
+        slot, self._slot = self._slot, None
+        if slot is not None:
+            slot.__exit__(None, None, None)
+
+    def __del__(self):
+        self._release()
+
+
 def _snowflake_connect(credentials: dict):
     """Create a Snowflake connection using either password or key-pair auth."""
     connect_args = {
@@ -18729,7 +20451,13 @@ def _snowflake_connect(credentials: dict):
         connect_args['private_key'] = credentials['private_key']
     elif credentials.get('password'):
         connect_args['password'] = credentials['password']
-    return snowflake.connector.connect(**connect_args)
+    slot = _IO.slot("snowflake")
+    slot.__enter__()
+    try:
+        return _SnowflakeSlotConnection(snowflake.connector.connect(**connect_args), slot)
+    except BaseException:
+        slot.__exit__(None, None, None)
+        raise
 
 
 def _write_to_snowflake(batch_id: str, master_bills: list[dict], memo: str, run_date: str) -> tuple[bool, str, int]:
@@ -18853,12 +20581,10 @@ def _read_historical_from_snowflake(property_id: str, account_number: str, charg
 
 def _load_invoice_history_cache():
     """Load and index INVOICES_MAT data into in-memory cache for instant accrual lookups."""
-    cache = _INVOICE_HISTORY_CACHE
-    if cache.get("loading"):
+    if not _INVOICE_HISTORY_LOCK.acquire(blocking=False):
         print("[INVOICE CACHE] Already loading, skipping")
         return
 
-    cache["loading"] = True
     t0 = time.time()
 
     try:
@@ -18885,7 +20611,6 @@ def _load_invoice_history_cache():
         credentials = _get_snowflake_credentials()
         if not credentials:
             print("[INVOICE CACHE] No Snowflake credentials, skipping")
-            cache["loading"] = False
             return
 
         conn = _snowflake_connect(credentials)
@@ -18977,12 +20702,8 @@ def _load_invoice_history_cache():
             vendor_index[prop_code] = list(vendors.keys())
 
         # Update cache atomically
-        with _INVOICE_HISTORY_LOCK:
-            cache["data"] = data
-            cache["account_data"] = account_data
-            cache["prop_code_map"] = prop_code_map
-            cache["vendor_index"] = vendor_index
-            cache["last_refresh"] = time.time()
+        _INVOICE_HISTORY_CACHE["index"] = {"data": data, "account_data": account_data,
+                                           "prop_code_map": prop_code_map, "vendor_index": vendor_index}
 
         elapsed = time.time() - t0
         vendor_count = sum(len(v) for v in vendor_index.values())
@@ -18994,7 +20715,7 @@ def _load_invoice_history_cache():
         import traceback
         traceback.print_exc()
     finally:
-        cache["loading"] = False
+        _INVOICE_HISTORY_LOCK.release()
 
 
 # -------- Vendor Name Matching for INVOICES_MAT --------
@@ -19015,7 +20736,7 @@ def _match_vendor_in_invoices(property_id: str, vendor_name: str, account_number
 
     Returns: {"matched_vendor": str, "match_type": str, "confidence": float, "history": list} or None
     """
-    cache = _INVOICE_HISTORY_CACHE
+    cache = _INVOICE_HISTORY_CACHE.get("index") or {}
     if not cache.get("data") or not vendor_name:
         return None
 
@@ -19133,7 +20854,7 @@ def _read_historical_from_invoices_mat(property_id: str, account_number: str, ve
 
     Returns: (list of {"period": "MM/YYYY", "amount": float}, match_info dict or None)
     """
-    cache = _INVOICE_HISTORY_CACHE
+    cache = _INVOICE_HISTORY_CACHE.get("index") or {}
     history_records = None
     match_info = None
 
@@ -20826,10 +22547,9 @@ async def api_update_line_item(request: Request, user: str = Depends(require_use
         # of "I hit Refresh GL, then Load Bills, and the charge code mapping
         # disappears" — the cache was never told to update.
         try:
-            cache_data = _UBI_UNASSIGNED_CACHE.get("data") or []
-            for cached_bill in cache_data:
-                if cached_bill.get("s3_key") != bill_id:
-                    continue
+            store = _UBI_UNASSIGNED_CACHE.get("store")
+            cached_bill = store.get(bill_id) if store is not None else None
+            if cached_bill is not None:
                 unassigned_lines = cached_bill.get("unassigned_lines") or []
                 # JS sends line_index into bill.unassigned_lines. For fresh S7
                 # bills (no exclusions yet) that's a 1:1 match with line_data.
@@ -20845,8 +22565,9 @@ async def api_update_line_item(request: Request, user: str = Depends(require_use
                             cached_line["charge"] = float(form.get("current_amount", "0"))
                         except Exception:
                             pass
+                    # line_data may carry a new GL code / names: refresh the indexes
+                    store.reindex(bill_id)
                     print(f"[UPDATE LINE ITEM] Cache updated for {bill_id.split('/')[-1]} line {line_index}")
-                break
         except Exception as _e:
             # Non-fatal — Lambda eventually reconciles
             print(f"[UPDATE LINE ITEM] Cache update failed (non-fatal): {_e}")
@@ -21133,7 +22854,7 @@ def _run_master_bills_generation(start_period: str, end_period: str, days_back:
     thread. Returns {"count": int, "total_amount": float}. Raises on failure
     (the caller serializes the error into the job state)."""
     from datetime import datetime, timedelta
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from concurrent.futures import as_completed
     import hashlib
 
     print("[GENERATE MASTER BILLS] Starting generation...")
@@ -21165,6 +22886,7 @@ def _run_master_bills_generation(start_period: str, end_period: str, days_back:
 
     # Collect all S3 keys
     all_keys = []
+    etags = {}
     for prefix in prefixes_to_scan:
         try:
             paginator = s3.get_paginator('list_objects_v2')
@@ -21173,6 +22895,7 @@ def _run_master_bills_generation(start_period: str, end_period: str, days_back:
                     key = obj['Key']
                     if key.endswith('.jsonl'):
                         all_keys.append(key)
+                        etags[key] = obj.get('ETag') or None
         except Exception as e:
             pass  # Skip inaccessible prefixes
 
@@ -21184,27 +22907,20 @@ def _run_master_bills_generation(start_period: str, end_period: str, days_back:
     def process_file(key):
         """Process a single S3 file and extract assigned line items."""
         try:
-            body = _read_s3_text(BUCKET, key)
             items = []
-            for line in body.splitlines():
-                line = (line or '').strip()
-                if not line:
-                    continue
-                try:
-                    rec = json.loads(line)
-                    # Only include lines with ubi_period (assigned items)
-                    if rec.get("ubi_period"):
-                        rec["__stage8_key__"] = key  # Track Stage 8 source (separate from baked __s3_key__)
-                        items.append(rec)
-                except Exception:
-                    continue
+            # Full records (they're hashed below); lines without ubi_period aren't parsed
+            for rec in _s3_jsonl_records(key, etag=etags.get(key), contains=b'"ubi_period"'):
+                # Only include lines with ubi_period (assigned items)
+                if rec.get("ubi_period"):
+                    rec["__stage8_key__"] = key  # Track Stage 8 source (separate from baked __s3_key__)
+                    items.append(rec)
             return items
         except Exception as e:
             print(f"[GENERATE MASTER BILLS] Error processing {key}: {e}")
             return []
 
     # Process files concurrently
-    with ThreadPoolExecutor(max_workers=20) as executor:
+    with _io_executor("s3", lane="background", max_workers=20) as executor:
         futures = {executor.submit(process_file, key): key for key in all_keys}
         for future in as_completed(futures):
             all_line_items.extend(future.result())
@@ -21949,7 +23665,7 @@ def api_diagnose_master_bills(period: str = "", user: str = Depends(require_user
     Now reads from S3 Stage 8 instead of DynamoDB.
     """
     from datetime import datetime, timedelta
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from concurrent.futures import as_completed
 
     print(f"[DIAGNOSE] Starting diagnosis for period: {period or 'all'}")
 
@@ -22025,7 +23741,7 @@ def api_diagnose_master_bills(period: str = "", user: str = Depends(require_user
 
         # Process files concurrently
         all_items = []
-        with ThreadPoolExecutor(max_workers=20) as executor:
+        with _io_executor("s3", max_workers=20) as executor:
             futures = {executor.submit(process_file, key): key for key in all_keys}
             for future in as_completed(futures):
                 all_items.extend(future.result())
@@ -22844,7 +24560,7 @@ def api_completion_tracker(
                     return keys
 
                 all_keys = []
-                list_futures = [_GLOBAL_EXECUTOR.submit(_list_tracker_prefix, p) for p in prefixes_to_scan]
+                list_futures = [_BACKGROUND_EXECUTOR.submit(_list_tracker_prefix, p) for p in prefixes_to_scan]
                 for future in as_completed(list_futures):
                     all_keys.extend(future.result())
 
@@ -22935,13 +24651,13 @@ def api_completion_tracker(
                         pass  # Silently skip errors for individual files
                     return acct_periods, file_vacant_stats, file_service_dates
 
-                # Process files in parallel using ThreadPoolExecutor
+                # Process files in parallel on the background I/O lane
                 total_assignments = 0
                 vacant_stats = {}  # (prop_id, acct_num, vendor_name) -> {"vacant": N, "house": N}
                 account_all_periods = {}  # (prop_id, acct_num, vendor_name) -> set of ALL assigned periods
                 service_dates = {}  # (prop_id, acct_num, vendor_name, period) -> {"start": date, "end": date, "s3_key": key}
                 service_dates_all = {}  # SAME key → {s3_key: svc_info, ...} for ALL bills assigned to that period (multi-bill case)
-                with ThreadPoolExecutor(max_workers=50) as executor:
+                with _io_executor("s3", lane="background", max_workers=50) as executor:
                     futures = {executor.submit(process_s3_file, key): key for key in all_keys}
                     for future in as_completed(futures):
                         try:
@@ -23141,7 +24857,7 @@ def api_completion_tracker(
                         pass
                     return None, None
 
-                with ThreadPoolExecutor(max_workers=50) as executor:
+                with _io_executor("s3", lane="background", max_workers=50) as executor:
                     futures = [executor.submit(_read_stage7_account, key) for key in stage7_keys]
                     for future in as_completed(futures):
                         try:
@@ -23202,7 +24918,7 @@ def api_completion_tracker(
                         pass
                     return acct_key, vs
 
-                with ThreadPoolExecutor(max_workers=50) as executor:
+                with _io_executor("s3", lane="background", max_workers=50) as executor:
                     futures = [executor.submit(_read_vacant_from_posted, (k, v)) for k, v in accounts_needing_vacant.items()]
                     for future in as_completed(futures):
                         try:
@@ -23569,7 +25285,7 @@ def api_accrual_calculate(property_id: str = "", account_number: str = "", vendo
 @app.get("/api/accrual/cache-stats")
 def api_accrual_cache_stats(user: str = Depends(require_user)):
     """Return current INVOICES_MAT cache status (for debugging)."""
-    cache = _INVOICE_HISTORY_CACHE
+    cache = _INVOICE_HISTORY_CACHE.get("index") or {}
     prop_count = len(cache.get("data", {}))
     vendor_count = sum(len(v) for v in cache.get("vendor_index", {}).values())
     record_count = sum(
@@ -23578,15 +25294,15 @@ def api_accrual_cache_stats(user: str = Depends(require_user)):
         for records in vendors.values()
     )
     unique_accounts = sum(len(a) for a in cache.get("account_data", {}).values())
-    last_refresh = cache.get("last_refresh")
+    last_refresh = _INVOICE_HISTORY_CACHE.stored_at("index")
     age_seconds = round(time.time() - last_refresh, 1) if last_refresh else None
 
     return {
         "loaded": last_refresh is not None,
-        "loading": cache.get("loading", False),
+        "loading": _INVOICE_HISTORY_LOCK.locked(),
         "last_refresh_utc": datetime.utcfromtimestamp(last_refresh).isoformat() if last_refresh else None,
         "age_seconds": age_seconds,
-        "ttl_seconds": cache.get("ttl_seconds", 7200),
+        "ttl_seconds": _INVOICE_HISTORY_REFRESH_SECONDS,
         "property_count": prop_count,
         "vendor_count": vendor_count,
         "unique_accounts": unique_accounts,
@@ -24500,7 +26216,7 @@ async def api_save_vendor_property_overrides(request: Request, user: str = Depen
     if not ok:
         return JSONResponse({"error": "save_failed"}, status_code=500)
     # Invalidate cached pairs so next validation uses updated overrides
-    _VENDOR_PAIR_CACHE["last_refresh"] = None
+    _VENDOR_PAIR_CACHE.expire("pairs")
     return {"ok": True, "saved": len(norm)}
 
 @app.get("/api/config/vendor-gl-overrides")
@@ -24546,7 +26262,7 @@ async def api_save_vendor_gl_overrides(request: Request, user: str = Depends(req
     if not ok:
         return JSONResponse({"error": "save_failed"}, status_code=500)
     # Invalidate cached pairs so next validation uses updated overrides
-    _VENDOR_PAIR_CACHE["last_refresh"] = None
+    _VENDOR_PAIR_CACHE.expire("pairs")
     return {"ok": True, "saved": len(norm)}
 
 
@@ -24558,11 +26274,12 @@ def api_debug_exclusion_hashes(user: str = Depends(require_user)):
     try:
         cache = _EXCLUSION_HASH_CACHE
         cache_age = None
-        if cache["last_refresh"]:
-            cache_age = (datetime.now() - cache["last_refresh"]).total_seconds()
+        stored_at = cache.stored_at("hashes")
+        if stored_at:
+            cache_age = time.time() - stored_at
 
         # Force a fresh build and capture details
-        old_hashes = len(cache.get("hashes", set()))
+        old_hashes = len(cache.get_stale("hashes", set()))
 
         # Temporarily invalidate to force rebuild
         fresh_hashes = _get_cached_exclusion_hashes(90)
@@ -24597,6 +26314,8 @@ def api_debug_exclusion_hashes(user: str = Depends(require_user)):
             "ubi_assigned_prefix": UBI_ASSIGNED_PREFIX,
             "months_scanned": months_scanned,
             "sample_hashes": sample,
+            "source": _EXCLUSION_SYNC_STATE.get("last_source"),
+            "pending_deltas": len(_EXCLUSION_SYNC_STATE.get("deltas") or {}),
         }
     except Exception as e:
         import traceback
@@ -24615,7 +26334,7 @@ def api_debug_orphaned_stage7(user: str = Depends(require_user), days_back: int
     """
     def _compute():
         from datetime import datetime, timedelta
-        from concurrent.futures import ThreadPoolExecutor, as_completed
+        from concurrent.futures import as_completed
         import time as _time
 
         t0 = _time.time()
@@ -24672,7 +26391,7 @@ def api_debug_orphaned_stage7(user: str = Depends(require_user), days_back: int
             except Exception:
                 return None
 
-        with ThreadPoolExecutor(max_workers=20) as executor:
+        with _io_executor("s3", lane="background", max_workers=20) as executor:
             futures = {executor.submit(check_file, k): k for k in all_keys}
             for future in as_completed(futures):
                 result = future.result()
@@ -25114,8 +26833,8 @@ async def api_create_debug_report(request: Request, user: str = Depends(require_
                 page_context if page_context else None,
                 screenshots if screenshots else [],
             )
-            _GLOBAL_EXECUTOR.submit(_send_improve_email, subject, body_html,
-                                     [user] if "@" in user else None)
+            _io_executor(None, lane="background").submit(_send_improve_email, subject, body_html,
+                                                          [user] if "@" in user else None)
         except Exception as email_err:
             print(f"[IMPROVE] Email scheduling failed (non-blocking): {email_err}")
 
@@ -26475,7 +28194,7 @@ def api_bulk_assign_property(
             except Exception as e:
                 print(f"[bulk_assign_property] Warning: Failed to update header draft for {pdf_id_val}/{draft_user}: {e}")
 
-        ddb_futures = [_GLOBAL_EXECUTOR.submit(_update_property_draft, pid, du) for pid in wanted for du in [user, "__final__"]]
+        ddb_futures = [_DDB_EXECUTOR.submit(_update_property_draft, pid, du) for pid in wanted for du in [user, "__final__"]]
         try:
             for f in as_completed(ddb_futures, timeout=60):
                 try:
@@ -26581,7 +28300,7 @@ def api_bulk_assign_vendor(
             except Exception as e:
                 print(f"[bulk_assign_vendor] Warning: Failed to update header draft for {pdf_id_val}/{draft_user}: {e}")
 
-        ddb_futures = [_GLOBAL_EXECUTOR.submit(_update_vendor_draft, pid, du) for pid in wanted for du in [user, "__final__"]]
+        ddb_futures = [_DDB_EXECUTOR.submit(_update_vendor_draft, pid, du) for pid in wanted for du in [user, "__final__"]]
         try:
             for f in as_completed(ddb_futures, timeout=60):
                 try:
@@ -27306,23 +29025,135 @@ def get_status_map(ids: List[str]) -> Dict[str, Dict[str, str]]:
     return out
 
 
-def day_status_counts(y: str, m: str, d: str) -> Dict[str, int]:
-    """Compute per-day status PER INVOICE GROUP (vendor, account, pdf_id) for the dashboard.
+# -------- Per-Day Status Rollups --------
+# One CONFIG_TABLE item per Stage 4 day (PK=DAY_STATUS_ROLLUP, SK=DAY#YYYY-MM-DD) holding
+# the dashboard counts plus the per-group tallies needed to update them in place:
+# "state" is gzip JSON {"groups": [[lines, submitted, deleted], ...],
+# "members": {s3_key: {row_idx: group_index}}}. put_status/api_submit apply status
+# changes with a seq-conditioned write; anything the tallies can't absorb (unknown
+# rows, Stage 4 rewrites via invalidate_day_cache) marks the item stale and the next
+# read rebuilds it. Every change bumps seq, so a rebuild that raced a change is not saved.
+DAY_ROLLUP_PK = "DAY_STATUS_ROLLUP"
+DAY_ROLLUP_MAX_AGE = int(os.getenv("DAY_ROLLUP_MAX_AGE_SECONDS", str(6 * 3600)))
+_DAY_ROLLUP_COUNT_ATTRS = ("REVIEW", "PARTIAL", "COMPLETE")
 
-    Rules (aligned with invoices list logic except artifact check):
-    - Exclude lines marked 'Deleted'.
-    - COMPLETE when all non-deleted lines are Submitted (no artifact check here).
-    - PARTIAL if some submitted; REVIEW if none submitted.
-    """
-    # Cache day_status_counts to avoid expensive DynamoDB queries on every parse page load
-    # Use longer TTL for past days since they change less frequently
-    cache_key = ("day_status_counts", y, m, d)
-    now = time.time()
-    ent = _CACHE.get(cache_key)
+
+def _day_rollup_sk(y: str, m: str, d: str) -> str:
+    return f"DAY#{y}-{m}-{d}"
+
+
+def _rollup_group_status(lines: int, submitted: int, deleted: int) -> str:
+    active = lines - deleted
+    if active <= 0 or submitted <= 0:
+        # No active lines; treat as REVIEW bucket until files are fully removed
+        return "REVIEW"
+    return "COMPLETE" if submitted >= active else "PARTIAL"
+
+
+def _rollup_counts(groups: list) -> Dict[str, int]:
+    counts = {k: 0 for k in _DAY_ROLLUP_COUNT_ATTRS}
+    for lines, submitted, deleted in groups:
+        counts[_rollup_group_status(lines, submitted, deleted)] += 1
+    return counts
+
+
+def _day_rollup_fresh(item: dict | None, y: str, m: str, d: str) -> bool:
+    # Today's rollup can miss newly landed Stage 4 files, so it ages out with the day cache
+    if not item or "stale" in item or "built_ts" not in item:
+        return False
     ttl = _get_cache_ttl(y, m, d)
-    if ent and (now - ent.get("ts", 0) < ttl):
-        return ent.get("data", {})
+    max_age = ttl if ttl == CACHE_TTL_SECONDS else DAY_ROLLUP_MAX_AGE
+    return time.time() - float(item["built_ts"]["N"]) < max_age
+
+
+def _day_rollup_item_counts(item: dict) -> Dict[str, int]:
+    return {k: int(item.get(k, {}).get("N", 0)) for k in _DAY_ROLLUP_COUNT_ATTRS}
+
+
+def _day_rollup_get(y: str, m: str, d: str) -> dict | None:
+    resp = ddb.get_item(TableName=CONFIG_TABLE, ConsistentRead=True,
+                        Key={"PK": {"S": DAY_ROLLUP_PK}, "SK": {"S": _day_rollup_sk(y, m, d)}})
+    return resp.get("Item")
+
+
+def _day_rollup_put(y: str, m: str, d: str, state: dict, seq: int, expect_seq: int | None, built_ts: float) -> bool:
+    """Write a full rollup; False if seq moved (a status change landed meanwhile)."""
+    counts = _rollup_counts(state["groups"])
+    item = {
+        "PK": {"S": DAY_ROLLUP_PK},
+        "SK": {"S": _day_rollup_sk(y, m, d)},
+        "seq": {"N": str(seq)},
+        "built_ts": {"N": str(built_ts)},
+        "state": {"B": gzip.compress(json.dumps(state, separators=(",", ":")).encode("utf-8"))},
+        **{k: {"N": str(v)} for k, v in counts.items()},
+    }
+    kwargs = {"ConditionExpression": "attribute_not_exists(PK)"}
+    if expect_seq is not None:
+        kwargs = {"ConditionExpression": "#seq = :s", "ExpressionAttributeNames": {"#seq": "seq"},
+                  "ExpressionAttributeValues": {":s": {"N": str(expect_seq)}}}
+    try:
+        ddb.put_item(TableName=CONFIG_TABLE, Item=item, **kwargs)
+        return True
+    except ddb.exceptions.ConditionalCheckFailedException:
+        return False
+
+
+def _day_rollup_invalidate(y: str, m: str, d: str):
+    """Mark a day's rollup stale (rows or grouping changed) so the next read rebuilds it.
+
+    Upserts, so a first build already in flight for the day fails its conditional save.
+    """
+    try:
+        ddb.update_item(TableName=CONFIG_TABLE,
+                        Key={"PK": {"S": DAY_ROLLUP_PK}, "SK": {"S": _day_rollup_sk(y, m, d)}},
+                        UpdateExpression="SET #stale = :t ADD #seq :one",
+                        ExpressionAttributeNames={"#stale": "stale", "#seq": "seq"},
+                        ExpressionAttributeValues={":t": {"BOOL": True}, ":one": {"N": "1"}})
+    except Exception as e:
+        print(f"[DAY ROLLUP] Invalidate {y}-{m}-{d} failed: {e}")
+
+
+def _day_rollup_apply(changes: List[tuple]):
+    """Fold (id, old_status, new_status) changes into their days' rollups."""
+    by_day: Dict[tuple, list] = {}
+    for id_, old, new in changes:
+        key, _, idx = str(id_).rpartition("#")
+        if old == new or not key.startswith(ENRICH_PREFIX) or "yyyy=" not in key:
+            continue
+        by_day.setdefault(_extract_ymd_from_key(key), []).append((key, idx, old, new))
+    for (y, m, d), day_changes in by_day.items():
+        try:
+            for _attempt in range(3):
+                item = _day_rollup_get(y, m, d)
+                if not item or "stale" in item or "state" not in item:
+                    _day_rollup_invalidate(y, m, d)
+                    break
+                seq = int(item["seq"]["N"])
+                state = json.loads(gzip.decompress(item["state"]["B"]))
+                groups = state["groups"]
+                unknown = False
+                for key, idx, old, new in day_changes:
+                    gi = state["members"].get(key, {}).get(idx)
+                    if gi is None:
+                        unknown = True
+                        break
+                    g = groups[gi]
+                    g[1] += (new == "Submitted") - (old == "Submitted")
+                    g[2] += (new == "Deleted") - (old == "Deleted")
+                if unknown:
+                    _day_rollup_invalidate(y, m, d)
+                    break
+                if _day_rollup_put(y, m, d, state, seq + 1, seq, float(item["built_ts"]["N"])):
+                    break
+            else:
+                _day_rollup_invalidate(y, m, d)
+        except Exception as e:
+            print(f"[DAY ROLLUP] Apply for {y}-{m}-{d} failed: {e}")
+            _day_rollup_invalidate(y, m, d)
 
+
+def _compute_day_status_rollup(y: str, m: str, d: str) -> dict:
+    """Group the day's rows and tally their statuses: {"groups": [...], "members": {...}}."""
     rows = load_day(y, m, d)
 
     # Collect all unique pdf_ids first for batch fetching
@@ -27377,26 +29208,81 @@ def day_status_counts(y: str, m: str, d: str) -> Dict[str, int]:
 
     stmap = get_status_map(all_ids)
 
-    review = partial = complete = 0
-    for group_key, ids_all in groups.items():
-        ids_active = [i for i in ids_all if stmap.get(i, {}).get("status") != "Deleted"]
-        if not ids_active:
-            # No active lines; treat as REVIEW bucket until files are fully removed
-            review += 1
-            continue
-        submitted = sum(1 for i in ids_active if stmap.get(i, {}).get("status") == "Submitted")
-        if submitted == 0:
-            review += 1
-        elif submitted == len(ids_active):
-            complete += 1
-        else:
-            partial += 1
+    tallies = []
+    members: Dict[str, Dict[str, int]] = {}
+    for gi, ids_all in enumerate(groups.values()):
+        statuses = [stmap.get(i, {}).get("status") for i in ids_all]
+        tallies.append([len(ids_all), statuses.count("Submitted"), statuses.count("Deleted")])
+        for rid in ids_all:
+            key, _, idx = rid.rpartition("#")
+            members.setdefault(key, {})[idx] = gi
+    return {"groups": tallies, "members": members}
+
+
+def day_status_counts(y: str, m: str, d: str) -> Dict[str, int]:
+    """Compute per-day status PER INVOICE GROUP (vendor, account, pdf_id) for the dashboard.
+
+    Rules (aligned with invoices list logic except artifact check):
+    - Exclude lines marked 'Deleted'.
+    - COMPLETE when all non-deleted lines are Submitted (no artifact check here).
+    - PARTIAL if some submitted; REVIEW if none submitted.
+
+    Served from the persisted day rollup when fresh; otherwise recomputed and saved.
+    """
+    # Cache day_status_counts to avoid expensive DynamoDB queries on every parse page load
+    # Use longer TTL for past days since they change less frequently
+    cache_key = ("day_status_counts", y, m, d)
+    now = time.time()
+    ent = _CACHE.get(cache_key)
+    ttl = _get_cache_ttl(y, m, d)
+    if ent and (now - ent.get("ts", 0) < ttl):
+        return ent.get("data", {})
+
+    item = None
+    try:
+        item = _day_rollup_get(y, m, d)
+    except Exception as e:
+        print(f"[DAY ROLLUP] Read {y}-{m}-{d} failed: {e}")
+    if _day_rollup_fresh(item, y, m, d):
+        counts = _day_rollup_item_counts(item)
+    else:
+        seq = int(item["seq"]["N"]) if item and "seq" in item else None
+        state = _compute_day_status_rollup(y, m, d)
+        counts = _rollup_counts(state["groups"])
+        try:
+            _day_rollup_put(y, m, d, state, seq or 0, seq, now)
+        except Exception as e:
+            print(f"[DAY ROLLUP] Save {y}-{m}-{d} failed: {e}")
 
-    counts = {"REVIEW": review, "PARTIAL": partial, "COMPLETE": complete}
     _CACHE[cache_key] = {"ts": now, "data": counts}
     return counts
 
 
+def day_status_counts_many(days: List[tuple]) -> Dict[tuple, Dict[str, int]]:
+    """Fresh persisted rollups for many (y, m, d) days with one Query; days without
+    a fresh rollup are left out for the caller to compute."""
+    if not days:
+        return {}
+    sks = sorted(_day_rollup_sk(*t) for t in days)
+    wanted = set(days)
+    out: Dict[tuple, Dict[str, int]] = {}
+    try:
+        pages = ddb.get_paginator("query").paginate(
+            TableName=CONFIG_TABLE,
+            KeyConditionExpression="PK = :pk AND SK BETWEEN :lo AND :hi",
+            ExpressionAttributeValues={":pk": {"S": DAY_ROLLUP_PK}, ":lo": {"S": sks[0]}, ":hi": {"S": sks[-1]}},
+            ProjectionExpression="SK, built_ts, #stale, REVIEW, PARTIAL, COMPLETE",
+            ExpressionAttributeNames={"#stale": "stale"},
+        )
+        for item in (it for page in pages for it in page.get("Items", [])):
+            ymd = tuple(item["SK"]["S"][4:].split("-"))
+            if ymd in wanted and _day_rollup_fresh(item, *ymd):
+                out[ymd] = _day_rollup_item_counts(item)
+    except Exception as e:
+        print(f"[DAY ROLLUP] Query failed: {e}")
+    return out
+
+
 @app.get("/review", response_class=HTMLResponse)
 def review_view(request: Request, date: str, pdf_id: str, user: str = Depends(require_user)):
     try:
@@ -28160,24 +30046,22 @@ def api_day(date: str, user: str = Depends(require_user), response: Response = N
 
 
 @app.get("/api/invoices")
-def api_invoices(date: str, user: str = Depends(require_user), response: Response = None):
+async def api_invoices(date: str, user: str = Depends(require_user), response: Response = None):
     try:
         y, m, d = date.split("-")
     except ValueError:
         return JSONResponse({"error": "Invalid date format, expected YYYY-MM-DD"}, status_code=400)
-    rows = load_day(y, m, d)
+    rows = await aio_call(load_day, y, m, d)
     # Build id list to fetch statuses so we can exclude Deleted lines from counts
-    id_list: List[str] = [str(r.get("__id__")) for r in rows if r.get("__id__")]
-    stmap = get_status_map(id_list)
+    id_list: List[str] = list(dict.fromkeys(str(r.get("__id__")) for r in rows if r.get("__id__")))
+    items = await aio_ddb_batch_get(REVIEW_TABLE, [{"pk": {"S": i}} for i in id_list])
+    stmap = {it["pk"]["S"]: {"status": it.get("status", {}).get("S", "")} for it in items if "pk" in it}
     # Cache per-pdf header overrides for vendor/account, prefer shared '__final__', then current user
-    header_by_pdf: Dict[str, Dict[str, Any]] = {}
-    for r in rows:
-        key = r.get("__s3_key__", "")
-        if not key: continue
-        pid = pdf_id_from_key(key)
-        if pid and pid not in header_by_pdf:
-            d = get_draft(pid, "__header__", "__final__") or get_draft(pid, "__header__", user)
-            header_by_pdf[pid] = (d or {}).get("fields", {})
+    pids = list(dict.fromkeys(pdf_id_from_key(r["__s3_key__"]) for r in rows if r.get("__s3_key__")))
+    pids = [p for p in pids if p]
+    drafts = await aio_map(lambda p: get_draft(p, "__header__", "__final__") or get_draft(p, "__header__", user),
+                           pids, service="ddb")
+    header_by_pdf: Dict[str, Dict[str, Any]] = {p: (dr or {}).get("fields", {}) for p, dr in zip(pids, drafts)}
     inv: Dict[str, Dict[str, Any]] = {}
     for r in rows:
         if stmap.get(str(r.get("__id__")), {}).get("status") == "Deleted":
@@ -29424,11 +31308,11 @@ def api_submit(date: str = Form(...), ids: str = Form(...), extras: str = Form("
 
         # Update statuses synchronously so the UI reflects submitted state immediately on redirect.
         # The background task also calls put_status (idempotent) so this is safe to do twice.
+        status_changes = []
         for id_ in id_list:
-            if str(id_) in deleted_set:
-                put_status(id_, "Deleted", user)
-            else:
-                put_status(id_, "Submitted", user)
+            new_status = "Deleted" if str(id_) in deleted_set else "Submitted"
+            status_changes.append((id_, put_status(id_, new_status, user, rollup=False), new_status))
+        _day_rollup_apply(status_changes)
         _CACHE.pop(("day_status_counts", y, m, d), None)
         _CACHE.pop(("parse_dashboard",), None)
 
@@ -30203,6 +32087,15 @@ def api_meters_scan(user: str = Depends(require_user)):
     return _metrics_serve("meters_scan", _compute)
 
 
+_METER_SCAN_FIELDS = (
+    "Utility Type", "Utility Name", "Meter Number", "Consumption Amount", "ENRICHED CONSUMPTION",
+    "Unit of Measure", "ENRICHED UOM", "Line Item Charge", "Amount", "AMOUNT",
+    "EnrichedPropertyID", "Property ID", "EnrichedPropertyName", "Property Name",
+    "Bill Period Start", "Service Start", "Bill Period End", "Current Reading Date",
+    "Account Number", "EnrichedVendorName", "Vendor Name", "source_input_key", "source_file_page",
+)
+
+
 def _api_meters_scan_local(user: str):
     """
     Local scan implementation (kept for reference, not used).
@@ -30240,14 +32133,9 @@ def _api_meters_scan_local(user: str):
                         continue
 
                     try:
-                        txt = _read_s3_text(BUCKET, key)
-                        line_index = 0
-                        for line in txt.strip().split('\n'):
-                            if not line.strip():
-                                continue
-
-                            rec = json.loads(line)
-                            line_index += 1
+                        records = _s3_jsonl_records(key, etag=obj.get('ETag') or None, fields=_METER_SCAN_FIELDS,
+                                                    skip_large=JSONL_SKIP_LARGE_BYTES)
+                        for line_index, rec in enumerate(records, start=1):
 
                             # Check deduplication
                             rkey = f"{key}|{line_index}"
@@ -30867,7 +32755,7 @@ def api_billback_report_data(
     """
     from collections import defaultdict
     from datetime import datetime, timedelta
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from concurrent.futures import as_completed
 
     def normalize_period(p: str) -> str:
         """Convert period to YYYY-MM format. Handles MM/YYYY, YYYY-MM, YYYY/MM formats."""
@@ -30938,6 +32826,8 @@ def api_billback_report_data(
         print(f"[REPORT DATA] Scanning {len(prefixes_to_scan)} month-level prefixes")
 
         # Collect S3 keys IN PARALLEL
+        report_etags = {}
+
         def _list_report_prefix(prefix):
             keys = []
             try:
@@ -30947,6 +32837,7 @@ def api_billback_report_data(
                         key = obj['Key']
                         if key.endswith('.jsonl'):
                             keys.append(key)
+                            report_etags[key] = obj.get('ETag') or None
             except Exception as e:
                 print(f"[REPORT DATA] Error listing {prefix}: {e}")
             return keys
@@ -30961,7 +32852,7 @@ def api_billback_report_data(
         def process_file(key):
             """Process a single S3 file."""
             try:
-                body = _read_s3_text(BUCKET, key)
+                body = _s3_cached_text(key, etag=report_etags.get(key))
                 lines = [ln.strip() for ln in body.splitlines() if ln.strip()]
                 results = []
                 for line in lines:
@@ -31044,7 +32935,7 @@ def api_billback_report_data(
                 return []
 
         # Process files concurrently
-        with ThreadPoolExecutor(max_workers=20) as executor:
+        with _io_executor("s3", max_workers=20) as executor:
             futures = {executor.submit(process_file, key): key for key in all_keys}
             for future in as_completed(futures):
                 items = future.result()
@@ -32714,7 +34605,7 @@ def api_print_checks_posted_invoices(
     Returns invoices grouped by vendor.
     """
     from collections import defaultdict
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from concurrent.futures import as_completed
     import hashlib
 
     today = dt.date.today()
@@ -32738,20 +34629,14 @@ def api_print_checks_posted_invoices(
 
     # Check cache first (unless refresh requested)
     cache = _PRINT_CHECKS_CACHE
-    now = dt.datetime.now()
-    cache_valid = (
-        refresh != "1" and
-        cache["last_refresh"] and
-        (now - cache["last_refresh"]).total_seconds() < cache["ttl_seconds"] and
-        cache["invoices"]
-    )
+    cached_invoices = None if refresh == "1" else cache.get("invoices")
 
-    if cache_valid:
-        print(f"[PRINT CHECKS] CACHE HIT - {len(cache['invoices'])} invoices cached")
+    if cached_invoices:
+        print(f"[PRINT CHECKS] CACHE HIT - {len(cached_invoices)} invoices cached")
         # Filter cached invoices by date range and exclude those now in check slips
         invoices_in_slips = _get_cached_invoices_in_slips()  # USE CACHED VERSION
         all_invoices = []
-        for inv in cache["invoices"]:
+        for inv in cached_invoices:
             if inv["pdf_id"] in invoices_in_slips:
                 continue
             # STRICT: Only include if PostedAt is valid and within range
@@ -32893,7 +34778,6 @@ def api_print_checks_posted_invoices(
 
         # Update cache with ALL invoices (no date filter - filter on read)
         cache["invoices"] = all_cached_invoices
-        cache["last_refresh"] = now
         _elapsed = _time.time() - _start_time
         print(f"[PRINT CHECKS] Cached {len(all_cached_invoices)} invoices in {_elapsed:.1f}s (cache valid for 10 min)")
 
@@ -33229,7 +35113,7 @@ def api_print_checks_slip_pdf(check_slip_id: str, user: str = Depends(require_us
         pdf_writer.add_page(page)
 
     # Fetch all source invoice PDFs in PARALLEL for speed
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from concurrent.futures import as_completed
     pdf_bucket = os.getenv("SCRAPER_BUCKET", "jrk-utility-pdfs")
     pdf_errors = []  # Track errors for each invoice
     successful_pdfs = 0
@@ -36230,7 +38114,7 @@ def _submeter_rates_scan(ubi_period: str):
                 files_done_counter[0] += 1
                 st["files_done"] = files_done_counter[0]
 
-        with ThreadPoolExecutor(max_workers=20) as executor:
+        with _io_executor("s3", lane="background", max_workers=20) as executor:
             futures = {executor.submit(_process_file, key): key for key in all_keys}
             for future in as_completed(futures):
                 matched_items.extend(future.result())
@@ -0,0 +1,201 @@
+"""
+Benchmark the bill router's ranged page-count probe against a full download.
+
+Builds a local corpus of synthetic bills (one file per class) under --corpus,
+plus any real PDFs already dropped in that directory, then replays each file
+through the router's probe with a simulated S3 link (per-request latency +
+bandwidth) and prints bytes transferred and latency per file class.
+
+    python scripts/bench_router_page_probe.py --corpus /tmp/router_corpus
+    python scripts/bench_router_page_probe.py --corpus ./my_pdfs --no-generate
+"""
+import argparse
+import os
+import sys
+import time
+import zlib
+from unittest.mock import patch
+
+ROUTER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "aws_lambdas", "us-east-1", "jrk-bill-router", "code")
+sys.path.insert(0, ROUTER_PATH)
+
+with patch("boto3.client"):
+    import lambda_bill_router as router
+
+
+# -------- Synthetic corpus --------
+
+def build_pdf(pages: int, image_bytes: int = 0, xref_stream: bool = False,
+              incremental: bool = False, truncate_trailer: bool = False, tree_first: bool = False) -> bytes:
+    """A structurally valid PDF with `pages` pages, each carrying an image stream
+    of image_bytes random bytes (scanned bills are mostly image data).
+
+    xref_stream=True writes PDF 1.5 style output: the catalog and page tree go into
+    a compressed object stream and the xref is a Flate/PNG-predicted xref stream.
+    incremental=True appends an update section that rewrites the page tree.
+    tree_first=True writes the catalog and page tree ahead of the page data, as most
+    scanner software does, so the probe has to seek back to the start of the file.
+    """
+    out = bytearray(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n" if xref_stream else b"%PDF-1.4\n")
+    offsets = {}
+    compressed = {}
+
+    def obj(num, body: bytes, stream: bytes = None):
+        offsets[num] = len(out)
+        out.extend(b"%d 0 obj\n" % num + body)
+        if stream is not None:
+            out.extend(b"\nstream\n" + stream + b"\nendstream")
+        out.extend(b"\nendobj\n")
+
+    page_nums = [10 + 2 * i for i in range(pages)]
+    kids = b" ".join(b"%d 0 R" % n for n in page_nums)
+    catalog = b"<< /Type /Catalog /Pages 2 0 R >>"
+    page_tree = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % pages
+    if tree_first and not xref_stream:
+        obj(1, catalog)
+        obj(2, page_tree)
+    for i, n in enumerate(page_nums):
+        img = os.urandom(image_bytes) if image_bytes else b""
+        obj(n + 1, b"<< /Type /XObject /Subtype /Image /Width 2550 /Height 3300 /BitsPerComponent 8 "
+                   b"/ColorSpace /DeviceGray /Filter /DCTDecode /Length %d >>" % len(img), img)
+        page = (b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                b"/Resources << /XObject << /Im0 %d 0 R >> >> >>" % (n + 1))
+        if xref_stream:
+            compressed[n] = page
+        else:
+            obj(n, page)
+
+    size = max(page_nums) + 2
+    if xref_stream:
+        compressed[1] = catalog
+        compressed[2] = page_tree
+        nums = sorted(compressed)
+        header, body = [], bytearray()
+        for n in nums:
+            header.append(b"%d %d" % (n, len(body)))
+            body.extend(compressed[n] + b"\n")
+        head = b" ".join(header) + b"\n"
+        stm = zlib.compress(head + bytes(body))
+        objstm_num = size
+        obj(objstm_num, b"<< /Type /ObjStm /N %d /First %d /Filter /FlateDecode /Length %d >>"
+            % (len(nums), len(head), len(stm)), stm)
+        xref_num = size + 1
+        size += 2
+        offsets[xref_num] = len(out)
+        rows, prev = bytearray(), bytearray(6)
+        for n in range(size):
+            if n in compressed:
+                rec = bytes([2]) + objstm_num.to_bytes(4, "big") + bytes([nums.index(n)])
+            elif n in offsets:
+                rec = bytes([1]) + offsets[n].to_bytes(4, "big") + bytes([0])
+            else:
+                rec = bytes([0]) + bytes(4) + bytes([0xFF])
+            rows.append(2)  # PNG Up
+            rows.extend((a - b) & 0xFF for a, b in zip(rec, prev))
+            prev = bytearray(rec)
+        data = zlib.compress(bytes(rows))
+        obj(xref_num, b"<< /Type /XRef /Size %d /W [1 4 1] /Root 1 0 R /Filter /FlateDecode "
+                      b"/DecodeParms << /Columns 6 /Predictor 12 >> /Length %d >>" % (size, len(data)), data)
+        out.extend(b"startxref\n%d\n%%%%EOF\n" % offsets[xref_num])
+        return bytes(out)
+
+    if not tree_first:
+        obj(1, catalog)
+        obj(2, page_tree)
+
+    def xref_section(nums, prev=None):
+        start = len(out)
+        out.extend(b"xref\n0 1\n0000000000 65535 f \n")
+        for n in nums:
+            out.extend(b"%d 1\n%010d 00000 n \n" % (n, offsets[n]))
+        trailer = b"trailer\n<< /Size %d /Root 1 0 R" % (max(offsets) + 1)
+        if prev is not None:
+            trailer += b" /Prev %d" % prev
+        out.extend(trailer + b" >>\nstartxref\n%d\n%%%%EOF\n" % start)
+        return start
+
+    first = xref_section(sorted(offsets))
+    if incremental:
+        # Rewrite the page tree so only the first half of the pages remain
+        half = page_nums[:max(1, pages // 2)]
+        obj(2, b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % n for n in half) + b"] /Count %d >>" % len(half))
+        xref_section([2], prev=first)
+    if truncate_trailer:
+        return bytes(out[:-60])
+    return bytes(out)
+
+
+CORPUS = [
+    # (file name, expected pages, builder kwargs)
+    ("small_text_2p.pdf", 2, {"pages": 2, "image_bytes": 20_000}),
+    ("scanned_classic_12p.pdf", 12, {"pages": 12, "image_bytes": 1_500_000, "tree_first": True}),
+    ("scanned_classic_60p.pdf", 60, {"pages": 60, "image_bytes": 1_200_000}),
+    ("scanned_xrefstream_40p.pdf", 40, {"pages": 40, "image_bytes": 1_500_000, "xref_stream": True}),
+    ("incremental_update_30p.pdf", 15, {"pages": 30, "image_bytes": 500_000, "incremental": True}),
+    ("damaged_trailer_20p.pdf", None, {"pages": 20, "image_bytes": 600_000, "truncate_trailer": True}),
+]
+
+
+# -------- Benchmark --------
+
+def simulated_fetch(data: bytes, latency_s: float, bandwidth_bps: float, clock: list):
+    def fetch(start, end):
+        chunk = data[start:end]
+        clock[0] += latency_s + len(chunk) / bandwidth_bps
+        return chunk
+    return fetch
+
+
+def run(corpus_dir: str, latency_ms: float, bandwidth_mbps: float, generate: bool):
+    os.makedirs(corpus_dir, exist_ok=True)
+    expected = {}
+    if generate:
+        for name, pages, kwargs in CORPUS:
+            path = os.path.join(corpus_dir, name)
+            if not os.path.exists(path):
+                with open(path, "wb") as f:
+                    f.write(build_pdf(**kwargs))
+            expected[name] = pages
+
+    latency_s = latency_ms / 1000.0
+    bandwidth_bps = bandwidth_mbps * 1024 * 1024
+    print(f"{'file':<32}{'size MB':>9}{'pages':>7}{'method':>13}{'probe KB':>10}{'reqs':>6}"
+          f"{'probe ms':>10}{'full ms':>9}{'cpu ms':>8}")
+    for name in sorted(os.listdir(corpus_dir)):
+        if not name.lower().endswith(".pdf"):
+            continue
+        with open(os.path.join(corpus_dir, name), "rb") as f:
+            data = f.read()
+        full_ms = (latency_s + len(data) / bandwidth_bps) * 1000
+        if len(data) < router.PAGE_PROBE_MIN_BYTES:
+            # The router skips the probe for small files: one GET is cheaper
+            print(f"{name:<32}{len(data) / 1048576:>9.1f}{'-':>7}{'full_read':>13}{len(data) / 1024:>10.1f}"
+                  f"{1:>6}{full_ms:>10.1f}{full_ms:>9.1f}{'-':>8}")
+            continue
+        clock = [0.0]
+        t0 = time.perf_counter()
+        pages, bytes_read, requests = router.probe_pdf_page_count(
+            simulated_fetch(data, latency_s, bandwidth_bps, clock), len(data))
+        cpu_ms = (time.perf_counter() - t0) * 1000
+        method = "range_probe"
+        probe_ms = clock[0] * 1000
+        if pages is None:
+            # The router would now download the whole file
+            method = "fallback"
+            probe_ms += full_ms
+            bytes_read += len(data)
+        want = expected.get(name)
+        flag = "" if want is None or pages in (want, None) else f"  MISMATCH (expected {want})"
+        print(f"{name:<32}{len(data) / 1048576:>9.1f}{pages if pages is not None else '-':>7}{method:>13}"
+              f"{bytes_read / 1024:>10.1f}{requests:>6}{probe_ms:>10.1f}{full_ms:>9.1f}{cpu_ms:>8.1f}{flag}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--corpus", default=os.path.join("build", "router_probe_corpus"))
+    ap.add_argument("--latency-ms", type=float, default=25.0, help="per-request S3 latency")
+    ap.add_argument("--bandwidth-mbps", type=float, default=80.0, help="S3 -> Lambda throughput (MB/s)")
+    ap.add_argument("--no-generate", action="store_true", help="only benchmark PDFs already in --corpus")
+    args = ap.parse_args()
+    run(args.corpus, args.latency_ms, args.bandwidth_mbps, not args.no_generate)
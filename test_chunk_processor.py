@@ -12,6 +12,7 @@ import json
 import sys
 import os
 import unittest
+import pytest
 from unittest.mock import patch, MagicMock, ANY
 from types import SimpleNamespace
 
@@ -43,6 +44,14 @@ import lambda_chunk_processor as lcp
 # Restore boto3.client for other uses
 _boto3.client = _original_client
 
+
+@pytest.fixture(autouse=True)
+def _fresh_key_pool():
+    """Key health (cooldowns, token buckets) lives for the warm container; start each test clean."""
+    lcp.gemini_key_pool.reset_pools()
+    yield
+    lcp.gemini_key_pool.reset_pools()
+
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
@@ -452,8 +461,8 @@ class TestParseChunkRetryLogic(unittest.TestCase):
 
     @patch("lambda_chunk_processor.time.sleep")
     @patch("lambda_chunk_processor.call_gemini_api")
-    def test_exponential_backoff_on_rate_limit(self, mock_api, mock_sleep):
-        """Rate limit errors should use exponential backoff."""
+    def test_rate_limited_key_not_reused_while_others_ready(self, mock_api, mock_sleep):
+        """A 429 cools the key down; the retry goes straight to another key without sleeping."""
         mock_api.side_effect = [
             lcp.RateLimitError("429"),
             lcp.RateLimitError("429"),
@@ -461,42 +470,41 @@ class TestParseChunkRetryLogic(unittest.TestCase):
         ]
         lcp.parse_chunk_with_retry(["k1", "k2", "k3"], b"pdf", 1, 1, "")
 
-        # sleep calls: stagger (0 for chunk 1) + backoff for attempt 0 + backoff for attempt 1
-        sleep_values = [c.args[0] for c in mock_sleep.call_args_list]
-        # First backoff: BASE * 2^0 = 2, Second: BASE * 2^1 = 4
-        self.assertIn(lcp.BASE_BACKOFF_SECONDS * 1, sleep_values)   # 2^0 = 1 -> 2*1=2
-        self.assertIn(lcp.BASE_BACKOFF_SECONDS * 2, sleep_values)   # 2^1 = 2 -> 2*2=4
+        keys_used = [c.args[0] for c in mock_api.call_args_list]
+        self.assertEqual(len(set(keys_used)), 3)
+        self.assertEqual(mock_sleep.call_count, 0)
 
     @patch("lambda_chunk_processor.time.sleep")
     @patch("lambda_chunk_processor.call_gemini_api")
-    def test_key_rotation_wraps_around(self, mock_api, mock_sleep):
-        """With 2 keys and 4 failures, keys should rotate: k1, k2, k1, k2."""
+    def test_all_keys_cooling_waits_for_first_free_key(self, mock_api, mock_sleep):
+        """With 2 keys both rate limited, the third call waits for the key that cooled first."""
         items = [_single_line_item()]
         mock_api.side_effect = [
-            lcp.RateLimitError("429"),  # k1
-            lcp.RateLimitError("429"),  # k2
-            lcp.RateLimitError("429"),  # k1
-            json.dumps(items),          # k2
+            lcp.RateLimitError("429"),
+            lcp.RateLimitError("429"),
+            json.dumps(items),
         ]
         rows, ctx = lcp.parse_chunk_with_retry(
             ["key_A", "key_B"], b"pdf", 1, 1, ""
         )
         self.assertEqual(len(rows), 1)
-        # Verify key alternation via the api_key arg
         keys_used = [c.args[0] for c in mock_api.call_args_list]
-        self.assertEqual(keys_used, ["key_A", "key_B", "key_A", "key_B"])
+        self.assertEqual(set(keys_used[:2]), {"key_A", "key_B"})
+        self.assertEqual(keys_used[2], keys_used[0])
+        self.assertEqual(mock_sleep.call_count, 1)
+        self.assertGreater(mock_sleep.call_args.args[0], 0)
 
     @patch("lambda_chunk_processor.time.sleep")
     @patch("lambda_chunk_processor.call_gemini_api")
-    def test_stagger_delay_based_on_chunk_num(self, mock_api, mock_sleep):
-        """Chunk 3 should have a stagger delay of (3-1)*1.5 = 3.0 seconds."""
+    def test_start_jitter_bounded(self, mock_api, mock_sleep):
+        """Chunk 3 should sleep a random jitter in [0, CHUNK_START_JITTER_SECONDS]."""
         mock_api.return_value = json.dumps([_single_line_item()])
-        lcp.parse_chunk_with_retry(["k1"], b"pdf", 3, 4, "")
+        lcp.parse_chunk_with_retry(["k1"], b"pdf", 3, 4, "", use_cache=False)
 
-        # First sleep call should be the stagger
+        # First sleep call should be the start jitter, not a per-chunk stagger
         first_sleep = mock_sleep.call_args_list[0].args[0]
-        expected_stagger = (3 - 1) * lcp.CHUNK_STAGGER_SECONDS
-        self.assertAlmostEqual(first_sleep, expected_stagger)
+        self.assertGreaterEqual(first_sleep, 0)
+        self.assertLessEqual(first_sleep, lcp.CHUNK_START_JITTER_SECONDS)
 
     @patch("lambda_chunk_processor.time.sleep")
     @patch("lambda_chunk_processor.call_gemini_api")
@@ -634,6 +642,22 @@ class TestParseChunkContextInheritance(unittest.TestCase):
         # Address should remain empty for chunk 1
         self.assertEqual(rows[0][6], "")
 
+    @patch("lambda_chunk_processor.parse_cache.put")
+    @patch("lambda_chunk_processor.parse_cache.get", return_value=None)
+    @patch("lambda_chunk_processor.time.sleep")
+    @patch("lambda_chunk_processor.call_gemini_api")
+    def test_cache_key_ignores_previous_context(self, mock_api, mock_sleep, mock_get, mock_put):
+        """The context comes from another Gemini answer; the cache key must not depend on it."""
+        mock_api.return_value = json.dumps([_single_line_item()])
+
+        lcp.parse_chunk_with_retry(["k1"], b"pdf", 2, 3, "Vendor: DTE | Service Address: 555 Oak Ave, Ann Arbor, MI 48104")
+        lcp.parse_chunk_with_retry(["k1"], b"pdf", 2, 3, "Vendor: DTE Energy | Service Address: 555 Oak Avenue, Ann Arbor, MI 48104")
+
+        keys = [c.args[2] for c in mock_get.call_args_list]
+        self.assertEqual(keys[0], keys[1])
+        self.assertIn("555 Oak Avenue", mock_api.call_args.args[2])
+        self.assertNotIn(lcp._CACHE_CONTEXT_SLOT, mock_api.call_args.args[2])
+
 
 # =========================================================================
 # 9. parse_chunk_with_retry — expected_lines prompt
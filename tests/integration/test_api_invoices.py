@@ -511,3 +511,49 @@ class TestErrorHandling:
 
         # Should return error
         assert response.status_code in [400, 422]
+
+
+class TestLoadDaySnapshot:
+    """Tests for the compacted Stage 4 day snapshot used by load_day."""
+
+    def _wait_for_snapshot(self, s3, key):
+        import time
+        for _ in range(50):
+            try:
+                return s3.get_object(Bucket="test-bucket", Key=key)
+            except Exception:
+                time.sleep(0.1)
+        raise AssertionError(f"snapshot {key} was never written")
+
+    def test_second_load_reads_snapshot_instead_of_files(self):
+        """Unchanged files should come from the snapshot, not per-file GETs."""
+        import main
+        s3 = boto3.client("s3", region_name="us-east-1")
+        prefix = "Bill_Parser_4_Enriched_Outputs/yyyy=2024/mm=03/dd=05/"
+        s3.put_object(Bucket="test-bucket", Key=prefix + "a.jsonl", Body=b'{"Vendor Name": "A"}\n')
+        s3.put_object(Bucket="test-bucket", Key=prefix + "b.jsonl", Body=b'{"Vendor Name": "B"}\n{"Vendor Name": "B2"}\n')
+
+        rows = main.load_day("2024", "03", "05", force_refresh=True)
+        assert len(rows) == 3
+        self._wait_for_snapshot(s3, main._day_snapshot_key("2024", "03", "05"))
+
+        with patch("main._fetch_s3_file") as fetch:
+            again = main.load_day("2024", "03", "05", force_refresh=True)
+        fetch.assert_not_called()
+        assert [r["__id__"] for r in again] == [r["__id__"] for r in rows]
+
+    def test_changed_and_deleted_files_fall_back_to_jsonl(self):
+        """Files whose ETag changed are re-read; deleted files drop out of the result."""
+        import main
+        s3 = boto3.client("s3", region_name="us-east-1")
+        prefix = "Bill_Parser_4_Enriched_Outputs/yyyy=2024/mm=03/dd=06/"
+        s3.put_object(Bucket="test-bucket", Key=prefix + "a.jsonl", Body=b'{"Vendor Name": "A"}\n')
+        s3.put_object(Bucket="test-bucket", Key=prefix + "b.jsonl", Body=b'{"Vendor Name": "B"}\n')
+        main.load_day("2024", "03", "06", force_refresh=True)
+        self._wait_for_snapshot(s3, main._day_snapshot_key("2024", "03", "06"))
+
+        s3.put_object(Bucket="test-bucket", Key=prefix + "a.jsonl", Body=b'{"Vendor Name": "A-edited"}\n')
+        s3.delete_object(Bucket="test-bucket", Key=prefix + "b.jsonl")
+
+        rows = main.load_day("2024", "03", "06", force_refresh=True)
+        assert [r["Vendor Name"] for r in rows] == ["A-edited"]
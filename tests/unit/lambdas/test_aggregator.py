@@ -0,0 +1,142 @@
+"""
+Unit tests for the aggregator Lambda.
+Tests ordered chunk merging, the streamed Stage 3 write and batched cleanup.
+"""
+import os
+import sys
+import json
+from io import BytesIO
+from unittest.mock import patch, MagicMock
+
+AGGREGATOR_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))),
+    "aws_lambdas", "us-east-1", "jrk-bill-aggregator", "code"
+)
+sys.path.insert(0, AGGREGATOR_PATH)
+
+# Mock AWS clients before importing
+with patch("boto3.client"):
+    import lambda_aggregator as agg
+
+
+def _row(vendor="", account="", desc="Charge", charge="1.00", bill_date=""):
+    row = [""] * len(agg.COLUMNS)
+    row[agg.COLUMNS.index("Vendor Name")] = vendor
+    row[agg.COLUMNS.index("Account Number")] = account
+    row[agg.COLUMNS.index("Line Item Description")] = desc
+    row[agg.COLUMNS.index("Line Item Charge")] = charge
+    row[agg.COLUMNS.index("Bill Date")] = bill_date
+    return row
+
+
+class FakeS3:
+    """Just enough of the S3 client for the aggregator."""
+
+    def __init__(self, objects=None):
+        self.objects = dict(objects or {})
+        self.parts = {}
+        self.delete_calls = []
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise Exception("An error occurred (NoSuchKey)")
+        return {"Body": BytesIO(self.objects[Key])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self.parts[Key] = []
+        return {"UploadId": "u1"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.parts[Key].append(Body)
+        return {"ETag": f"e{PartNumber}"}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        assert [p["PartNumber"] for p in MultipartUpload["Parts"]] == list(range(1, len(self.parts[Key]) + 1))
+        self.objects[Key] = b"".join(self.parts[Key])
+
+    def get_paginator(self, name):
+        paginator = MagicMock()
+        paginator.paginate.side_effect = lambda Bucket, Prefix: [
+            {"Contents": [{"Key": k} for k in sorted(self.objects) if k.startswith(Prefix)]}]
+        return paginator
+
+    def delete_objects(self, Bucket, Delete):
+        self.delete_calls.append(len(Delete["Objects"]))
+        for obj in Delete["Objects"]:
+            self.objects.pop(obj["Key"], None)
+        return {}
+
+
+def _result(job_id, n, rows, start, end):
+    key = f"{agg.CHUNK_RESULTS_PREFIX}{job_id}/chunk_{n:03d}.json"
+    body = json.dumps({"chunk_num": n, "rows": rows, "source_page_start": start, "source_page_end": end})
+    return key, body.encode("utf-8")
+
+
+class TestCombineChunkResults:
+    """Tests for concurrent fetch + ordered merge."""
+
+    def test_chunks_in_order_regardless_of_completion_order(self):
+        objects = dict([_result("j1", 3, [_row(desc="c")], 5, 6),
+                        _result("j1", 1, [_row(desc="a")], 1, 2),
+                        _result("j1", 2, [_row(desc="b")], 3, 4)])
+        keys = [f"{agg.CHUNK_RESULTS_PREFIX}j1/chunk_{n:03d}.json" for n in (3, 1, 2, 1)]
+        with patch.object(agg, "s3", FakeS3(objects)):
+            chunks = agg.combine_chunk_results({"job_id": "j1", "chunk_results": keys})
+        assert [c["chunk_num"] for c in chunks] == [1, 2, 3]
+        assert chunks[2]["source_page_start"] == 5
+
+    def test_listing_fallback_skips_timing_sidecars(self):
+        objects = dict([_result("j2", 1, [_row()], 1, 2)])
+        objects[f"{agg.CHUNK_RESULTS_PREFIX}j2/chunk_001.timing.json"] = b'{"lineCount": 1}'
+        with patch.object(agg, "s3", FakeS3(objects)):
+            chunks = agg.combine_chunk_results({"job_id": "j2", "chunk_results": []})
+        assert len(chunks) == 1
+
+
+class TestWriteFinalJsonl:
+    """Tests for the streamed Stage 3 write."""
+
+    JOB = {"job_id": "j1", "source_file": "Bill_Parser_2_Parsed_Inputs/bill.pdf"}
+
+    def test_header_fields_filled_from_majority_across_chunks(self):
+        chunks = [
+            {"chunk_num": 1, "rows": [_row(vendor="DTE", account="123", bill_date="1-2-25")],
+             "source_page_start": 1, "source_page_end": 2},
+            {"chunk_num": 2, "rows": [_row(), _row(vendor="DTE")], "source_page_start": 3, "source_page_end": 4},
+        ]
+        fake = FakeS3()
+        with patch.object(agg, "s3", fake):
+            out_key, written = agg.write_final_jsonl(self.JOB, chunks)
+        records = [json.loads(line) for line in fake.objects[out_key].decode("utf-8").splitlines()]
+        assert written == 3 and len(records) == 3
+        assert all(r["Vendor Name"] == "DTE" and r["Account Number"] == "123" for r in records)
+        assert all(r["Bill Date"] == "01/02/2025" for r in records)
+        assert [r["source_chunk"] for r in records] == [1, 2, 2]
+        assert out_key.endswith("/source=s3/bill.jsonl")
+
+    def test_large_output_uses_multipart(self):
+        chunks = [{"chunk_num": n, "rows": [_row(vendor="DTE", desc="x" * 200) for _ in range(20)],
+                   "source_page_start": n, "source_page_end": n} for n in range(1, 6)]
+        fake = FakeS3()
+        with patch.object(agg, "s3", fake), patch.object(agg, "OUTPUT_PART_BYTES", 16 * 1024):
+            out_key, written = agg.write_final_jsonl(self.JOB, chunks)
+        assert len(fake.parts[out_key]) > 1
+        assert len(fake.objects[out_key].decode("utf-8").splitlines()) == written == 100
+
+
+class TestCleanupJobFiles:
+    """Tests for batched deletes."""
+
+    def test_deletes_both_prefixes_in_batches(self):
+        objects = {f"{agg.CHUNKS_PREFIX}j1/chunk_{n:03d}.pdf": b"" for n in range(1, 6)}
+        objects.update({f"{agg.CHUNK_RESULTS_PREFIX}j1/chunk_{n:03d}.json": b"" for n in range(1, 6)})
+        objects["other/keep.json"] = b""
+        fake = FakeS3(objects)
+        with patch.object(agg, "s3", fake), patch.object(agg, "DELETE_BATCH_SIZE", 2):
+            agg.cleanup_job_files("j1")
+        assert list(fake.objects) == ["other/keep.json"]
+        assert max(fake.delete_calls) <= 2
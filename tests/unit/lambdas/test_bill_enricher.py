@@ -4,7 +4,11 @@ Tests name normalization, address parsing, GL description building, and unit con
 """
 import os
 import sys
+import gzip
+import json
 import pytest
+from io import BytesIO
+from botocore.exceptions import ClientError
 from unittest.mock import patch, MagicMock
 
 # Add Lambda code path
@@ -26,6 +30,8 @@ with patch("boto3.client"):
         _to_gallons,
         _build_gl_desc,
     )
+    import lambda_bill_enricher as enricher
+    import fuzzy_match
 
 
 class TestNormName:
@@ -493,3 +499,393 @@ class TestAddressParsingCombinations:
         result = _find_unit("123 Main St APT5")
         assert result == "" or result == "5"
 
+
+class _ArtifactS3:
+    """Just enough of the S3 client for candidate loading."""
+
+    def __init__(self, objects=None):
+        self.objects = dict(objects or {})
+        self.calls = []
+
+    def _etag(self, key):
+        return f'"{hash(self.objects[key]) & 0xffff:x}"'
+
+    def get_object(self, Bucket, Key):
+        self.calls.append(("get", Key))
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return {"Body": BytesIO(self.objects[Key]), "ETag": self._etag(Key)}
+
+    def head_object(self, Bucket, Key):
+        self.calls.append(("head", Key))
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {"ETag": self._etag(Key)}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.calls.append(("put", Key))
+        self.objects[Key] = Body
+        return {"ETag": self._etag(Key)}
+
+    def get_paginator(self, name):
+        paginator = MagicMock()
+        paginator.paginate.side_effect = lambda Bucket, Prefix: [self.list_objects_v2(Bucket, Prefix)]
+        return paginator
+
+    def list_objects_v2(self, Bucket, Prefix, **kwargs):
+        self.calls.append(("list", Prefix))
+        order = list(self.objects)  # Later writes are newer
+        return {"Contents": [{"Key": k, "LastModified": order.index(k)} for k in self.objects if k.startswith(Prefix)]}
+
+
+
+def _exports():
+    def jsonl(rows):
+        return "\n".join(json.dumps(r) for r in rows).encode("utf-8")
+    return {
+        f"{enricher.DIM_VENDOR_PREFIX}2025/vendors.jsonl": jsonl([
+            {"VENDOR_ID": "v1", "VENDOR_NAME": "DTE Energy"}, {"VENDOR_ID": "v2", "VENDOR_NAME": "City of Austin"}]),
+        f"{enricher.DIM_PROPERTY_PREFIX}2025/props.jsonl": jsonl([
+            {"PROPERTY_ID": "p1", "PROPERTY_NAME": "Oak Ridge", "GEO_STATE": "TX", "LOOKUP_CODE": "OAK"}]),
+        f"{enricher.DIM_GL_PREFIX}2025/gl.jsonl": jsonl([
+            {"GL_ACCOUNT_ID": "g1", "NAME": "Water & Sewer", "GL_ACCOUNT_NUMBER": "5100-0000"}]),
+    }
+
+
+@pytest.fixture
+def fresh_candidates():
+    names = ["_VENDOR_CANDIDATES", "_PROPERTY_CANDIDATES", "_GL_CANDIDATES", "_VENDOR_NAME_INDEX",
+             "_VENDOR_NORMS", "_PROPERTY_NORMS", "_GL_NORMS", "_CANDIDATE_ETAG"]
+    saved = {n: getattr(enricher, n) for n in names}
+    for n in names:
+        setattr(enricher, n, None)
+    enricher._CANDIDATE_CHECKED_AT = 0.0
+    yield
+    for n, v in saved.items():
+        setattr(enricher, n, v)
+
+
+class TestCandidateArtifact:
+    """Tests for the prebuilt candidate artifact and its warm-container refresh."""
+
+    def test_artifact_round_trip(self):
+        fake = _ArtifactS3(_exports())
+        with patch.object(enricher, "s3", fake):
+            art = enricher.build_candidate_artifact()
+            enricher.publish_candidate_artifact(art)
+        raw = fake.objects[enricher.CANDIDATE_ARTIFACT_KEY]
+        assert json.loads(gzip.decompress(raw))["sources"]["gl"] == f"{enricher.DIM_GL_PREFIX}2025/gl.jsonl"
+        loaded = enricher.candidate_artifact_from_bytes(raw)
+        assert loaded["version"] == enricher.CANDIDATE_ARTIFACT_VERSION
+        assert loaded["vendors"][0] == {"id": "v1", "name": "DTE Energy"}
+        assert loaded["gl_index"].norms == ["water and sewer"]
+        assert loaded["vendors_index"].search("austin city", k=1)[0][0] == 1
+        assert loaded["properties"][0]["lookup_code"] == "OAK"
+
+    def test_cold_start_reads_only_the_artifact(self, fresh_candidates):
+        fake = _ArtifactS3(_exports())
+        with patch.object(enricher, "s3", fake):
+            enricher.publish_candidate_artifact()
+            fake.calls.clear()
+            enricher._ensure_candidates_loaded()
+        assert [c[0] for c in fake.calls] == ["list", "list", "list", "get"]
+        assert fake.calls[-1] == ("get", enricher.CANDIDATE_ARTIFACT_KEY)
+        assert enricher._VENDOR_NAME_INDEX["dte energy"]["id"] == "v1"
+
+    def test_missing_artifact_builds_from_exports_and_publishes(self, fresh_candidates):
+        fake = _ArtifactS3(_exports())
+        with patch.object(enricher, "s3", fake):
+            enricher._ensure_candidates_loaded()
+        assert [c["id"] for c in enricher._VENDOR_CANDIDATES] == ["v1", "v2"]
+        assert enricher.CANDIDATE_ARTIFACT_KEY in fake.objects
+
+    def test_unreadable_artifact_is_not_overwritten(self, fresh_candidates):
+        """Only NoSuchKey/404 count as missing; other read errors build locally without publishing."""
+        fake = _ArtifactS3(_exports())
+        get_object = fake.get_object
+
+        def denied(Bucket, Key):
+            if Key == enricher.CANDIDATE_ARTIFACT_KEY:
+                raise ClientError({"Error": {"Code": "AccessDenied"}}, "GetObject")
+            return get_object(Bucket, Key)
+
+        fake.get_object = denied
+        with patch.object(enricher, "s3", fake):
+            enricher._ensure_candidates_loaded()
+        assert [c["id"] for c in enricher._VENDOR_CANDIDATES] == ["v1", "v2"]
+        assert enricher.CANDIDATE_ARTIFACT_KEY not in fake.objects
+
+    def test_warm_container_reloads_only_on_new_etag(self, fresh_candidates):
+        fake = _ArtifactS3(_exports())
+        with patch.object(enricher, "s3", fake):
+            enricher.publish_candidate_artifact()
+            enricher._ensure_candidates_loaded()
+            enricher._VENDOR_MATCH_CACHE["dte energy"] = {"id": "v1"}
+
+            fake.calls.clear()
+            enricher._ensure_candidates_loaded()  # Within the check interval: no S3 calls
+            assert fake.calls == []
+
+            enricher._CANDIDATE_CHECKED_AT = 0.0
+            enricher._ensure_candidates_loaded()  # Same ETag and exports: LISTs + HEAD only
+            assert [c[0] for c in fake.calls] == ["list", "list", "list", "head"]
+            assert enricher._VENDOR_MATCH_CACHE
+
+            fake.objects[f"{enricher.DIM_VENDOR_PREFIX}2026/vendors.jsonl"] = b'{"VENDOR_ID": "v9", "VENDOR_NAME": "Xcel"}'
+            enricher.publish_candidate_artifact()
+            enricher._CANDIDATE_CHECKED_AT = 0.0
+            enricher._ensure_candidates_loaded()
+        assert [c["id"] for c in enricher._VENDOR_CANDIDATES] == ["v9"]
+        assert not enricher._VENDOR_MATCH_CACHE
+
+    def test_new_export_without_event_rebuilds_stale_artifact(self, fresh_candidates):
+        """Dim exports don't trigger the enricher; the export check rebuilds and republishes."""
+        fake = _ArtifactS3(_exports())
+        with patch.object(enricher, "s3", fake):
+            enricher.publish_candidate_artifact()
+            enricher._ensure_candidates_loaded()
+            old_etag = enricher._CANDIDATE_ETAG
+            fake.objects[f"{enricher.DIM_VENDOR_PREFIX}2026/vendors.jsonl"] = b'{"VENDOR_ID": "v9", "VENDOR_NAME": "Xcel"}'
+            enricher._CANDIDATE_CHECKED_AT = 0.0
+            enricher._ensure_candidates_loaded()
+            assert [c["id"] for c in enricher._VENDOR_CANDIDATES] == ["v9"]
+            published = enricher.candidate_artifact_from_bytes(fake.objects[enricher.CANDIDATE_ARTIFACT_KEY])
+            assert published["sources"]["vendors"].endswith("2026/vendors.jsonl")
+            assert enricher._CANDIDATE_ETAG != old_etag
+
+            fake.calls.clear()
+            enricher._CANDIDATE_CHECKED_AT = 0.0
+            enricher._ensure_candidates_loaded()  # Republished ETag matches: nothing to reload
+            assert "get" not in [c[0] for c in fake.calls]
+
+    def test_cold_start_skips_stale_artifact(self, fresh_candidates):
+        fake = _ArtifactS3(_exports())
+        with patch.object(enricher, "s3", fake):
+            enricher.publish_candidate_artifact()
+            fake.objects[f"{enricher.DIM_GL_PREFIX}2026/gl.jsonl"] = b'{"GL_ACCOUNT_ID": "g9", "NAME": "Gas"}'
+            enricher._ensure_candidates_loaded()
+        assert [c["id"] for c in enricher._GL_CANDIDATES] == ["g9"]
+
+
+class TestFuzzyMatch:
+    """Tests for the local fuzzy matcher that shortlists candidates for Gemini."""
+
+    def test_similarity_bounds(self):
+        assert fuzzy_match.similarity("DTE Energy", "dte energy.") == 1.0
+        assert fuzzy_match.similarity("", "DTE") == 0.0
+        assert fuzzy_match.jaro_winkler("martha", "marhta") == pytest.approx(0.9611, abs=1e-4)
+
+    def test_word_order_and_typos_score_high(self):
+        assert fuzzy_match.similarity("Dominion Energy Virgina", "Dominion Energy Virginia") > 0.95
+        assert fuzzy_match.similarity("Energy Atmos", "Atmos Energy") > fuzzy_match.similarity("Atmos Energy", "Xcel Energy")
+
+    def test_index_search_ranks_and_filters(self):
+        names = ["Oak Ridge Apartments", "Oakwood Villas", "Pine Ridge Apartments", "Oak Ridge Townhomes"]
+        index = fuzzy_match.FuzzyIndex(names)
+        assert index.search("oak ridge apts", k=2)[0][0] == 0
+        assert [i for i, _ in index.search("oak ridge apts", allowed={1, 2})] in ([2, 1], [1, 2])
+        assert index.search("", k=3) == []
+
+
+class TestMatchCandidate:
+    """Tests for skipping Gemini on clear fuzzy winners."""
+
+    CANDS = [{"id": "v1", "name": "Dominion Energy Virginia"}, {"id": "v2", "name": "Duke Energy Carolinas"},
+             {"id": "v3", "name": "Dominion Energy South Carolina"}]
+
+    def test_clear_winner_skips_model(self):
+        index = fuzzy_match.FuzzyIndex([c["name"] for c in self.CANDS])
+        with patch.object(enricher, "_gemini_match") as gm:
+            best, used_model = enricher._match_candidate("k", "Dominion Energy Virgina", self.CANDS, index=index)
+        gm.assert_not_called()
+        assert best["id"] == "v1" and not used_model
+
+    def test_ambiguous_target_sends_shortlist_only(self):
+        with patch.object(enricher, "MATCH_SHORTLIST", 2), \
+                patch.object(enricher, "_gemini_match", return_value={"best": {"id": "v3"}}) as gm:
+            best, used_model = enricher._match_candidate("k", "Dominion Energy", self.CANDS)
+        assert used_model and best["id"] == "v3"
+        sent = gm.call_args.args[2]
+        assert len(sent) == 2 and {c["id"] for c in sent} == {"v1", "v3"}
+
+    def test_accept_local_false_always_asks_model(self):
+        with patch.object(enricher, "_gemini_match", return_value={}) as gm:
+            best, used_model = enricher._match_candidate("k", "Dominion Energy Virginia", self.CANDS, accept_local=False)
+        gm.assert_called_once()
+        assert best["id"] == "v1"
+
+
+class _MemoDDB:
+    """Just enough of the DynamoDB client for the match memo."""
+
+    def __init__(self):
+        self.items = {}
+        self.batch_calls = 0
+
+    def put_item(self, TableName, Item):
+        self.items[(Item["PK"]["S"], Item["SK"]["S"])] = Item
+
+    def batch_get_item(self, RequestItems):
+        self.batch_calls += 1
+        (table, req), = RequestItems.items()
+        found = [self.items[(k["PK"]["S"], k["SK"]["S"])] for k in req["Keys"]
+                 if (k["PK"]["S"], k["SK"]["S"]) in self.items]
+        return {"Responses": {table: found}}
+
+
+class TestMatchMemo:
+    """Tests for the durable match memo."""
+
+    BEST = {"id": "v1", "name": "DTE Energy", "number": "", "score": 0.9}
+
+    def test_round_trip_batched(self):
+        ddb = _MemoDDB()
+        with patch.object(enricher, "_ddb", ddb), patch.object(enricher, "_DIM_VERSIONS", {"vendors": "abc"}):
+            enricher.memo_put("vendors", "dte energy", self.BEST)
+            got = enricher.memo_get_many("vendors", ["dte energy", "xcel"] + [f"v{i}" for i in range(150)])
+        assert got == {"dte energy": self.BEST}
+        assert ddb.batch_calls == 2
+        item = next(iter(ddb.items.values()))
+        assert item["SK"]["S"] == "V#abc" and item["source"]["S"] == "model" and "ttl" in item
+
+    def test_new_dim_version_invalidates(self):
+        ddb = _MemoDDB()
+        with patch.object(enricher, "_ddb", ddb):
+            with patch.object(enricher, "_DIM_VERSIONS", {"vendors": "old"}):
+                enricher.memo_put("vendors", "dte energy", self.BEST)
+            with patch.object(enricher, "_DIM_VERSIONS", {"vendors": "new"}):
+                assert enricher.memo_get_many("vendors", ["dte energy"]) == {}
+
+    def test_kinds_do_not_collide(self):
+        ddb = _MemoDDB()
+        with patch.object(enricher, "_ddb", ddb), patch.object(enricher, "_DIM_VERSIONS", {"vendors": "a", "gl": "a"}):
+            enricher.memo_put("vendors", "water", self.BEST)
+            assert enricher.memo_get_many("gl", ["water"]) == {}
+
+    def test_ddb_errors_are_misses(self):
+        ddb = MagicMock()
+        ddb.batch_get_item.side_effect = Exception("AccessDenied")
+        ddb.put_item.side_effect = Exception("AccessDenied")
+        with patch.object(enricher, "_ddb", ddb), patch.object(enricher, "_DIM_VERSIONS", {"vendors": "a"}):
+            enricher.memo_put("vendors", "dte", self.BEST)
+            assert enricher.memo_get_many("vendors", ["dte"]) == {}
+
+    def test_dim_version_tracks_content(self):
+        fake = _ArtifactS3(_exports())
+        with patch.object(enricher, "s3", fake):
+            first = enricher.build_candidate_artifact()["dim_versions"]
+            fake.objects[f"{enricher.DIM_VENDOR_PREFIX}2026/vendors.jsonl"] = b'{"VENDOR_ID": "v9", "VENDOR_NAME": "Xcel"}'
+            second = enricher.build_candidate_artifact()["dim_versions"]
+        assert first["vendors"] != second["vendors"]
+        assert first["gl"] == second["gl"]
+
+
+class TestEnrichBatch:
+    """Tests for batch mode: one matching pass shared by many files."""
+
+    @pytest.fixture(autouse=True)
+    def _clean_caches(self, fresh_candidates):
+        for cache in (enricher._VENDOR_MATCH_CACHE, enricher._PROPERTY_MATCH_CACHE, enricher._GL_MATCH_CACHE):
+            cache.clear()
+        yield
+        for cache in (enricher._VENDOR_MATCH_CACHE, enricher._PROPERTY_MATCH_CACHE, enricher._GL_MATCH_CACHE):
+            cache.clear()
+
+    @staticmethod
+    def _stage3(day, n):
+        rec = {"Vendor Name": "Austin Water Utility", "Bill To Name First Line": "Oak Ridge Apts",
+               "Service State": "TX", "Utility Type": "Water", "House Or Vacant": "House",
+               "Line Item Description": "Water charge", "Invoice Number": str(n)}
+        key = f"{enricher.INPUT_PREFIX}yyyy=2026/mm=01/dd={day:02d}/bill_{n}.jsonl"
+        return key, (json.dumps(rec) + "\n").encode("utf-8")
+
+    def _run(self, spec, extra=None, context=None, invoke=None):
+        objects = _exports()
+        objects.update(dict(self._stage3(day, n) for day, n in [(1, 1), (1, 2), (2, 3), (5, 4)]))
+        objects.update(extra or {})
+        fake = _ArtifactS3(objects)
+        model_targets = []
+
+        def gemini(api_key, target, cands, **kwargs):
+            model_targets.append(target)
+            return {"best": {"id": cands[0]["id"]}}
+
+        with patch.object(enricher, "s3", fake), patch.object(enricher, "_ddb", _MemoDDB()), \
+                patch.object(enricher, "_get_matcher_keys", return_value=["k1", "k2"]), \
+                patch.object(enricher, "_gemini_match", side_effect=gemini), \
+                patch.object(enricher, "lambda_client", invoke or MagicMock()):
+            report = enricher.enrich_batch(spec, context)
+        return report, fake, model_targets
+
+    def test_shared_names_resolved_once(self):
+        report, fake, model_targets = self._run({"start_date": "2026-01-01", "end_date": "2026-01-02"})
+        assert report["files_written"] == 3 and report["lines"] == 3
+        assert sorted(model_targets) == ["Austin Water Utility", "Oak Ridge Apts"]
+        out = json.loads(fake.objects[f"{enricher.OUTPUT_PREFIX}yyyy=2026/mm=01/dd=02/bill_3.jsonl"])
+        assert out["EnrichedPropertyID"] == "p1"
+        for field in ("files_per_s", "lines_per_s", "match_s", "unique_vendors"):
+            assert field in report
+
+    def test_only_missing_skips_enriched_files(self):
+        done = {f"{enricher.OUTPUT_PREFIX}yyyy=2026/mm=01/dd=01/bill_1.jsonl": b"{}\n"}
+        report, _, _ = self._run({"prefix": "yyyy=2026/mm=01/dd=01/"}, extra=done)
+        assert report["files"] == 1
+
+    def test_max_files_reports_remaining(self):
+        report, _, _ = self._run({"prefix": "yyyy=2026/", "max_files": 3})
+        assert report["files"] == 3 and report["remaining"] == 1
+
+    def test_single_file_handler_keeps_enriched_output(self):
+        """The per-file path writes the enriched lines and reports its counters, not the fallback copy."""
+        key, body = self._stage3(1, 1)
+        objects = _exports()
+        objects[key] = body
+        fake = _ArtifactS3(objects)
+        event = {"Records": [{"eventSource": "aws:s3", "s3": {"bucket": {"name": enricher.BUCKET}, "object": {"key": key}}}]}
+        with patch.object(enricher, "s3", fake), patch.object(enricher, "_ddb", _MemoDDB()), \
+                patch.object(enricher, "_get_matcher_keys", return_value=["k1"]), \
+                patch.object(enricher, "_gemini_match", side_effect=lambda api_key, target, cands, **kw: {"best": {"id": cands[0]["id"]}}), \
+                patch.object(enricher, "_pipeline_track") as track:
+            enricher.lambda_handler(event, None)
+        out = json.loads(fake.objects[enricher._stage4_key(key)])
+        assert out["EnrichedPropertyID"] == "p1"
+        (call,) = track.call_args_list
+        assert call.args[1] == "ENRICHED" and call.args[4]["vendor_gemini"] == 1
+
+    @staticmethod
+    def _context(remaining_ms):
+        return MagicMock(function_name="jrk-bill-enricher", get_remaining_time_in_millis=lambda: remaining_ms)
+
+    def test_near_deadline_hands_keys_to_a_new_invocation(self):
+        """With less than the reserve left nothing is written; the keys are re-dispatched."""
+        client = MagicMock()
+        spec = {"start_date": "2026-01-01", "end_date": "2026-01-02", "workers": 2}
+        report, fake, model_targets = self._run(spec, context=self._context(1000), invoke=client)
+        assert report["files_written"] == 0 and report["deferred"] == 3 and report["handed_off"]
+        assert model_targets == []
+        assert not any(k.startswith(enricher.OUTPUT_PREFIX) for k in fake.objects)
+        call = client.invoke.call_args.kwargs
+        assert call["FunctionName"] == "jrk-bill-enricher" and call["InvocationType"] == "Event"
+        batch = json.loads(call["Payload"])["batch"]
+        assert len(batch["keys"]) == 3 and batch["handoffs"] == 1 and batch["workers"] == 2
+        assert "start_date" not in batch
+
+    def test_enough_time_writes_everything(self):
+        client = MagicMock()
+        report, _, _ = self._run({"start_date": "2026-01-01", "end_date": "2026-01-02"},
+                                 context=self._context(600_000), invoke=client)
+        assert report["files_written"] == 3 and report["deferred"] == 0
+        client.invoke.assert_not_called()
+
+    def test_hand_off_chain_is_capped(self):
+        client = MagicMock()
+        spec = {"prefix": "yyyy=2026/mm=01/dd=01/", "handoffs": enricher.BATCH_MAX_HANDOFFS}
+        report, _, _ = self._run(spec, context=self._context(1000), invoke=client)
+        assert report["deferred"] == 2 and not report["handed_off"] and len(report["deferred_keys"]) == 2
+        client.invoke.assert_not_called()
+
+    def test_handler_routes_batch_events(self):
+        with patch.object(enricher, "enrich_batch", return_value={"files": 0}) as batch:
+            resp = enricher.lambda_handler({"batch": {"keys": []}}, None)
+        batch.assert_called_once_with({"keys": []}, None)
+        assert json.loads(resp["body"]) == {"files": 0}
@@ -0,0 +1,126 @@
+"""
+Unit tests for the large-file splitter Lambda.
+Tests chunk planning and the vendor chunk stats the aggregator feeds back to it.
+"""
+import os
+import sys
+import json
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+from botocore.exceptions import ClientError
+
+LAMBDAS_ROOT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))),
+    "aws_lambdas", "us-east-1"
+)
+sys.path.insert(0, os.path.join(LAMBDAS_ROOT, "jrk-bill-large-parser", "code"))
+sys.path.insert(0, os.path.join(LAMBDAS_ROOT, "jrk-bill-aggregator", "code"))
+
+# Mock AWS clients before importing
+with patch("boto3.client"):
+    import lambda_bill_large_parser as splitter
+    from lambda_bill_large_parser import plan_chunks, vendor_stats_key
+    from lambda_aggregator import fold_vendor_chunk_stats, vendor_stats_key as aggregator_stats_key
+
+
+class TestPlanChunks:
+    """Tests for packing pages into chunks against a row budget."""
+
+    def test_sparse_pages_share_a_chunk(self):
+        """Ten 3-row pages fit in two chunks when capped at 8 pages."""
+        assert plan_chunks([3] * 10, row_budget=60, max_pages=8) == [(0, 8), (8, 10)]
+
+    def test_dense_pages_split_on_budget(self):
+        """Pages are added until the next one would overflow the budget."""
+        assert plan_chunks([25, 25, 25, 5], row_budget=60, max_pages=8) == [(0, 2), (2, 4)]
+
+    def test_oversized_page_gets_own_chunk(self):
+        """A page over budget can't be split further, but doesn't drag neighbours in."""
+        assert plan_chunks([5, 90, 5], row_budget=60, max_pages=8) == [(0, 1), (1, 2), (2, 3)]
+
+    def test_ranges_cover_every_page_in_order(self):
+        rows = [1, 40, 12, 12, 30, 2, 2, 2, 70, 1]
+        ranges = plan_chunks(rows, row_budget=50, max_pages=4)
+        assert ranges[0][0] == 0 and ranges[-1][1] == len(rows)
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            assert end == start
+        for start, end in ranges:
+            assert end - start <= 4
+            assert end - start == 1 or sum(rows[start:end]) <= 50
+
+    def test_empty_document(self):
+        assert plan_chunks([], row_budget=60, max_pages=8) == []
+
+
+class TestVendorChunkStats:
+    """Tests for the per-vendor chunk history shared by the aggregator and splitter."""
+
+    def test_stats_key_matches_between_lambdas(self):
+        assert vendor_stats_key("DTE Energy, Inc.") == aggregator_stats_key("DTE Energy, Inc.")
+        assert vendor_stats_key("DTE Energy, Inc.").endswith("/dte-energy-inc.json")
+
+    def test_no_vendor_no_key(self):
+        assert vendor_stats_key("") == ""
+        assert aggregator_stats_key("  ") == ""
+
+    def test_fold_first_job(self):
+        stats = fold_vendor_chunk_stats({"vendor": "DTE"}, [
+            {"pages": 2, "lineCount": 10, "retryCount": 0},
+            {"pages": 2, "lineCount": 30, "retryCount": 2},
+        ])
+        assert stats["rows_per_page"] == 10.0
+        assert stats["rows_per_page_high"] == 15.0
+        assert stats["retry_rate"] == 0.5
+
+    def test_fold_decays_history(self):
+        old = {"chunks": 10, "pages": 20, "rows": 400, "retries": 10, "rows_per_page_high": 20}
+        stats = fold_vendor_chunk_stats(old, [{"pages": 4, "lineCount": 8, "retryCount": 0}])
+        assert stats["rows_per_page"] < 20
+        assert stats["retry_rate"] < 1
+        assert stats["rows_per_page_high"] == 18.0
+
+
+def _no_such_key():
+    return ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+
+
+class TestHeaderPass:
+    """Tests for the single-attempt page-1 header pass."""
+
+    HEADER = {"vendor_name": "DTE", "account_number": "42"}
+
+    def _run(self, cached=None, call=None, use_cache=True):
+        s3 = MagicMock()
+        if cached is None:
+            s3.get_object.side_effect = _no_such_key()
+        else:
+            s3.get_object.return_value = {"Body": MagicMock(read=lambda: json.dumps(cached).encode("utf-8"))}
+        call = call or MagicMock(return_value=self.HEADER)
+        splitter.gemini_key_pool.reset_pools()
+        with patch.object(splitter, "s3", s3), patch.object(splitter, "ddb", None), \
+                patch.object(splitter, "first_page_pdf", return_value=b"%PDF-page1"), \
+                patch.object(splitter.gemini_key_pool, "get_secret_string", return_value='{"keys": ["k1", "k2", "k3"]}'), \
+                patch.object(splitter, "_call_header_model", call):
+            context = splitter.extract_header_context("bucket", b"%PDF", use_cache=use_cache)
+        return context, call, s3
+
+    def test_fresh_cache_entry_skips_the_model(self):
+        entry = {"context_summary": "Vendor: DTE", "created_at": datetime.now(timezone.utc).isoformat()}
+        context, call, _ = self._run(cached=entry)
+        assert context == "Vendor: DTE"
+        call.assert_not_called()
+
+    def test_expired_cache_entry_is_ignored(self):
+        old = datetime.now(timezone.utc) - timedelta(days=splitter.parse_cache.PARSE_CACHE_MAX_AGE_DAYS + 1)
+        context, call, s3 = self._run(cached={"context_summary": "Vendor: Old", "created_at": old.isoformat()})
+        assert "Vendor: DTE" in context
+        call.assert_called_once()
+        s3.put_object.assert_called_once()
+
+    def test_failure_makes_one_attempt(self):
+        """A failed call doesn't retry with other keys; chunk 1 extracts the header instead."""
+        context, call, _ = self._run(call=MagicMock(side_effect=RuntimeError("Gemini REST error 500")))
+        assert context == ""
+        assert call.call_count == 1
+
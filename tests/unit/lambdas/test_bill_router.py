@@ -4,6 +4,7 @@ Tests PDF page counting and routing logic.
 """
 import os
 import sys
+import zlib
 import pytest
 from unittest.mock import patch, MagicMock
 from io import BytesIO
@@ -17,7 +18,48 @@ sys.path.insert(0, ROUTER_PATH)
 
 # Mock AWS clients before importing
 with patch("boto3.client"):
-    from lambda_bill_router import count_pdf_pages
+    from lambda_bill_router import count_pdf_pages, probe_pdf_page_count
+
+
+def _build_pdf(pages, pad=0, xref_stream=False):
+    """Minimal PDF with the page tree after `pad` bytes of filler stream data."""
+    out = bytearray(b"%PDF-1.5\n")
+    offsets = {}
+
+    def obj(num, body, stream=None):
+        offsets[num] = len(out)
+        out.extend(b"%d 0 obj\n" % num + body)
+        if stream is not None:
+            out.extend(b"\nstream\n" + stream + b"\nendstream")
+        out.extend(b"\nendobj\n")
+
+    obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = b" ".join(b"%d 0 R" % (4 + i) for i in range(pages))
+    obj(2, b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % pages)
+    obj(3, b"<< /Length %d >>" % pad, b"x" * pad)
+    for i in range(pages):
+        obj(4 + i, b"<< /Type /Page /Parent 2 0 R >>")
+    size = 4 + pages
+    if xref_stream:
+        offsets[size] = len(out)
+        rows = b"".join(bytes([1 if n in offsets else 0]) + offsets.get(n, 0).to_bytes(4, "big") + b"\x00"
+                        for n in range(size + 1))
+        data = zlib.compress(rows)
+        out.extend(b"%d 0 obj\n<< /Type /XRef /Size %d /W [1 4 1] /Root 1 0 R /Filter /FlateDecode /Length %d >>"
+                   b"\nstream\n" % (size, size + 1, len(data)) + data + b"\nendstream\nendobj\n")
+        xref_at = offsets[size]
+    else:
+        xref_at = len(out)
+        out.extend(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for n in range(1, size):
+            out.extend(b"%010d 00000 n \n" % offsets[n])
+        out.extend(b"trailer\n<< /Size %d /Root 1 0 R >>\n" % size)
+    out.extend(b"startxref\n%d\n%%%%EOF\n" % xref_at)
+    return bytes(out)
+
+
+def _probe(data):
+    return probe_pdf_page_count(lambda start, end: data[start:end], len(data))
 
 
 class TestCountPdfPages:
@@ -77,6 +119,45 @@ startxref
         assert result == -1
 
 
+class TestPageCountProbe:
+    """Tests for the ranged page-count probe."""
+
+    def test_classic_xref(self):
+        """Reads only the tail and the page tree, not the filler in between."""
+        data = _build_pdf(7, pad=500_000)
+        pages, bytes_read, requests = _probe(data)
+        assert pages == 7
+        assert bytes_read < 100_000
+
+    def test_xref_stream(self):
+        pages, _, _ = _probe(_build_pdf(12, pad=200_000, xref_stream=True))
+        assert pages == 12
+
+    def test_damaged_trailer_falls_back(self):
+        """No startxref -> None so the router reads the whole file."""
+        data = _build_pdf(3)[:-30]
+        pages, _, _ = _probe(data)
+        assert pages is None
+
+    def test_not_a_pdf_falls_back(self):
+        pages, _, _ = _probe(b"This is not a PDF file" * 100)
+        assert pages is None
+
+    def test_stale_xref_offset_falls_back(self):
+        """An xref offset pointing at a different object is rejected, not followed."""
+        data = _build_pdf(3)
+        shifted = data.replace(b"1 0 obj\n<< /Type /Catalog", b"9 0 obj\n<< /Type /Catalog")
+        pages, _, _ = _probe(shifted)
+        assert pages is None
+
+    def test_unexpected_error_falls_back(self):
+        """Errors outside the probe's own checks still fall back to a full read."""
+        def fetch(start, end):
+            raise KeyError("boom")
+        pages, _, _ = probe_pdf_page_count(fetch, 200_000)
+        assert pages is None
+
+
 class TestRoutingLogic:
     """Tests for routing decision logic."""
 
@@ -0,0 +1,39 @@
+"""
+Unit tests for the enrichment retry Lambda.
+Tests handing large backlogs to the enricher's batch mode.
+"""
+import os
+import sys
+import json
+from unittest.mock import patch, MagicMock
+
+RETRY_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))),
+    "aws_lambdas", "us-east-1", "jrk-enrichment-retry", "code"
+)
+sys.path.insert(0, RETRY_PATH)
+
+# Mock AWS clients before importing
+with patch("boto3.client"):
+    import lambda_enrichment_retry as retry
+
+
+class TestDispatchBatches:
+    """Tests for splitting orphaned keys into batch-mode invocations."""
+
+    def test_keys_split_per_invocation(self):
+        client = MagicMock()
+        keys = [f"{retry.STAGE3_PREFIX}k{i}.jsonl" for i in range(5)]
+        with patch.object(retry, "lambda_client", client), patch.object(retry, "BATCH_INVOKE_KEYS", 2):
+            leftover, batches = retry.dispatch_batches(keys)
+        assert leftover == [] and batches == 3
+        payloads = [json.loads(c.kwargs["Payload"]) for c in client.invoke.call_args_list]
+        assert [len(p["batch"]["keys"]) for p in payloads] == [2, 2, 1]
+        assert all(c.kwargs["InvocationType"] == "Event" for c in client.invoke.call_args_list)
+
+    def test_failed_invoke_returns_keys_for_copy_fallback(self):
+        client = MagicMock()
+        client.invoke.side_effect = [None, Exception("TooManyRequests")]
+        with patch.object(retry, "lambda_client", client), patch.object(retry, "BATCH_INVOKE_KEYS", 2):
+            leftover, batches = retry.dispatch_batches(["a", "b", "c"])
+        assert leftover == ["c"] and batches == 1
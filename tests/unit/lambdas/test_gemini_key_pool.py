@@ -0,0 +1,178 @@
+"""
+Unit tests for the Gemini key pool shared by the parser Lambdas.
+Tests cooldowns, token buckets, DynamoDB health sharing and secret caching.
+"""
+import os
+import sys
+import time
+import pytest
+from unittest.mock import patch, MagicMock
+
+LAMBDAS_ROOT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))),
+    "aws_lambdas", "us-east-1"
+)
+# Lambdas that ship a copy of gemini_key_pool.py in their code/ dir
+POOL_LAMBDAS = ("jrk-bill-parser", "jrk-bill-chunk-processor", "jrk-bill-large-parser")
+sys.path.insert(0, os.path.join(LAMBDAS_ROOT, "jrk-bill-chunk-processor", "code"))
+
+import gemini_key_pool as kp
+
+
+@pytest.fixture(autouse=True)
+def _reset():
+    kp.reset_pools()
+    yield
+    kp.reset_pools()
+
+
+class TestCopiesInSync:
+    """Each Lambda zips its own code/ dir, so the pool is copied; the copies must not drift."""
+
+    def test_copies_identical(self):
+        copies = {}
+        for name in POOL_LAMBDAS:
+            with open(os.path.join(LAMBDAS_ROOT, name, "code", "gemini_key_pool.py"), "rb") as f:
+                copies[name] = f.read()
+        reference = copies["jrk-bill-chunk-processor"]
+        assert [name for name, body in copies.items() if body != reference] == []
+
+
+class TestClassifyError:
+    """Tests for telling rate limits from daily quota exhaustion."""
+
+    def test_rate_limit(self):
+        assert kp.classify_error("Gemini quota exhausted (429): RESOURCE_EXHAUSTED") == "rate"
+
+    def test_daily_quota(self):
+        assert kp.classify_error('429 {"quotaId": "GenerateRequestsPerDayPerProjectPerModel"}') == "quota"
+
+    def test_other_errors(self):
+        assert kp.classify_error("Gemini error 500: internal") == ""
+        assert kp.classify_error(None) == ""
+
+
+class TestParseKeys:
+    """Tests for reading keys out of the secret string formats in use."""
+
+    def test_json_formats(self):
+        assert kp.parse_keys('{"keys": ["k1", " k2 ", ""]}') == ["k1", "k2"]
+        assert kp.parse_keys('["k1", "k2"]') == ["k1", "k2"]
+
+    def test_plaintext_formats(self):
+        assert kp.parse_keys("k1, k2,,k3") == ["k1", "k2", "k3"]
+        assert kp.parse_keys("k1\nk2\n") == ["k1", "k2"]
+        assert kp.parse_keys("") == []
+
+    def test_limit(self):
+        assert kp.parse_keys(",".join(f"k{i}" for i in range(20))) == [f"k{i}" for i in range(10)]
+
+
+class TestKeyPoolSelection:
+    """Tests for acquire/report without DynamoDB."""
+
+    def test_cooling_key_skipped(self):
+        pool = kp.KeyPool(["a", "b"])
+        pool.report("a", ok=False, error="429")
+        with patch.object(kp.time, "sleep") as sleep:
+            assert {pool.acquire() for _ in range(4)} == {"b"}
+        sleep.assert_not_called()
+
+    def test_repeated_429_doubles_cooldown(self):
+        pool = kp.KeyPool(["a"])
+        pool.report("a", ok=False, error="429")
+        first = pool.states[0].cooldown_until - time.time()
+        pool.report("a", ok=False, error="429")
+        second = pool.states[0].cooldown_until - time.time()
+        assert second > first * 1.5
+
+    def test_success_resets_strikes(self):
+        pool = kp.KeyPool(["a"])
+        pool.report("a", ok=False, error="429")
+        pool.report("a", ok=True)
+        assert pool.states[0].strikes == 0
+
+    def test_all_cooling_waits_once_for_earliest(self):
+        pool = kp.KeyPool(["a", "b"])
+        pool.report("a", ok=False, error="429")
+        pool.report("b", ok=False, error="429 PerDay")
+        with patch.object(kp.time, "sleep") as sleep:
+            assert pool.acquire(max_wait=60) == "a"
+        assert sleep.call_count == 1
+        assert 0 < sleep.call_args.args[0] <= kp.RATE_LIMIT_COOLDOWN_SECONDS
+
+    def test_wait_capped_by_max_wait(self):
+        pool = kp.KeyPool(["a"])
+        pool.report("a", ok=False, error="429 PerDay")
+        with patch.object(kp.time, "sleep") as sleep:
+            pool.acquire(max_wait=5)
+        assert sleep.call_args.args[0] == 5
+
+    def test_token_bucket_limits_burst(self):
+        pool = kp.KeyPool(["a"])
+        with patch.object(kp.time, "sleep") as sleep:
+            for _ in range(int(kp.KEY_BURST)):
+                pool.acquire()
+            sleep.assert_not_called()
+            pool.acquire()
+        assert sleep.call_count == 1
+
+    def test_failing_key_picked_less(self):
+        pool = kp.KeyPool(["good", "bad"])
+        for _ in range(20):
+            pool.report("bad", ok=False, error="500")
+        with patch.object(kp, "KEY_BURST", 1000.0):
+            for s in pool.states:
+                s.tokens = 1000.0
+            picks = [pool.acquire() for _ in range(300)]
+        assert picks.count("good") > picks.count("bad") * 3
+
+
+class TestKeyPoolSharedHealth:
+    """Tests for cooldowns shared through DynamoDB."""
+
+    def test_cooldown_written_with_condition(self):
+        ddb = MagicMock()
+        secret = "AIzaSyExampleExampleExample123"
+        pool = kp.KeyPool([secret], ddb_client=ddb)
+        pool.report(secret, ok=False, error="429")
+        kwargs = ddb.update_item.call_args.kwargs
+        assert kwargs["Key"]["SK"]["S"] == f"KEY#{kp.key_id(secret)}"
+        assert "cooldown_until" in kwargs["UpdateExpression"]
+        assert "ConditionExpression" in kwargs
+        assert secret not in str(kwargs)
+
+    def test_refresh_applies_remote_cooldown(self):
+        ddb = MagicMock()
+        ddb.query.return_value = {"Items": [{
+            "SK": {"S": f"KEY#{kp.key_id('a')}"},
+            "cooldown_until": {"N": str(time.time() + 120)},
+            "success_rate": {"N": "0.2"},
+        }]}
+        pool = kp.KeyPool(["a", "b"], ddb_client=ddb)
+        with patch.object(kp.time, "sleep"):
+            assert pool.acquire() == "b"
+        assert pool.states[0].success_rate == pytest.approx(0.6)
+
+    def test_ddb_errors_do_not_break_selection(self):
+        ddb = MagicMock()
+        ddb.query.side_effect = Exception("AccessDenied")
+        ddb.update_item.side_effect = Exception("AccessDenied")
+        pool = kp.KeyPool(["a"], ddb_client=ddb)
+        assert pool.acquire() == "a"
+        pool.report("a", ok=False, error="429")
+
+
+class TestSecretCache:
+    """Tests for caching secrets across warm invocations."""
+
+    def test_secret_fetched_once_within_ttl(self):
+        client = MagicMock()
+        client.get_secret_value.return_value = {"SecretString": "k1,k2"}
+        assert kp.get_secret_string(client, "s") == "k1,k2"
+        assert kp.get_secret_string(client, "s") == "k1,k2"
+        assert client.get_secret_value.call_count == 1
+
+    def test_pool_reused_for_same_keys(self):
+        assert kp.get_pool(["a", "b"]) is kp.get_pool(["a", "b"])
+        assert kp.get_pool(["a", "b"]) is not kp.get_pool(["a"])
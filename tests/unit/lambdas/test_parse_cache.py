@@ -0,0 +1,103 @@
+"""
+Unit tests for the content-addressed parse cache shared by the parser Lambdas.
+Tests key derivation, max-age and miss handling, and that the copies stay identical.
+"""
+import os
+import sys
+import json
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+from botocore.exceptions import ClientError
+
+LAMBDAS_ROOT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))),
+    "aws_lambdas", "us-east-1"
+)
+# Lambdas that ship a copy of parse_cache.py in their code/ dir
+CACHE_LAMBDAS = ("jrk-bill-parser", "jrk-bill-chunk-processor", "jrk-bill-large-parser")
+sys.path.insert(0, os.path.join(LAMBDAS_ROOT, "jrk-bill-parser", "code"))
+
+import parse_cache
+
+
+def _s3_with(entry=None, error=None):
+    s3 = MagicMock()
+    if error is not None:
+        s3.get_object.side_effect = error
+    else:
+        s3.get_object.return_value = {"Body": MagicMock(read=lambda: json.dumps(entry).encode("utf-8"))}
+    return s3
+
+
+class TestCopiesInSync:
+    """Each Lambda zips its own code/ dir, so the cache module is copied; the copies must not drift."""
+
+    def test_copies_identical(self):
+        copies = {}
+        for name in CACHE_LAMBDAS:
+            with open(os.path.join(LAMBDAS_ROOT, name, "code", "parse_cache.py"), "rb") as f:
+                copies[name] = f.read()
+        reference = copies["jrk-bill-parser"]
+        assert [name for name, body in copies.items() if body != reference] == []
+
+
+class TestCacheKey:
+    """Tests for the content-addressed parse cache key."""
+
+    def test_same_inputs_same_key(self):
+        key = parse_cache.cache_key(b"%PDF-1.4 bytes", "prompt", "m1")
+
+        assert key == parse_cache.cache_key(b"%PDF-1.4 bytes", "prompt", "m1")
+        assert key.startswith(parse_cache.PARSE_CACHE_PREFIX)
+
+    def test_bytes_prompt_and_model_all_change_key(self):
+        base = parse_cache.cache_key(b"pdf", "prompt", "m1")
+
+        assert parse_cache.cache_key(b"pdf2", "prompt", "m1") != base
+        assert parse_cache.cache_key(b"pdf", "prompt + rework notes", "m1") != base
+        assert parse_cache.cache_key(b"pdf", "prompt", "m2") != base
+
+
+class TestGet:
+    """Tests for reading entries back."""
+
+    def test_fresh_entry_returned(self):
+        entry = {"rows": [["a"]], "context_summary": "Vendor: DTE", "created_at": datetime.now(timezone.utc).isoformat()}
+
+        assert parse_cache.get(_s3_with(entry), "bucket", "k") == entry
+
+    def test_expired_entry_ignored(self):
+        old = datetime.now(timezone.utc) - timedelta(days=parse_cache.PARSE_CACHE_MAX_AGE_DAYS)
+
+        assert parse_cache.get(_s3_with({"rows": [], "created_at": old.isoformat()}), "bucket", "k") is None
+
+    def test_miss_is_not_logged(self, capsys):
+        miss = ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+
+        assert parse_cache.get(_s3_with(error=miss), "bucket", "k") is None
+        assert "parse_cache_read_failed" not in capsys.readouterr().out
+
+    def test_other_errors_logged(self, capsys):
+        denied = ClientError({"Error": {"Code": "AccessDenied"}}, "GetObject")
+
+        assert parse_cache.get(_s3_with(error=denied), "bucket", "k") is None
+        assert "parse_cache_read_failed" in capsys.readouterr().out
+
+
+class TestPut:
+    """Tests for writing entries."""
+
+    def test_entry_round_trips(self):
+        s3 = MagicMock()
+        parse_cache.put(s3, "bucket", "k", "m1", [["a", "b"]], "Vendor: DTE", source="src.pdf")
+
+        body = json.loads(s3.put_object.call_args.kwargs["Body"].decode("utf-8"))
+        assert parse_cache.get(_s3_with(body), "bucket", "k")["rows"] == [["a", "b"]]
+        assert body["context_summary"] == "Vendor: DTE"
+
+    def test_write_failure_swallowed(self):
+        s3 = MagicMock()
+        s3.put_object.side_effect = RuntimeError("throttled")
+
+        parse_cache.put(s3, "bucket", "k", "m1", [["a"]])
@@ -4,6 +4,11 @@ Tests date formatting, address parsing, hash computation, and account normalizat
 """
 import os
 import sys
+import gzip
+import json
+import time
+import shutil
+import tempfile
 import pytest
 import hashlib
 from unittest.mock import patch, MagicMock
@@ -22,6 +27,9 @@ from main import (
     _account_similarity,
     _validate_s3_key,
     _basename_from_key,
+    _build_search_lookup,
+    _search_lookup_query,
+    _CacheNamespace,
 )
 
 
@@ -474,3 +482,954 @@ class TestEdgeCases:
         """Account similarity should be symmetric."""
         a, b = "12345", "12346"
         assert _account_similarity(a, b) == _account_similarity(b, a)
+
+
+class TestSearchLookup:
+    """Tests for the trigram search lookup behind /api/search."""
+
+    def _entry(self, pdf_id, date, account="", vendor="", prop=""):
+        return {"pdf_id": pdf_id, "date": date,
+                "account_l": account.lower(), "vendor_l": vendor.lower(), "property_l": prop.lower()}
+
+    def _query(self, entries, limit=500, start="", end="", **terms):
+        lookup = _build_search_lookup(entries)
+        fields = {"account_l": terms.get("account", ""), "vendor_l": terms.get("vendor", ""),
+                  "property_l": terms.get("prop", "")}
+        return [e["pdf_id"] for e in _search_lookup_query(lookup, fields, start, end, limit)]
+
+    def test_substring_match_newest_first(self):
+        """Matches anywhere in the field, ordered newest date first."""
+        entries = [
+            self._entry("a", "2025-01-01", vendor="City of Tempe"),
+            self._entry("b", "2025-03-01", vendor="Tempe Water"),
+            self._entry("c", "2025-02-01", vendor="Austin Energy"),
+        ]
+        assert self._query(entries, vendor="tempe") == ["b", "a"]
+
+    def test_limit_keeps_newest(self):
+        """Truncation should keep the newest matches regardless of list order."""
+        entries = [self._entry(str(i), f"2025-01-{i:02d}", account="12345") for i in range(1, 11)]
+        assert self._query(entries, limit=3, account="234") == ["10", "9", "8"]
+
+    def test_all_terms_must_match(self):
+        """Multiple fields intersect."""
+        entries = [
+            self._entry("a", "2025-01-01", account="999", vendor="Tempe"),
+            self._entry("b", "2025-01-02", account="111", vendor="Tempe"),
+        ]
+        assert self._query(entries, account="999", vendor="tem") == ["a"]
+
+    def test_short_terms_fall_back_to_substring(self):
+        """Terms under three characters still match via the verification pass."""
+        entries = [self._entry("a", "2025-01-01", account="A1"), self._entry("b", "2025-01-02", account="B2")]
+        assert self._query(entries, account="a1") == ["a"]
+
+    def test_date_range_inclusive(self):
+        """Start and end dates are inclusive."""
+        entries = [self._entry(str(d), f"2025-01-0{d}", vendor="xcel") for d in range(1, 6)]
+        assert self._query(entries, start="2025-01-02", end="2025-01-04", vendor="xcel") == ["4", "3", "2"]
+
+    def test_no_match(self):
+        """Missing trigram returns nothing."""
+        entries = [self._entry("a", "2025-01-01", vendor="Tempe")]
+        assert self._query(entries, vendor="zzz") == []
+
+
+class TestSearchIndexSegments:
+    """Tests for segmented search index persistence (moto S3 from conftest)."""
+
+    def _entry(self, pdf_id, date):
+        return {"pdf_id": pdf_id, "date": date, "account": "A", "account_l": "a",
+                "vendor": "V", "vendor_l": "v", "property": "P", "property_l": "p", "amount": 1.0}
+
+    def _seed(self, entries):
+        import main
+        with main._SEARCH_INDEX_LOCK:
+            main._SEARCH_INDEX.update({
+                "entries": entries, "lookup": main._build_search_lookup(entries),
+                "removed": set(), "tombstones": {}, "segments_dirty": False,
+                "dates_indexed": {e["date"] for e in entries},
+            })
+
+    def teardown_method(self):
+        import main
+        with main._SEARCH_INDEX_LOCK:
+            main._SEARCH_INDEX.update({"entries": [], "lookup": None, "removed": set(),
+                                       "tombstones": {}, "ready": False, "dates_indexed": set()})
+
+    def test_removal_round_trips_through_delta(self):
+        """Removed entries stay removed after reload without rewriting segments."""
+        import main
+        self._seed([self._entry("a", "2025-01-02"), self._entry("b", "2025-02-03")])
+        main._save_search_index_to_s3()
+
+        with patch("main._save_search_index_to_s3") as full_save:
+            main._search_index_remove({"a"})
+        full_save.assert_not_called()
+        assert main._SEARCH_INDEX["tombstones"] == {"2025-01": {"a"}}
+
+        assert main._load_search_index_from_s3()
+        assert [e["pdf_id"] for e in main._SEARCH_INDEX["entries"]] == ["b"]
+        assert main._SEARCH_INDEX["tombstones"] == {"2025-01": {"a"}}
+
+    def test_rewriting_segment_prunes_its_tombstones(self):
+        """Once a month segment is rewritten without the entry, its tombstone is dropped."""
+        import main
+        self._seed([self._entry("a", "2025-01-02"), self._entry("c", "2025-01-05"),
+                    self._entry("b", "2025-02-03")])
+        main._save_search_index_to_s3()
+        main._search_index_remove({"a"})
+
+        main._save_search_index_to_s3({"2025-01"})
+        assert main._SEARCH_INDEX["tombstones"] == {}
+        assert main._load_search_index_from_s3()
+        assert sorted(e["pdf_id"] for e in main._SEARCH_INDEX["entries"]) == ["b", "c"]
+
+
+class TestCacheNamespace:
+    """Tests for the LRU cache namespaces behind _CACHE and friends."""
+
+    def test_dict_compatible(self):
+        """Call sites use get/pop/[]/keys like a plain dict."""
+        c = _CacheNamespace("t")
+        c["a"] = {"ts": 1, "data": [1]}
+        assert c.get("a") == {"ts": 1, "data": [1]}
+        assert c.pop("a")["data"] == [1]
+        assert c.pop("a", None) is None
+        assert c.get("missing") is None
+
+    def test_evicts_least_recently_used_by_count(self):
+        """Reads refresh recency; the oldest untouched key is evicted first."""
+        c = _CacheNamespace("t", max_entries=2)
+        c["a"] = 1
+        c["b"] = 2
+        c.get("a")
+        c["c"] = 3
+        assert set(c.keys()) == {"a", "c"}
+        assert c.stats()["evictions"] == 1
+
+    def test_evicts_by_byte_budget(self):
+        """Large values push older entries out once the byte budget is exceeded."""
+        c = _CacheNamespace("t", max_bytes=50_000)
+        c["old"] = "x" * 30_000
+        c["new"] = "y" * 30_000
+        assert "old" not in c and "new" in c
+
+    def test_ttl_expires_entries(self):
+        """Entries older than the namespace TTL read as misses."""
+        c = _CacheNamespace("t", ttl=60)
+        c["a"] = 1
+        with patch("main.time.time", return_value=__import__("time").time() + 120):
+            assert c.get("a") is None
+        assert c.stats()["expirations"] == 1
+
+    def test_stale_value_survives_expiry(self):
+        """Expired and expire()d entries miss but stay readable for serve-stale paths."""
+        c = _CacheNamespace("t", ttl=60)
+        c["a"] = {1}
+        assert c.stored_at("a") is not None
+        c.expire("a")
+        assert c.get("a") is None and c.stored_at("a") is None
+        assert c.get_stale("a") == {1}
+        c["a"] = {2}
+        assert c.get("a") == {2}
+        assert c.get_stale("missing", ()) == ()
+
+    def test_single_flight_runs_loader_once(self):
+        """Concurrent callers for one key wait for the first loader."""
+        import threading
+        import time
+        c = _CacheNamespace("t")
+        calls = []
+
+        def load():
+            with c.single_flight("k"):
+                if "k" in c:
+                    return
+                calls.append(1)
+                time.sleep(0.05)
+                c["k"] = 1
+
+        threads = [threading.Thread(target=load) for _ in range(5)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        assert len(calls) == 1
+        assert c.stats()["coalesced"] >= 1
+
+    def test_single_flight_keeps_lock_for_woken_waiter(self):
+        """Releasing the lock to a waiter doesn't drop it: a later caller still queues."""
+        import threading
+        import time
+        c = _CacheNamespace("t")
+        entered, hold = [], threading.Event()
+
+        def load(name):
+            with c.single_flight("k"):
+                entered.append(name)
+                hold.wait(5)
+
+        def wait_for(cond):
+            deadline = time.time() + 5
+            while not cond() and time.time() < deadline:
+                time.sleep(0.001)
+
+        first = c.single_flight("k")
+        first.__enter__()
+        waiter = threading.Thread(target=load, args=("waiter",))
+        waiter.start()
+        wait_for(lambda: c.coalesced == 1)
+        first.__exit__(None, None, None)
+        wait_for(lambda: entered)
+        late = threading.Thread(target=load, args=("late",))
+        late.start()
+        wait_for(lambda: c.coalesced == 2 or len(entered) == 2)
+        assert entered == ["waiter"]
+        hold.set()
+        waiter.join()
+        late.join()
+        assert entered == ["waiter", "late"]
+        assert c._flight_locks == {}
+
+
+class TestS3ObjectCache:
+    """Tests for the ETag-validated S3 read-through cache (moto S3 from conftest)."""
+
+    def setup_method(self):
+        import main
+        self._dir = tempfile.mkdtemp()
+        self._patches = [patch.object(main, "S3_DISK_CACHE_DIR", self._dir)]
+        for p in self._patches:
+            p.start()
+        main._S3_OBJECT_CACHE.clear()
+        main._S3_DISK_INDEX.clear()
+        main._S3_DISK_STATE.update({"loaded": False, "bytes": 0, "hits": 0, "misses": 0,
+                                    "evictions": 0, "heads": 0})
+
+    def teardown_method(self):
+        import main
+        for p in self._patches:
+            p.stop()
+        main._S3_OBJECT_CACHE.clear()
+        main._S3_DISK_INDEX.clear()
+        main._S3_DISK_STATE["loaded"] = False
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _put(self, key, body):
+        import main
+        return main.s3.put_object(Bucket=main.BUCKET, Key=key, Body=body)["ETag"]
+
+    def test_listing_etag_hit_skips_get(self):
+        """A matching ETag is served from memory without touching S3."""
+        import main
+        etag = self._put("cache/a.jsonl", b'{"x": 1}\n')
+        assert main._s3_cached_get("cache/a.jsonl", etag=etag) == b'{"x": 1}\n'
+        with patch.object(main.s3, "get_object", side_effect=AssertionError("GET issued")):
+            assert main._s3_cached_get("cache/a.jsonl", etag=etag) == b'{"x": 1}\n'
+
+    def test_changed_object_is_refetched(self):
+        """A new ETag invalidates both tiers."""
+        import main
+        old = self._put("cache/b.jsonl", b"old")
+        main._s3_cached_get("cache/b.jsonl", etag=old)
+        new = self._put("cache/b.jsonl", b"new")
+        assert main._s3_cached_get("cache/b.jsonl", etag=new) == b"new"
+        assert main._s3_cached_get("cache/b.jsonl") == b"new"
+
+    def test_disk_tier_survives_memory_clear(self):
+        """After the memory tier is dropped the body comes back from disk."""
+        import main
+        etag = self._put("cache/c.jsonl.gz", gzip.compress(b"line\n"))
+        main._s3_cached_get("cache/c.jsonl.gz", etag=etag)
+        main._S3_OBJECT_CACHE.clear()
+        with patch.object(main.s3, "get_object", side_effect=AssertionError("GET issued")):
+            assert main._s3_cached_text("cache/c.jsonl.gz", etag=etag) == "line\n"
+        assert main._s3_disk_cache_stats()["hits"] == 1
+
+    def test_disk_tier_trims_to_budget(self):
+        """Oldest files are removed once the disk budget is exceeded."""
+        import main
+        with patch.object(main, "S3_DISK_CACHE_MB", 1):
+            main._s3_disk_put(main.BUCKET, "k1", "e1", b"a" * 700_000)
+            main._s3_disk_put(main.BUCKET, "k2", "e2", b"b" * 700_000)
+            assert main._s3_disk_get(main.BUCKET, "k1", "e1") is None
+            assert main._s3_disk_get(main.BUCKET, "k2", "e2") == b"b" * 700_000
+        assert len(os.listdir(self._dir)) == 1
+
+
+class TestExclusionHashSet:
+    """Tests for the incrementally maintained UBI exclusion set (moto S3/DDB)."""
+
+    def setup_method(self):
+        import main
+        try:
+            main.ddb.create_table(
+                TableName="jrk-bill-ubi-assignments",
+                KeySchema=[{"AttributeName": "assignment_id", "KeyType": "HASH"}],
+                AttributeDefinitions=[{"AttributeName": "assignment_id", "AttributeType": "S"}],
+                BillingMode="PAY_PER_REQUEST",
+            )
+        except Exception:
+            pass
+        for lh in ("h1", "h2"):
+            main.ddb.put_item(TableName="jrk-bill-ubi-assignments",
+                              Item={"assignment_id": {"S": lh}, "line_hash": {"S": lh}})
+        self._reset()
+
+    def teardown_method(self):
+        import main
+        for page in main.s3.get_paginator("list_objects_v2").paginate(
+                Bucket=main.BUCKET, Prefix=main.EXCLUSION_SET_PREFIX):
+            for obj in page.get("Contents", []):
+                main.s3.delete_object(Bucket=main.BUCKET, Key=obj["Key"])
+        main.ddb.delete_table(TableName="jrk-bill-ubi-assignments")
+        self._reset()
+
+    def _reset(self):
+        import main
+        main._EXCLUSION_HASH_CACHE.clear()
+        main._EXCLUSION_SYNC_STATE.update({"snapshot_etag": None, "snapshot_scan_started": 0.0,
+                                           "base": frozenset(), "deltas": {}})
+
+    def test_deltas_refresh_without_table_scan(self):
+        """After the first snapshot, assign/unassign deltas are merged without scanning DDB."""
+        import main
+        assert main._get_cached_exclusion_hashes() == {"h1", "h2"}
+        main._exclusion_record_delta(add=["h3"])
+        main._exclusion_record_delta(remove=["h1"])
+        main._EXCLUSION_HASH_CACHE.clear()
+        with patch.object(main.ddb, "get_paginator", side_effect=AssertionError("table scanned")):
+            assert main._get_cached_exclusion_hashes() == {"h2", "h3"}
+
+    def test_rebuild_prunes_covered_deltas(self):
+        """A snapshot rebuild drops deltas older than its scan (minus clock-skew margin)."""
+        import main
+        old = f"{main._EXCLUSION_DELTA_PREFIX}20200101T000000000000Z_aaaa.json"
+        main.s3.put_object(Bucket=main.BUCKET, Key=old, Body=b'{"add": ["h9"], "remove": []}')
+        main._exclusion_record_delta(add=["h4"])
+        main._get_cached_exclusion_hashes()
+        keys = [o["Key"] for o in main.s3.list_objects_v2(
+            Bucket=main.BUCKET, Prefix=main._EXCLUSION_DELTA_PREFIX).get("Contents", [])]
+        assert old not in keys and len(keys) == 1
+
+
+class TestUbiPeriodsIndex:
+    """Tests for the incremental Stage 8 last-period index (moto S3)."""
+
+    OLD = "Bill_Parser_8_UBI_Assigned/yyyy=2025/mm=01/dd=05/bill_20250105T100000Z_20250105T100001Z.jsonl"
+    NEW = "Bill_Parser_8_UBI_Assigned/yyyy=2025/mm=02/dd=05/bill_20250205T100000Z_20250205T100001Z.jsonl"
+
+    @staticmethod
+    def _row(period, start):
+        return {"EnrichedPropertyID": "P1", "EnrichedVendorID": "V1", "Account Number": " 42 ",
+                "ubi_period": period, "Bill Period Start": start, "Bill Period End": ""}
+
+    def _put_stage8(self, key, rows):
+        import main
+        main.s3.put_object(Bucket=main.BUCKET, Key=key, Body="\n".join(json.dumps(r) for r in rows).encode("utf-8"))
+
+    def setup_method(self):
+        self._reset()
+
+    def teardown_method(self):
+        import main
+        for prefix in (main.UBI_PERIODS_INDEX_PREFIX, main.UBI_ASSIGNED_PREFIX):
+            for page in main.s3.get_paginator("list_objects_v2").paginate(Bucket=main.BUCKET, Prefix=prefix):
+                for obj in page.get("Contents", []):
+                    main.s3.delete_object(Bucket=main.BUCKET, Key=obj["Key"])
+        self._reset()
+
+    def _reset(self):
+        import main
+        main._UBI_PERIODS_INDEX.update({"snapshot_etag": None, "base": {}, "watermark": 0.0,
+                                        "scan_started": 0.0, "deltas": {}})
+        main._LAST_UBI_PERIODS_CACHE.clear()
+
+    def test_file_entries_dedupe(self):
+        """One entry per (account, service month, period) per file; rows without a period are skipped."""
+        import main
+        rows = [self._row("01/2025", "11/01/2024"), self._row("01/2025", "11/15/2024"),
+                self._row("", "11/01/2024"), self._row("02/2025", "2024-12-01")]
+        entries = main._ubi_period_entries(rows)
+        assert [e[0] for e in entries] == ["P1|V1|42", "P1|V1|42"]
+        assert [(tuple(e[1]), e[4]) for e in entries] == [((2024, 11), "01/2025"), ((2024, 12), "02/2025")]
+
+    def test_deltas_apply_without_rescan(self):
+        """After the first build, assign/unassign deltas update the result without reading Stage 8."""
+        import main
+        self._put_stage8(self.OLD, [self._row("01/2025", "11/01/2024")])
+        assert main._get_last_ubi_periods_from_stage8()["P1|V1|42"]["last_ubi_period"] == "01/2025"
+
+        main._ubi_periods_record_delta(put={self.NEW: [self._row("02/2025", "12/01/2024")]})
+        main._LAST_UBI_PERIODS_CACHE.expire("data")
+        with patch.object(main.s3, "get_object", wraps=main.s3.get_object) as get:
+            result = main._get_last_ubi_periods_from_stage8()
+        assert result["P1|V1|42"]["last_ubi_period"] == "02/2025"
+        assert result["P1|V1|42"]["last_service_month"] == (2024, 12)
+        assert not any(c.kwargs["Key"].startswith(main.UBI_ASSIGNED_PREFIX) for c in get.call_args_list)
+
+        main._ubi_periods_record_delta(drop=[self.NEW])
+        main._LAST_UBI_PERIODS_CACHE.expire("data")
+        assert main._get_last_ubi_periods_from_stage8()["P1|V1|42"]["last_ubi_period"] == "01/2025"
+
+    def test_reconcile_reads_only_new_files(self):
+        """A reconcile skips files at or before the watermark and drops files that disappeared."""
+        import main
+        gone = self.OLD.replace("bill_", "gone_")
+        self._put_stage8(self.OLD, [self._row("01/2025", "11/01/2024")])
+        self._put_stage8(gone, [self._row("09/2024", "07/01/2024")])
+        with patch.object(main, "_UBI_PERIODS_SKEW_SECONDS", 0):
+            main._rebuild_ubi_periods_cache()
+            time.sleep(1.1)  # S3 LastModified has one-second resolution
+            main.s3.delete_object(Bucket=main.BUCKET, Key=gone)
+            self._put_stage8(self.NEW, [self._row("02/2025", "12/01/2024")])
+            with patch.object(main.s3, "get_object", wraps=main.s3.get_object) as get:
+                result = main._rebuild_ubi_periods_cache()
+        read = [c.kwargs["Key"] for c in get.call_args_list if c.kwargs["Key"].startswith(main.UBI_ASSIGNED_PREFIX)]
+        assert read == [self.NEW]
+        assert [a["ubi_period"] for a in result["P1|V1|42"]["all_assignments"]] == ["02/2025", "01/2025"]
+
+    def test_same_month_latest_file_wins(self):
+        """Two files for one service month: the later assignment timestamp wins."""
+        import main
+        later = self.OLD.replace("20250105T100000Z", "20250106T100000Z")
+        result = main._ubi_periods_summarize({
+            self.OLD: main._ubi_period_entries([self._row("01/2025", "11/01/2024")]),
+            later: main._ubi_period_entries([self._row("03/2025", "11/01/2024")]),
+        })
+        assert result["P1|V1|42"]["last_ubi_period"] == "03/2025"
+        assert len(result["P1|V1|42"]["all_assignments"]) == 2
+
+
+class TestUbiBillStore:
+    """Tests for the indexed in-memory UBI unassigned store."""
+
+    @staticmethod
+    def _bill(n, amount, prop="Oak Apartments", vendor="DTE Energy", gls=("5100",)):
+        return {"s3_key": f"k{n}", "total_amount": amount, "last_modified_ts": n, "account_key": f"P|V|{n}",
+                "unassigned_lines": [{"line_data": {"EnrichedPropertyName": prop, "EnrichedVendorName": vendor,
+                                                    "EnrichedGLAccountNumber": gl}} for gl in gls]}
+
+    def _store(self):
+        from main import _UbiBillStore
+        return _UbiBillStore([
+            self._bill(1, 10.0), self._bill(2, 30.0, prop="Pine Court"),
+            self._bill(3, 20.0, vendor="Consumers Energy", gls=("5100", "5200")),
+            self._bill(4, 5.0, prop="Pine Court", gls=("5300",)),
+        ])
+
+    def test_sorted_pages(self):
+        store = self._store()
+        total, page = store.query(sort="amount_desc", limit=2)
+        assert total == 4 and [b["s3_key"] for b in page] == ["k2", "k3"]
+        total, page = store.query(sort="amount_asc", offset=2, limit=2)
+        assert [b["s3_key"] for b in page] == ["k3", "k2"]
+        assert [b["s3_key"] for b in store.query(sort="bogus")[1]] == ["k2", "k3", "k1", "k4"]
+
+    def test_filters_combine(self):
+        """Property/vendor are case-insensitive substrings of the first line; GL matches any line."""
+        store = self._store()
+        total, page = store.query(property_filter="pine", sort="amount_asc")
+        assert total == 2 and [b["s3_key"] for b in page] == ["k4", "k2"]
+        total, page = store.query(gl_filter="5200")
+        assert [b["s3_key"] for b in page] == ["k3"]
+        assert store.query(property_filter="oak", vendor_filter="dte")[0] == 1
+
+    def test_upsert_remove_and_reindex(self):
+        store = self._store()
+        store.upsert(self._bill(1, 99.0, gls=("5400",)))
+        assert store.query(limit=1)[1][0]["s3_key"] == "k1"
+        assert "k1" not in store.by_gl["5100"] and store.by_gl["5400"] == {"k1"}
+        assert store.remove("k2") and not store.remove("k2")
+        store.apply({"k3": None, "k5": self._bill(5, 1.0)})
+        assert sorted(store.bills) == ["k1", "k4", "k5"]
+        store.get("k4")["unassigned_lines"][0]["line_data"]["EnrichedGLAccountNumber"] = "5900"
+        store.reindex("k4")
+        assert store.query(gl_filter="5900")[0] == 1 and "5300" not in store.by_gl
+
+    def test_bulk_remove_rebuilds_cursors(self):
+        from main import _UbiBillStore
+        store = _UbiBillStore([self._bill(n, float(n)) for n in range(200)])
+        assert store.remove_many([f"k{n}" for n in range(0, 200, 2)]) == 100
+        total, page = store.query(sort="amount_asc", limit=3)
+        assert total == 100 and [b["s3_key"] for b in page] == ["k1", "k3", "k5"]
+        assert all(len(c) == 100 for c in store.cursors.values())
+
+    def test_filter_options(self):
+        opts = self._store().filter_options()
+        assert opts["properties"] == ["Oak Apartments", "Pine Court"]
+        assert opts["gl_codes"] == ["5100", "5200", "5300"]
+
+
+class TestUbiCachePatches:
+    """Tests for applying keyed unassigned-cache patches on top of the Lambda build (moto S3)."""
+
+    def _put_base(self, keys, scan_started):
+        import main
+        payload = {"data": [{"s3_key": k} for k in keys], "ts": scan_started + 5, "scan_started": scan_started}
+        main.s3.put_object(Bucket=main.BUCKET, Key=main._UBI_CACHE_S3_KEY,
+                           Body=gzip.compress(json.dumps(payload).encode("utf-8")))
+
+    def _put_patch(self, stamp, bills):
+        import main
+        main.s3.put_object(Bucket=main.BUCKET, Key=f"{main.UBI_CACHE_PATCH_PREFIX}{stamp}_abcd1234.json",
+                           Body=json.dumps({"bills": bills}).encode("utf-8"))
+
+    def teardown_method(self):
+        import main
+        for page in main.s3.get_paginator("list_objects_v2").paginate(
+                Bucket=main.BUCKET, Prefix=main.UBI_CACHE_PATCH_PREFIX):
+            for obj in page.get("Contents", []):
+                main.s3.delete_object(Bucket=main.BUCKET, Key=obj["Key"])
+        main.s3.delete_object(Bucket=main.BUCKET, Key=main._UBI_CACHE_S3_KEY)
+        main._UBI_UNASSIGNED_CACHE.clear()
+        main._UBI_CACHE_STATE.update({"etag": "", "scan_started": 0.0, "applied": set()})
+
+    def _keys(self):
+        import main
+        return sorted(b["s3_key"] for b in main._UBI_UNASSIGNED_CACHE["store"].values())
+
+    def test_removal_survives_reload(self):
+        """A bill removed by an operation stays removed when the same base is loaded again."""
+        import main
+        self._put_base(["k1", "k2"], time.time() - 60)
+        main._load_ubi_cache_from_s3()
+        with patch.object(main._BACKGROUND_EXECUTOR, "submit", side_effect=lambda fn, *a, **k: fn(*a, **k)):
+            main._remove_bill_from_ubi_cache("k2")
+        assert self._keys() == ["k1"]
+        main._load_ubi_cache_from_s3()
+        assert self._keys() == ["k1"]
+
+    def test_removals_queued_together_share_one_patch(self):
+        """Removals made before the background PUT runs go out as a single patch object."""
+        import main
+        queued = []
+        with patch.object(main._BACKGROUND_EXECUTOR, "submit", side_effect=lambda fn, *a, **k: queued.append(fn)):
+            main._remove_bill_from_ubi_cache("k1")
+            main._remove_bill_from_ubi_cache("k2")
+        assert len(queued) == 1
+        queued[0]()
+        (obj,) = main.s3.list_objects_v2(Bucket=main.BUCKET, Prefix=main.UBI_CACHE_PATCH_PREFIX)["Contents"]
+        body = json.loads(main.s3.get_object(Bucket=main.BUCKET, Key=obj["Key"])["Body"].read())
+        assert body == {"bills": {"k1": None, "k2": None}}
+
+    def test_patches_upsert_in_order_and_skip_covered(self):
+        """Later patches win per key; patches older than the build's scan are already in it."""
+        import main
+        self._put_base(["k1", "k2"], time.time() - 60)
+        self._put_patch("20200101T000000000000Z", {"k1": None})
+        main._load_ubi_cache_from_s3()
+        assert self._keys() == ["k1", "k2"]
+
+        self._put_patch("29990101T000000000000Z", {"k3": {"s3_key": "k3", "v": 1}, "k2": None})
+        self._put_patch("29990101T000001000000Z", {"k3": {"s3_key": "k3", "v": 2}})
+        main._poll_ubi_cache()
+        assert self._keys() == ["k1", "k3"]
+        assert main._UBI_UNASSIGNED_CACHE["store"].get("k3")["v"] == 2
+        assert main._apply_ubi_cache_patches() == 0
+
+
+class TestStageScan:
+    """Tests for the shared incremental Stage 7/8/9 projection (moto S3)."""
+
+    @staticmethod
+    def _key(prefix, name, days_ago=0):
+        import datetime as _dt
+        d = _dt.date.today() - _dt.timedelta(days=days_ago)
+        return f"{prefix}yyyy={d.year}/mm={d.month:02d}/dd={d.day:02d}/{name}.jsonl"
+
+    def _put(self, key, rows):
+        import main
+        main.s3.put_object(Bucket=main.BUCKET, Key=key, Body="\n".join(json.dumps(r) for r in rows).encode("utf-8"))
+
+    def setup_method(self):
+        self._reset()
+
+    def teardown_method(self):
+        import main
+        for prefix in (main.POST_ENTRATA_PREFIX, main.FLAGGED_REVIEW_PREFIX):
+            for page in main.s3.get_paginator("list_objects_v2").paginate(Bucket=main.BUCKET, Prefix=prefix):
+                for obj in page.get("Contents", []):
+                    main.s3.delete_object(Bucket=main.BUCKET, Key=obj["Key"])
+        self._reset()
+
+    def _reset(self):
+        import main
+        for proj in main._STAGE_SCANS.values():
+            proj.files, proj.days, proj.refreshed_at, proj.stale = {}, 0, 0.0, False
+            proj.requested = {}
+
+    def test_stage7_projection_keeps_head_and_charges(self):
+        """Stage 7 lines keep their stable hash and charge; the head keeps the bill fields."""
+        import main
+        rows = [{"EnrichedPropertyName": "Oak", "Account Number": "42", "Line Item Charge": "$10.00", "Other": "x"},
+                {"EnrichedPropertyName": "Oak", "Account Number": "42", "Line Item Charge": "5"}]
+        key = self._key(main.POST_ENTRATA_PREFIX, "bill")
+        self._put(key, rows)
+        (got_key, ent), = main._stage_scan_files("stage7", 3)
+        assert got_key == key
+        assert ent["head"] == {"EnrichedPropertyName": "Oak", "Account Number": "42"}
+        assert ent["lines"] == [(main._compute_stable_line_hash(rows[0]), {"Line Item Charge": "$10.00"}),
+                                (main._compute_stable_line_hash(rows[1]), {"Line Item Charge": "5"})]
+
+    def test_refresh_reads_only_changed_and_drops_deleted(self):
+        """A stale refresh re-reads only objects whose ETag changed and forgets deleted ones."""
+        import main
+        k1 = self._key(main.POST_ENTRATA_PREFIX, "a")
+        k2 = self._key(main.POST_ENTRATA_PREFIX, "b", days_ago=1)
+        self._put(k1, [{"Line Item Charge": "1"}])
+        self._put(k2, [{"Line Item Charge": "2"}])
+        assert len(main._stage_scan_files("stage7", 3)) == 2
+
+        self._put(k1, [{"Line Item Charge": "9"}])
+        main._stage_scan_mark_stale()
+        main._STAGE_SCANS["stage7"].refreshed_at -= main._STAGE_SCAN_MIN_REFRESH_SECONDS
+        with patch.object(main.s3, "get_object", wraps=main.s3.get_object) as read:
+            files = dict(main._stage_scan_files("stage7", 3))
+        assert [c.kwargs["Key"] for c in read.call_args_list] == [k1]
+        assert files[k1]["lines"][0][1] == {"Line Item Charge": "9"}
+
+        main.s3.delete_object(Bucket=main.BUCKET, Key=k2)
+        main._STAGE_SCANS["stage7"].refreshed_at = 0.0
+        assert [k for k, _ in main._stage_scan_files("stage7", 3)] == [k1]
+
+    def test_window_filter_and_widening(self):
+        """A query only sees its own window; a wider query lists the extra days."""
+        import main
+        recent = self._key(main.POST_ENTRATA_PREFIX, "recent")
+        older = self._key(main.POST_ENTRATA_PREFIX, "older", days_ago=10)
+        self._put(recent, [{"Line Item Charge": "1"}])
+        self._put(older, [{"Line Item Charge": "2"}])
+        assert [k for k, _ in main._stage_scan_files("stage7", 5)] == [recent]
+        assert sorted(k for k, _ in main._stage_scan_files("stage7", 30)) == sorted([recent, older])
+        assert [k for k, _ in main._stage_scan_files("stage7", 5)] == [recent]
+
+    def test_window_narrows_after_wide_requests_stop(self):
+        """The window shrinks back once no caller has asked for the wide range recently."""
+        import main
+        proj = main._STAGE_SCANS["stage7"]
+        older = self._key(main.POST_ENTRATA_PREFIX, "older", days_ago=10)
+        self._put(older, [{"Line Item Charge": "2"}])
+        main._stage_scan_files("stage7", 30)
+        assert proj.days == 30 and older in proj.files
+
+        proj.requested = {d: at - main._STAGE_SCAN_WINDOW_DECAY_SECONDS - 1 for d, at in proj.requested.items()}
+        proj.refreshed_at = 0.0
+        assert main._stage_scan_files("stage7", 5) == []
+        assert proj.days == 5 and older not in proj.files
+
+    def test_request_beyond_max_days_is_scanned_once(self):
+        """Windows wider than STAGE_SCAN_MAX_DAYS are served directly and not kept."""
+        import main
+        proj = main._STAGE_SCANS["stage7"]
+        old = self._key(main.POST_ENTRATA_PREFIX, "old", days_ago=main.STAGE_SCAN_MAX_DAYS + 5)
+        self._put(old, [{"Line Item Charge": "2"}])
+        assert [k for k, _ in main._stage_scan_files("stage7", main.STAGE_SCAN_MAX_DAYS + 10)] == [old]
+        assert proj.days == 0 and old not in proj.files
+
+    def test_concurrent_callers_share_one_refresh(self):
+        """A caller that waited on another's refresh returns instead of refreshing again."""
+        import threading
+        import time
+        import main
+        proj = main._STAGE_SCANS["stage7"]
+        calls = []
+        coalesced = proj.stats["coalesced"]
+
+        def slow_refresh():
+            calls.append(1)
+            time.sleep(0.1)
+            proj.refreshed_at = time.time()
+            proj.stats["refreshes"] += 1
+
+        with patch.object(proj, "refresh", side_effect=slow_refresh):
+            threads = [threading.Thread(target=proj.ensure, args=(3,)) for _ in range(2)]
+            for th in threads:
+                th.start()
+            for th in threads:
+                th.join()
+        assert len(calls) == 1
+        assert proj.stats["coalesced"] == coalesced + 1
+
+    def test_stage9_keeps_view_fields_only(self):
+        """Stage 9 lines keep the flagged-view fields; the hash still covers the whole record."""
+        import main
+        row = {"original_submitter": "amy", "Line Item Charge": "3", "__pdf_b64__": "AAAA", "Other": "x"}
+        self._put(self._key(main.FLAGGED_REVIEW_PREFIX, "flag"), [row])
+        (_, ent), = main._stage_scan_files("stage9", 1)
+        assert ent["head"] == {}
+        assert ent["lines"] == [(main._compute_stable_line_hash(row), {"original_submitter": "amy", "Line Item Charge": "3"})]
+
+    def test_projection_reported_in_cache_stats(self):
+        """Each projection shows its size and window bound next to the cache namespaces."""
+        import main
+        self._put(self._key(main.POST_ENTRATA_PREFIX, "bill"), [{"Line Item Charge": "1"}])
+        main._stage_scan_files("stage7", 3)
+        stats = {ns["name"]: ns for ns in main._cache_stats()["namespaces"]}
+        ent = stats["stage_scan_stage7"]
+        assert ent["entries"] == 1 and ent["approx_mb"] >= 0
+        assert ent["window_days"] == 3 and ent["max_days"] == main.STAGE_SCAN_MAX_DAYS
+
+
+class TestUbiSuggestBatch:
+    """Tests for the vectorized UBI suggestion engine (moto S3)."""
+
+    def _put_history(self, accounts):
+        import main
+        main.s3.put_object(Bucket=main.CONFIG_BUCKET, Key=main.UBI_ACCOUNT_HISTORY_KEY,
+                           Body=json.dumps({"accounts": accounts}).encode("utf-8"))
+
+    def setup_method(self):
+        self._reset()
+
+    def teardown_method(self):
+        import main
+        main.s3.delete_object(Bucket=main.CONFIG_BUCKET, Key=main.UBI_ACCOUNT_HISTORY_KEY)
+        self._reset()
+
+    def _reset(self):
+        import main
+        main._UBI_SUGGEST_STATE.update({"etag": None, "stage8": None, "accounts": None, "months": None,
+                                        "result_key": None, "result": None})
+
+    def test_period_index_round_trip(self):
+        import main
+        assert main._ubi_period_from_index(main._ubi_period_to_index("12/2025")) == "12/2025"
+        assert main._ubi_period_to_index("13/2025") is None
+        assert main._ubi_period_to_index("") is None
+
+    def test_same_rules_as_scalar(self):
+        """Stage 8 last period wins, then account history, then the current month; non-UBI gets None."""
+        import main
+        hist = {"lastUbiPeriods": ["01/2026"], "billHistory": [{"ubiPeriods": ["01/2026"]}]}
+        self._put_history({"H": hist, "S": {"lastUbiPeriods": ["01/2026"]}})
+        stage8 = {"S": {"last_ubi_period": "12/2026"}}
+        bills = [{"account_key": k, "amount": 10.005, "is_ubi": ubi}
+                 for k, ubi in (("S", True), ("H", True), ("N", True), ("H", False))]
+        out = main._ubi_suggest_batch(bills, stage8)
+        assert out[0]["suggested_periods"][0]["period"] == "01/2027"
+        assert out[0]["reason"].endswith("(from Stage 8 history)")
+        expected = main._calculate_ubi_suggestion(None, None, 10.005, hist)
+        assert {k: v for k, v in out[1].items() if k != "warnings"} == expected
+        assert out[2]["confidence"] == "low" and out[2]["last_period"] is None
+        assert out[3] is None
+
+    def test_duplicate_and_gap_warnings(self):
+        import main
+        self._put_history({"A": {"lastUbiPeriods": ["03/2026"],
+                                 "billHistory": [{"ubiPeriods": ["01/2026"]}, {"ubiPeriods": ["03/2026"]}]},
+                           "B": {"lastUbiPeriods": ["02/2026"], "billHistory": [{"ubiPeriods": ["02/2026"]}]}})
+        stage8 = {"B": {"last_ubi_period": "01/2026"}}
+        out = main._ubi_suggest_batch([{"account_key": "A", "amount": 1, "is_ubi": True},
+                                       {"account_key": "A", "amount": 2, "is_ubi": True},
+                                       {"account_key": "B", "amount": 3, "is_ubi": True}], stage8)
+        kinds = {w["type"]: w for w in out[0]["warnings"]}
+        assert kinds["duplicate_period"]["count"] == 2
+        assert kinds["prior_period_gap"]["missing_periods"] == ["02/2026"]
+        assert out[2]["suggested_periods"][0]["period"] == "02/2026"
+        assert [w["message"] for w in out[2]["warnings"]] == ["02/2026 is already assigned for this account"]
+
+    def test_history_columns_cached_by_etag(self):
+        """Unchanged history is not re-read; a new history version is."""
+        import main
+        self._put_history({"A": {"lastUbiPeriods": ["01/2026"]}})
+        stage8 = {}
+        bill = [{"account_key": "A", "amount": 1, "is_ubi": True}]
+        assert main._ubi_suggest_batch(bill, stage8)[0]["suggested_periods"][0]["period"] == "02/2026"
+        with patch.object(main.s3, "get_object", wraps=main.s3.get_object) as get:
+            main._ubi_suggest_batch(bill + bill, stage8)
+        assert get.call_count == 0
+        self._put_history({"A": {"lastUbiPeriods": ["05/2026"]}})
+        assert main._ubi_suggest_batch(bill, stage8)[0]["suggested_periods"][0]["period"] == "06/2026"
+
+
+class TestAsyncIOLayer:
+    """Tests for the async S3/DDB helpers on the shared I/O pool (moto S3/DDB)."""
+
+    def test_list_and_get_objects(self):
+        """Listing a prefix and reading its objects concurrently; unreadable keys are skipped."""
+        import asyncio
+        import main
+        for i in range(5):
+            main.s3.put_object(Bucket=main.BUCKET, Key=f"aio_test/{i}.json", Body=str(i).encode())
+
+        async def run():
+            objs = await main.aio_list_prefix("aio_test/")
+            keys = sorted(o["Key"] for o in objs)
+            return keys, await main.aio_get_objects(keys + ["aio_test/missing.json"])
+
+        keys, bodies = asyncio.run(run())
+        assert len(keys) == 5
+        assert bodies == {f"aio_test/{i}.json": str(i).encode() for i in range(5)}
+
+    def test_batch_get_spans_chunks(self):
+        """More than 100 keys are split into concurrent batch_get_item calls and merged."""
+        import asyncio
+        import main
+        ids = [f"aio-{i}" for i in range(150)]
+        for i in ids:
+            main.ddb.put_item(TableName=main.REVIEW_TABLE, Item={"pk": {"S": i}, "status": {"S": "Submitted"}})
+        items = asyncio.run(main.aio_ddb_batch_get(main.REVIEW_TABLE, [{"pk": {"S": i}} for i in ids]))
+        assert sorted(it["pk"]["S"] for it in items) == sorted(ids)
+
+    def test_map_bounds_fanout(self):
+        """aio_map keeps result order and never exceeds its in-flight limit."""
+        import asyncio
+        import threading
+        import time
+        import main
+        lock = threading.Lock()
+        state = {"now": 0, "peak": 0}
+
+        def work(x):
+            with lock:
+                state["now"] += 1
+                state["peak"] = max(state["peak"], state["now"])
+            time.sleep(0.01)
+            with lock:
+                state["now"] -= 1
+            return x * 2
+
+        assert asyncio.run(main.aio_map(work, list(range(20)), limit=3)) == [x * 2 for x in range(20)]
+        assert state["peak"] <= 3
+
+
+class TestIOScheduler:
+    """Tests for the shared I/O scheduler and its executor facade."""
+
+    def _sched(self, workers=4, s3_cap=3):
+        import main
+        return main._IOScheduler({"interactive": workers, "background": 2}, {"s3": s3_cap, "ddb": 2})
+
+    def test_executor_caps_own_fanout(self):
+        """max_workers bounds one caller's in-flight tasks; the rest are held, then drained."""
+        import threading
+        import time
+        import main
+        sched = self._sched()
+        lock = threading.Lock()
+        state = {"now": 0, "peak": 0}
+
+        def work(x):
+            with lock:
+                state["now"] += 1
+                state["peak"] = max(state["peak"], state["now"])
+            time.sleep(0.005)
+            with lock:
+                state["now"] -= 1
+            return x
+
+        with main._IOExecutor(sched, "s3", "interactive", max_workers=2) as ex:
+            futures = [ex.submit(work, i) for i in range(12)]
+        assert sorted(f.result() for f in futures) == list(range(12))
+        assert state["peak"] <= 2
+        lane = sched.stats()["lanes"][0]
+        assert lane["completed"] == 12 and lane["held"] == 0 and lane["queued"] == 0
+
+    def test_nested_fanout_does_not_deadlock(self):
+        """Parents that fill the lane and wait on children still finish (children run inline)."""
+        from concurrent.futures import as_completed
+        import main
+        sched = self._sched(workers=2, s3_cap=2)
+
+        def parent(i):
+            with main._IOExecutor(sched, "s3", "interactive") as ex:
+                return sum(f.result() for f in as_completed([ex.submit(lambda j=j: j) for j in range(5)]))
+
+        with main._IOExecutor(sched, "s3", "interactive") as ex:
+            futures = [ex.submit(parent, i) for i in range(6)]
+        assert [f.result(timeout=10) for f in futures] == [10] * 6
+        assert sched.stats()["lanes"][0]["inline"] > 0
+
+    def test_exceptions_propagate(self):
+        import main
+        with main._IOExecutor(self._sched(), None, "background") as ex:
+            future = ex.submit(lambda: 1 / 0)
+        with pytest.raises(ZeroDivisionError):
+            future.result()
+
+
+class TestJsonlParsing:
+    """Tests for the projecting JSONL reader used by stage scans."""
+
+    def test_row_index_matches_str_splitlines(self):
+        """Indexes match the old decode().splitlines() numbering, blank and bad lines included."""
+        import json
+        import main
+        body = "\n".join([json.dumps({"a": 1}), "", "not json", json.dumps({"a": 2}, ensure_ascii=False),
+                          json.dumps({"a": "x y"}, ensure_ascii=False), json.dumps({"a": 3})]).encode()
+        expected = []
+        for idx, line in enumerate(body.decode().splitlines()):
+            try:
+                expected.append((idx, json.loads(line)))
+            except Exception:
+                pass
+        assert list(main._iter_jsonl_records(body)) == expected
+
+    def test_projection_and_large_values(self):
+        """fields keeps only named keys; skip_large nulls oversized strings without losing small ones."""
+        import json
+        import main
+        body = (json.dumps({"id": "1", "pdf": "A" * 5000, "note": "keep"}) + "\n").encode()
+        [(_, rec)] = main._iter_jsonl_records(body, fields=("id", "pdf", "note"), skip_large=1000)
+        assert rec == {"id": "1", "pdf": None, "note": "keep"}
+
+    def test_large_values_respect_token_boundaries(self):
+        """Long non-string runs and escaped quotes are parsed as written, not mistaken for one big string."""
+        import json
+        import main
+        row = {"a": "x", "n": list(range(400)), "q": 'say \\"' + "B" * 1500 + '\\" ok', "b": "y"}
+        [(_, rec)] = main._iter_jsonl_records((json.dumps(row) + "\n").encode(), skip_large=1000)
+        assert rec == {**row, "q": None}
+
+    def test_contains_prefilter(self):
+        import json
+        import main
+        body = "\n".join(json.dumps(r) for r in ({"a": 1}, {"ubi_period": "2025-01"}, {"a": 2})).encode()
+        assert list(main._iter_jsonl_records(body, contains=b'"ubi_period"')) == [(1, {"ubi_period": "2025-01"})]
+
+    def test_streaming_body(self):
+        """An S3 streaming body is read through iter_lines with the same results as bytes."""
+        import json
+        import main
+        body = "\n".join(json.dumps(r) for r in ({"a": 1}, {"pdf": "C" * 3000}, {"a": 2})).encode()
+        main.s3.put_object(Bucket=main.BUCKET, Key="jsonl_test/stream.jsonl", Body=body)
+        stream = main.s3.get_object(Bucket=main.BUCKET, Key="jsonl_test/stream.jsonl")["Body"]
+        assert list(main._iter_jsonl_records(stream, skip_large=1000)) == \
+            list(main._iter_jsonl_records(body, skip_large=1000))
+
+    def test_first_record_ranged_read(self):
+        """A first line longer than the initial range is still read in full."""
+        import json
+        import main
+        first = {"Account Number": "123", "pdf": "B" * 40000}
+        main.s3.put_object(Bucket=main.BUCKET, Key="jsonl_test/first.jsonl",
+                           Body=(json.dumps(first) + "\n" + json.dumps({"x": 1}) + "\n").encode())
+        rec = main._s3_read_first_jsonl_record("jsonl_test/first.jsonl", fields=("Account Number",))
+        assert rec == {"Account Number": "123"}
+
+
+class TestDayStatusRollup:
+    """Tests for the per-day status tallies behind the parse dashboard."""
+
+    def test_group_status_rules(self):
+        """Deleted lines don't count; all remaining submitted is COMPLETE."""
+        import main
+        assert main._rollup_group_status(3, 0, 0) == "REVIEW"
+        assert main._rollup_group_status(3, 1, 0) == "PARTIAL"
+        assert main._rollup_group_status(3, 2, 1) == "COMPLETE"
+        assert main._rollup_group_status(2, 0, 2) == "REVIEW"
+
+    def test_counts_from_tallies(self):
+        import main
+        groups = [[2, 0, 0], [2, 1, 0], [2, 2, 0], [1, 0, 1]]
+        assert main._rollup_counts(groups) == {"REVIEW": 2, "PARTIAL": 1, "COMPLETE": 1}
+
+    def test_stale_or_unbuilt_rollup_not_fresh(self):
+        import time
+        import main
+        item = {"built_ts": {"N": str(time.time())}}
+        assert main._day_rollup_fresh(item, "2020", "01", "02")
+        assert not main._day_rollup_fresh({**item, "stale": {"BOOL": True}}, "2020", "01", "02")
+        assert not main._day_rollup_fresh({}, "2020", "01", "02")